@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+broadcast.py
+
+Admin broadcasts (deadline reminders) delivered through a throttled,
+resumable queue.
+
+A broadcast is one row in `broadcasts` plus one row per recipient in
+`broadcast_targets`, in data/bot.db (same Storage as the rest of the bot).
+The sender takes the pending recipients a batch at a time, paces the sends
+below Telegram's ~30 messages/s per bot, and writes the batch outcome in one
+transaction: that is the checkpoint. After a crash or a restart the
+broadcast resumes from the recipients still pending; at most the batch in
+flight can be delivered twice.
+
+RetryAfter (flood control) stops the whole queue for the time Telegram asks
+and the message is retried; Forbidden (bot blocked, account deleted) and
+BadRequest are final; network errors are retried up to MAX_ATTEMPTS times.
+While should_yield() is true (updates or Bot API calls backing up) the
+sender waits, so replies to users always go first.
+"""
+
+import time
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import metrics
+from storage import Storage
+
+log = logging.getLogger("savitri-bot.broadcast")
+
+MAX_ATTEMPTS = 3
+
+SEGMENTS = {
+    "no_wallet": "vincitori senza wallet registrato",
+    "change_pending": "cambio wallet avviato e non concluso (o richiesta pending)",
+    "all": "tutti gli utenti che hanno scritto al bot",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    segment TEXT NOT NULL,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    created_by INTEGER,
+    report_chat_id INTEGER,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    status TEXT NOT NULL DEFAULT 'running',  -- running | paused | cancelled | done
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS broadcast_targets (
+    broadcast_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | sent | failed | blocked
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    sent_at REAL,
+    PRIMARY KEY (broadcast_id, chat_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS broadcast_targets_status ON broadcast_targets(broadcast_id, status, chat_id);
+"""
+
+metrics.REGISTRY.describe("broadcast_messages_total", "Broadcast messages by outcome")
+
+# -------------------- TARGETS --------------------
+def select_targets(segment: str, users: Dict[int, str], zealy_index: Dict[str, Dict[str, Any]],
+                   submissions: Dict[str, dict], pending_user_ids: Set[int], approved_user_ids: Set[int]) -> List[int]:
+    """Chat ids of the users in `segment`.
+
+    users: tg_id -> Zealy username (lowercase) of everyone known to the bot.
+    """
+    if segment not in SEGMENTS:
+        raise ValueError(f"segmento sconosciuto: {segment}")
+    out = []
+    for tg_id, username in users.items():
+        sub = submissions.get(str(tg_id)) or {}
+        if segment == "all":
+            out.append(tg_id)
+        elif segment == "no_wallet":
+            entry = zealy_index.get(username or "")
+            has_wallet = (entry or {}).get("wallet") or sub.get("reg_wallet") or sub.get("new_wallet") \
+                or tg_id in pending_user_ids or tg_id in approved_user_ids
+            if entry is not None and not has_wallet:
+                out.append(tg_id)
+        elif tg_id in pending_user_ids or (sub.get("old_sig") and not sub.get("new_sig")):
+            out.append(tg_id)
+    return sorted(out)
+
+# -------------------- PACING --------------------
+class TokenBucket:
+    """Evenly spaced send slots (`rate` per second); pause() pushes every slot back."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / max(rate, 0.1)
+        self.next_slot = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+# -------------------- QUEUE --------------------
+class Broadcaster:
+    """Broadcast rows, per-recipient checkpoints and the single sender task."""
+
+    def __init__(self, store: Storage, rate: float = 20.0, batch: int = 25,
+                 should_yield: Optional[Callable[[], bool]] = None):
+        self.store = store
+        self.bucket = TokenBucket(rate)
+        self.batch = batch
+        self.should_yield = should_yield or (lambda: False)
+        self.live: Dict[int, tuple] = {}  # id -> (monotonic start of this run, sent at start)
+        with store.transaction() as con:
+            for stmt in SCHEMA.split(";"):
+                if stmt.strip():
+                    con.execute(stmt)
+
+    def create(self, segment: str, text: str, chat_ids: Iterable[int], created_by: int,
+               report_chat_id: int, parse_mode: Optional[str] = None) -> int:
+        with self.store.transaction() as con:
+            cur = con.execute(
+                "INSERT INTO broadcasts (segment, text, parse_mode, created_by, report_chat_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (segment, text, parse_mode, created_by, report_chat_id, time.time()),
+            )
+            bid = cur.lastrowid
+            con.executemany("INSERT OR IGNORE INTO broadcast_targets (broadcast_id, chat_id) VALUES (?, ?)",
+                            ((bid, c) for c in chat_ids))
+            total = con.execute("SELECT count(*) FROM broadcast_targets WHERE broadcast_id=?", (bid,)).fetchone()[0]
+            con.execute("UPDATE broadcasts SET total=? WHERE id=?", (total, bid))
+        return bid
+
+    def get(self, bid: Optional[int] = None) -> Optional[dict]:
+        """Broadcast `bid`, or the most recent one."""
+        if bid is None:
+            rows = self.store.query("SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1")
+        else:
+            rows = self.store.query("SELECT * FROM broadcasts WHERE id=?", (bid,))
+        return dict(rows[0]) if rows else None
+
+    def set_status(self, bid: int, status: str) -> bool:
+        with self.store.transaction() as con:
+            cur = con.execute("UPDATE broadcasts SET status=? WHERE id=? AND status NOT IN ('done', 'cancelled')",
+                              (status, bid))
+        return cur.rowcount == 1
+
+    def next_running(self) -> Optional[int]:
+        rows = self.store.query("SELECT id FROM broadcasts WHERE status='running' ORDER BY id LIMIT 1")
+        return rows[0]["id"] if rows else None
+
+    def progress(self, bid: int) -> Optional[dict]:
+        b = self.get(bid)
+        if b is None:
+            return None
+        done = b["sent"] + b["failed"] + b["blocked"]
+        b["pending"] = b["total"] - done
+        b["rate"] = 0.0
+        b["eta_s"] = None
+        live = self.live.get(bid)
+        if live is not None:
+            elapsed = time.monotonic() - live[0]
+            if elapsed > 0:
+                b["rate"] = (b["sent"] - live[1]) / elapsed
+            if b["rate"] > 0:
+                b["eta_s"] = b["pending"] / b["rate"]
+        return b
+
+    async def _send(self, bot, b: dict, chat_id: int) -> tuple:
+        """(status, error) for one recipient; status 'retry' leaves it pending."""
+        try:
+            await bot.send_message(chat_id=chat_id, text=b["text"], parse_mode=b["parse_mode"])
+            return "sent", None
+        except RetryAfter as e:
+            wait = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            log.warning("Broadcast #%s: flood control, pausa di %.0fs", b["id"], wait)
+            self.bucket.pause(wait + 1)
+            return "flood", str(e)
+        except Forbidden as e:
+            return "blocked", str(e)
+        except BadRequest as e:
+            return "failed", str(e)
+        except TelegramError as e:
+            return "retry", str(e)
+
+    async def run(self, bot, bid: int) -> Optional[dict]:
+        """Deliver broadcast `bid` until done, paused or cancelled; returns its final progress."""
+        b = self.get(bid)
+        if b is None or b["status"] != "running":
+            return b
+        with self.store.transaction() as con:
+            con.execute("UPDATE broadcasts SET started_at=coalesce(started_at, ?) WHERE id=?", (time.time(), bid))
+        self.live[bid] = (time.monotonic(), b["sent"])
+        try:
+            while True:
+                status = self.store.query("SELECT status FROM broadcasts WHERE id=?", (bid,))[0]["status"]
+                if status != "running":
+                    return self.progress(bid)
+                rows = self.store.query(
+                    "SELECT chat_id, attempts FROM broadcast_targets WHERE broadcast_id=? AND status='pending' "
+                    "ORDER BY chat_id LIMIT ?", (bid, self.batch))
+                if not rows:
+                    with self.store.transaction() as con:
+                        con.execute("UPDATE broadcasts SET status='done', finished_at=? WHERE id=? AND status='running'",
+                                    (time.time(), bid))
+                    return self.progress(bid)
+                while self.should_yield():
+                    await asyncio.sleep(0.5)
+
+                tasks = []
+                for row in rows:
+                    await self.bucket.acquire()
+                    tasks.append(asyncio.ensure_future(self._send(bot, b, row["chat_id"])))
+                results = await asyncio.gather(*tasks)
+
+                # checkpoint: esiti del batch e contatori in una transazione
+                now = time.time()
+                counts = {"sent": 0, "failed": 0, "blocked": 0}
+                updates = []
+                for row, (outcome, error) in zip(rows, results):
+                    attempts = row["attempts"] + (outcome != "flood")
+                    if outcome == "retry" and attempts >= MAX_ATTEMPTS:
+                        outcome = "failed"
+                    final = outcome if outcome in counts else "pending"
+                    if final in counts:
+                        counts[final] += 1
+                    metrics.REGISTRY.inc("broadcast_messages_total", status=outcome)
+                    updates.append((final, attempts, error, now if final == "sent" else None, bid, row["chat_id"]))
+                with self.store.transaction() as con:
+                    con.executemany(
+                        "UPDATE broadcast_targets SET status=?, attempts=?, error=?, sent_at=? "
+                        "WHERE broadcast_id=? AND chat_id=?", updates)
+                    con.execute("UPDATE broadcasts SET sent=sent+?, failed=failed+?, blocked=blocked+? WHERE id=?",
+                                (counts["sent"], counts["failed"], counts["blocked"], bid))
+                if any(outcome == "retry" for outcome, _ in results):
+                    await asyncio.sleep(1.0)  # errori di rete: piccola pausa prima di riprovare
+        finally:
+            self.live.pop(bid, None)
+
+    async def worker(self, bot, on_finish: Optional[Callable[[dict], Any]] = None) -> None:
+        """Run the running broadcasts one after another (they share the same send rate)."""
+        while True:
+            bid = self.next_running()
+            if bid is None:
+                return
+            result = await self.run(bot, bid)
+            if on_finish is not None and result is not None:
+                await on_finish(result)
+            if result is not None and result["status"] == "running":
+                return  # non dovrebbe accadere: evita un loop stretto
@@ -1,9 +1,53 @@
 #!/usr/bin/env bash
 set -e
 
-echo "Starting Savitri bot with auto-restart loop..."
-while true; do
-  python /app/main.py || true
-  echo "Bot crashed, restarting in 5s..."
-  sleep 5
+WORKERS="${WORKERS:-1}"
+
+# Riavvio subito dopo un'uscita (crash, watchdog): gli update non gestiti restano in coda in bot.db.
+# Se il processo esce di nuovo entro 60s l'attesa raddoppia (1, 2, 4 ... 30s) per non girare a vuoto.
+# SIGTERM/SIGINT (docker stop) vengono inoltrati a python, che chiude in modo ordinato (workers.run:
+# persistence salvata, update in corso lasciati in coda); poi niente più riavvii.
+supervise() {
+  local name="$1" delay=0 started child="" stopping=""
+  trap 'stopping=1; [ -n "$child" ] && kill -TERM "$child" 2>/dev/null' TERM INT
+  while [ -z "$stopping" ]; do
+    started=$SECONDS
+    python /app/main.py &
+    child=$!
+    # wait ritorna anche quando arriva un segnale: si aspetta finché python non è uscito davvero
+    while kill -0 "$child" 2>/dev/null; do
+      wait "$child" || true
+    done
+    child=""
+    [ -n "$stopping" ] && break
+    if [ $((SECONDS - started)) -ge 60 ]; then
+      delay=0
+    elif [ "$delay" -eq 0 ]; then
+      delay=1
+    else
+      delay=$((delay * 2 > 30 ? 30 : delay * 2))
+    fi
+    echo "$name exited, restarting in ${delay}s..."
+    sleep "$delay" &
+    wait $! || true
+  done
+  echo "$name stopped."
+}
+
+if [ "$WORKERS" -le 1 ]; then
+  echo "Starting Savitri bot with auto-restart loop..."
+  supervise "Bot"
+  exit 0
+fi
+
+# Multi-worker: un processo per WORKER_ID, ognuno con il proprio auto-restart (vedi workers.py)
+echo "Starting Savitri bot with $WORKERS workers..."
+pids=()
+for i in $(seq 0 $((WORKERS - 1))); do
+  WORKER_ID=$i supervise "Worker $i" &
+  pids+=($!)
 done
+trap 'kill -TERM "${pids[@]}" 2>/dev/null' TERM INT
+# il primo wait viene interrotto dal segnale, il secondo attende l'arresto ordinato di tutti i worker
+wait || true
+wait
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+flow.py
+
+Per-user state of the wallet flows (registration and change), stored in
+user_data["fsm"] as a few bytes instead of a dozen loose keys.
+
+A flow is a Step plus a small record: flags (proof received, proof or
+wallet awaited), the command to resume once the proof arrives, the old
+wallet and the wallet being registered or proposed. Registration is the
+change flow without an old wallet: start() picks the first step from that,
+then every command is an Event looked up in TRANSITIONS. A (step, event)
+pair missing from the table is rejected with a dict lookup, before any
+storage or network work.
+
+Encoded form: step, flags and pending command (one byte each), then the
+20-byte keys (wallets.wallet_key) of the wallets that are set: 3 to 43
+bytes. load() also converts the keys written by earlier versions ("flow",
+"awaiting_proof", "reg_wallet", ...) and drops them from user_data.
+"""
+
+from enum import IntEnum
+from typing import Dict, MutableMapping, Optional, Tuple
+
+from wallets import check_wallet, checksum, wallet_key
+
+class Step(IntEnum):
+    IDLE = 0
+    REGISTER = 1    # /add_wallet: attesa di /set_wallet
+    REG_SIGN = 2    # wallet dato: attesa (o reinvio) di /reg_sig
+    CHANGE = 3      # /change_wallet: attesa di /old_sig
+    CHG_WALLET = 4  # vecchio wallet firmato: attesa di /new_wallet
+    CHG_SIGN = 5    # nuovo wallet dato: attesa (o reinvio) di /new_sig
+
+class Event(IntEnum):
+    ADD_WALLET = 1
+    CHANGE_WALLET = 2
+    SET_WALLET = 3
+    REG_SIG = 4
+    OLD_SIG = 5
+    NEW_WALLET = 6
+    NEW_SIG = 7
+
+# /add_wallet e /change_wallet (ri)partono da qualsiasi step: start()
+TRANSITIONS: Dict[Tuple[Step, Event], Step] = {
+    (Step.IDLE, Event.SET_WALLET): Step.REG_SIGN,  # /proof e poi /set_wallet, come suggerisce msg_proof_ok
+    (Step.REGISTER, Event.SET_WALLET): Step.REG_SIGN,
+    (Step.REG_SIGN, Event.SET_WALLET): Step.REG_SIGN,
+    (Step.REG_SIGN, Event.REG_SIG): Step.REG_SIGN,
+    (Step.CHANGE, Event.OLD_SIG): Step.CHG_WALLET,
+    (Step.CHG_WALLET, Event.OLD_SIG): Step.CHG_WALLET,
+    (Step.CHG_WALLET, Event.NEW_WALLET): Step.CHG_SIGN,
+    (Step.CHG_SIGN, Event.OLD_SIG): Step.CHG_SIGN,
+    (Step.CHG_SIGN, Event.NEW_WALLET): Step.CHG_SIGN,
+    (Step.CHG_SIGN, Event.NEW_SIG): Step.CHG_SIGN,
+}
+
+PROOF_DONE = 0x01
+AWAIT_PROOF = 0x02
+AWAIT_WALLET = 0x04
+_HAS_OLD = 0x40     # nel byte dei flag: segue la chiave del vecchio wallet
+_HAS_WALLET = 0x80  # segue la chiave del wallet registrato/proposto
+
+LEGACY_KEYS = ("flow", "awaiting_wallet", "awaiting_proof", "post_proof_action", "proof_done",
+               "reg_wallet", "old_wallet", "new_wallet", "reg_sig", "old_sig", "new_sig")
+
+def _flag(bit: int) -> property:
+    def get(self) -> bool:
+        return bool(self.flags & bit)
+
+    def put(self, on: bool) -> None:
+        self.flags = self.flags | bit if on else self.flags & ~bit
+    return property(get, put)
+
+def _key(address: Optional[str]) -> Optional[bytes]:
+    address, _ = check_wallet(address) if address else (None, None)
+    return wallet_key(address) if address else None
+
+class FlowState:
+    """Step of a user's wallet flow plus the few values it needs."""
+
+    __slots__ = ("step", "flags", "pending", "old_key", "wallet_key")
+    KEY = "fsm"
+
+    proof_done = _flag(PROOF_DONE)
+    awaiting_proof = _flag(AWAIT_PROOF)
+    awaiting_wallet = _flag(AWAIT_WALLET)
+
+    def __init__(self, step: Step = Step.IDLE, flags: int = 0, pending: Optional[Event] = None,
+                 old_key: Optional[bytes] = None, wallet_key: Optional[bytes] = None):
+        self.step = step
+        self.flags = flags
+        self.pending = pending
+        self.old_key = old_key
+        self.wallet_key = wallet_key
+
+    @property
+    def flow(self) -> Optional[str]:
+        if self.step == Step.IDLE:
+            return None
+        return "register" if self.step <= Step.REG_SIGN else "change"
+
+    @property
+    def old_wallet(self) -> Optional[str]:
+        return checksum(self.old_key.hex()) if self.old_key else None
+
+    @property
+    def wallet(self) -> Optional[str]:
+        """Wallet given with /set_wallet (registration) or /new_wallet (change)."""
+        return checksum(self.wallet_key.hex()) if self.wallet_key else None
+
+    def start(self, old_wallet: Optional[str] = None) -> Step:
+        """(Re)start a flow: change if the user has a valid old wallet, registration otherwise."""
+        self.old_key = _key(old_wallet)
+        self.wallet_key = None
+        self.pending = None
+        self.step = Step.CHANGE if self.old_key else Step.REGISTER
+        return self.step
+
+    def allows(self, event: Event) -> bool:
+        return (self.step, event) in TRANSITIONS
+
+    def advance(self, event: Event, wallet: Optional[str] = None) -> bool:
+        """Apply `event` (with the wallet it carries, if any); False if not allowed at this step."""
+        nxt = TRANSITIONS.get((self.step, event))
+        if nxt is None:
+            return False
+        self.step = nxt
+        if wallet:
+            self.wallet_key = _key(wallet)
+        return True
+
+    # -------------------- ENCODING --------------------
+    def encode(self) -> bytes:
+        flags = self.flags | (_HAS_OLD if self.old_key else 0) | (_HAS_WALLET if self.wallet_key else 0)
+        return bytes((self.step, flags, self.pending or 0)) + (self.old_key or b"") + (self.wallet_key or b"")
+
+    @classmethod
+    def decode(cls, data: bytes) -> "FlowState":
+        step, flags, pending = data[0], data[1], data[2]
+        pos = 3
+        old = wallet = None
+        if flags & _HAS_OLD:
+            old, pos = data[pos:pos + 20], pos + 20
+        if flags & _HAS_WALLET:
+            wallet = data[pos:pos + 20]
+        return cls(Step(step), flags & ~(_HAS_OLD | _HAS_WALLET), Event(pending) if pending else None, old, wallet)
+
+    @classmethod
+    def from_legacy(cls, ud: MutableMapping) -> "FlowState":
+        """State from the loose keys of earlier versions (which are removed from `ud`)."""
+        st = cls()
+        st.proof_done = bool(ud.get("proof_done"))
+        st.awaiting_proof = bool(ud.get("awaiting_proof"))
+        st.awaiting_wallet = bool(ud.get("awaiting_wallet"))
+        st.pending = {"add_wallet": Event.ADD_WALLET,
+                      "change_wallet": Event.CHANGE_WALLET}.get(ud.get("post_proof_action"))
+        if ud.get("flow") == "register":
+            st.wallet_key = _key(ud.get("reg_wallet"))
+            st.step = Step.REG_SIGN if st.wallet_key else Step.REGISTER
+        elif ud.get("flow") == "change":
+            st.old_key, st.wallet_key = _key(ud.get("old_wallet")), _key(ud.get("new_wallet"))
+            if st.wallet_key:
+                st.step = Step.CHG_SIGN
+            else:
+                st.step = Step.CHG_WALLET if ud.get("old_sig") else Step.CHANGE
+        for key in LEGACY_KEYS:
+            ud.pop(key, None)
+        return st
+
+    @classmethod
+    def load(cls, ud: MutableMapping) -> "FlowState":
+        data = ud.get(cls.KEY)
+        if data is not None:
+            return cls.decode(data)
+        if any(key in ud for key in LEGACY_KEYS):
+            st = cls.from_legacy(ud)
+            st.save(ud)  # subito: anche un handler che legge soltanto lascia user_data convertito
+            return st
+        return cls()
+
+    def save(self, ud: MutableMapping) -> None:
+        """Write the state back to user_data (one key, removed when there is nothing to keep)."""
+        if self.step == Step.IDLE and not self.flags and self.pending is None:
+            ud.pop(self.KEY, None)
+        else:
+            ud[self.KEY] = self.encode()
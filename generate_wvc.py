@@ -7,6 +7,14 @@ Optional: generates QR code images for each WVC and packs them in a ZIP.
 
 Usage:
     python generate_wvc.py --count 150 --prefix SAVI --segments 4 --seglen 4 --expiry-days 30 --out wvc_list.csv --qrcode
+    python generate_wvc.py --count 1000000 --out wvc_list.csv --qrcode --workers 8
+
+Codes are cut from bulk secrets.token_bytes() draws: bytes.translate maps
+each byte to the alphabet in C and drops the few bytes that would bias it
+(rejection sampling), so there is no per-character Python call.
+QR images are rendered by a process pool and written straight into the ZIP
+(PNG is already compressed, so entries are stored, not deflated); no
+intermediate directory unless --qr-dir is given.
 
 Dependencies:
     pip install python-dotenv qrcode[pil] pillow
@@ -14,11 +22,14 @@ Dependencies:
 """
 
 import csv
+import io
 import secrets
 import string
 import argparse
 from datetime import datetime, timedelta
+from multiprocessing import Pool
 from pathlib import Path
+from typing import Iterable, Iterator, List
 import zipfile
 import os
 
@@ -31,8 +42,22 @@ except Exception:
 
 ALPHABET = string.ascii_uppercase + string.digits
 
+# byte -> carattere: i byte >= 252 (= 7 * 36) vengono scartati, così ogni carattere ha probabilità 1/36
+_USABLE = 256 - 256 % len(ALPHABET)
+_BYTE_TO_CHAR = bytes(ord(ALPHABET[b % len(ALPHABET)]) if b < _USABLE else 0 for b in range(256))
+_REJECT = bytes(range(_USABLE, 256))
+
+def random_chars(n: int) -> str:
+    """n uniformly random alphabet characters from one token_bytes() draw (topped up if bytes were rejected)."""
+    out = b""
+    while len(out) < n:
+        missing = n - len(out)
+        raw = secrets.token_bytes(missing + missing // 32 + 16)
+        out += raw.translate(_BYTE_TO_CHAR, _REJECT)
+    return out[:n].decode("ascii")
+
 def random_segment(seglen: int) -> str:
-    return ''.join(secrets.choice(ALPHABET) for _ in range(seglen))
+    return random_chars(seglen)
 
 def make_code(prefix: str, segments: int, seglen: int) -> str:
     parts = [prefix] if prefix else []
@@ -40,18 +65,34 @@ def make_code(prefix: str, segments: int, seglen: int) -> str:
         parts.append(random_segment(seglen))
     return '-'.join(parts)
 
-def generate_codes(count: int, prefix: str, segments: int, seglen: int) -> list:
-    codes = set()
+def iter_code_batches(count: int, prefix: str, segments: int, seglen: int, batch: int = 100_000) -> Iterator[List[str]]:
+    """Yield lists of unique codes, `batch` at a time, until `count` codes have been produced."""
+    seen = set()
     attempts = 0
-    while len(codes) < count:
-        c = make_code(prefix, segments, seglen)
-        attempts += 1
-        if c not in codes:
-            codes.add(c)
-        if attempts > count * 20:
+    head = prefix + "-" if prefix else ""
+    width = segments * seglen
+    while len(seen) < count:
+        n = min(batch, count - len(seen))
+        attempts += n
+        if attempts > count * 20 + 100:
             # safety to avoid infinite loop (extremely unlikely)
             raise RuntimeError("Too many collisions generating codes; try longer seglen")
-    return list(codes)
+        chars = random_chars(n * width)
+        out = []
+        for i in range(0, n * width, width):
+            body = chars[i:i + width]
+            code = head + "-".join(body[j:j + seglen] for j in range(0, width, seglen))
+            if code not in seen:
+                seen.add(code)
+                out.append(code)
+        if out:
+            yield out
+
+def generate_codes(count: int, prefix: str, segments: int, seglen: int) -> list:
+    codes = []
+    for chunk in iter_code_batches(count, prefix, segments, seglen):
+        codes.extend(chunk)
+    return codes
 
 def write_csv(out_path: Path, codes: list, expiry_days: int):
     header = ["wvc", "assigned_to", "created_at", "expires_at", "used"]
@@ -63,14 +104,35 @@ def write_csv(out_path: Path, codes: list, expiry_days: int):
         for code in codes:
             writer.writerow([code, "", now.isoformat(), expires, "false"])
 
+def render_qr_png(code: str) -> bytes:
+    """PNG bytes of the QR code for `code` (runs in the worker processes)."""
+    buf = io.BytesIO()
+    qrcode.make(code).save(buf)
+    return buf.getvalue()
+
+def write_qr_zip(codes: Iterable[str], zip_path: Path, workers: int = 0, chunksize: int = 256) -> int:
+    """Render the QR codes in a process pool and stream them into `zip_path`; returns the number of images."""
+    if not QR_AVAILABLE:
+        raise RuntimeError("qrcode library not available. Install with: pip install qrcode[pil]")
+    codes = list(codes)
+    workers = workers or os.cpu_count() or 1
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        if workers == 1:
+            for code in codes:
+                zf.writestr(f"{code}.png", render_qr_png(code))
+        else:
+            with Pool(workers) as pool:
+                # imap mantiene l'ordine: il nome del file è il codice corrispondente
+                for code, png in zip(codes, pool.imap(render_qr_png, codes, chunksize=chunksize)):
+                    zf.writestr(f"{code}.png", png)
+    return len(codes)
+
 def generate_qrcodes(codes: list, out_dir: Path):
     if not QR_AVAILABLE:
         raise RuntimeError("qrcode library not available. Install with: pip install qrcode[pil]")
     out_dir.mkdir(parents=True, exist_ok=True)
     for code in codes:
-        img = qrcode.make(code)
-        fname = out_dir / f"{code}.png"
-        img.save(fname)
+        (out_dir / f"{code}.png").write_bytes(render_qr_png(code))
 
 def zip_qrcodes(qr_dir: Path, zip_path: Path):
     with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
@@ -86,8 +148,9 @@ def main():
     parser.add_argument("--expiry-days", type=int, default=0, help="Expiry in days (0 = no expiry)")
     parser.add_argument("--out", type=str, default="wvc_list.csv", help="Output CSV filename")
     parser.add_argument("--qrcode", action="store_true", help="Also generate QR codes and zip them (requires qrcode[pil])")
-    parser.add_argument("--qr-dir", type=str, default="wvc_qr", help="Directory for QR images (if --qrcode)")
+    parser.add_argument("--qr-dir", type=str, default="", help="Also keep the QR images in this directory (if --qrcode)")
     parser.add_argument("--zip", type=str, default="wvc_qr.zip", help="Output zip filename for QR images (if --qrcode)")
+    parser.add_argument("--workers", type=int, default=0, help="Processes rendering QR codes (0 = one per CPU)")
 
     args = parser.parse_args()
 
@@ -97,12 +160,16 @@ def main():
     print(f"[OK] Generated {len(codes)} codes -> {out_path.resolve()}")
 
     if args.qrcode:
-        qr_dir = Path(args.qr_dir)
-        print("[..] Generating QR codes (this may take a few seconds)...")
-        generate_qrcodes(codes, qr_dir)
         zip_path = Path(args.zip)
-        zip_qrcodes(qr_dir, zip_path)
-        print(f"[OK] QR images in {qr_dir.resolve()} zipped -> {zip_path.resolve()}")
+        print("[..] Generating QR codes...")
+        if args.qr_dir:
+            qr_dir = Path(args.qr_dir)
+            generate_qrcodes(codes, qr_dir)
+            zip_qrcodes(qr_dir, zip_path)
+            print(f"[OK] QR images in {qr_dir.resolve()} zipped -> {zip_path.resolve()}")
+        else:
+            n = write_qr_zip(codes, zip_path, args.workers)
+            print(f"[OK] {n} QR images -> {zip_path.resolve()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+bench.py
+
+Micro-benchmarks for the storage, CSV and export hot paths, on synthetic
+datasets (default 1k / 10k / 100k users) generated in a temporary DATA_DIR.
+
+Cases:
+    load_zealy_index          parse the Zealy CSV into ZEALY_INDEX
+    load_submissions          all submissions from bot.db (exports, backup)
+    save_submissions          replace every submission in one transaction
+    update_submission         one user's record updated in place (what the commands do)
+    request_lookup            get_request (last id) + first /admin_list page of pending requests
+    export_final_join         build_final_rows + CSV writer (admin_export_final)
+    make_backup_archive       zip of DATA_DIR (with an online snapshot of bot.db)
+    variant_upsert_db_one     upsert_winner + db_one on savitri_rewards_bot (skipped
+                              if that bot cannot be imported, e.g. no eth_account)
+
+Each case runs --repeat times; median and min are stored in JSON. With a
+baseline file, any case whose median exceeds baseline * (1 + threshold) and
+baseline + --min-delta fails the run (exit code 1).
+
+Usage:
+    python loadtest/bench.py                                   # run, write bench_results.json
+    python loadtest/bench.py --sizes 1000,10000 --update-baseline
+    python loadtest/bench.py --baseline loadtest/bench_baseline.json --threshold 0.2
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import argparse
+import platform
+import tempfile
+import importlib.util
+import statistics
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "bench_baseline.json"
+VARIANT_OPS = 200  # upserts/lookups per variant run (each one is its own transaction)
+
+# The bot modules read their configuration at import time: point them at a
+# scratch directory before importing anything.
+WORKDIR = Path(tempfile.mkdtemp(prefix="bench_"))
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:BENCH")
+os.environ["DATA_DIR"] = str(WORKDIR / "data")
+os.environ["BACKUP_DIR"] = str(WORKDIR / "backups")
+os.environ["ZEALY_CSV_PATH"] = str(WORKDIR / "zealy.csv")
+os.environ["HEARTBEAT_FILE"] = str(WORKDIR / "data" / "heartbeat.txt")
+sys.path.insert(0, str(ROOT))
+
+import main as bot  # noqa: E402
+
+logging.getLogger("savitri-bot").setLevel(logging.WARNING)
+
+# -------------------- SYNTHETIC DATA --------------------
+def _hex(rnd: random.Random, n: int) -> str:
+    return "0x" + "".join(rnd.choice("0123456789abcdef") for _ in range(n))
+
+def make_dataset(n: int, seed: int = 42) -> Tuple[List[dict], dict, List[dict]]:
+    """Return (zealy rows, submissions dict, wallet requests) for n users."""
+    rnd = random.Random(seed + n)
+    zealy, subs, reqs = [], {}, []
+    for i in range(n):
+        username = f"user_{i:06d}"
+        wallet = _hex(rnd, 40)
+        zealy.append({"Position": str(i + 1), "XP": str(rnd.randint(100, 50000)), "Username": username,
+                      "Binance Smart Chain Address": wallet, "WVC": f"WVC-{rnd.getrandbits(40):010X}"})
+        if i % 3 == 0:  # a third of the winners interacted with the bot
+            tg_id = 100_000_000 + i
+            rec = {"tg_id": tg_id, "username": username, "proofs": [f"data/proofs/{tg_id}_1700000000.jpg"],
+                   "reg_wallet": _hex(rnd, 40), "reg_sig": _hex(rnd, 130)}
+            if i % 2:
+                rec.update({"new_wallet": _hex(rnd, 40), "old_sig": _hex(rnd, 130), "new_sig": _hex(rnd, 130)})
+            subs[str(tg_id)] = rec
+            reqs.append({"id": len(reqs) + 1, "user_id": tg_id, "username": username, "wallet": rec["reg_wallet"],
+                         "timestamp": "2025-11-01 12:00:00 UTC", "status": "pending"})
+    return zealy, subs, reqs
+
+def write_zealy_csv(path: Path, rows: List[dict]) -> None:
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0].keys()), delimiter=";")
+        w.writeheader()
+        w.writerows(rows)
+
+# -------------------- VARIANT (SQLite) --------------------
+def load_variant():
+    """Import savitri_rewards_bot/main.py under another module name, or None."""
+    cwd = os.getcwd()
+    os.chdir(WORKDIR)  # it creates ./data at import time
+    try:
+        spec = importlib.util.spec_from_file_location("savitri_variant", ROOT / "savitri_rewards_bot" / "main.py")
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        return mod
+    except Exception as e:
+        print(f"[SKIP] variant_upsert_db_one: cannot import savitri_rewards_bot/main.py ({e})")
+        return None
+    finally:
+        os.chdir(cwd)
+
+def seed_variant(mod, zealy: List[dict]) -> None:
+    mod.DB_PATH = WORKDIR / f"rewards_{len(zealy)}.db"
+    mod.init_db()
+    with closing(sqlite3.connect(mod.DB_PATH)) as con:
+        con.executemany(
+            "INSERT OR IGNORE INTO winners (username, rank, xp, wallet, wvc, wvc_used) VALUES (?,?,?,?,?,0)",
+            ((z["Username"], int(z["Position"]), int(z["XP"]), z["Binance Smart Chain Address"], z["WVC"]) for z in zealy),
+        )
+        con.commit()
+
+# -------------------- CASES --------------------
+def build_cases(n: int, variant) -> Dict[str, Callable[[], None]]:
+    zealy, subs, reqs = make_dataset(n)
+    # bot.db resta aperto da bot.STORE: si svuotano le tabelle invece di cancellare DATA_DIR
+    store = bot.STORE
+    write_zealy_csv(Path(bot.ZEALY_CSV_PATH), zealy)
+    bot.save_submissions(subs)
+    with store.transaction() as con:
+        con.execute("DELETE FROM requests")
+        for r in reqs:
+            store.add_request(r)
+    bot.load_zealy_index()
+    last_id = reqs[-1]["id"] if reqs else 0
+    pending = {"status": "pending", "user_id": None, "from": None, "to": None}
+    some_sid = next(iter(subs))
+
+    def request_lookup():
+        store.get_request(last_id)
+        store.page_requests(pending, None, "next", bot.ADMIN_LIST_PAGE_SIZE)
+
+    def update_submission():
+        store.update_submission(some_sid, {}, append={"proofs": "data/proofs/bench.jpg"})
+
+    def export_final_join():
+        buf = io.StringIO()
+        w = csv.DictWriter(buf, fieldnames=bot.FINAL_EXPORT_FIELDS)
+        w.writeheader()
+        w.writerows(bot.build_final_rows(bot.ZEALY_INDEX, subs))
+
+    def backup():
+        bot.make_backup_archive().unlink()
+
+    cases = {
+        "load_zealy_index": bot.load_zealy_index,
+        "load_submissions": bot.load_submissions,
+        "save_submissions": lambda: bot.save_submissions(subs),
+        "update_submission": update_submission,
+        "request_lookup": request_lookup,
+        "export_final_join": export_final_join,
+        "make_backup_archive": backup,
+    }
+    if variant is not None:
+        seed_variant(variant, zealy)
+        names = [z["Username"] for z in random.Random(n).sample(zealy, min(VARIANT_OPS, n))]
+
+        def upsert_db_one():
+            for i, u in enumerate(names):
+                variant.upsert_winner(u, tg_id=200_000_000 + i)
+                variant.db_one("SELECT username, rank, xp, wallet, wvc, wvc_used FROM winners WHERE tg_id=?",
+                               (200_000_000 + i,))
+        cases["variant_upsert_db_one"] = upsert_db_one
+    return cases
+
+def time_case(fn: Callable[[], None], repeat: int) -> Dict[str, float]:
+    fn()  # warm-up (page cache, lazy imports)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "runs": repeat}
+
+# -------------------- BASELINE --------------------
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float,
+            min_delta: float) -> List[str]:
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        limit = max(base["median_s"] * (1 + threshold), base["median_s"] + min_delta)
+        if cur["median_s"] > limit:
+            regressions.append(
+                f"{key}: {cur['median_s'] * 1000:.2f} ms vs baseline {base['median_s'] * 1000:.2f} ms "
+                f"(+{(cur['median_s'] / base['median_s'] - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark storage/CSV/export hot paths.")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="comma separated user counts")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", help="comma separated case names")
+    ap.add_argument("--out", default="bench_results.json", help="where to write this run's results")
+    ap.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    ap.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.25")),
+                    help="allowed slowdown vs baseline (0.25 = +25%%)")
+    ap.add_argument("--min-delta", type=float, default=0.002,
+                    help="ignore regressions smaller than this many seconds (timer noise)")
+    ap.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    only = {s.strip() for s in args.only.split(",")} if args.only else None
+    variant = load_variant() if only is None or "variant_upsert_db_one" in only else None
+    results: Dict[str, dict] = {}
+    try:
+        for n in sizes:
+            for name, fn in build_cases(n, variant).items():
+                if only and name not in only:
+                    continue
+                r = time_case(fn, args.repeat)
+                results[f"{name}@{n}"] = r
+                print(f"{name:<24}{n:>8}  median {r['median_s'] * 1000:>10.2f} ms  min {r['min_s'] * 1000:>10.2f} ms")
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    doc = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat, "sizes": sizes},
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(doc, indent=2), encoding="utf-8")
+    print(f"\n[OK] Results written to {args.out}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+        print(f"[OK] Baseline updated: {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"[INFO] No baseline at {baseline_path}; run with --update-baseline to create one.")
+        return
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+    regressions = compare(results, baseline, args.threshold, args.min_delta)
+    if regressions:
+        print(f"\n[FAIL] {len(regressions)} regression(s) over +{args.threshold * 100:.0f}%:")
+        for r in regressions:
+            print(f"  - {r}")
+        sys.exit(1)
+    print(f"[OK] No regressions over +{args.threshold * 100:.0f}% against {baseline_path}")
+
+if __name__ == "__main__":
+    main()
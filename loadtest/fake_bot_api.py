@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+fake_bot_api.py
+
+Local stand-in for the Telegram Bot API, good enough to drive the bots in
+this repo without touching Telegram.
+
+Supported: getMe, getUpdates (long polling with offset confirmation),
+sendMessage, editMessageText, sendDocument, sendPhoto, getFile and file
+downloads under /file/bot<token>/...; any other method answers ok=true.
+
+The server runs in a background thread (ThreadingHTTPServer). Tests and the
+load generator push updates with push_message()/push_photo() and wait for
+the bot's replies with wait_replies().
+
+Usage (standalone, for manual poking):
+    python loadtest/fake_bot_api.py --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_TOKEN=123456:TEST python main.py
+"""
+
+import io
+import json
+import time
+import random
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP as HTTP_POLICY
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote
+
+# Optional: Pillow makes proof downloads real (decodable) JPEGs
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+DEFAULT_TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+# Fallback JPEG (8x8 grey) used when Pillow is not installed
+_FALLBACK_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f"
+    "141d1a1f1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080008000801"
+    "011100ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403"
+    "050504040000017d01020300041105122131410613516107227114328191a1082342b1c11552d1f02433627282090a1617"
+    "18191a25262728292a3435363738393a434445464748494a535455565758595a636465666768696a737475767778797a83"
+    "8485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7"
+    "d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00fbfcffd9"
+)
+
+def make_jpeg(seed: int) -> bytes:
+    if not PIL_AVAILABLE:
+        return _FALLBACK_JPEG
+    rnd = random.Random(seed)
+    img = Image.new("L", (64, 64))
+    img.putdata([rnd.randrange(256) for _ in range(64 * 64)])
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=70)
+    return buf.getvalue()
+
+class FakeBotAPI:
+    """In-process fake Bot API server. Thread-safe; all state guarded by one Condition."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token: str = DEFAULT_TOKEN):
+        self.token = token
+        self.cond = threading.Condition()
+        self.updates: List[dict] = []          # not yet confirmed via offset
+        self.next_update_id = 1
+        self.next_message_id = 1
+        # chat_id -> [(monotonic ts, method, params)]
+        self.sent: Dict[int, List[tuple]] = {}
+        self.calls: Dict[str, int] = {}
+        self.files: Dict[str, bytes] = {}
+        self.polling_started = threading.Event()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):  # keep the load test output readable
+                pass
+
+            def _reply(self, status: int, body: bytes, ctype: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _params(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                ctype = self.headers.get("Content-Type", "")
+                if not raw:
+                    return {}
+                if ctype.startswith("application/json"):
+                    return json.loads(raw)
+                if ctype.startswith("multipart/form-data"):
+                    msg = BytesParser(policy=HTTP_POLICY).parsebytes(
+                        b"Content-Type: " + ctype.encode("latin-1") + b"\r\n\r\n" + raw
+                    )
+                    out = {}
+                    for part in msg.iter_parts():
+                        name = part.get_param("name", header="content-disposition")
+                        if part.get_filename():
+                            out[name] = {"filename": part.get_filename(), "size": len(part.get_payload(decode=True) or b"")}
+                        else:
+                            out[name] = part.get_content().strip() if part.get_content_maintype() == "text" \
+                                else (part.get_payload(decode=True) or b"").decode("utf-8")
+                    return out
+                return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+
+            def _route(self):
+                # httpx percent-encodes the ':' of the token in file download URLs
+                path = unquote(self.path.split("?", 1)[0])
+                file_prefix = f"/file/bot{api.token}/"
+                if path.startswith(file_prefix):
+                    data = api.files.get(path[len(file_prefix):])
+                    if data is None:
+                        return self._reply(404, b"not found", "text/plain")
+                    return self._reply(200, data, "image/jpeg")
+                prefix = f"/bot{api.token}/"
+                if not path.startswith(prefix):
+                    return self._reply(404, json.dumps({"ok": False, "error_code": 404, "description": "Not Found"}).encode())
+                method = path[len(prefix):]
+                params = self._params()
+                result = api.handle(method, params)
+                self._reply(200, json.dumps({"ok": True, "result": result}).encode())
+
+            do_GET = _route
+            do_POST = _route
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-bot-api", daemon=True)
+
+    # ---------- lifecycle ----------
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBotAPI":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self.cond:
+            self.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ---------- Bot API methods ----------
+    def handle(self, method: str, p: dict):
+        with self.cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getUpdates":
+            return self._get_updates(p)
+        if method == "getMe":
+            return BOT_USER
+        if method == "getFile":
+            fid = str(p.get("file_id"))
+            path = f"photos/{fid}.jpg"
+            with self.cond:
+                if path not in self.files:
+                    self.files[path] = make_jpeg(hash(fid) & 0xFFFFFFFF)
+                size = len(self.files[path])
+            return {"file_id": fid, "file_unique_id": f"u{fid}", "file_size": size, "file_path": path}
+        if method in ("sendMessage", "editMessageText", "sendDocument", "sendPhoto"):
+            return self._record(method, p)
+        if method == "deleteWebhook" and str(p.get("drop_pending_updates")).lower() == "true":
+            with self.cond:
+                self.updates = []
+        return True
+
+    def _get_updates(self, p: dict) -> list:
+        self.polling_started.set()
+        offset = int(p.get("offset") or 0)
+        timeout = min(float(p.get("timeout") or 0), 10.0)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            # offset confirms everything below it
+            if offset:
+                self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return []
+                self.cond.wait(left)
+            limit = int(p.get("limit") or 100)
+            return self.updates[:limit]
+
+    def _record(self, method: str, p: dict) -> dict:
+        try:
+            chat_id = int(p.get("chat_id"))
+        except (TypeError, ValueError):
+            chat_id = 0
+        with self.cond:
+            mid = self.next_message_id
+            self.next_message_id += 1
+            self.sent.setdefault(chat_id, []).append((time.monotonic(), method, p))
+            self.cond.notify_all()
+        msg = {"message_id": mid, "date": int(time.time()), "from": BOT_USER,
+               "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendDocument":
+            doc = p.get("document") if isinstance(p.get("document"), dict) else {}
+            msg["document"] = {"file_id": f"doc{mid}", "file_unique_id": f"udoc{mid}",
+                               "file_name": doc.get("filename", "file"), "file_size": doc.get("size", 0)}
+            msg["caption"] = p.get("caption")
+        else:
+            msg["text"] = p.get("text") or ""
+        return msg
+
+    # ---------- test driver API ----------
+    def _push(self, chat_id: int, message: dict) -> float:
+        with self.cond:
+            uid = self.next_update_id
+            self.next_update_id += 1
+            message.setdefault("message_id", uid)
+            message.update({
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": f"Load{chat_id}"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": f"Load{chat_id}", "username": f"load{chat_id}"},
+            })
+            self.updates.append({"update_id": uid, "message": message})
+            self.cond.notify_all()
+            return time.monotonic()
+
+    def push_message(self, chat_id: int, text: str) -> float:
+        """Queue a text message (commands get a bot_command entity). Returns the push timestamp."""
+        msg = {"text": text}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._push(chat_id, msg)
+
+    def push_photo(self, chat_id: int, caption: Optional[str] = None) -> float:
+        fid = f"ph{chat_id}_{self.next_update_id}"
+        msg = {"photo": [
+            {"file_id": fid + "s", "file_unique_id": fid + "us", "width": 90, "height": 90, "file_size": 1000},
+            {"file_id": fid, "file_unique_id": fid + "u", "width": 64, "height": 64, "file_size": 2000},
+        ]}
+        if caption:
+            msg["caption"] = caption
+        return self._push(chat_id, msg)
+
+    def reply_count(self, chat_id: int) -> int:
+        with self.cond:
+            return len(self.sent.get(chat_id, []))
+
+    def wait_replies(self, chat_id: int, already_seen: int, n: int, timeout: float = 30.0) -> List[tuple]:
+        """Block until chat_id has received n new messages after already_seen; return them."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while len(self.sent.get(chat_id, [])) < already_seen + n:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.cond.wait(left)
+            return self.sent.get(chat_id, [])[already_seen:already_seen + n]
+
+def main():
+    ap = argparse.ArgumentParser(description="Run a local fake Telegram Bot API server.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--token", default=DEFAULT_TOKEN)
+    args = ap.parse_args()
+    api = FakeBotAPI(args.host, args.port, args.token).start()
+    print(f"[OK] Fake Bot API on {api.url} (token {args.token}) — Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+run_load.py
+
+Load generator for the bots in this repo, driven through fake_bot_api.py.
+
+The bot runs unmodified in a subprocess (TELEGRAM_API_URL points it at the
+fake server, data goes to a temporary directory). N simulated users then run
+the full registration flow concurrently, and for every step we measure the
+time from the update being queued to the bot's last expected reply.
+
+Flows:
+    main     /set_username → /proof → photo → /add_wallet → /set_wallet → /reg_sig
+    variant  /set_username → /add_wallet → /proof → /set_wallet → /reg_sig
+             (savitri_rewards_bot/main.py; needs eth_account installed)
+
+Usage:
+    python loadtest/run_load.py --target main --users 50 --rounds 2
+    python loadtest/run_load.py --target variant --users 20 --json results.json
+    python loadtest/run_load.py --target main --users 200 --workers 4   # multi-worker (workers.py)
+
+Output: p50/p99/max latency per step and overall, updates/sec, timeouts.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import secrets
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bot_api import FakeBotAPI
+
+# Optional: real signatures for the variant's /reg_sig (it verifies them)
+try:
+    from eth_account import Account
+    from eth_account.messages import encode_defunct
+    ETH_AVAILABLE = True
+except Exception:
+    ETH_AVAILABLE = False
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGETS = {
+    "main": ROOT / "main.py",
+    "variant": ROOT / "savitri_rewards_bot" / "main.py",
+}
+
+# Repo root first on sys.path: the variant imports `messages`, and its own
+# savitri_rewards_bot/messages.py is only a placeholder.
+LAUNCHER = (
+    "import runpy, sys; sys.path.insert(0, sys.argv[1]); "
+    "runpy.run_path(sys.argv[2], run_name='__main__')"
+)
+
+FIRST_USER_ID = 910_000_000
+
+# -------------------- FLOWS --------------------
+# Step = (label, kind, payload, expected replies in the user's chat)
+Step = Tuple[str, str, str, int]
+
+def _wallet_and_sig(username: str) -> Tuple[str, str]:
+    if not ETH_AVAILABLE:
+        return "0x" + secrets.token_hex(20), "0x" + secrets.token_hex(65)
+    acct = Account.create()
+    wallet = acct.address.lower()
+    message = (
+        f"Wallet registration — Zealy: {username} — Wallet: {wallet}\n"
+        "I declare that I request the registration of the wallet indicated above and release Savitri Network from any liability in case of my own mistake."
+    )
+    sig = Account.sign_message(encode_defunct(text=message), private_key=acct.key).signature.hex()
+    return wallet, sig if sig.startswith("0x") else "0x" + sig
+
+def build_flow(target: str, user_id: int) -> List[Step]:
+    username = f"load_{user_id}"
+    wallet, sig = _wallet_and_sig(username)
+    if target == "main":
+        return [
+            ("set_username", "text", f"/set_username {username}", 1),
+            ("proof", "text", "/proof", 1),
+            ("photo", "photo", "", 1),
+            ("add_wallet", "text", "/add_wallet", 1),
+            ("set_wallet", "text", f"/set_wallet {wallet}", 1),
+            ("reg_sig", "text", f"/reg_sig {sig}", 1),
+        ]
+    return [
+        ("set_username", "text", f"/set_username {username}", 1),
+        ("add_wallet", "text", "/add_wallet", 1),
+        ("proof", "text", "/proof", 1),
+        ("set_wallet", "text", f"/set_wallet {wallet}", 1),
+        ("reg_sig", "text", f"/reg_sig {sig}", 1),
+    ]
+
+# -------------------- STATS --------------------
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(q * (len(s) - 1)))))
+    return s[k]
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, dict]:
+    out = {}
+    everything: List[float] = []
+    for label, vals in samples.items():
+        everything.extend(vals)
+        out[label] = {
+            "count": len(vals),
+            "p50_ms": round(percentile(vals, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(vals, 0.99) * 1000, 2),
+            "max_ms": round(max(vals) * 1000, 2) if vals else 0.0,
+        }
+    out["ALL"] = {
+        "count": len(everything),
+        "p50_ms": round(percentile(everything, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(everything, 0.99) * 1000, 2),
+        "max_ms": round(max(everything) * 1000, 2) if everything else 0.0,
+    }
+    return out
+
+# -------------------- RUNNER --------------------
+def start_bot(target: str, api: FakeBotAPI, workdir: Path, log_file,
+              workers: int = 1, worker_id: int = 0) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": api.token,
+        "BOT_TOKEN": api.token,
+        "TELEGRAM_API_URL": api.url,
+        "DATA_DIR": str(workdir / "data"),
+        "BACKUP_DIR": str(workdir / "backups"),
+        "HEARTBEAT_FILE": str(workdir / "data" / "heartbeat.txt"),
+        "ZEALY_CSV_PATH": str(workdir / "zealy.csv"),
+        "METRICS_PORT": "0",
+        "ADMIN_CHAT_IDS": "",
+        "GROUP_NOTIFY_CHAT_ID": "0",
+        "WORKERS": str(workers),
+        "WORKER_ID": str(worker_id),
+    })
+    return subprocess.Popen(
+        [sys.executable, "-c", LAUNCHER, str(ROOT), str(TARGETS[target])],
+        cwd=str(workdir), env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+
+def stop_bot(proc: subprocess.Popen) -> None:
+    if proc.poll() is not None:
+        return
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def user_worker(api: FakeBotAPI, target: str, user_id: int, rounds: int, step_timeout: float,
+                samples: Dict[str, List[float]], errors: List[str], lock: threading.Lock,
+                start_gate: threading.Event) -> None:
+    start_gate.wait()
+    for _ in range(rounds):
+        for label, kind, payload, expected in build_flow(target, user_id):
+            seen = api.reply_count(user_id)
+            t0 = api.push_photo(user_id) if kind == "photo" else api.push_message(user_id, payload)
+            replies = api.wait_replies(user_id, seen, expected, timeout=step_timeout)
+            with lock:
+                if len(replies) < expected:
+                    errors.append(f"user {user_id}: timeout on {label} ({len(replies)}/{expected} replies)")
+                    return
+                samples.setdefault(label, []).append(replies[-1][0] - t0)
+
+def run(target: str, users: int, rounds: int, step_timeout: float, startup_timeout: float,
+        keep_logs: bool, workers: int = 1) -> Optional[dict]:
+    api = FakeBotAPI().start()
+    workdir = Path(tempfile.mkdtemp(prefix=f"loadtest_{target}_"))
+    (workdir / "data").mkdir()
+    log_path = workdir / "bot.log"
+    samples: Dict[str, List[float]] = {}
+    errors: List[str] = []
+    lock = threading.Lock()
+    with open(log_path, "wb") as log_file:
+        procs = [start_bot(target, api, workdir, log_file, workers, k) for k in range(workers)]
+        try:
+            if not api.polling_started.wait(startup_timeout):
+                print(f"[ERROR] Bot did not start polling within {startup_timeout:.0f}s (log: {log_path})")
+                return None
+            gate = threading.Event()
+            threads = [
+                threading.Thread(
+                    target=user_worker,
+                    args=(api, target, FIRST_USER_ID + i, rounds, step_timeout, samples, errors, lock, gate),
+                    daemon=True,
+                )
+                for i in range(users)
+            ]
+            for t in threads:
+                t.start()
+            t_start = time.monotonic()
+            gate.set()
+            for t in threads:
+                t.join()
+            elapsed = time.monotonic() - t_start
+        finally:
+            for proc in procs:
+                stop_bot(proc)
+            api.stop()
+    total_updates = sum(len(v) for v in samples.values())
+    result = {
+        "target": target,
+        "workers": workers,
+        "users": users,
+        "rounds": rounds,
+        "elapsed_s": round(elapsed, 3),
+        "updates": total_updates,
+        "updates_per_s": round(total_updates / elapsed, 2) if elapsed else 0.0,
+        "timeouts": len(errors),
+        "steps": summarize(samples),
+        "api_calls": dict(sorted(api.calls.items())),
+        "bot_log": str(log_path),
+    }
+    if errors:
+        result["errors"] = errors[:20]
+    if not keep_logs and not errors:
+        result.pop("bot_log")
+    return result
+
+def print_report(res: dict) -> None:
+    print(f"\n=== {res['target']} ({res['workers']} worker): {res['users']} users x {res['rounds']} rounds ===")
+    print(f"updates: {res['updates']}  elapsed: {res['elapsed_s']}s  throughput: {res['updates_per_s']} updates/s  timeouts: {res['timeouts']}")
+    print(f"{'step':<14}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, st in res["steps"].items():
+        print(f"{label:<14}{st['count']:>8}{st['p50_ms']:>10}{st['p99_ms']:>10}{st['max_ms']:>10}")
+    for e in res.get("errors", []):
+        print(f"[WARN] {e}")
+    if "bot_log" in res:
+        print(f"bot log: {res['bot_log']}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Concurrent registration-flow load test against a fake Bot API.")
+    ap.add_argument("--target", choices=sorted(TARGETS) + ["both"], default="main")
+    ap.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    ap.add_argument("--rounds", type=int, default=1, help="flows per user")
+    ap.add_argument("--workers", type=int, default=1, help="main.py processes (WORKERS), main target only")
+    ap.add_argument("--step-timeout", type=float, default=30.0, help="seconds to wait for each reply")
+    ap.add_argument("--startup-timeout", type=float, default=60.0)
+    ap.add_argument("--keep-logs", action="store_true", help="keep the bot log even on success")
+    ap.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args()
+
+    targets = sorted(TARGETS) if args.target == "both" else [args.target]
+    results = []
+    for target in targets:
+        if target == "variant" and not ETH_AVAILABLE:
+            print("[WARN] eth_account not installed: the variant bot cannot start, skipping.")
+            continue
+        workers = args.workers if target == "main" else 1
+        res = run(target, args.users, args.rounds, args.step_timeout, args.startup_timeout, args.keep_logs, workers)
+        if res is None:
+            sys.exit(1)
+        print_report(res)
+        results.append(res)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\n[OK] Results written to {args.json}")
+    if any(r["timeouts"] for r in results):
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
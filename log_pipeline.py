@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+log_pipeline.py
+
+Asynchronous logging for the bot.
+
+Callers (the event loop included) only build the LogRecord and push it on an
+in-memory queue: no string formatting, no I/O, no locks beyond the queue's.
+A QueueListener thread does the rest in a single pass: format the record,
+replace secrets (the bot token appears in every Bot API URL httpx logs), and
+write it out.
+
+httpx logs one INFO line per request, which with long polling means one per
+getUpdates cycle plus one per reply. Those lines are sampled (1 every N);
+responses with status >= 400 and anything at WARNING or above always pass.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Iterable, List, Optional
+
+REDACTED = "***TOKEN***"
+DEFAULT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+class RedactingFormatter(logging.Formatter):
+    """Formatter that hides secrets in the final text (message, args and tracebacks)."""
+
+    def __init__(self, secrets: Iterable[str] = (), fmt: str = DEFAULT_FORMAT, **kwargs):
+        super().__init__(fmt, **kwargs)
+        self.secrets: List[str] = [s for s in secrets if s]
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        for s in self.secrets:
+            if s in text:
+                text = text.replace(s, REDACTED)
+        return text
+
+class SamplingFilter(logging.Filter):
+    """Let through one INFO-or-lower record every `every`; keep warnings and HTTP errors."""
+
+    def __init__(self, every: int = 20):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        # httpx: "HTTP Request: %s %s \"%s %d %s\"" (method, url, version, status, reason)
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 5 and isinstance(args[3], int) and args[3] >= 400:
+            return True
+        self.seen += 1
+        return self.seen % self.every == 1
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() merges msg/args (and renders tracebacks) in the calling
+    thread. The queue is in-process, so the record can travel as is.
+    """
+
+    pipeline: Optional["LogPipeline"] = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class LogPipeline:
+    """Owns the queue, the listener thread and the redacting formatter."""
+
+    def __init__(self, handler: logging.Handler, formatter: RedactingFormatter):
+        self.queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.queue_handler = DeferredQueueHandler(self.queue)
+        self.queue_handler.pipeline = self
+        self.formatter = formatter
+        self.handler = handler
+        self.listener = logging.handlers.QueueListener(self.queue, handler, respect_handler_level=True)
+        self.running = False
+
+    def add_secret(self, secret: Optional[str]) -> None:
+        if secret and secret not in self.formatter.secrets:
+            self.formatter.secrets.append(secret)
+
+    def start(self) -> None:
+        self.listener.start()
+        self.running = True
+
+    def stop(self) -> None:
+        """Flush pending records and join the listener thread (idempotent)."""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+def setup_logging(secrets: Iterable[str] = (), level: int = logging.INFO, httpx_sample_every: int = 20,
+                  stream=None, fmt: str = DEFAULT_FORMAT) -> LogPipeline:
+    """Route every logger through a single queue + listener and return the pipeline.
+
+    Existing root handlers are replaced, so calling this again (e.g. in tests)
+    does not duplicate output.
+    """
+    formatter = RedactingFormatter(secrets, fmt)
+    out = logging.StreamHandler(stream or sys.stderr)
+    out.setFormatter(formatter)
+    pipeline = LogPipeline(out, formatter)
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+        if isinstance(h, DeferredQueueHandler) and h.pipeline is not None:
+            h.pipeline.stop()
+    root.addHandler(pipeline.queue_handler)
+    root.setLevel(level)
+
+    httpx_logger = logging.getLogger("httpx")
+    for f in httpx_logger.filters[:]:
+        if isinstance(f, SamplingFilter):
+            httpx_logger.removeFilter(f)
+    httpx_logger.addFilter(SamplingFilter(httpx_sample_every))
+
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    return pipeline
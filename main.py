@@ -8,9 +8,16 @@ import zipfile
 import html
 import csv
 import io
+import gzip
+import tempfile
 import logging
+import asyncio
+import cProfile
+import gc
+import pstats
+import tracemalloc
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Iterator
 from datetime import datetime
 from datetime import time as dtime  # for JobQueue daily time
 
@@ -19,164 +26,39 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    CallbackQueryHandler, filters, ContextTypes, PicklePersistence, JobQueue
+    CallbackQueryHandler, filters, ContextTypes, JobQueue
 )
 
 import messages as T
+import metrics
+from log_pipeline import setup_logging
+from proof_index import ProofIndex
+from username_index import TrigramIndex
+from broadcast import SEGMENTS, Broadcaster, select_targets
+from rewards import DEFAULT_BATCH_SIZE, WinnerTable, allocate
+from wallets import BAD_CHECKSUM, check_wallet
+from wallet_index import WalletIndex, describe_owners, submission_owner
+from flow import Event, FlowState, Step
+from throttle import ALLOW, MUTE, WARN, Limit, Throttle, parse_limits, update_kind
+from storage import DB_NAME, Storage, SQLitePersistence, migrate_legacy, read_zealy_csv
+import workers
 
 # -------------------- LOGGING --------------------
-class TokenSafeFormatter(logging.Formatter):
-    """Formatter che nasconde i token nei messaggi di log."""
-    def __init__(self, token, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.token = token
-    
-    def format(self, record):
-        """Formatta il record e nasconde il token."""
-        # Formatta normalmente
-        message = super().format(record)
-        # Sostituisce il token se presente
-        if self.token and self.token in message:
-            message = message.replace(self.token, "***TOKEN***")
-        return message
-
-class TokenSafeHandler(logging.StreamHandler):
-    """Handler che nasconde i token prima di scrivere."""
-    def __init__(self, token, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.token = token
-    
-    def emit(self, record):
-        """Intercetta e modifica il record prima di emetterlo."""
-        if self.token:
-            # Sostituisce il token nel messaggio formattato
-            try:
-                msg = self.format(record)
-                if self.token in msg:
-                    msg = msg.replace(self.token, "***TOKEN***")
-                    # Scrivi direttamente il messaggio modificato
-                    stream = self.stream
-                    stream.write(msg + self.terminator)
-                    self.flush()
-                else:
-                    super().emit(record)
-            except Exception:
-                self.handleError(record)
-        else:
-            super().emit(record)
-
-class TokenFilter(logging.Filter):
-    """Filtro per nascondere i token nei log."""
-    def __init__(self, token):
-        super().__init__()
-        self.token = token
-    
-    def filter(self, record):
-        """Sostituisce il token nelle stringhe di log."""
-        if not self.token:
-            return True
-        
-        # Sostituisce il token in tutti i campi del record
-        if hasattr(record, 'msg'):
-            if isinstance(record.msg, str):
-                record.msg = record.msg.replace(self.token, "***TOKEN***")
-            elif isinstance(record.msg, (tuple, list)):
-                record.msg = tuple(
-                    str(arg).replace(self.token, "***TOKEN***") if isinstance(arg, str) else arg
-                    for arg in record.msg
-                )
-        
-        if hasattr(record, 'args') and record.args:
-            if isinstance(record.args, tuple):
-                record.args = tuple(
-                    str(arg).replace(self.token, "***TOKEN***") if isinstance(arg, str) else arg
-                    for arg in record.args
-                )
-            elif isinstance(record.args, dict):
-                record.args = {
-                    k: str(v).replace(self.token, "***TOKEN***") if isinstance(v, str) else v
-                    for k, v in record.args.items()
-                }
-        
-        return True
-
-# Carica il token temporaneamente per il filtro
+# Formattazione, redazione del token e scrittura avvengono in un thread dedicato
+# (log_pipeline.py): nel loop asyncio resta solo l'accodamento del record.
 load_dotenv()
-_temp_token = os.getenv("TELEGRAM_TOKEN")
-
-# Crea il filtro e il formatter prima di configurare il logging
-token_filter = TokenFilter(_temp_token)
-token_formatter = TokenSafeFormatter(_temp_token, "%(levelname)s:%(name)s:%(message)s")
-
-# Configura il logging con handler e formatter personalizzati
-root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO)
-
-# Rimuovi tutti gli handler esistenti
-for handler in root_logger.handlers[:]:
-    root_logger.removeHandler(handler)
-
-# Aggiungi un nuovo handler personalizzato che intercetta tutto
-console_handler = TokenSafeHandler(_temp_token)
-console_handler.setFormatter(token_formatter)
-root_logger.addHandler(console_handler)
-
+LOG_PIPELINE = setup_logging(
+    secrets=[os.getenv("TELEGRAM_TOKEN", "")],
+    httpx_sample_every=int(os.getenv("HTTPX_LOG_SAMPLE", "20")),  # 1 = logga ogni richiesta
+)
 log = logging.getLogger("savitri-bot")
 
-# Applica anche il filtro a tutti i logger, specialmente httpx e telegram
-logging.getLogger().addFilter(token_filter)
-logging.getLogger("httpx").addFilter(token_filter)
-logging.getLogger("telegram").addFilter(token_filter)
-logging.getLogger("httpcore").addFilter(token_filter)
-
-# Funzione per applicare il formatter/handler personalizzato a tutti gli handler
-def apply_token_protection_to_all_handlers(token_value=None):
-    """Applica protezione token a tutti gli handler esistenti."""
-    if token_value is None:
-        token_value = globals().get('TOKEN', _temp_token)
-    
-    for logger_name in logging.Logger.manager.loggerDict:
-        logger = logging.getLogger(logger_name)
-        for handler in list(logger.handlers):
-            # Se non è già un TokenSafeHandler, sostituiscilo o aggiungi protezione
-            if not isinstance(handler, TokenSafeHandler):
-                # Crea un nuovo handler sicuro con lo stesso stream
-                new_handler = TokenSafeHandler(token_value, stream=handler.stream)
-                new_handler.setFormatter(token_formatter)
-                new_handler.setLevel(handler.level)
-                logger.removeHandler(handler)
-                logger.addHandler(new_handler)
-            elif isinstance(handler, TokenSafeHandler):
-                # Aggiorna il token se necessario
-                handler.token = token_value
-                handler.setFormatter(token_formatter)
-    
-    # Applica anche al root logger
-    for handler in list(root_logger.handlers):
-        if not isinstance(handler, TokenSafeHandler):
-            new_handler = TokenSafeHandler(token_value, stream=handler.stream)
-            new_handler.setFormatter(token_formatter)
-            new_handler.setLevel(handler.level)
-            root_logger.removeHandler(handler)
-            root_logger.addHandler(new_handler)
-        elif isinstance(handler, TokenSafeHandler):
-            handler.token = token_value
-            handler.setFormatter(token_formatter)
-
 # -------------------- ENV --------------------
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 if not TOKEN:
     print("ERROR: TELEGRAM_TOKEN is not set in environment.")
     sys.exit(1)
 
-# Aggiorna il filtro, il formatter e l'handler con il token finale
-token_filter.token = TOKEN
-token_formatter.token = TOKEN
-console_handler.token = TOKEN
-
-# Applica la protezione a tutti gli handler esistenti (in caso ne siano stati creati altri)
-apply_token_protection_to_all_handlers(TOKEN)
-
 ADMIN_CHAT_IDS = [int(x.strip()) for x in os.getenv("ADMIN_CHAT_IDS", "").split(",") if x.strip()]
 DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
 BACKUP_DIR = Path(os.getenv("BACKUP_DIR", "backups"))
@@ -184,59 +66,95 @@ BACKUP_TIME = os.getenv("BACKUP_TIME", "03:00")  # HH:MM container time
 HEARTBEAT_FILE = Path(os.getenv("HEARTBEAT_FILE", "data/heartbeat.txt"))
 WATCHDOG_MAX_FAILS = int(os.getenv("WATCHDOG_MAX_FAILS", "6"))
 WATCHDOG_INTERVAL = int(os.getenv("WATCHDOG_INTERVAL", "30"))
-WALLET_REQUESTS_FILE = DATA_DIR / "wallet_update_requests.json"
+WALLET_REQUESTS_FILE = DATA_DIR / "wallet_update_requests.json"  # legacy: importato in bot.db
 ZEALY_CSV_PATH = os.getenv("ZEALY_CSV_PATH", "zealy_with_wvc.csv")
+ZEALY_REJECTED_REPORT = DATA_DIR / "zealy_rejected_wallets.csv"  # wallet scartati dall'ultimo import
 DEADLINE_TEXT = os.getenv("DEADLINE_TEXT", "30-11-2025")
 GROUP_NOTIFY_CHAT_ID = int(os.getenv("GROUP_NOTIFY_CHAT_ID", "0")) or None
-SUBMISSIONS_FILE = DATA_DIR / "user_submissions.json"
+ADMIN_LIST_PAGE_SIZE = int(os.getenv("ADMIN_LIST_PAGE_SIZE", "10"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 = disabilitato
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))      # secondi tra due campioni di lag
+LOOP_STALL_SECONDS = float(os.getenv("LOOP_STALL_SECONDS", "1.0"))     # loop fermo oltre questa soglia -> stack nel log
+SLOW_HANDLER_SECONDS = float(os.getenv("SLOW_HANDLER_SECONDS", "2.0"))  # 0 = disabilitato
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))      # TTL dei check di /readyz
+HEALTH_MAX_UPDATE_QUEUE = int(os.getenv("HEALTH_MAX_UPDATE_QUEUE", "100"))  # update in attesa oltre i quali non si è pronti
+HEALTH_MAX_INFLIGHT = int(os.getenv("HEALTH_MAX_INFLIGHT", "200"))          # chiamate Bot API in corso (pool: 256)
+# Bot API alternativa (es. loadtest/fake_bot_api.py o un telegram-bot-api locale); vuoto = api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+SUBMISSIONS_FILE = DATA_DIR / "user_submissions.json"  # legacy: importato in bot.db
+DB_PATH = DATA_DIR / DB_NAME
+PROOFS_DIR = DATA_DIR / "proofs"
+PROOF_SIMILARITY_MAX_DISTANCE = int(os.getenv("PROOF_SIMILARITY_MAX_DISTANCE", "6"))  # bit su 64
+USERNAME_SUGGESTIONS = int(os.getenv("USERNAME_SUGGESTIONS", "3"))                 # 0 = niente "did you mean"
+USERNAME_MIN_SIMILARITY = float(os.getenv("USERNAME_MIN_SIMILARITY", "0.4"))       # Jaccard sui trigrammi
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))                          # messaggi/s (limite Telegram ~30)
+# Più processi sullo stesso bot.db (workers.py): entrypoint.sh avvia WORKER_ID 0..WORKERS-1
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+WORKER_SYNC_INTERVAL = float(os.getenv("WORKER_SYNC_INTERVAL", "30"))  # secondi tra due riallineamenti degli indici
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))          # update/s per utente, 0 = anti-flood disabilitato
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "8"))        # update consecutivi ammessi prima del limite
+THROTTLE_KINDS = os.getenv("THROTTLE_KINDS",                    # limiti per comando/tipo: tipo=rate/burst
+                           "status=0.2/3,proof=0.1/3,photo=0.1/5,document=0.1/3,text=0.5/5,callback=1/6")
+THROTTLE_HARD_STRIKES = int(os.getenv("THROTTLE_HARD_STRIKES", "20"))  # rifiuti entro THROTTLE_HARD_WINDOW...
+THROTTLE_HARD_WINDOW = float(os.getenv("THROTTLE_HARD_WINDOW", "60"))
+THROTTLE_MUTE_SECONDS = float(os.getenv("THROTTLE_MUTE_SECONDS", "300"))  # ...e l'utente viene ignorato per N secondi
+if METRICS_PORT and WORKERS > 1:
+    METRICS_PORT += WORKER_ID  # un endpoint per worker: 9100, 9101, ...
 
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 BACKUP_DIR.mkdir(exist_ok=True, parents=True)
 
+# Oggetti di runtime (server, monitor, profiling in corso): NON in bot_data, che la persistence serializza
+RUNTIME: Dict[str, Any] = {}
+
 # -------------------- UTILS / STORAGE --------------------
-WALLET_REGEX = re.compile(r"^0x[a-fA-F0-9]{40}$")
+def wallet_error_text(reason: Optional[str]) -> str:
+    return T.msg_wallet_checksum_error() if reason == BAD_CHECKSUM else T.msg_wallet_format_error()
 
 def _now_str() -> str:
     return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
 
-def load_requests() -> List[dict]:
-    if WALLET_REQUESTS_FILE.exists():
-        try:
-            data = json.loads(WALLET_REQUESTS_FILE.read_text(encoding="utf-8"))
-            if isinstance(data, list):
-                return data
-        except Exception as e:
-            log.warning("Failed to read requests file: %s", e)
-    return []
-
-def save_requests(items: List[dict]) -> None:
-    WALLET_REQUESTS_FILE.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
-
-def next_request_id(items: List[dict]) -> int:
-    if not items:
-        return 1
-    return max((r.get("id", 0) for r in items), default=0) + 1
-
-def get_request_by_id(items: List[dict], rid: int) -> Optional[dict]:
-    for r in items:
-        if r.get("id") == rid:
-            return r
-    return None
+# Richieste, submission, indice Zealy e stato PTB in SQLite (storage.py); i file
+# JSON/pickle della versione precedente vengono importati una volta sola.
+STORE = Storage(DB_PATH)
+try:
+    _migrated = migrate_legacy(STORE, DATA_DIR, Path(ZEALY_CSV_PATH))
+    if _migrated:
+        log.info("Legacy JSON/pickle/CSV imported into %s: %s", DB_PATH, _migrated)
+except Exception as e:
+    log.error("Legacy migration failed (run `python storage.py migrate --force`): %s", e)
+workers.ensure_schema(STORE)
 
 def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_CHAT_IDS
 
+def is_leader() -> bool:
+    """Vero per il processo che ha il lease del leader (con WORKERS=1 l'unico, appena avviato)."""
+    worker = RUNTIME.get("worker")
+    return worker is None or worker.is_leader
+
+def is_replay(update: Update) -> bool:
+    """L'update era già in gestione quando il processo si è fermato (workers.py): notifiche
+    e richieste potrebbero essere già partite, i dati già salvati."""
+    worker = RUNTIME.get("worker")
+    return worker is not None and worker.is_replay(update.update_id)
+
 # Submissions storage (per tg_id)
+@metrics.timed("load_submissions")
 def load_submissions() -> dict:
-    if SUBMISSIONS_FILE.exists():
-        try:
-            return json.loads(SUBMISSIONS_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
+    """Tutte le submission {tg_id: record}: solo per export e backup, i comandi usano update_submission."""
+    return STORE.all_submissions()
 
+@metrics.timed("save_submissions")
 def save_submissions(data: dict) -> None:
-    SUBMISSIONS_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    STORE.replace_submissions(data)
+
+@metrics.timed("update_submission")
+def update_submission(user, username: Optional[str], append: Optional[dict] = None, **fields) -> dict:
+    """Aggiorna (o crea) il record di un solo utente in una transazione."""
+    return STORE.update_submission(str(user.id), {"tg_id": user.id}, append=append, username=username, **fields)
 
 def heartbeat_touch():
     try:
@@ -265,6 +183,8 @@ async def notify_group(context: ContextTypes.DEFAULT_TYPE, text: str):
 
 # -------------------- ZEALY/WVC INDEX FROM CSV --------------------
 ZEALY_INDEX: Dict[str, Dict[str, Any]] = {}
+# Trigrammi degli username Zealy, ricostruito insieme a ZEALY_INDEX (username_index.py)
+USERNAME_INDEX = TrigramIndex(USERNAME_MIN_SIMILARITY)
 
 def _discover_latest_zealy_csv() -> Path:
     # Prefer explicit path; if not found, try latest import_* file under DATA_DIR
@@ -276,68 +196,121 @@ def _discover_latest_zealy_csv() -> Path:
         return candidates[0]
     return p  # fallback (may not exist)
 
+def _zealy_csv_signature(path: Path) -> Optional[str]:
+    """Percorso, dimensione e mtime del CSV: se non cambiano, all'avvio basta l'indice in bot.db."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return f"{path.resolve()}:{st.st_size}:{st.st_mtime_ns}"
+
+@metrics.timed("load_zealy_index")
 def load_zealy_index() -> tuple[bool, str, int]:
     """
     Carica l'indice Zealy dal CSV più recente.
+    Gli indici nuovi vengono costruiti a parte e sostituiti alla fine: gli handler la
+    chiamano con asyncio.to_thread (validazione dei wallet di tutto il CSV) e intanto
+    continuano a usare l'indice precedente, che resta anche se il CSV non è valido.
     Returns: (success, message, user_count)
     """
-    global ZEALY_INDEX
-    ZEALY_INDEX = {}
+    global ZEALY_INDEX, USERNAME_INDEX
     csv_path = _discover_latest_zealy_csv()
     if not csv_path.exists():
         msg = f"CSV non trovato: {csv_path}"
         log.warning(msg)
         return False, msg, 0
+    rejected: List[dict] = []
     try:
-        # CSV appears to be semicolon-delimited
-        with csv_path.open("r", encoding="utf-8", newline="") as f:
-            reader = csv.DictReader(f, delimiter=';')
-            if not reader.fieldnames:
-                msg = "Il CSV non contiene intestazioni (header)"
-                log.error(msg)
-                return False, msg, 0
-            # Normalize header names
-            headers = {h.lower().strip(): h for h in reader.fieldnames}
-            pos_key = headers.get("position on leadborad") or headers.get("position on leaderboard") or headers.get("position")
-            xp_key = headers.get("xp") or headers.get("xp on zealy") or headers.get("zealy xp")
-            user_key = headers.get("username")
-            wallet_key = headers.get("binance smart chain address") or headers.get("bsc address") or headers.get("wallet")
-            wvc_key = headers.get("wvc")
-            
-            if not user_key:
-                msg = "Colonna 'username' non trovata nel CSV"
-                log.error(msg)
-                return False, msg, 0
-            
-            rows_processed = 0
-            for row in reader:
-                username = (row.get(user_key) or "").strip() if user_key else ""
-                if not username:
-                    continue
-                key = username.lower()
-                rank = (row.get(pos_key) or "").strip() if pos_key else ""
-                xp = (row.get(xp_key) or "").strip() if xp_key else ""
-                wallet = (row.get(wallet_key) or "").strip() if wallet_key else ""
-                wvc = (row.get(wvc_key) or "").strip() if wvc_key else ""
-                ZEALY_INDEX[key] = {
-                    "rank": rank or None,
-                    "xp": xp or None,
-                    "wallet": wallet or None,
-                    "wvc": wvc or None,
-                    "wvc_used": None,  # unknown from CSV
-                }
-                rows_processed += 1
-            
-            log.info("Loaded Zealy index from %s: %d users", csv_path, len(ZEALY_INDEX))
-            return True, f"CSV caricato da: {csv_path.name}", len(ZEALY_INDEX)
-    except UnicodeDecodeError as e:
+        index = read_zealy_csv(csv_path, rejected)
+    except UnicodeDecodeError as e:  # prima di ValueError, di cui è sottoclasse
         msg = f"Errore di codifica del file CSV: {e}"
         log.error(msg)
         return False, msg, 0
+    except ValueError as e:
+        msg = str(e)
+        log.error(msg)
+        return False, msg, 0
     except Exception as e:
         msg = f"Errore durante il caricamento del CSV: {e}"
         log.error(msg)
         return False, msg, 0
+    username_index = TrigramIndex(USERNAME_MIN_SIMILARITY)
+    username_index.build(index)
+    ZEALY_INDEX, USERNAME_INDEX = index, username_index
+    rebuild_wallet_index()
+    try:
+        STORE.replace_zealy(index)
+        # gli altri worker ricaricano l'indice quando questo valore cambia (sync_worker_state)
+        RUNTIME["zealy_gen"] = _now_str() + f" w{WORKER_ID}"
+        STORE.set_meta("zealy_loaded_at", RUNTIME["zealy_gen"])
+        STORE.set_meta("zealy_csv_sig", _zealy_csv_signature(csv_path) or "")
+    except Exception as e:
+        log.warning("Zealy index not saved to %s: %s", DB_PATH, e)
+    log.info("Loaded Zealy index from %s: %d users", csv_path, len(ZEALY_INDEX))
+    msg = f"CSV caricato da: {csv_path.name}"
+    ZEALY_REJECTED_REPORT.unlink(missing_ok=True)
+    if rejected:
+        with ZEALY_REJECTED_REPORT.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["line", "username", "wallet", "reason"])
+            writer.writeheader()
+            writer.writerows(rejected)
+        log.warning("Zealy import: %d wallets rejected, report in %s", len(rejected), ZEALY_REJECTED_REPORT)
+        msg += f"\n⚠️ {len(rejected)} wallet scartati (formato o checksum EIP-55): report in `{ZEALY_REJECTED_REPORT.name}`"
+    return True, msg, len(ZEALY_INDEX)
+
+# -------------------- WALLET REVERSE INDEX --------------------
+# wallet -> username da CSV, /set_wallet e /new_wallet (wallet_index.py)
+WALLET_INDEX = WalletIndex()
+
+def rebuild_wallet_index() -> None:
+    global WALLET_INDEX
+    index = WalletIndex()
+    index.build(ZEALY_INDEX, load_submissions())
+    WALLET_INDEX = index
+    log.info("Wallet index: %d wallets, %d shared by more than one user", len(index), len(index.duplicates()))
+
+async def check_duplicate_wallet(context: ContextTypes.DEFAULT_TYPE, user, rec: dict, source: str, wallet: str):
+    """Index the wallet just submitted and alert the admins if other usernames already use it."""
+    others = WALLET_INDEX.set(submission_owner(rec), source, wallet)
+    if not others:
+        return
+    owners = WALLET_INDEX.lookup(wallet)
+    log.warning("Duplicate wallet %s (%s) from tg_id %s: %s", wallet, source, user.id, sorted(owners))
+    uname = f"@{user.username}" if user.username else user.full_name
+    text = "\n".join([
+        "<b>⚠️ Wallet già usato da altri utenti</b>",
+        "",
+        f"• User: {html.escape(uname)} (id: {user.id}, Zealy: {html.escape(submission_owner(rec))})",
+        f"• Wallet ({source}): <code>{html.escape(wallet)}</code>",
+        f"• Utenti sul wallet: {html.escape(describe_owners(owners))}",
+    ])
+    for admin_id in ADMIN_CHAT_IDS:
+        try:
+            await context.bot.send_message(chat_id=admin_id, text=text, parse_mode=ParseMode.HTML)
+        except Exception as e:
+            log.warning("Failed to notify admin %s: %s", admin_id, e)
+
+# -------------------- PROOF SIMILARITY INDEX --------------------
+PROOF_INDEX = ProofIndex(PROOFS_DIR, DATA_DIR / "proof_hashes.json", max_distance=PROOF_SIMILARITY_MAX_DISTANCE)
+
+async def notify_similar_proof(context: ContextTypes.DEFAULT_TYPE, user, file_name: str, matches: List[dict]):
+    """Flag a freshly ingested proof that looks like another user's screenshot."""
+    uname = f"@{user.username}" if user.username else user.full_name
+    lines = [
+        "<b>⚠️ Proof simile a screenshot di altri utenti</b>",
+        "",
+        f"• User: {html.escape(uname)} (id: {user.id})",
+        f"• File: <code>{html.escape(file_name)}</code>",
+        "",
+    ]
+    for m in matches[:10]:
+        lines.append(f"  ↳ <code>{html.escape(m['file'])}</code> (tg_id {m['tg_id']}, distanza {m['distance']})")
+    text = "\n".join(lines)
+    for admin_id in ADMIN_CHAT_IDS:
+        try:
+            await context.bot.send_message(chat_id=admin_id, text=text, parse_mode=ParseMode.HTML)
+        except Exception as e:
+            log.warning("Failed to notify admin %s: %s", admin_id, e)
 
 # -------------------- NOTIFY ADMINS --------------------
 async def notify_admins(app,
@@ -361,11 +334,17 @@ async def notify_admins(app,
          InlineKeyboardButton("❌ Reject",  callback_data=f"req:reject:{req_id}")],
         [InlineKeyboardButton("📄 Details", callback_data=f"req:details:{req_id}")]
     ])
+    sent = []
     for admin_id in ADMIN_CHAT_IDS:
         try:
-            await app.bot.send_message(chat_id=admin_id, text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
+            m = await app.bot.send_message(chat_id=admin_id, text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
+            sent.append((admin_id, m.message_id))
         except Exception as e:
             log.warning("Failed to notify admin %s: %s", admin_id, e)
+    # Remember where the buttons live so bulk moderation can close them later
+    # (in bot.db, not bot_data: the decision may come through another worker)
+    if sent:
+        STORE.add_admin_messages(req_id, sent)
 
 # -------------------- COMMAND HANDLERS (USER) --------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -389,10 +368,37 @@ async def set_username_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not re.fullmatch(r"[A-Za-z0-9_]{2,32}", username):
         await update.message.reply_text(T.msg_username_format_error(), parse_mode=None)
         return
-    # Persist in user_data (PicklePersistence enabled)
+    # Not in the winners list but close to some names: let the user pick with one tap
+    if USERNAME_SUGGESTIONS and ZEALY_INDEX and username.lower() not in ZEALY_INDEX:
+        matches = USERNAME_INDEX.suggest(username, limit=USERNAME_SUGGESTIONS)
+        if matches:
+            context.user_data["username_choices"] = [username] + [m for m, _ in matches]
+            rows = [[InlineKeyboardButton(f"✅ {m}", callback_data=f"uname:{i}")] for i, (m, _) in enumerate(matches, 1)]
+            rows.append([InlineKeyboardButton(T.btn_username_keep(username), callback_data="uname:0")])
+            await update.message.reply_text(T.msg_username_suggestions(username), parse_mode=ParseMode.MARKDOWN,
+                                            reply_markup=InlineKeyboardMarkup(rows))
+            return
+    # Persist in user_data (SQLitePersistence, storage.py)
     context.user_data["zealy_username"] = username
+    context.user_data.pop("username_choices", None)
     await update.message.reply_text(T.msg_username_saved(username), parse_mode=ParseMode.MARKDOWN)
 
+async def username_choice_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tap on a "did you mean" button: uname:0 keeps the typed name, uname:N picks suggestion N."""
+    q = update.callback_query
+    choices = context.user_data.pop("username_choices", None)
+    idx = int(q.data.split(":", 1)[1])
+    if not choices or idx >= len(choices):
+        await q.answer("Expired, send /set_username again.", show_alert=True)
+        return
+    username = choices[idx]
+    context.user_data["zealy_username"] = username
+    await q.answer()
+    try:
+        await q.edit_message_text(T.msg_username_saved(username), parse_mode=ParseMode.MARKDOWN)
+    except Exception:
+        await q.message.reply_text(T.msg_username_saved(username), parse_mode=ParseMode.MARKDOWN)
+
 async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Show basic contest status for the user
     username = context.user_data.get("zealy_username")
@@ -405,24 +411,18 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         rank = entry.get("rank")
         xp = entry.get("xp")
         wallet = entry.get("wallet")
-        wvc = entry.get("wvc")
         wvc_used = entry.get("wvc_used")
-        msg = T.msg_status(username, rank, xp, wallet, DEADLINE_TEXT, wvc, wvc_used)
+        # l'indice conserva solo l'hash del WVC, il codice in chiaro non è disponibile
+        msg = T.msg_status(username, rank, xp, wallet, DEADLINE_TEXT, None, wvc_used)
         await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
         return
     # Fallback: last submitted/approved wallet from local requests file
     wallet = None
     try:
-        items = load_requests()
         uid = update.effective_user.id
-        user_items = [r for r in items if r.get("user_id") == uid]
-        approved = [r for r in user_items if r.get("status") == "approved"]
-        if approved:
-            approved.sort(key=lambda r: r.get("id", 0), reverse=True)
-            wallet = approved[0].get("wallet")
-        elif user_items:
-            user_items.sort(key=lambda r: r.get("id", 0), reverse=True)
-            wallet = user_items[0].get("wallet")
+        r = STORE.latest_request(uid, "approved") or STORE.latest_request(uid)
+        if r:
+            wallet = r.get("wallet")
     except Exception:
         pass
     msg = T.msg_status(username, None, None, wallet, DEADLINE_TEXT, None, None)
@@ -432,180 +432,173 @@ async def ask_wallet_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     await q.message.reply_text(T.ASK_WALLET, parse_mode=None)
-    context.user_data["awaiting_wallet"] = True
+    st = FlowState.load(context.user_data)
+    st.awaiting_wallet = True
+    st.save(context.user_data)
 
 async def update_wallet_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if not args:
-        context.user_data["awaiting_wallet"] = True
+        st = FlowState.load(context.user_data)
+        st.awaiting_wallet = True
+        st.save(context.user_data)
         await update.message.reply_text(T.ASK_WALLET, parse_mode=None)
         return
     wallet = args[0].strip()
     await handle_wallet_submission(update, context, wallet)
 
 async def text_collector(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get("awaiting_wallet") and update.message:
+    if update.message and FlowState.load(context.user_data).awaiting_wallet:
         wallet = update.message.text.strip()
         await handle_wallet_submission(update, context, wallet)
 
 # -------------------- USER WALLET FLOWS (REGISTRATION/CHANGE) --------------------
+# Stato del flusso in user_data["fsm"] (flow.py); i comandi fuori sequenza ricevono il passo atteso
+STEP_HINTS = {
+    (Step.REGISTER, Event.REG_SIG): "Send your wallet first: `/set_wallet 0x...`",
+    (Step.CHANGE, Event.NEW_WALLET): "Send the old wallet signature first: `/old_sig 0x...`",
+    (Step.CHANGE, Event.NEW_SIG): "Send `/new_wallet 0x...` first.",
+    (Step.CHG_WALLET, Event.NEW_SIG): "Send `/new_wallet 0x...` first.",
+}
+DEFAULT_STEP_HINT = "Use /change_wallet first."
+
+async def reject_step(update: Update, st: FlowState, event: Event):
+    if st.flow == "change" and event == Event.SET_WALLET:
+        hint = "You are changing your wallet: send it with `/new_wallet 0x...`"
+    else:
+        hint = STEP_HINTS.get((st.step, event), DEFAULT_STEP_HINT)
+    await update.message.reply_text(T.msg_command_usage(hint), parse_mode=ParseMode.MARKDOWN)
+
+async def require_proof(update: Update, context: ContextTypes.DEFAULT_TYPE, st: FlowState,
+                        resume: Optional[Event] = None) -> bool:
+    """True se lo screenshot è già arrivato; altrimenti lo chiede (e riprende `resume` alla ricezione)."""
+    if st.proof_done:
+        return True
+    st.awaiting_proof = True
+    if resume is not None:
+        st.pending = resume
+    st.save(context.user_data)
+    await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    return False
+
+async def send_flow_guide(message, username: str, st: FlowState):
+    if st.step == Step.CHANGE:
+        text = T.msg_change_wallet_guide(username, st.old_wallet, DEADLINE_TEXT, False)
+    else:
+        text = T.msg_add_wallet_guide(username, DEADLINE_TEXT, False)
+    await message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+
 async def change_wallet_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username = context.user_data.get("zealy_username")
+    ud = context.user_data
+    username = ud.get("zealy_username")
     if not username:
         await update.message.reply_text(T.msg_start_request_username(), parse_mode=ParseMode.MARKDOWN)
         return
-    # Require proof first
-    if not context.user_data.get("proof_done"):
-        context.user_data["awaiting_proof"] = True
-        context.user_data["post_proof_action"] = "change_wallet"
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    st = FlowState.load(ud)
+    if not await require_proof(update, context, st, resume=Event.CHANGE_WALLET):
         return
+    # Cambio se il CSV ha già un wallet, altrimenti registrazione
     entry = ZEALY_INDEX.get(username.lower())
-    old_wallet = (entry or {}).get("wallet")
-    # Reset flow state
-    ud = context.user_data
-    ud.pop("flow", None)
-    ud.pop("old_wallet", None)
-    ud.pop("new_wallet", None)
-    ud.pop("reg_wallet", None)
-    ud.pop("reg_sig", None)
-    ud.pop("old_sig", None)
-    ud.pop("new_sig", None)
-    ud.pop("proof_done", None)
-    if old_wallet:
-        ud["flow"] = "change"
-        ud["old_wallet"] = old_wallet
-        await update.message.reply_text(
-            T.msg_change_wallet_guide(username, old_wallet, DEADLINE_TEXT, False),
-            parse_mode=ParseMode.MARKDOWN
-        )
-    else:
-        ud["flow"] = "register"
-        await update.message.reply_text(
-            T.msg_add_wallet_guide(username, DEADLINE_TEXT, False),
-            parse_mode=ParseMode.MARKDOWN
-        )
+    st.start((entry or {}).get("wallet"))
+    st.proof_done = False  # un nuovo flusso chiede un nuovo screenshot prima delle firme
+    st.save(ud)
+    await send_flow_guide(update.message, username, st)
 
 async def add_wallet_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Force registration flow regardless of CSV old wallet presence."""
-    username = context.user_data.get("zealy_username")
+    ud = context.user_data
+    username = ud.get("zealy_username")
     if not username:
         await update.message.reply_text(T.msg_start_request_username(), parse_mode=ParseMode.MARKDOWN)
         return
-    if not context.user_data.get("proof_done"):
-        context.user_data["awaiting_proof"] = True
-        context.user_data["post_proof_action"] = "add_wallet"
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    st = FlowState.load(ud)
+    if not await require_proof(update, context, st, resume=Event.ADD_WALLET):
         return
-    # Start registration guide
-    ud = context.user_data
-    ud["flow"] = "register"
-    ud.pop("old_wallet", None)
-    ud.pop("new_wallet", None)
-    ud.pop("reg_wallet", None)
-    ud.pop("reg_sig", None)
-    ud.pop("old_sig", None)
-    ud.pop("new_sig", None)
-    await update.message.reply_text(
-        T.msg_add_wallet_guide(username, DEADLINE_TEXT, False),
-        parse_mode=ParseMode.MARKDOWN
-    )
+    st.start(None)
+    st.save(ud)
+    await send_flow_guide(update.message, username, st)
 
 async def proof_collector(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Accept photo uploads as proof when in flow
     if not update.message or not update.message.photo:
         return
     ud = context.user_data
-    if ud.get("flow") not in {"register", "change"} and not ud.get("awaiting_proof"):
+    st = FlowState.load(ud)
+    if st.step == Step.IDLE and not st.awaiting_proof:
         return
     try:
         photo_sizes = update.message.photo
         best = photo_sizes[-1]
-        ts = int(time.time())
-        proofs_dir = DATA_DIR / "proofs"
-        proofs_dir.mkdir(parents=True, exist_ok=True)
-        target = proofs_dir / f"{update.effective_user.id}_{ts}.jpg"
+        ts = int(update.message.date.timestamp())  # dall'update, non dall'orologio: stesso file se rigestito
+        PROOFS_DIR.mkdir(parents=True, exist_ok=True)
+        target = PROOFS_DIR / f"{update.effective_user.id}_{ts}.jpg"
         file = await best.get_file()
         await file.download_to_drive(custom_path=str(target))
-        context.user_data["proof_done"] = True
-        context.user_data.pop("awaiting_proof", None)
+        # Proof ricevuto; se era stato chiesto da /change_wallet o /add_wallet il flusso parte ora
+        username = ud.get("zealy_username")
+        pending = st.pending
+        st.proof_done, st.awaiting_proof, st.pending = True, False, None
+        if pending == Event.CHANGE_WALLET and username:
+            st.start((ZEALY_INDEX.get(username.lower()) or {}).get("wallet"))
+        elif pending == Event.ADD_WALLET and username:
+            st.start(None)
+        else:
+            pending = None
+        st.save(ud)
         await update.message.reply_text(T.msg_proof_ok(), parse_mode=ParseMode.MARKDOWN)
         # Persist proof file under submissions
-        subs = load_submissions()
-        sid = str(update.effective_user.id)
-        rec = subs.get(sid) or {"tg_id": update.effective_user.id}
-        rec["username"] = context.user_data.get("zealy_username")
-        proofs = rec.get("proofs") or []
-        proofs.append(str(target))
-        rec["proofs"] = proofs
-        subs[sid] = rec
-        save_submissions(subs)
+        update_submission(update.effective_user, username, append={"proofs": str(target)})
+        # Perceptual duplicate check against other users' proofs (decodifica fuori dal loop)
+        try:
+            similar = await asyncio.to_thread(PROOF_INDEX.add_file, target)
+        except Exception as e:
+            log.warning("Proof hash failed for %s: %s", target.name, e)
+            similar = []
+        if similar:
+            await notify_similar_proof(context, update.effective_user, target.name, similar)
         # Group notice
         u = update.effective_user
         uname = f"@{u.username}" if u.username else u.full_name
-        await notify_group(context, f"📸 Proof received from {uname}")
-        # If there is a pending action (e.g., change_wallet or add_wallet), proceed with the appropriate guide now
-        pending = context.user_data.pop("post_proof_action", None)
-        username = context.user_data.get("zealy_username")
-        if pending and username:
-            if pending == "change_wallet":
-                entry = ZEALY_INDEX.get(username.lower())
-                old_wallet = (entry or {}).get("wallet")
-                if old_wallet:
-                    context.user_data["flow"] = "change"
-                    context.user_data["old_wallet"] = old_wallet
-                    await update.message.reply_text(
-                        T.msg_change_wallet_guide(username, old_wallet, DEADLINE_TEXT, False),
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    context.user_data["flow"] = "register"
-                    await update.message.reply_text(
-                        T.msg_add_wallet_guide(username, DEADLINE_TEXT, False),
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-            elif pending == "add_wallet":
-                context.user_data["flow"] = "register"
-                await update.message.reply_text(
-                    T.msg_add_wallet_guide(username, DEADLINE_TEXT, False),
-                    parse_mode=ParseMode.MARKDOWN
-                )
+        if not is_replay(update):
+            await notify_group(context, f"📸 Proof received from {uname}")
+        if pending:
+            await send_flow_guide(update.message, username, st)
     except Exception:
         await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
 
 async def proof_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Prompt user to send a screenshot as photo (not file)
-    ud = context.user_data
-    ud["awaiting_proof"] = True
+    st = FlowState.load(context.user_data)
+    st.awaiting_proof = True
+    st.save(context.user_data)
     await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
 
 async def set_wallet_cmd2(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # For registration flow: /set_wallet 0x...
-    username = context.user_data.get("zealy_username")
+    ud = context.user_data
+    username = ud.get("zealy_username")
     if not username:
         await update.message.reply_text(T.msg_start_request_username(), parse_mode=ParseMode.MARKDOWN)
         return
-    if not context.user_data.get("proof_done"):
-        context.user_data["awaiting_proof"] = True
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    st = FlowState.load(ud)
+    if not st.allows(Event.SET_WALLET):
+        await reject_step(update, st, Event.SET_WALLET)
+        return
+    if not await require_proof(update, context, st):
         return
     args = context.args
     if not args:
         await update.message.reply_text(T.msg_wallet_format_error(), parse_mode=ParseMode.MARKDOWN)
         return
-    wallet = args[0].strip()
-    if not WALLET_REGEX.match(wallet):
-        await update.message.reply_text(T.msg_wallet_format_error(), parse_mode=ParseMode.MARKDOWN)
+    wallet, reason = check_wallet(args[0])
+    if wallet is None:
+        await update.message.reply_text(wallet_error_text(reason), parse_mode=ParseMode.MARKDOWN)
         return
-    context.user_data["reg_wallet"] = wallet
+    st.advance(Event.SET_WALLET, wallet)
+    st.save(ud)
     # Persist registration wallet
-    subs = load_submissions()
-    sid = str(update.effective_user.id)
-    rec = subs.get(sid) or {"tg_id": update.effective_user.id}
-    rec["username"] = context.user_data.get("zealy_username")
-    rec["reg_wallet"] = wallet
-    subs[sid] = rec
-    save_submissions(subs)
+    rec = update_submission(update.effective_user, username, reg_wallet=wallet)
+    await check_duplicate_wallet(context, update.effective_user, rec, "reg_wallet", wallet)
     await update.message.reply_text(T.msg_set_wallet_ok(wallet, username), parse_mode=ParseMode.MARKDOWN)
     # Group notice
     u = update.effective_user
@@ -614,34 +607,27 @@ async def set_wallet_cmd2(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def reg_sig_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Final step of registration: /reg_sig 0x...
-    username = context.user_data.get("zealy_username")
     ud = context.user_data
-    if ud.get("flow") != "register" or not username:
-        await update.message.reply_text(T.msg_command_usage("Use /change_wallet first."), parse_mode=ParseMode.MARKDOWN)
+    username = ud.get("zealy_username")
+    st = FlowState.load(ud)
+    if not username or not st.allows(Event.REG_SIG):
+        await reject_step(update, st, Event.REG_SIG)
         return
-    if not ud.get("proof_done"):
-        ud["awaiting_proof"] = True
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    if not await require_proof(update, context, st):
         return
     args = context.args
     if not args:
         await update.message.reply_text(T.msg_command_usage("Usage: `/reg_sig 0x...`"), parse_mode=ParseMode.MARKDOWN)
         return
     sig_hash = args[0].strip()
-    reg_wallet = ud.get("reg_wallet")
-    if not reg_wallet:
-        await update.message.reply_text(T.msg_command_usage("Send your wallet first: `/set_wallet 0x...`"), parse_mode=ParseMode.MARKDOWN)
-        return
-    ud["reg_sig"] = sig_hash
+    reg_wallet = st.wallet
+    st.advance(Event.REG_SIG)
+    st.save(ud)
     # Persist reg signature
-    subs = load_submissions()
-    sid = str(update.effective_user.id)
-    rec = subs.get(sid) or {"tg_id": update.effective_user.id}
-    rec["username"] = context.user_data.get("zealy_username")
-    rec["reg_sig"] = sig_hash
-    subs[sid] = rec
-    save_submissions(subs)
+    update_submission(update.effective_user, username, reg_sig=sig_hash)
     await update.message.reply_text(T.msg_reg_sig_ok(reg_wallet, sig_hash), parse_mode=ParseMode.MARKDOWN)
+    if is_replay(update):
+        return  # firma salvata di nuovo (stesso valore); admin e gruppo già avvisati
     # Notify admins
     try:
         txt = T.admin_notify_registration(username, update.effective_user.id, reg_wallet, sig_hash, sig_hash)
@@ -655,28 +641,22 @@ async def reg_sig_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await notify_group(context, f"✅ Registration signature confirmed for {uname}: `{reg_wallet}`")
 
 async def old_sig_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username = context.user_data.get("zealy_username")
     ud = context.user_data
-    if ud.get("flow") != "change" or not username:
-        await update.message.reply_text(T.msg_command_usage("Use /change_wallet first."), parse_mode=ParseMode.MARKDOWN)
+    username = ud.get("zealy_username")
+    st = FlowState.load(ud)
+    if not username or not st.allows(Event.OLD_SIG):
+        await reject_step(update, st, Event.OLD_SIG)
         return
-    if not ud.get("proof_done"):
-        ud["awaiting_proof"] = True
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    if not await require_proof(update, context, st):
         return
     args = context.args
     if not args:
         await update.message.reply_text(T.msg_command_usage("Usage: `/old_sig 0x...`"), parse_mode=ParseMode.MARKDOWN)
         return
     sig_hash = args[0].strip()
-    ud["old_sig"] = sig_hash
-    subs = load_submissions()
-    sid = str(update.effective_user.id)
-    rec = subs.get(sid) or {"tg_id": update.effective_user.id}
-    rec["username"] = context.user_data.get("zealy_username")
-    rec["old_sig"] = sig_hash
-    subs[sid] = rec
-    save_submissions(subs)
+    st.advance(Event.OLD_SIG)
+    st.save(ud)
+    update_submission(update.effective_user, username, old_sig=sig_hash)
     await update.message.reply_text(T.msg_old_sig_ok(sig_hash), parse_mode=ParseMode.MARKDOWN)
     # Group notice
     u = update.effective_user
@@ -684,66 +664,53 @@ async def old_sig_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await notify_group(context, f"🧾 Old wallet signature received from {uname}")
 
 async def new_wallet_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username = context.user_data.get("zealy_username")
     ud = context.user_data
-    if ud.get("flow") != "change" or not username:
-        await update.message.reply_text(T.msg_command_usage("Use /change_wallet first."), parse_mode=ParseMode.MARKDOWN)
+    username = ud.get("zealy_username")
+    st = FlowState.load(ud)
+    if not username or not st.allows(Event.NEW_WALLET):
+        await reject_step(update, st, Event.NEW_WALLET)
         return
-    if not ud.get("proof_done"):
-        ud["awaiting_proof"] = True
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    if not await require_proof(update, context, st):
         return
     args = context.args
     if not args:
         await update.message.reply_text(T.msg_wallet_format_error(), parse_mode=ParseMode.MARKDOWN)
         return
-    new_wallet = args[0].strip()
-    if not WALLET_REGEX.match(new_wallet):
-        await update.message.reply_text(T.msg_wallet_format_error(), parse_mode=ParseMode.MARKDOWN)
+    new_wallet, reason = check_wallet(args[0])
+    if new_wallet is None:
+        await update.message.reply_text(wallet_error_text(reason), parse_mode=ParseMode.MARKDOWN)
         return
-    ud["new_wallet"] = new_wallet
-    subs = load_submissions()
-    sid = str(update.effective_user.id)
-    rec = subs.get(sid) or {"tg_id": update.effective_user.id}
-    rec["username"] = context.user_data.get("zealy_username")
-    rec["new_wallet"] = new_wallet
-    subs[sid] = rec
-    save_submissions(subs)
-    await update.message.reply_text(T.msg_new_wallet_ok(new_wallet, username, ud.get("old_wallet", "-")), parse_mode=ParseMode.MARKDOWN)
+    st.advance(Event.NEW_WALLET, new_wallet)
+    st.save(ud)
+    rec = update_submission(update.effective_user, username, new_wallet=new_wallet)
+    await check_duplicate_wallet(context, update.effective_user, rec, "new_wallet", new_wallet)
+    await update.message.reply_text(T.msg_new_wallet_ok(new_wallet, username, st.old_wallet or "-"), parse_mode=ParseMode.MARKDOWN)
     # Group notice
     u = update.effective_user
     uname = f"@{u.username}" if u.username else u.full_name
     await notify_group(context, f"🔁 New wallet proposed by {uname}: `{new_wallet}`")
 
 async def new_sig_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username = context.user_data.get("zealy_username")
     ud = context.user_data
-    if ud.get("flow") != "change" or not username:
-        await update.message.reply_text(T.msg_command_usage("Use /change_wallet first."), parse_mode=ParseMode.MARKDOWN)
+    username = ud.get("zealy_username")
+    st = FlowState.load(ud)
+    if not username or not st.allows(Event.NEW_SIG):
+        await reject_step(update, st, Event.NEW_SIG)
         return
-    if not ud.get("proof_done"):
-        ud["awaiting_proof"] = True
-        await update.message.reply_text(T.msg_need_photo(), parse_mode=ParseMode.MARKDOWN)
+    if not await require_proof(update, context, st):
         return
     args = context.args
     if not args:
         await update.message.reply_text(T.msg_command_usage("Usage: `/new_sig 0x...`"), parse_mode=ParseMode.MARKDOWN)
         return
     sig_hash = args[0].strip()
-    old_wallet = ud.get("old_wallet")
-    new_wallet = ud.get("new_wallet")
-    if not (old_wallet and new_wallet):
-        await update.message.reply_text(T.msg_command_usage("Send `/new_wallet 0x...` first."), parse_mode=ParseMode.MARKDOWN)
-        return
-    ud["new_sig"] = sig_hash
-    subs = load_submissions()
-    sid = str(update.effective_user.id)
-    rec = subs.get(sid) or {"tg_id": update.effective_user.id}
-    rec["username"] = context.user_data.get("zealy_username")
-    rec["new_sig"] = sig_hash
-    subs[sid] = rec
-    save_submissions(subs)
+    old_wallet, new_wallet = st.old_wallet, st.wallet
+    st.advance(Event.NEW_SIG)
+    st.save(ud)
+    update_submission(update.effective_user, username, new_sig=sig_hash)
     await update.message.reply_text(T.msg_new_sig_ok(old_wallet, new_wallet, sig_hash), parse_mode=ParseMode.MARKDOWN)
+    if is_replay(update):
+        return  # firma salvata di nuovo (stesso valore); admin e gruppo già avvisati
     # Notify admins
     try:
         txt = T.admin_notify_change(username, update.effective_user.id, old_wallet, new_wallet, sig_hash, sig_hash)
@@ -756,19 +723,30 @@ async def new_sig_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uname = f"@{u.username}" if u.username else u.full_name
     await notify_group(context, f"✅ Change signature confirmed for {uname}: `{old_wallet}` → `{new_wallet}`")
 
+def _wallet_request_done(context: ContextTypes.DEFAULT_TYPE):
+    st = FlowState.load(context.user_data)
+    st.awaiting_wallet = False
+    st.save(context.user_data)
+
 async def handle_wallet_submission(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet: str):
-    if not WALLET_REGEX.match(wallet):
+    wallet, _ = check_wallet(wallet)
+    if wallet is None:
         await update.message.reply_text(T.INVALID_WALLET, parse_mode=None)
         return
 
     requester = update.effective_user
     ts = _now_str()
 
+    # Update ripreso dopo un riavvio: la richiesta potrebbe essere già stata salvata
+    if is_replay(update):
+        prev = STORE.latest_request(requester.id, "pending")
+        if prev and prev["wallet"] == wallet:
+            await update.message.reply_text(T.CONFIRM_RECEIVED, parse_mode=None)
+            _wallet_request_done(context)
+            return
+
     # Save request
-    items = load_requests()
-    rid = next_request_id(items)
-    items.append({
-        "id": rid,
+    rid = STORE.add_request({
         "user_id": requester.id,
         "username": requester.username,
         "first_name": requester.first_name,
@@ -780,7 +758,6 @@ async def handle_wallet_submission(update: Update, context: ContextTypes.DEFAULT
         "handled_at": None,
         "note": ""
     })
-    save_requests(items)
 
     # Notify Admins
     user_display = f"@{requester.username}" if requester.username else requester.full_name
@@ -795,26 +772,59 @@ async def handle_wallet_submission(update: Update, context: ContextTypes.DEFAULT
 
     # Ack
     await update.message.reply_text(T.CONFIRM_RECEIVED, parse_mode=None)
-    context.user_data["awaiting_wallet"] = False
+    _wallet_request_done(context)
 
 # -------------------- ADMIN COMMANDS --------------------
-async def admin_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not is_admin(update.effective_user.id):
-        return
-    show_all = bool(context.args and context.args[0].lower() == "all")
-    items = load_requests()
-    if not items:
-        await update.message.reply_text("📭 No wallet update requests yet.")
-        return
-    if not show_all:
-        items = [r for r in items if r.get("status") == "pending"]
-        if not items:
-            await update.message.reply_text("✅ No pending requests.")
-            return
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_STATUSES = ("pending", "approved", "rejected")
 
-    items = sorted(items, key=lambda r: r.get("id", 0), reverse=True)[:30]
-    lines = ["<b>📋 Wallet update requests</b>", ""]
-    for r in items:
+def parse_request_filters(args: List[str], default_status: Optional[str] = "pending") -> tuple[Optional[dict], Optional[str]]:
+    """Parse admin filter args: [pending|approved|rejected|all] [user=<id|@name>] [from=YYYY-MM-DD] [to=YYYY-MM-DD].
+    Returns (filter, error).
+    """
+    flt = {"status": default_status, "user_id": None, "from": None, "to": None}
+    for raw in args or []:
+        a = raw.strip()
+        low = a.lower()
+        if low == "all":
+            flt["status"] = None
+        elif low in _STATUSES:
+            flt["status"] = low
+        elif low.startswith("user="):
+            v = a[5:].lstrip("@")
+            if v.isdigit():
+                flt["user_id"] = int(v)
+            else:
+                uid = STORE.user_id_by_name(v)
+                if uid is None:
+                    return None, f"Unknown user: {v}"
+                flt["user_id"] = uid
+        elif low.startswith(("from=", "to=")):
+            k, v = low.split("=", 1)
+            if not _DATE_RE.match(v):
+                return None, f"Invalid date '{v}', expected YYYY-MM-DD"
+            flt[k] = v
+        else:
+            return None, f"Unknown filter: {a}"
+    return flt, None
+
+def _describe_filters(flt: dict) -> str:
+    parts = [flt.get("status") or "all"]
+    if flt.get("user_id") is not None:
+        parts.append(f"user={flt['user_id']}")
+    if flt.get("from"):
+        parts.append(f"from={flt['from']}")
+    if flt.get("to"):
+        parts.append(f"to={flt['to']}")
+    return " ".join(parts)
+
+def render_request_page(flt: dict, cursor: Optional[int] = None, direction: str = "next") -> tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    """Render one admin_list page as (html, keyboard); (None, None) when the page is empty."""
+    rows, has_newer, has_older = STORE.page_requests(flt, cursor, direction, ADMIN_LIST_PAGE_SIZE)
+    if not rows:
+        return None, None
+    lines = [f"<b>📋 Wallet update requests</b> ({html.escape(_describe_filters(flt))})", ""]
+    for r in rows:
         user = r.get("username") or r.get("first_name") or str(r.get("user_id"))
         lines.append(
             f"• <b>ID</b>: {r.get('id')} | <b>Status</b>: {html.escape(r.get('status',''))}\n"
@@ -825,62 +835,180 @@ async def admin_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if r.get("handled_by"):
             lines.append(f"  Handled by: {r['handled_by']} at {r.get('handled_at')}")
         lines.append("")
-    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"lst:prev:{rows[0]['id']}"))
+    if has_older:
+        nav.append(InlineKeyboardButton("Older ➡️", callback_data=f"lst:next:{rows[-1]['id']}"))
+    return "\n".join(lines), (InlineKeyboardMarkup([nav]) if nav else None)
 
-async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /admin_list [pending|approved|rejected|all] [user=<id|@name>] [from=YYYY-MM-DD] [to=YYYY-MM-DD]"""
     if not is_admin(update.effective_user.id):
         return
-    items = load_requests()
-    if not items:
-        await update.message.reply_text("📭 Nothing to export.")
+    flt, err = parse_request_filters(context.args)
+    if err:
+        await update.message.reply_text(
+            f"❌ {err}\nUsage: /admin_list [pending|approved|rejected|all] "
+            "[user=<id|@name>] [from=YYYY-MM-DD] [to=YYYY-MM-DD]"
+        )
         return
-    items = sorted(items, key=lambda r: r.get("id", 0))[-100:]
-    buf = io.StringIO()
-    writer = csv.DictWriter(buf, fieldnames=[
-        "id","user_id","username","first_name","last_name","wallet","timestamp","status","handled_by","handled_at","note"
-    ])
-    writer.writeheader()
-    for r in items:
-        writer.writerow({
-            "id": r.get("id"),
-            "user_id": r.get("user_id"),
-            "username": r.get("username"),
-            "first_name": r.get("first_name"),
-            "last_name": r.get("last_name"),
-            "wallet": r.get("wallet"),
-            "timestamp": r.get("timestamp"),
-            "status": r.get("status"),
-            "handled_by": r.get("handled_by"),
-            "handled_at": r.get("handled_at"),
-            "note": r.get("note")
-        })
-    data = io.BytesIO(buf.getvalue().encode("utf-8"))
-    data.name = "wallet_update_requests.csv"
-    await update.message.reply_document(document=data, caption="📎 Export last 100 requests (CSV)")
+    if not STORE.count_requests():
+        await update.message.reply_text("📭 No wallet update requests yet.")
+        return
+    text, kb = render_request_page(flt)
+    if not text:
+        if flt == {"status": "pending", "user_id": None, "from": None, "to": None}:
+            await update.message.reply_text("✅ No pending requests.")
+        else:
+            await update.message.reply_text("📭 No requests match these filters.")
+        return
+    # Filters stay with the admin; the buttons only carry direction + cursor
+    context.user_data["admin_list_filter"] = flt
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=kb)
 
-async def admin_export_final(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_list_page_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
     if not is_admin(update.effective_user.id):
+        await q.answer()
         return
-    subs = load_submissions()
-    fieldnames = [
-        "username","tg_id","rank","xp","original_wallet","updated_wallet","change_type",
-        "reg_sig","old_sig","new_sig","proofs"
-    ]
-    buf = io.StringIO()
-    writer = csv.DictWriter(buf, fieldnames=fieldnames)
-    writer.writeheader()
-    keys = set(ZEALY_INDEX.keys()) | { (rec.get("username") or "").lower() for rec in subs.values() if rec.get("username") }
-    for key in sorted([k for k in keys if k]):
-        z = ZEALY_INDEX.get(key) or {}
-        rec = None
-        for v in subs.values():
-            if (v.get("username") or "").lower() == key:
-                rec = v
-                break
+    _, direction, sid = q.data.split(":")
+    flt = context.user_data.get("admin_list_filter") or {"status": "pending", "user_id": None, "from": None, "to": None}
+    text, kb = render_request_page(flt, int(sid), direction)
+    if not text:
+        await q.answer("No more requests", show_alert=False)
+        return
+    await q.answer()
+    try:
+        await q.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=kb)
+    except Exception as e:
+        log.warning("admin_list page edit failed: %s", e)
+
+# -------------------- STREAMING EXPORT --------------------
+EXPORT_FIELDS = [
+    "id","user_id","username","first_name","last_name","wallet","timestamp","status","handled_by","handled_at","note"
+]
+EXPORT_FORMATS = ("csv", "gz", "parquet")
+EXPORT_CHUNK_ROWS = 1000
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[List[list]]:
+    chunk = []
+    for r in rows:
+        chunk.append([r.get(f) for f in EXPORT_FIELDS])
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def write_requests_export(path: Path, rows: Iterable[dict], fmt: str = "csv") -> int:
+    """Write rows to path in fixed-size chunks; memory stays bounded by EXPORT_CHUNK_ROWS.
+    Returns the number of rows written.
+    """
+    count = 0
+    if fmt == "parquet":
+        # pyarrow is optional and heavy: import only when asked for
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([
+            ("id", pa.int64()), ("user_id", pa.int64()), ("username", pa.string()),
+            ("first_name", pa.string()), ("last_name", pa.string()), ("wallet", pa.string()),
+            ("timestamp", pa.string()), ("status", pa.string()), ("handled_by", pa.int64()),
+            ("handled_at", pa.string()), ("note", pa.string()),
+        ])
+        with pq.ParquetWriter(str(path), schema, compression="zstd") as pw:
+            for chunk in _chunks(rows, EXPORT_CHUNK_ROWS):
+                cols = list(zip(*chunk))
+                pw.write_table(pa.Table.from_arrays(
+                    [pa.array(col, type=schema.field(i).type) for i, col in enumerate(cols)], schema=schema
+                ))
+                count += len(chunk)
+        return count
+    opener = gzip.open if fmt == "gz" else open
+    with opener(path, "wt", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(EXPORT_FIELDS)
+        for chunk in _chunks(rows, EXPORT_CHUNK_ROWS):
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /admin_export [pending|approved|rejected|all] [user=<id|@name>] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [csv|gz|parquet]"""
+    if not is_admin(update.effective_user.id):
+        return
+    args = list(context.args or [])
+    fmt = "csv"
+    for a in list(args):
+        if a.lower() in EXPORT_FORMATS:
+            fmt = a.lower()
+            args.remove(a)
+    flt, err = parse_request_filters(args, default_status=None)
+    if err:
+        await update.message.reply_text(
+            f"❌ {err}\nUsage: /admin_export [pending|approved|rejected|all] "
+            "[user=<id|@name>] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [csv|gz|parquet]"
+        )
+        return
+    if not STORE.count_requests():
+        await update.message.reply_text("📭 Nothing to export.")
+        return
+
+    suffix = {"csv": ".csv", "gz": ".csv.gz", "parquet": ".parquet"}[fmt]
+    fd, tmp_name = tempfile.mkstemp(prefix="requests_export_", suffix=suffix)
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        try:
+            # query a blocchi e scrittura (gzip/parquet) in un thread: il bot resta reattivo
+            count = await asyncio.to_thread(write_requests_export, tmp_path, STORE.iter_requests(flt), fmt)
+        except ImportError:
+            await update.message.reply_text("❌ Export parquet non disponibile: installa pyarrow.")
+            return
+        if count == 0:
+            await update.message.reply_text("📭 No requests match these filters.")
+            return
+        size = tmp_path.stat().st_size
+        if size > TELEGRAM_UPLOAD_LIMIT:
+            await update.message.reply_text(
+                f"❌ Export troppo grande per Telegram ({size // (1024 * 1024)} MB). "
+                "Usa il formato gz o restringi i filtri."
+            )
+            return
+        with tmp_path.open("rb") as fh:
+            await update.message.reply_document(
+                document=fh,
+                filename=f"wallet_update_requests{suffix}",
+                caption=f"📎 Export {count} requests ({_describe_filters(flt)}, {fmt})"
+            )
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+FINAL_EXPORT_FIELDS = [
+    "username","tg_id","rank","xp","original_wallet","updated_wallet","change_type",
+    "reg_sig","old_sig","new_sig","proofs"
+]
+
+def build_final_rows(zealy_index: Dict[str, Dict[str, Any]], subs: dict,
+                     winners_only: bool = False) -> Iterator[dict]:
+    """Join Zealy index and submissions by lowercase username, sorted by username.
+
+    Submissions are indexed once (first record wins for duplicate usernames),
+    so the join is linear instead of a scan of subs for every username.
+    With winners_only, users who are not in the Zealy index are left out.
+    """
+    by_username: Dict[str, dict] = {}
+    for v in subs.values():
+        key = (v.get("username") or "").lower()
+        if key and key not in by_username:
+            by_username[key] = v
+    keys = set(zealy_index) if winners_only else set(zealy_index) | set(by_username)
+    for key in sorted(k for k in keys if k):
+        z = zealy_index.get(key) or {}
+        rec = by_username.get(key)
         username = (rec.get("username") if rec else None) or key
         tg_id = rec.get("tg_id") if rec else None
-        rank = z.get("rank")
-        xp = z.get("xp")
         original_wallet = z.get("wallet")
         updated_wallet = None
         change_type = None
@@ -891,11 +1019,11 @@ async def admin_export_final(update: Update, context: ContextTypes.DEFAULT_TYPE)
             if rec.get("new_wallet"):
                 updated_wallet = rec.get("new_wallet")
                 change_type = "changed"
-        row = {
+        yield {
             "username": username,
             "tg_id": tg_id,
-            "rank": rank,
-            "xp": xp,
+            "rank": z.get("rank"),
+            "xp": z.get("xp"),
             "original_wallet": original_wallet,
             "updated_wallet": updated_wallet or original_wallet,
             "change_type": change_type or ("none" if original_wallet else ("added" if updated_wallet else "none")),
@@ -904,7 +1032,15 @@ async def admin_export_final(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "new_sig": rec.get("new_sig") if rec else None,
             "proofs": ";".join(rec.get("proofs", [])) if rec else "",
         }
-        writer.writerow(row)
+
+async def admin_export_final(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    subs = load_submissions()
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=FINAL_EXPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(build_final_rows(ZEALY_INDEX, subs))
     data = io.BytesIO(buf.getvalue().encode("utf-8"))
     data.name = "winners_final.csv"
     await update.message.reply_document(document=data, caption="📎 Final winners CSV (with updated_wallet)")
@@ -916,8 +1052,7 @@ async def admin_details_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     _, _, sid = q.data.split(":")
     rid = int(sid)
-    items = load_requests()
-    r = get_request_by_id(items, rid)
+    r = STORE.get_request(rid)
     if not r:
         await q.answer("Not found", show_alert=True)
         return
@@ -935,6 +1070,11 @@ async def admin_details_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.answer()
     await q.message.reply_text(text, parse_mode=ParseMode.HTML)
 
+def decide_request(r: dict, action: str, admin_id: int, ts: Optional[str] = None) -> None:
+    r["status"] = "approved" if action == "approve" else "rejected"
+    r["handled_by"] = admin_id
+    r["handled_at"] = ts or _now_str()
+
 async def admin_approve_reject_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
         await update.callback_query.answer()
@@ -943,8 +1083,7 @@ async def admin_approve_reject_cb(update: Update, context: ContextTypes.DEFAULT_
     _, action, sid = q.data.split(":")
     rid = int(sid)
 
-    items = load_requests()
-    r = get_request_by_id(items, rid)
+    r = STORE.get_request(rid)
     if not r:
         await q.answer("Not found", show_alert=True)
         return
@@ -952,10 +1091,12 @@ async def admin_approve_reject_cb(update: Update, context: ContextTypes.DEFAULT_
         await q.answer("Already handled", show_alert=True)
         return
 
-    r["status"] = "approved" if action == "approve" else "rejected"
-    r["handled_by"] = update.effective_user.id
-    r["handled_at"] = _now_str()
-    save_requests(items)
+    decide_request(r, action, update.effective_user.id)
+    if not STORE.save_requests([r]):
+        # deciso nel frattempo da un altro admin (anche su un altro worker)
+        await q.answer("Already handled", show_alert=True)
+        return
+    STORE.pop_admin_messages([rid])
 
     await q.answer("Saved")
     try:
@@ -968,19 +1109,356 @@ async def admin_approve_reject_cb(update: Update, context: ContextTypes.DEFAULT_
     except Exception:
         await q.message.reply_text(f"✅ Request #{rid} {r['status']}.")
 
+# -------------------- ADMIN REWARDS --------------------
+REWARDS_USAGE = (
+    "Usage: /admin_rewards tiers <1:1000,2-10:500,...> [batch=N]\n"
+    "       /admin_rewards pool <importo> [xp|rank] [exp=1] [redistribute] [batch=N]\n"
+    "Calcola i pagamenti dai rank/XP dell'indice Zealy e invia il manifest CSV per wallet."
+)
+
+def parse_rewards_args(args: List[str]) -> tuple[Optional[dict], Optional[str]]:
+    if len(args) < 2 or args[0].lower() not in ("tiers", "pool"):
+        return None, REWARDS_USAGE
+    opts = {"tiers": None, "pool": None, "weight": "xp", "exponent": 1.0, "redistribute": False}
+    batch = DEFAULT_BATCH_SIZE
+    try:
+        if args[0].lower() == "tiers":
+            opts["tiers"] = args[1]
+        else:
+            opts["pool"] = float(args[1])
+        for raw in args[2:]:
+            low = raw.lower()
+            if low in ("xp", "rank"):
+                opts["weight"] = low
+            elif low == "redistribute":
+                opts["redistribute"] = True
+            elif low.startswith("exp="):
+                opts["exponent"] = float(low[4:])
+            elif low.startswith("batch="):
+                batch = max(1, int(low[6:]))
+            else:
+                return None, REWARDS_USAGE
+    except ValueError:
+        return None, REWARDS_USAGE
+    opts["batch"] = batch
+    return opts, None
+
+async def admin_rewards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: payout manifest (per wallet, in multisend batches) from rank/XP tiers or a pool."""
+    if not is_admin(update.effective_user.id):
+        return
+    opts, err = parse_rewards_args(context.args or [])
+    if err:
+        await update.message.reply_text(err)
+        return
+    if not ZEALY_INDEX:
+        await update.message.reply_text("❌ Indice Zealy vuoto: carica prima il CSV dei vincitori.")
+        return
+    batch = opts.pop("batch")
+    zealy_index = ZEALY_INDEX
+
+    def compute(path: Path) -> dict:
+        # lettura delle submission, calcolo e manifest fuori dall'event loop
+        payouts = allocate(WinnerTable(build_final_rows(zealy_index, load_submissions(), winners_only=True)), **opts)
+        payouts.write_manifest(path, batch)
+        return payouts.summary(batch)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "payouts.csv"
+        try:
+            s = await asyncio.to_thread(compute, path)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        with path.open("rb") as f:
+            await update.message.reply_document(
+                document=f, filename="payouts.csv",
+                caption=(f"💰 Totale {s['total']}" + (f" su pool {s['pool']}" if "pool" in s else "")
+                         + f" | {s['wallets']} wallet in {s['batches']} batch da {batch}\n"
+                         f"Vincitori: {s['winners']} (pagati {s['winners_paid']}, senza wallet {s['missing_wallet']}, "
+                         f"wallet condivisi {s['shared_wallets']}) | trattenuto: {s['withheld']}\n"
+                         + ("✅ Totali coerenti" if s["checks_ok"] else "⚠️ Totali NON coerenti: non usare il manifest")),
+            )
+
+# -------------------- ADMIN BULK MODERATION --------------------
+BULK_EDIT_BATCH = 20          # edits sent concurrently
+BULK_EDIT_PAUSE = 1.0         # seconds between batches (Telegram ~30 msg/s)
+BULK_USAGE = (
+    "Usage: /admin_bulk <approve|reject> [ids=A-B] [csv] [user=<id|@name>] "
+    "[from=YYYY-MM-DD] [to=YYYY-MM-DD] [all] [confirm]\n"
+    "Senza 'confirm' mostra solo un'anteprima."
+)
+
+def parse_bulk_args(args: List[str]) -> tuple[Optional[dict], Optional[str]]:
+    """Parse /admin_bulk arguments into a selection dict (only pending requests are eligible)."""
+    if not args or args[0].lower() not in ("approve", "reject"):
+        return None, BULK_USAGE
+    sel = {"action": args[0].lower(), "ids": None, "csv": False, "all": False, "confirm": False}
+    rest = []
+    for raw in args[1:]:
+        low = raw.strip().lower()
+        if low.startswith("ids="):
+            m = re.fullmatch(r"(\d+)(?:-(\d+))?", low[4:])
+            if not m:
+                return None, f"Invalid id range '{raw}'"
+            a = int(m.group(1)); b = int(m.group(2) or a)
+            sel["ids"] = (min(a, b), max(a, b))
+        elif low in ("csv", "all", "confirm"):
+            sel[low] = True
+        else:
+            rest.append(raw)
+    flt, err = parse_request_filters(rest)
+    if err:
+        return None, err
+    if flt["status"] != "pending":
+        return None, "Bulk moderation only applies to pending requests"
+    sel["filter"] = flt
+    if not (sel["ids"] or sel["csv"] or sel["all"] or flt["user_id"] is not None or flt["from"] or flt["to"]):
+        return None, "Specifica almeno un criterio (ids=, csv, user=, from=/to=) oppure 'all'."
+    return sel, None
+
+def select_bulk_requests(sel: dict) -> List[dict]:
+    """Pending requests matching the selection, newest first."""
+    flt = sel["filter"]
+    csv_wallets = None
+    if sel["csv"]:
+        csv_wallets = {(z.get("wallet") or "").lower() for z in ZEALY_INDEX.values() if z.get("wallet")}
+    out = []
+    cursor = None
+    if sel["ids"]:
+        cursor = sel["ids"][1] + 1
+    while True:
+        rows, _, has_older = STORE.page_requests(flt, cursor, "next", 500)
+        for r in rows:
+            if sel["ids"] and r.get("id", 0) < sel["ids"][0]:
+                return out
+            if csv_wallets is not None and (r.get("wallet") or "").lower() not in csv_wallets:
+                continue
+            out.append(r)
+        if not has_older or not rows:
+            return out
+        cursor = rows[-1]["id"]
+
+async def _close_admin_messages(app, decided: List[dict], report_chat_id: int, summary: str):
+    """Edit the admin notifications of decided requests in throttled batches, then report."""
+    refs = STORE.pop_admin_messages(r["id"] for r in decided)
+    jobs = []
+    for r in decided:
+        text = f"✅ Request #{r['id']} {r['status']} (bulk).\nUser id: {r.get('user_id')}\nWallet: {r.get('wallet')}"
+        for chat_id, message_id in refs.get(r["id"], []):
+            jobs.append((chat_id, message_id, text))
+    edited = 0
+    for i in range(0, len(jobs), BULK_EDIT_BATCH):
+        batch = jobs[i:i + BULK_EDIT_BATCH]
+        results = await asyncio.gather(
+            *(app.bot.edit_message_text(chat_id=c, message_id=m, text=t) for c, m, t in batch),
+            return_exceptions=True
+        )
+        edited += sum(1 for res in results if not isinstance(res, Exception))
+        if i + BULK_EDIT_BATCH < len(jobs):
+            await asyncio.sleep(BULK_EDIT_PAUSE)
+    try:
+        await app.bot.send_message(
+            chat_id=report_chat_id,
+            text=f"{summary}\n✏️ Messaggi admin aggiornati: {edited}/{len(jobs)}"
+        )
+    except Exception as e:
+        log.warning("Bulk report failed: %s", e)
+
+async def admin_bulk(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Approve/reject many pending requests in a single transaction."""
+    if not is_admin(update.effective_user.id):
+        return
+    sel, err = parse_bulk_args(context.args)
+    if err:
+        await update.message.reply_text(f"❌ {err}" if err != BULK_USAGE else err)
+        return
+    if sel["csv"] and not ZEALY_INDEX:
+        await update.message.reply_text("❌ Indice Zealy vuoto: impossibile filtrare per wallet CSV.")
+        return
+    targets = select_bulk_requests(sel)
+    if not targets:
+        await update.message.reply_text("📭 Nessuna richiesta pending corrisponde ai criteri.")
+        return
+    verb = "approvate" if sel["action"] == "approve" else "rifiutate"
+    if not sel["confirm"]:
+        ids = [str(r["id"]) for r in targets[:20]]
+        more = f" … (+{len(targets) - 20})" if len(targets) > 20 else ""
+        await update.message.reply_text(
+            f"🔎 Anteprima: {len(targets)} richieste pending verrebbero {verb}.\n"
+            f"ID: {', '.join(ids)}{more}\n\n"
+            "Ripeti il comando aggiungendo 'confirm' per applicare."
+        )
+        return
+
+    ts = _now_str()
+    admin_id = update.effective_user.id
+    for r in targets:
+        decide_request(r, sel["action"], admin_id, ts)
+    # una sola transazione per tutto il batch; solo le richieste ancora pending
+    changed = set(STORE.save_requests(targets))
+    targets = [r for r in targets if r["id"] in changed]
+    total_pending = STORE.count_requests("pending")
+    summary = f"✅ Bulk completato: {len(targets)} richieste {verb}. Pending rimaste: {total_pending}."
+    log.info("Bulk %s by %s: %d requests", sel["action"], admin_id, len(targets))
+    await update.message.reply_text(summary + "\n⏳ Aggiornamento messaggi admin in corso…")
+    context.application.create_task(
+        _close_admin_messages(context.application, targets, update.effective_chat.id, summary)
+    )
+
+# -------------------- ADMIN BROADCAST --------------------
+BROADCAST_USAGE = (
+    "Usage: /admin_broadcast <" + "|".join(SEGMENTS) + "> [confirm] [testo]\n"
+    "       /admin_broadcast <status|pause|resume|cancel> [id]\n"
+    "Senza 'confirm' mostra solo quanti utenti riceverebbero il messaggio. "
+    "Senza testo usa il promemoria standard del segmento (con la deadline)."
+)
+
+def broadcast_users(application) -> Dict[int, str]:
+    """tg_id -> username Zealy (minuscolo, "" se mai impostato) di chi ha scritto al bot."""
+    users: Dict[int, str] = {}
+    for sid, rec in load_submissions().items():
+        if sid.lstrip("-").isdigit():
+            users[int(sid)] = (rec.get("username") or "").lower()
+    user_data = dict(application.user_data)
+    if WORKERS > 1:
+        # gli utenti degli altri shard: user_data salvato in bot.db dai rispettivi worker
+        user_data = {**{int(k): v for k, v in STORE.state_get("user_data").items()}, **user_data}
+    for uid, data in user_data.items():
+        name = (data or {}).get("zealy_username")
+        if name or uid not in users:
+            users[uid] = (name or "").lower()
+    return users
+
+def broadcast_targets(application, segment: str) -> List[int]:
+    def user_ids(status):
+        flt = {"status": status, "user_id": None, "from": None, "to": None}
+        return {r["user_id"] for r in STORE.iter_requests(flt) if r.get("user_id") is not None}
+    return select_targets(segment, broadcast_users(application), ZEALY_INDEX, load_submissions(),
+                          user_ids("pending"), user_ids("approved"))
+
+def _broadcast_report(b: dict) -> str:
+    line = (f"📣 Broadcast #{b['id']} ({b['segment']}) — {b['status']}\n"
+            f"Inviati: {b['sent']}/{b['total']} | bloccati: {b['blocked']} | falliti: {b['failed']} | "
+            f"in coda: {b['pending']}")
+    if b["rate"]:
+        line += f"\nVelocità: {b['rate']:.1f} msg/s"
+        if b["eta_s"] is not None:
+            line += f" | fine stimata tra {int(b['eta_s'] // 60)}m{int(b['eta_s'] % 60):02d}s"
+    return line
+
+def ensure_broadcast_worker(application) -> None:
+    """Start the sender task unless it is already running (one task for all broadcasts).
+
+    With WORKERS > 1 only the leader sends; the other workers just queue the
+    broadcast and the leader picks it up at its next tick (worker_leader_tick).
+    """
+    task = RUNTIME.get("broadcast_task")
+    if task is not None and not task.done():
+        return
+    if not is_leader():
+        return
+    broadcaster = RUNTIME.get("broadcaster")
+    if broadcaster is None:
+        broadcaster = RUNTIME["broadcaster"] = Broadcaster(
+            STORE, rate=BROADCAST_RATE, should_yield=lambda: under_load(application))
+
+    async def on_finish(b: dict):
+        log.info("Broadcast #%s %s: %s", b["id"], b["status"], {k: b[k] for k in ("sent", "failed", "blocked", "pending")})
+        if b["report_chat_id"]:
+            try:
+                await application.bot.send_message(chat_id=b["report_chat_id"], text=_broadcast_report(b))
+            except Exception as e:
+                log.warning("Broadcast report failed: %s", e)
+
+    RUNTIME["broadcast_task"] = application.create_task(broadcaster.worker(application.bot, on_finish))
+
+async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: reminder to a segment of users through the throttled, resumable queue."""
+    if not is_admin(update.effective_user.id):
+        return
+    args = context.args or []
+    if not args:
+        await update.message.reply_text(BROADCAST_USAGE)
+        return
+    action = args[0].lower()
+    broadcaster = RUNTIME.get("broadcaster") or Broadcaster(STORE, rate=BROADCAST_RATE)
+
+    if action in ("status", "pause", "resume", "cancel"):
+        bid = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+        b = broadcaster.get(bid)
+        if b is None:
+            await update.message.reply_text("📭 Nessun broadcast trovato.")
+            return
+        if action != "status":
+            status = {"pause": "paused", "resume": "running", "cancel": "cancelled"}[action]
+            if not broadcaster.set_status(b["id"], status):
+                await update.message.reply_text(f"❌ Broadcast #{b['id']} è già {b['status']}.")
+                return
+            if status == "running":
+                ensure_broadcast_worker(context.application)
+        await update.message.reply_text(_broadcast_report(broadcaster.progress(b["id"])))
+        return
+
+    if action not in SEGMENTS:
+        await update.message.reply_text(BROADCAST_USAGE)
+        return
+    confirm = len(args) > 1 and args[1].lower() == "confirm"
+    # il testo libero mantiene spazi e a capo del messaggio originale
+    m = re.match(r"^/\S+\s+\S+(?:\s+confirm\b)?\s*(.*)$", update.message.text or "", re.S | re.I)
+    text = m.group(1).strip() if m else ""
+    parse_mode = None  # testo libero: niente Markdown (un "_" non chiuso farebbe fallire ogni invio)
+    if not text:
+        if action == "all":
+            await update.message.reply_text("❌ Per il segmento 'all' serve un testo.")
+            return
+        text = T.msg_reminder(action, DEADLINE_TEXT)
+        parse_mode = ParseMode.MARKDOWN
+    targets = broadcast_targets(context.application, action)
+    if not targets:
+        await update.message.reply_text(f"📭 Nessun utente nel segmento '{action}'.")
+        return
+    if not confirm:
+        minutes = len(targets) / BROADCAST_RATE / 60
+        await update.message.reply_text(
+            f"🔎 Anteprima: {len(targets)} utenti ({SEGMENTS[action]}), ~{minutes:.0f} min a {BROADCAST_RATE:g} msg/s.\n\n"
+            f"{text}\n\nRipeti il comando con 'confirm' dopo il segmento per inviare."
+        )
+        return
+    bid = broadcaster.create(action, text, targets, update.effective_user.id, update.effective_chat.id,
+                             parse_mode=parse_mode)
+    log.info("Broadcast #%s (%s) by %s: %d users", bid, action, update.effective_user.id, len(targets))
+    ensure_broadcast_worker(context.application)
+    await update.message.reply_text(
+        f"📣 Broadcast #{bid} avviato: {len(targets)} utenti. Stato con /admin_broadcast status {bid}."
+    )
+
 # -------------------- BACKUP --------------------
+@metrics.timed("make_backup_archive")
 def make_backup_archive() -> Path:
     ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     target = BACKUP_DIR / f"backup_{ts}.zip"
-    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(DATA_DIR):
-            for name in files:
-                fp = Path(root) / name
-                arcname = str(fp.relative_to(DATA_DIR.parent))
-                zf.write(fp, arcname)
+    # Il database attivo (e il suo WAL) non si copia a file: snapshot con la backup API di SQLite
+    live = {DB_PATH.name, DB_PATH.name + "-wal", DB_PATH.name + "-shm"}
+    snapshot = STORE.backup(BACKUP_DIR / f".{DB_PATH.name}.{ts}")
+    try:
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zf:
+            for root, dirs, files in os.walk(DATA_DIR):
+                for name in files:
+                    fp = Path(root) / name
+                    if Path(root) == DATA_DIR and name in live:
+                        continue
+                    arcname = str(fp.relative_to(DATA_DIR.parent))
+                    zf.write(fp, arcname)
+            zf.write(snapshot, str(DB_PATH.relative_to(DATA_DIR.parent)))
+    finally:
+        snapshot.unlink(missing_ok=True)
     return target
 
 async def daily_backup_job(context: ContextTypes.DEFAULT_TYPE):
+    # con più worker il job scatta in ogni processo: lo esegue solo il primo che prende la data
+    if not workers.claim_run(STORE, "daily_backup", datetime.utcnow().strftime("%Y-%m-%d"), workers.holder_id(WORKER_ID)):
+        return
     try:
         path = make_backup_archive()
         msg = f"🗄️ Backup completed: {path.name}"
@@ -1071,7 +1549,7 @@ async def admin_upload_zealy_csv(update: Update, context: ContextTypes.DEFAULT_T
             parse_mode=ParseMode.MARKDOWN
         )
         
-        success, message, total = load_zealy_index()
+        success, message, total = await asyncio.to_thread(load_zealy_index)
         
         if success:
             await processing_msg.edit_text(
@@ -1165,7 +1643,7 @@ async def admin_import_list_cmd(update: Update, context: ContextTypes.DEFAULT_TY
             parse_mode=ParseMode.MARKDOWN
         )
         
-        success, message, total = load_zealy_index()
+        success, message, total = await asyncio.to_thread(load_zealy_index)
         
         if success:
             await processing_msg.edit_text(
@@ -1195,28 +1673,25 @@ async def admin_import_list_cmd(update: Update, context: ContextTypes.DEFAULT_TY
 
 # -------------------- ADMIN DOWNLOAD SUBMISSIONS & PROOFS --------------------
 async def admin_download_submissions(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Admin command to download user_submissions.json file."""
+    """Admin command to download the submissions as user_submissions.json."""
     if not is_admin(update.effective_user.id):
         return
     
-    if not SUBMISSIONS_FILE.exists():
-        await update.message.reply_text("❌ File user_submissions.json non trovato.")
+    subs = load_submissions()
+    if not subs:
+        await update.message.reply_text("❌ Nessuna submission salvata.")
         return
     
     try:
-        # Leggi il file e invialo
-        with open(SUBMISSIONS_FILE, "rb") as f:
-            data = io.BytesIO(f.read())
-            data.name = "user_submissions.json"
-            
-            # Conta il numero di submission
-            subs = load_submissions()
-            count = len(subs)
-            
-            await update.message.reply_document(
-                document=data,
-                caption=f"📎 File user_submissions.json\n📊 Totale submission: {count}"
-            )
+        # Stesso formato del vecchio user_submissions.json
+        data = io.BytesIO(json.dumps(subs, ensure_ascii=False, indent=2).encode("utf-8"))
+        data.name = "user_submissions.json"
+        count = len(subs)
+        
+        await update.message.reply_document(
+            document=data,
+            caption=f"📎 File user_submissions.json\n📊 Totale submission: {count}"
+        )
     except Exception as e:
         log.error("Failed to send submissions file: %s", e)
         await update.message.reply_text(f"❌ Errore durante il download: {e}")
@@ -1282,13 +1757,11 @@ async def admin_download_all(update: Update, context: ContextTypes.DEFAULT_TYPE)
         zip_path = DATA_DIR / f"user_data_export_{ts}.zip"
         
         with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            # Aggiungi il file JSON delle submission
-            if SUBMISSIONS_FILE.exists():
-                zf.write(SUBMISSIONS_FILE, arcname="user_submissions.json")
-                subs = load_submissions()
-                subs_count = len(subs)
-            else:
-                subs_count = 0
+            # Aggiungi il JSON delle submission (esportato dal database)
+            subs = load_submissions()
+            subs_count = len(subs)
+            if subs:
+                zf.writestr("user_submissions.json", json.dumps(subs, ensure_ascii=False, indent=2))
             
             # Aggiungi tutti gli screenshot
             proofs_dir = DATA_DIR / "proofs"
@@ -1333,43 +1806,468 @@ async def admin_download_all(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if zip_path.exists():
             zip_path.unlink()
 
-# -------------------- WATCHDOG via JobQueue --------------------
+async def admin_similar_proofs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: report groups of near-identical proofs sent by different users.
+    Usage: /admin_similar_proofs [max_distance]
+    """
+    if not is_admin(update.effective_user.id):
+        return
+    max_distance = PROOF_INDEX.max_distance
+    if context.args:
+        try:
+            max_distance = max(0, min(32, int(context.args[0])))
+        except ValueError:
+            await update.message.reply_text("Usage: /admin_similar_proofs [max_distance]")
+            return
+    groups = await asyncio.to_thread(PROOF_INDEX.similar_groups, max_distance)
+    if not groups:
+        await update.message.reply_text(
+            f"✅ Nessuno screenshot simile tra utenti diversi "
+            f"({len(PROOF_INDEX)} proof indicizzati, distanza ≤ {max_distance})."
+        )
+        return
+    lines = [f"<b>🔍 Proof simili tra utenti diversi</b> (distanza ≤ {max_distance})", ""]
+    for i, group in enumerate(groups[:20], start=1):
+        users = sorted({str(e["tg_id"]) for e in group})
+        lines.append(f"<b>Gruppo {i}</b> — {len(group)} file, utenti: {html.escape(', '.join(users))}")
+        for e in group[:8]:
+            lines.append(f"  • <code>{html.escape(e['file'])}</code> (d={e['distance']})")
+        lines.append("")
+    if len(groups) > 20:
+        lines.append(f"… altri {len(groups) - 20} gruppi non mostrati")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+FIND_WALLET_USAGE = "Usage: /admin_find_wallet <prefisso 0x… (almeno 4 cifre)|dups>"
+FIND_WALLET_LIMIT = 20
+
+async def admin_find_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: wallets by partial address, or the wallets shared by several usernames."""
+    if not is_admin(update.effective_user.id):
+        return
+    arg = (context.args[0] if context.args else "").strip()
+    if arg.lower() == "dups":
+        found = WALLET_INDEX.duplicates()
+        total = len(found)
+        title = f"<b>👥 Wallet usati da più utenti</b>: {total}"
+    else:
+        digits = arg[2:] if arg.lower().startswith("0x") else arg
+        if len(digits) < 4 or not re.fullmatch(r"[0-9a-fA-F]+", digits):
+            await update.message.reply_text(FIND_WALLET_USAGE)
+            return
+        found, total = WALLET_INDEX.search(digits, FIND_WALLET_LIMIT)
+        title = f"<b>🔎 Wallet che iniziano con</b> <code>0x{html.escape(digits.lower())}</code>: {total}"
+    if not total:
+        await update.message.reply_text(f"📭 Nessun wallet trovato ({len(WALLET_INDEX)} indicizzati).")
+        return
+    lines = [title, ""]
+    for address, owners in found[:FIND_WALLET_LIMIT]:
+        lines.append(f"<code>{address}</code>")
+        lines.append(f"   {html.escape(describe_owners(owners))}")
+    if total > FIND_WALLET_LIMIT:
+        lines.append(f"… altri {total - FIND_WALLET_LIMIT} non mostrati: usa un prefisso più lungo")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+# -------------------- ADMIN STATS --------------------
+START_TIME = time.time()
+
+def _fmt_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds >= 0.01 else f"{seconds * 1000:.1f}ms"
+
+def _stats_section(title: str, metric: str, label: str, errors_metric: Optional[str] = None, limit: int = 12) -> List[str]:
+    rows = metrics.REGISTRY.snapshot(metric)
+    if not rows:
+        return []
+    lines = [title]
+    for r in rows[:limit]:
+        name = r["labels"].get(label, "?")
+        line = f"• {name}: p50 {_fmt_ms(r['p50'])} | p99 {_fmt_ms(r['p99'])} | max {_fmt_ms(r['max'])} | n={r['count']}"
+        if errors_metric:
+            errs = int(sum(v for k, v in metrics.REGISTRY.counters.get(errors_metric, {}).items()
+                           if dict(k).get(label) == name))
+            if errs:
+                line += f" | err={errs}"
+        lines.append(line)
+    lines.append("")
+    return lines
+
+def _loop_section() -> List[str]:
+    lines = []
+    rows = metrics.REGISTRY.snapshot("bot_loop_lag_seconds")
+    if rows:
+        r = rows[0]
+        stalls = int(metrics.REGISTRY.counter_value("bot_loop_stalls_total"))
+        lines += ["Event loop:", f"• lag p50 {_fmt_ms(r['p50'])} | p99 {_fmt_ms(r['p99'])} | max {_fmt_ms(r['max'])} | blocchi >{LOOP_STALL_SECONDS:g}s: {stalls}"]
+    slow = list(metrics.SLOW_HANDLERS.events)[-5:]
+    if slow:
+        lines.append(f"Handler lenti (>{SLOW_HANDLER_SECONDS:g}s), ultimi:")
+        for e in reversed(slow):
+            when = datetime.utcfromtimestamp(e["ts"]).strftime("%d/%m %H:%M:%S")
+            lines.append(f"• {e['handler']}: {e['seconds']:.2f}s ({when} UTC)")
+    if lines:
+        lines.append("")
+    return lines
+
+async def _send_stacks(update: Update) -> None:
+    """/admin_stats stacks: last stalls and slow handlers with their stack."""
+    events = []
+    if metrics.LOOP_MONITOR is not None:
+        events += [("Loop bloccato", st["ts"], f"{st['blocked']:.2f}s" + (f", handler {st['handler']}" if st["handler"] else ""), st["stack"])
+                   for st in metrics.LOOP_MONITOR.stalls]
+    events += [("Handler lento", e["ts"], f"{e['handler']} {e['seconds']:.2f}s", e["stack"]) for e in metrics.SLOW_HANDLERS.events]
+    if not events:
+        await update.message.reply_text("✅ Nessun blocco del loop o handler lento registrato.")
+        return
+    events.sort(key=lambda e: e[1])
+    for kind, ts, what, stack in events[-3:]:
+        when = datetime.utcfromtimestamp(ts).strftime("%d/%m %H:%M:%S")
+        text = f"<b>{kind}</b> — {html.escape(what)} ({when} UTC)\n<pre>{html.escape((stack or '(stack non disponibile)')[-3500:])}</pre>"
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: latency/error summary of handlers, storage, Bot API calls and event loop."""
+    if not is_admin(update.effective_user.id):
+        return
+    if context.args and context.args[0].lower() == "stacks":
+        await _send_stacks(update)
+        return
+    uptime = int(time.time() - START_TIME)
+    lines = [f"📈 Statistiche bot — uptime {uptime // 3600}h {uptime % 3600 // 60}m", ""]
+    lines += _stats_section("Handler:", "bot_handler_seconds", "handler", "bot_handler_errors_total")
+    lines += _stats_section("Storage I/O:", "bot_storage_seconds", "op")
+    lines += _stats_section("Bot API:", "bot_api_seconds", "method", "bot_api_errors_total")
+    lines += _loop_section()
+    worker = RUNTIME.get("worker")
+    if worker is not None:
+        lines += [f"Worker {WORKER_ID}/{WORKERS}{' (leader)' if worker.is_leader else ''}: "
+                  f"in coda {worker.queue.depth(WORKER_ID)} su questo shard, {worker.queue.depth()} in totale", ""]
+    if THROTTLE is not None:
+        lines += [f"Anti-flood: {len(THROTTLE)} utenti attivi, {THROTTLE.muted()} ignorati", ""]
+    if METRICS_PORT:
+        lines.append(f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    await update.message.reply_text("\n".join(lines).strip())
+
+# -------------------- ADMIN PROFILE --------------------
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILE_USAGE = (
+    "Uso: /admin_profile <cpu|mem> [secondi]\n"
+    f"• cpu: cProfile sul processo per N secondi (default {PROFILE_DEFAULT_SECONDS}, max {PROFILE_MAX_SECONDS}), statistiche ordinate\n"
+    "• mem: due snapshot tracemalloc a N secondi di distanza e differenza per riga"
+)
+
+def _profile_context(application) -> List[str]:
+    """Dimensioni delle strutture sospettate di crescere (user_data, ZEALY_INDEX, database)."""
+    db_files = [p for p in (DB_PATH, DB_PATH.with_name(DB_PATH.name + "-wal")) if p.exists()]
+    lines = [
+        f"ZEALY_INDEX: {len(ZEALY_INDEX)} utenti",
+        f"user_data: {len(application.user_data)} utenti, chat_data: {len(application.chat_data)} chat",
+        f"{DB_PATH.name}: " + " + ".join(f"{p.stat().st_size / 1024:.0f} KB" for p in db_files) if db_files
+        else f"{DB_PATH.name}: assente",
+    ]
+    try:
+        import resource
+        lines.append(f"RSS max: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    except Exception:
+        pass
+    lines.append(f"gc: {gc.get_count()} (oggetti tracciati: {len(gc.get_objects())})")
+    return lines
+
+async def profile_cpu(seconds: float) -> str:
+    """Profile the event loop thread (where every handler runs) for `seconds`."""
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+    out = io.StringIO()
+    for key in ("cumulative", "tottime"):
+        out.write(f"==== sorted by {key} ====\n")
+        pstats.Stats(prof, stream=out).strip_dirs().sort_stats(key).print_stats(60)
+    return out.getvalue()
+
+async def profile_memory(seconds: float) -> str:
+    """Diff two tracemalloc snapshots taken `seconds` apart."""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(25)
+    try:
+        noise = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(noise)
+        await asyncio.sleep(seconds)
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(noise)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    out = io.StringIO()
+    out.write(f"traced: current {current / 1024 / 1024:.1f} MB, peak {peak / 1024 / 1024:.1f} MB\n")
+    if started_here:
+        out.write("(tracemalloc avviato per questa misura: allocazioni precedenti non tracciate)\n")
+    stats = after.compare_to(before, "lineno")
+    out.write("\n==== top 50 differenze per riga ====\n")
+    for st in stats[:50]:
+        out.write(f"{st}\n")
+    out.write("\n==== top 10 crescite con traceback ====\n")
+    for st in after.compare_to(before, "traceback")[:10]:
+        out.write(f"\n{st.size_diff / 1024:+.1f} KB, {st.count_diff:+d} blocchi\n")
+        out.write("\n".join(st.traceback.format(limit=10)) + "\n")
+    return out.getvalue()
+
+async def _run_profile(application, chat_id: int, mode: str, seconds: float) -> None:
+    try:
+        if mode == "cpu":
+            report = await profile_cpu(seconds)
+        else:
+            report = await profile_memory(seconds)
+        header = [f"/admin_profile {mode} {seconds:g}s — {_now_str()}"] + _profile_context(application)
+        data = io.BytesIO(("\n".join(header) + "\n\n" + report).encode("utf-8"))
+        await application.bot.send_document(
+            chat_id=chat_id, document=data,
+            filename=f"profile_{mode}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt",
+            caption=f"📊 Profilo {mode} ({seconds:g}s)",
+        )
+    except Exception as e:
+        log.exception("Profiling failed")
+        try:
+            await application.bot.send_message(chat_id=chat_id, text=f"❌ Profilo {mode} fallito: {e}")
+        except Exception:
+            pass
+    finally:
+        RUNTIME.pop("profiling", None)
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: CPU (cProfile) or memory (tracemalloc diff) profile of the live process."""
+    if not is_admin(update.effective_user.id):
+        return
+    args = context.args or []
+    if not args or args[0].lower() not in ("cpu", "mem"):
+        await update.message.reply_text(PROFILE_USAGE)
+        return
+    mode = args[0].lower()
+    seconds = float(PROFILE_DEFAULT_SECONDS)
+    if len(args) > 1:
+        try:
+            seconds = max(1.0, min(float(PROFILE_MAX_SECONDS), float(args[1])))
+        except ValueError:
+            await update.message.reply_text(PROFILE_USAGE)
+            return
+    if RUNTIME.get("profiling"):
+        await update.message.reply_text(f"⏳ Profilo {RUNTIME['profiling']} già in corso, riprova al termine.")
+        return
+    RUNTIME["profiling"] = mode
+    await update.message.reply_text(f"⏱️ Profilo {mode} avviato per {seconds:g}s: il report arriverà come documento.")
+    # in background: il bot continua a gestire gli update (ed è proprio quello che misuriamo)
+    context.application.create_task(_run_profile(context.application, update.effective_chat.id, mode, seconds))
+
+# -------------------- HEALTH / WATCHDOG --------------------
+HEALTH = metrics.HealthChecks(ttl=HEALTH_CACHE_SECONDS)
+
+def _check_zealy_index():
+    return bool(ZEALY_INDEX), f"{len(ZEALY_INDEX)} utenti"
+
+def _check_storage():
+    probe = DATA_DIR / ".health_probe"
+    probe.write_text(str(time.time()), encoding="utf-8")
+    probe.unlink()
+    pending = STORE.count_requests("pending")
+    return True, f"{DATA_DIR}, {DB_PATH.name}: {pending} richieste pending"
+
+def _load_state(application) -> dict:
+    """Indicatori di saturazione: update in coda, chiamate Bot API in corso, lag recente del loop."""
+    monitor = metrics.LOOP_MONITOR
+    worker = RUNTIME.get("worker")
+    return {
+        "update_queue": application.update_queue.qsize() + (worker.queue.depth(WORKER_ID) if worker else 0),
+        "api_inflight": metrics.InstrumentedRequest.inflight,
+        "loop_lag_max_s": monitor.summary()["recent_max_s"] if monitor else 0.0,
+    }
+
+def under_load(application) -> bool:
+    st = _load_state(application)
+    return (st["update_queue"] > HEALTH_MAX_UPDATE_QUEUE
+            or st["api_inflight"] > HEALTH_MAX_INFLIGHT
+            or st["loop_lag_max_s"] > LOOP_STALL_SECONDS)
+
+def register_health_checks(application) -> None:
+    HEALTH.add("zealy_index", _check_zealy_index)
+    HEALTH.add("storage", _check_storage)
+
+    def queues():
+        st = _load_state(application)
+        ok = st["update_queue"] <= HEALTH_MAX_UPDATE_QUEUE and st["api_inflight"] <= HEALTH_MAX_INFLIGHT
+        return ok, f"update_queue={st['update_queue']} api_inflight={st['api_inflight']}"
+    HEALTH.add("queues", queues)
+
+    def bot_api():
+        fails = RUNTIME.get("wd_fails", 0)
+        return fails < 2, f"{fails} ping falliti consecutivi"
+    HEALTH.add("bot_api", bot_api)
+
+    def worker():
+        w = RUNTIME.get("worker")
+        return w.status() if w is not None else (False, "non avviato")
+    HEALTH.add("worker", worker)
+
+def healthz():
+    """Liveness: risponde se il loop gira (questa coroutine gira sul loop stesso)."""
+    fails = RUNTIME.get("wd_fails", 0)
+    monitor = metrics.LOOP_MONITOR
+    payload = {
+        "status": "ok" if fails < WATCHDOG_MAX_FAILS else "failing",
+        "uptime_s": int(time.time() - START_TIME),
+        "bot_api_fails": fails,
+        "loop": monitor.summary() if monitor else None,
+    }
+    return metrics.json_result(fails < WATCHDOG_MAX_FAILS, payload)
+
+def readyz():
+    ok, checks = HEALTH.run()
+    return metrics.json_result(ok, {"status": "ready" if ok else "not_ready", "checks": checks})
+
 async def watchdog_tick(context: ContextTypes.DEFAULT_TYPE):
-    # Touch heartbeat
+    # Heartbeat su file, mantenuto per compatibilità con monitor esterni (preferire /healthz)
     try:
         HEARTBEAT_FILE.parent.mkdir(parents=True, exist_ok=True)
         HEARTBEAT_FILE.write_text(str(int(time.time())), encoding="utf-8")
     except Exception as e:
         log.warning("Heartbeat error: %s", e)
 
-    # Fails counter in bot_data
-    bot_data = context.application.bot_data
-    fails = bot_data.get("wd_fails", 0)
-
     try:
         await context.bot.get_me()
-        bot_data["wd_fails"] = 0
+        RUNTIME["wd_fails"] = 0
     except Exception as e:
-        log.warning("Watchdog ping failed: %s", e)
-        fails += 1
-        bot_data["wd_fails"] = fails
-        if fails >= WATCHDOG_MAX_FAILS:
-            log.error("Watchdog: too many failures, exiting for auto-restart...")
-            os._exit(1)
+        # Sotto carico un ping lento non indica un bot bloccato: non contarlo
+        if under_load(context.application):
+            log.warning("Watchdog ping failed under load (%s): %s", _load_state(context.application), e)
+            return
+        fails = RUNTIME.get("wd_fails", 0) + 1
+        RUNTIME["wd_fails"] = fails
+        log.warning("Watchdog ping failed (%d/%d): %s", fails, WATCHDOG_MAX_FAILS, e)
+        if fails >= WATCHDOG_MAX_FAILS and not RUNTIME.get("stopping"):
+            # Arresto ordinato: workers.run termina, la persistence viene salvata, entrypoint.sh riavvia
+            log.error("Watchdog: too many failures, stopping gracefully for auto-restart...")
+            RUNTIME["stopping"] = True
+            context.application.stop_running()
+
+# -------------------- MULTI-WORKER --------------------
+async def sync_worker_state(context: ContextTypes.DEFAULT_TYPE):
+    """WORKERS > 1: pick up what the other workers changed in memory-only indexes."""
+    global ZEALY_INDEX, WALLET_INDEX
+    gen = STORE.get_meta("zealy_loaded_at")
+    if gen and gen != RUNTIME.get("zealy_gen"):
+        RUNTIME["zealy_gen"] = gen
+        ZEALY_INDEX = STORE.load_zealy()
+        USERNAME_INDEX.build(ZEALY_INDEX)
+        log.info("Zealy index reloaded from %s (import %s): %d users", DB_PATH, gen, len(ZEALY_INDEX))
+    # wallet inviati tramite gli altri worker: indice ricostruito fuori dal loop e sostituito
+    index = WalletIndex()
+    zealy = ZEALY_INDEX
+    await asyncio.to_thread(lambda: index.build(zealy, load_submissions()))
+    WALLET_INDEX = index
+    # proof salvati dagli altri worker: anche la decodifica delle immagini resta fuori dal loop
+    await asyncio.to_thread(PROOF_INDEX.refresh)
+
+async def worker_leader_tick(context: ContextTypes.DEFAULT_TYPE):
+    """The broadcast sender follows the leader lease (resumed here after a restart)."""
+    task = RUNTIME.get("broadcast_task")
+    if is_leader():
+        broadcaster = RUNTIME.get("broadcaster")
+        if (task is None or task.done()) and broadcaster is not None and broadcaster.next_running() is not None:
+            log.info("Resuming broadcast #%s", broadcaster.next_running())
+            ensure_broadcast_worker(context.application)
+    elif task is not None and not task.done():
+        log.warning("Leadership lost: stopping the broadcast sender")
+        task.cancel()  # il batch in corso non viene salvato: il nuovo leader lo rinvia
+
+# -------------------- ANTI-FLOOD --------------------
+# Per worker: con WORKERS > 1 gli update di un utente arrivano sempre allo stesso processo (workers.shard_of)
+THROTTLE = Throttle(Limit(THROTTLE_RATE, THROTTLE_BURST), parse_limits(THROTTLE_KINDS),
+                    hard_strikes=THROTTLE_HARD_STRIKES, hard_window=THROTTLE_HARD_WINDOW,
+                    mute_seconds=THROTTLE_MUTE_SECONDS) if THROTTLE_RATE > 0 else None
+
+async def throttle_screen(update: Update) -> bool:
+    """Chiamata dal worker prima di attempts, handler e persistence: False = update scartato."""
+    user = update.effective_user
+    if THROTTLE is None or user is None or is_admin(user.id):
+        return True
+    kind = update_kind(update)
+    msg = update.effective_message
+    verdict = THROTTLE.check(user.id, kind, group=msg.media_group_id if msg is not None else None)
+    if verdict == ALLOW:
+        return True
+    metrics.REGISTRY.inc("bot_throttled_total", kind=kind if kind in THROTTLE.kinds else "other", verdict=verdict)
+    if verdict == MUTE:
+        log.warning("User %s muted for %.0fs (flood)", user.id, THROTTLE_MUTE_SECONDS)
+    if verdict in (WARN, MUTE):
+        text = T.msg_throttled() if verdict == WARN else T.msg_muted(max(1, round(THROTTLE_MUTE_SECONDS / 60)))
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(text)
+            elif update.effective_chat is not None and update.effective_chat.type == "private":
+                await update.effective_message.reply_text(text, parse_mode=None)
+        except Exception as e:
+            log.debug("Throttle notice not sent to %s: %s", user.id, e)
+    return False
 
 # -------------------- ERROR HANDLER --------------------
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     log.exception("Exception while handling an update: %s", context.error)
 
 # -------------------- MAIN --------------------
+async def post_init(application):
+    metrics.SLOW_HANDLERS.threshold = SLOW_HANDLER_SECONDS
+    RUNTIME["loop_monitor"] = metrics.start_loop_monitor(LOOP_LAG_INTERVAL, LOOP_STALL_SECONDS)
+    if METRICS_PORT:
+        server = metrics.MetricsServer(METRICS_HOST, METRICS_PORT)
+        register_health_checks(application)
+        server.route("/healthz", healthz)
+        server.route("/readyz", readyz)
+        try:
+            await server.start()
+            RUNTIME["metrics_server"] = server
+        except OSError as e:
+            log.warning("Metrics endpoint not started: %s", e)
+    # broadcast interrotti da crash/riavvio: worker_leader_tick li riprende dai destinatari ancora in coda
+    RUNTIME["broadcaster"] = Broadcaster(STORE, rate=BROADCAST_RATE, should_yield=lambda: under_load(application))
+    # notifiche admin ancora aperte, salvate in bot_data dalle versioni precedenti
+    legacy_refs = application.bot_data.pop("req_admin_msgs", None)
+    for rid, sent in (legacy_refs or {}).items():
+        STORE.add_admin_messages(int(rid), [tuple(ref) for ref in sent])
+
+async def post_shutdown(application):
+    task = RUNTIME.pop("broadcast_task", None)
+    if task is not None and not task.done():
+        task.cancel()  # i batch già inviati sono salvati; il resto riparte al prossimo avvio
+    server = RUNTIME.pop("metrics_server", None)
+    if server is not None:
+        await server.stop()
+    monitor = RUNTIME.pop("loop_monitor", None)
+    if monitor is not None:
+        await monitor.stop()
+
 def main():
-    persistence = PicklePersistence(filepath=str(DATA_DIR / "bot_state"))
-    application = ApplicationBuilder().token(TOKEN).persistence(persistence).build()
+    persistence = SQLitePersistence(STORE)
+    builder = ApplicationBuilder().token(TOKEN)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = (
+        builder
+        .persistence(persistence)
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(metrics.InstrumentedRequest(connection_pool_size=1))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # User commands
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_cmd))
     application.add_handler(CommandHandler("set_username", set_username_cmd))
+    application.add_handler(CallbackQueryHandler(username_choice_cb, pattern=r"^uname:\d+$"))
     application.add_handler(CommandHandler("status", status_cmd))
     # Wallet flows
     application.add_handler(CommandHandler("change_wallet", change_wallet_cmd))
@@ -1387,10 +2285,14 @@ def main():
 
     # Admin
     application.add_handler(CommandHandler("admin_list", admin_list))
+    application.add_handler(CallbackQueryHandler(admin_list_page_cb, pattern=r"^lst:(next|prev):\d+$"))
     application.add_handler(CommandHandler("admin_export", admin_export))
     application.add_handler(CommandHandler("admin_export_final", admin_export_final))
+    application.add_handler(CommandHandler("admin_rewards", admin_rewards))
     application.add_handler(CallbackQueryHandler(admin_details_cb, pattern=r"^req:details:\d+$"))
     application.add_handler(CallbackQueryHandler(admin_approve_reject_cb, pattern=r"^req:(approve|reject):\d+$"))
+    application.add_handler(CommandHandler("admin_bulk", admin_bulk))
+    application.add_handler(CommandHandler("admin_broadcast", admin_broadcast))
     # Admin: upload CSV (document) to import winners/WVC
     application.add_handler(MessageHandler(
         (filters.Document.MimeType("text/csv") | filters.Document.FileExtension("csv")),
@@ -1403,10 +2305,17 @@ def main():
     application.add_handler(CommandHandler("admin_download_submissions", admin_download_submissions))
     application.add_handler(CommandHandler("admin_download_proofs", admin_download_proofs))
     application.add_handler(CommandHandler("admin_download_all", admin_download_all))
+    application.add_handler(CommandHandler("admin_similar_proofs", admin_similar_proofs))
+    application.add_handler(CommandHandler("admin_find_wallet", admin_find_wallet))
+    application.add_handler(CommandHandler("admin_stats", admin_stats))
+    application.add_handler(CommandHandler("admin_profile", admin_profile))
 
     # Error handler
     application.add_error_handler(on_error)
 
+    # Latency/error instrumentation on every handler registered above
+    metrics.instrument_application(application)
+
     # Jobs (correct order)
     ensure_jobqueue(application)                 # 1) ensure JobQueue
     schedule_daily_backup(application)           # 2) schedule backup
@@ -1417,16 +2326,38 @@ def main():
             first=WATCHDOG_INTERVAL,
             name="watchdog"
         )
-
-    # Load Zealy index at startup
-    success, msg, count = load_zealy_index()
-    if success:
-        log.info("Zealy index loaded at startup: %d users", count)
-    else:
-        log.warning("Zealy index not loaded at startup: %s", msg)
+    if application.job_queue is not None:        # 4) broadcast sender on the leader
+        application.job_queue.run_repeating(worker_leader_tick, interval=5, first=1, name="worker_leader_tick")
+    if WORKERS > 1 and application.job_queue is not None:  # 5) multi-worker
+        application.job_queue.run_repeating(sync_worker_state, interval=WORKER_SYNC_INTERVAL,
+                                            first=WORKER_SYNC_INTERVAL, name="worker_sync")
+
+    # Load Zealy index at startup: the CSV is parsed again only if it changed since the last
+    # import (a warm restart restores the index from bot.db), and only by worker 0
+    loaded = False
+    csv_sig = _zealy_csv_signature(_discover_latest_zealy_csv())
+    if WORKER_ID == 0 and (csv_sig is None or csv_sig != STORE.get_meta("zealy_csv_sig")):
+        loaded, msg, count = load_zealy_index()
+        if loaded:
+            log.info("Zealy index loaded at startup: %d users", count)
+        else:
+            log.warning("Zealy index not loaded at startup: %s", msg)
+    if not loaded:
+        RUNTIME["zealy_gen"] = STORE.get_meta("zealy_loaded_at")
+        # Ultimo indice importato, salvato nel database
+        ZEALY_INDEX.update(STORE.load_zealy())
+        USERNAME_INDEX.build(ZEALY_INDEX)
+        if ZEALY_INDEX:
+            log.info("Zealy index restored from %s: %d users", DB_PATH, len(ZEALY_INDEX))
+        rebuild_wallet_index()
+    PROOF_INDEX.build()
     heartbeat_touch()
     log.info("🚀 SavitriRewardsBot is running...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    # Update dalla coda in bot.db (workers.py): dopo un crash o un riavvio del watchdog
+    # si riparte dall'offset salvato, senza perdere i comandi arrivati nel frattempo
+    # anti-flood nel worker, prima che l'update tocchi bot.db (attempts, persistence)
+    RUNTIME["worker"] = workers.Worker(application, STORE, WORKER_ID, WORKERS, screen=throttle_screen)
+    workers.run(application, RUNTIME["worker"])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+merge_wvc.py
+
+Merges the Zealy winners export with a WVC list (generate_wvc.py output) and
+writes zealy_with_wvc.csv, the file the bot imports. Successor of
+obsolete_file/assign_wvc.py, which loaded both files in memory and paired
+them by row position.
+
+Two ways to pair rows:
+  --mode key   hash join: Zealy column --zealy-key (default username) against
+               WVC column --wvc-key (default assigned_to), case-insensitive
+  --mode rank  the n-th code of the WVC list goes to the winner with rank n
+               (column "Position on Leaderboard", or the row order if absent)
+
+Both files are streamed. Only the WVC side of one partition is held in a
+dict: when the WVC list is larger than 64 MB (or with --partitions N), both
+inputs are first split into partitions by hash of the key (Grace hash join)
+and joined one partition at a time, so memory stays bounded on
+multi-million-row exports.
+With more than one partition the output is grouped by partition (the bot
+indexes winners by username, so order does not matter).
+
+Usage:
+    python merge_wvc.py --zealy zealy_winners.csv --wvc wvc_list.csv --out zealy_with_wvc.csv --mode rank
+    python merge_wvc.py --zealy zealy_winners.csv --wvc wvc_assigned.csv --mode key --unmatched unmatched.csv
+"""
+
+import csv
+import sys
+import zlib
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+POSITION_HEADERS = ("position on leaderboard", "position on leadborad", "position", "rank")
+DEFAULT_PARTITION_MB = 64
+
+def sniff_delimiter(sample: str) -> str:
+    """Same detection as assign_wvc.py: csv.Sniffer, then ';' vs ',' on the header line."""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except Exception:
+        header_line = sample.splitlines()[0] if sample else ""
+        return ";" if header_line.count(";") >= header_line.count(",") else ","
+
+def open_csv(path: Path) -> Tuple[Iterator[List[str]], List[str], str, object]:
+    """Open a CSV for streaming: (row reader, header, delimiter, file handle to close)."""
+    f = path.open("r", encoding="utf-8-sig", newline="")
+    sample = f.read(4096)
+    f.seek(0)
+    delim = sniff_delimiter(sample)
+    reader = csv.reader(f, delimiter=delim)
+    header = next(reader, None) or []
+    return reader, header, delim, f
+
+def find_column(header: List[str], *names: str) -> Optional[int]:
+    lower = {h.strip().lower(): i for i, h in enumerate(header)}
+    for n in names:
+        if n in lower:
+            return lower[n]
+    return None
+
+def _rank(value: str) -> str:
+    # "#1", "1st", " 12 " -> "1", "1", "12"
+    digits = "".join(ch for ch in value if ch.isdigit())
+    return str(int(digits)) if digits else ""
+
+def _partition(key: str, n: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % n if n > 1 else 0
+
+class MergeStats(dict):
+    """Counters printed at the end: rows, matched, unmatched, unused_codes, duplicate_keys."""
+
+    def __init__(self):
+        super().__init__(rows=0, matched=0, unmatched=0, unused_codes=0, duplicate_keys=0)
+
+def _wvc_pairs(path: Path, mode: str, wvc_key: str) -> Iterator[Tuple[str, str]]:
+    """(join key, code) for every code in the WVC list."""
+    reader, header, _, f = open_csv(path)
+    with f:
+        code_col = find_column(header, "wvc", "code")
+        if code_col is None:
+            raise ValueError(f"WVC CSV must contain a 'wvc' column (headers: {header})")
+        key_col = find_column(header, wvc_key.lower()) if mode == "key" else None
+        if mode == "key" and key_col is None:
+            raise ValueError(f"WVC CSV has no '{wvc_key}' column (headers: {header})")
+        ordinal = 0
+        for row in reader:
+            code = row[code_col].strip() if code_col < len(row) else ""
+            if not code:
+                continue
+            ordinal += 1
+            if mode == "rank":
+                yield str(ordinal), code
+            else:
+                key = row[key_col].strip().lower() if key_col < len(row) else ""
+                if key:
+                    yield key, code
+
+def _zealy_rows(reader: Iterator[List[str]], mode: str, key_col: Optional[int], width: int) -> Iterator[Tuple[str, List[str]]]:
+    """(join key, row padded to the output width); rank mode without a position column uses the row order."""
+    n = 0
+    for row in reader:
+        if not any(c.strip() for c in row):
+            continue
+        n += 1
+        if len(row) < width:
+            row += [""] * (width - len(row))
+        if mode == "key":
+            key = row[key_col].strip().lower()
+        else:
+            key = _rank(row[key_col]) if key_col is not None else str(n)
+        yield key, row
+
+def merge(zealy_path: Path, wvc_path: Path, out_path: Path, mode: str = "key", zealy_key: str = "username",
+          wvc_key: str = "assigned_to", partitions: int = 0, unmatched_path: Optional[Path] = None) -> MergeStats:
+    """Join the two CSVs into out_path (Zealy columns + WVC, Zealy delimiter) and return the counters."""
+    if mode not in ("key", "rank"):
+        raise ValueError(f"unknown mode: {mode}")
+    if partitions <= 0:
+        partitions = max(1, -(-wvc_path.stat().st_size // (DEFAULT_PARTITION_MB << 20)))
+
+    reader, header, delim, zf = open_csv(zealy_path)
+    with zf:
+        if not header:
+            raise ValueError("Zealy CSV has no header")
+        if mode == "key":
+            key_col = find_column(header, zealy_key.lower())
+            if key_col is None:
+                raise ValueError(f"Zealy CSV has no '{zealy_key}' column (headers: {header})")
+        else:
+            key_col = find_column(header, *POSITION_HEADERS)
+        out_header = list(header)
+        wvc_col = find_column(out_header, "wvc")
+        if wvc_col is None:
+            out_header.append("WVC")
+            wvc_col = len(out_header) - 1
+        rows = _zealy_rows(reader, mode, key_col, len(out_header))
+
+        stats = MergeStats()
+        with out_path.open("w", encoding="utf-8", newline="") as out, \
+                tempfile.TemporaryDirectory(prefix="merge_wvc_") as tmp:
+            writer = csv.writer(out, delimiter=delim)
+            writer.writerow(out_header)
+            miss_writer, miss_f = None, None
+            if unmatched_path is not None:
+                miss_f = unmatched_path.open("w", encoding="utf-8", newline="")
+                miss_writer = csv.writer(miss_f, delimiter=delim)
+                miss_writer.writerow(header)
+            try:
+                if partitions == 1:
+                    _join(_wvc_pairs(wvc_path, mode, wvc_key), rows, wvc_col, len(header), writer, miss_writer, stats)
+                else:
+                    wparts, zparts = _split(Path(tmp), partitions, _wvc_pairs(wvc_path, mode, wvc_key), rows)
+                    for wp, zp in zip(wparts, zparts):
+                        with wp.open("r", encoding="utf-8", newline="") as wf, \
+                                zp.open("r", encoding="utf-8", newline="") as zpf:
+                            zrows = ((r[0], r[1:]) for r in csv.reader(zpf))
+                            _join((tuple(r) for r in csv.reader(wf)), zrows, wvc_col, len(header),
+                                  writer, miss_writer, stats)
+                        wp.unlink()
+                        zp.unlink()
+            finally:
+                if miss_f is not None:
+                    miss_f.close()
+    return stats
+
+def _split(tmp: Path, n: int, wvc_pairs, zealy_rows) -> Tuple[List[Path], List[Path]]:
+    """Write both inputs into n partition files each, by hash of the join key."""
+    wparts = [tmp / f"wvc_{i}.csv" for i in range(n)]
+    zparts = [tmp / f"zealy_{i}.csv" for i in range(n)]
+    files = [p.open("w", encoding="utf-8", newline="") for p in wparts + zparts]
+    try:
+        writers = [csv.writer(f) for f in files]
+        for key, code in wvc_pairs:
+            writers[_partition(key, n)].writerow((key, code))
+        for key, row in zealy_rows:
+            writers[n + _partition(key, n)].writerow([key] + row)
+    finally:
+        for f in files:
+            f.close()
+    return wparts, zparts
+
+def _join(wvc_pairs, zealy_rows, wvc_col: int, zealy_width: int, writer, miss_writer, stats: MergeStats) -> None:
+    """In-memory hash join of one partition: build on the WVC side, probe with the Zealy rows."""
+    table: Dict[str, str] = {}
+    for key, code in wvc_pairs:
+        if key in table:
+            stats["duplicate_keys"] += 1
+            continue
+        table[key] = code
+    for key, row in zealy_rows:
+        stats["rows"] += 1
+        code = table.pop(key, None)  # pop: un codice non va mai a due righe
+        if code is None:
+            stats["unmatched"] += 1
+            if miss_writer is not None:
+                miss_writer.writerow(row[:zealy_width])
+        else:
+            stats["matched"] += 1
+        row[wvc_col] = code or row[wvc_col]
+        writer.writerow(row)
+    stats["unused_codes"] += len(table)
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge Zealy winners with a WVC list (streaming hash join).")
+    ap.add_argument("--zealy", required=True, help="Zealy winners CSV (delimiter auto-detected)")
+    ap.add_argument("--wvc", required=True, help="WVC CSV with a 'wvc' column (generate_wvc.py output)")
+    ap.add_argument("--out", default="zealy_with_wvc.csv", help="Output CSV path")
+    ap.add_argument("--mode", choices=("key", "rank"), default="key", help="Pair by key column or by rank")
+    ap.add_argument("--zealy-key", default="username", help="Zealy join column (mode key)")
+    ap.add_argument("--wvc-key", default="assigned_to", help="WVC join column (mode key)")
+    ap.add_argument("--partitions", type=int, default=0,
+                    help=f"Hash partitions (0 = one per {DEFAULT_PARTITION_MB} MB of WVC list)")
+    ap.add_argument("--unmatched", default="", help="Also write the Zealy rows without a code here")
+    ap.add_argument("--strict", action="store_true", help="Exit with status 1 if some winner got no code")
+    args = ap.parse_args()
+
+    zealy_path, wvc_path = Path(args.zealy), Path(args.wvc)
+    for p in (zealy_path, wvc_path):
+        if not p.exists():
+            print(f"ERROR: file not found: {p}")
+            sys.exit(1)
+    try:
+        stats = merge(zealy_path, wvc_path, Path(args.out), args.mode, args.zealy_key, args.wvc_key,
+                      args.partitions, Path(args.unmatched) if args.unmatched else None)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    print(f"✅ Output written: {Path(args.out).resolve()}")
+    print(f"   Rows: {stats['rows']} | with code: {stats['matched']} | without code: {stats['unmatched']}")
+    print(f"   Unused codes: {stats['unused_codes']} | duplicate WVC keys skipped: {stats['duplicate_keys']}")
+    if args.strict and stats["unmatched"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+message_catalog.py
+
+Locale-aware message catalog behind messages.py.
+
+Templates are str.format strings ("{wallet}", literal braces as "{{ }}"),
+grouped by locale. Everything that can be done once is done at import:
+the locale footer (the liability disclaimer) is joined to each template, and
+templates without placeholders are rendered to their final string, so a
+static reply is a dict lookup.
+
+Parametrized templates are rewritten with positional fields ({0}, {1}, ...)
+in the order their names first appear in the default-locale template; every
+locale uses that same order, whatever order its text mentions them in.
+render() takes the values positionally (they must be hashable) and is a
+bounded functools.lru_cache: on a hit (same user asking /status again, same
+guide with the same deadline) the cost is the C cache lookup, several times
+cheaper than formatting a ~1 KB template. text() returns the precompiled
+static messages; get() takes keyword arguments for either kind.
+
+A key missing from a locale falls back to the default locale, so a new
+language can be added one message at a time.
+"""
+
+import string
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+_FORMATTER = string.Formatter()
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+def _field_names(tpl: str) -> Tuple[str, ...]:
+    names = []
+    for _, field, _, _ in _FORMATTER.parse(tpl):
+        if field is not None and field not in names:
+            names.append(field)
+    return tuple(names)
+
+def _positional(tpl: str, order: Tuple[str, ...]) -> str:
+    """Rewrite "{name!r:>10}" as "{3!r:>10}" following `order`."""
+    out = []
+    for literal, field, spec, conv in _FORMATTER.parse(tpl):
+        out.append(_escape(literal))
+        if field is not None:
+            out.append("{" + str(order.index(field)) + (f"!{conv}" if conv else "") + (f":{spec}" if spec else "") + "}")
+    return "".join(out)
+
+class MessageCatalog:
+    """{locale: {key: template}} compiled once; render()/get() go through a bounded cache."""
+
+    def __init__(self, templates: Dict[str, Dict[str, str]], default_locale: str = "en",
+                 footers: Optional[Dict[str, str]] = None, no_footer: Iterable[str] = (), cache_size: int = 1024):
+        self.default_locale = default_locale
+        self.static: Dict[str, Dict[str, str]] = {}
+        self.compiled: Dict[str, Dict[str, str]] = {}
+        self.fields: Dict[str, Tuple[str, ...]] = {k: _field_names(t) for k, t in templates[default_locale].items()}
+        footers = footers or {}
+        no_footer = set(no_footer)
+        for locale, entries in templates.items():
+            footer = _escape(footers.get(locale, footers.get(default_locale, "")))
+            static, compiled = self.static.setdefault(locale, {}), self.compiled.setdefault(locale, {})
+            for key, tpl in entries.items():
+                order = self.fields.get(key)
+                if order is None:
+                    raise ValueError(f"{locale}:{key} not in the default locale")
+                if set(_field_names(tpl)) - set(order):
+                    raise ValueError(f"{locale}:{key} uses fields not in the default locale")
+                if footer and key not in no_footer:
+                    tpl = f"{tpl}\n\n{footer}"
+                if order:
+                    compiled[key] = _positional(tpl, order)
+                else:
+                    static[key] = tpl.format()  # solo "{{ }}" -> "{ }"
+        # render(key, locale, *values): lru_cache in C davanti a _format, nessun livello Python in più
+        self.render = lru_cache(maxsize=cache_size)(self._format)
+
+    def locales(self) -> set:
+        return set(self.static)
+
+    def _format(self, key: str, locale: Optional[str], *args) -> str:
+        tpl = self.compiled.get(locale or self.default_locale, {}).get(key)
+        if tpl is None:
+            tpl = self.compiled[self.default_locale][key]
+        return tpl.format(*args)
+
+    def text(self, key: str, locale: Optional[str] = None) -> str:
+        """A message without placeholders (precompiled at import)."""
+        text = self.static.get(locale or self.default_locale, {}).get(key)
+        return text if text is not None else self.static[self.default_locale][key]
+
+    def get(self, key: str, locale: Optional[str] = None, **params) -> str:
+        """Keyword-argument form of text()/render()."""
+        if not self.fields[key]:
+            return self.text(key, locale)
+        return self.render(key, locale, *(params[f] for f in self.fields[key]))
+
+    def cache_info(self):
+        return self.render.cache_info()
+
+    def cache_clear(self) -> None:
+        self.render.cache_clear()
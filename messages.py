@@ -1,5 +1,10 @@
 # messages.py (EN)
 
+from message_catalog import MessageCatalog
+
+DEFAULT_LOCALE = "en"   # utenti
+ADMIN_LOCALE = "it"     # notifiche al gruppo admin
+
 DISCLAIMER = (
     "⚖️ *Liability Clause:*\n"
     "_I declare that I request the registration/change of the wallet indicated above and "
@@ -9,186 +14,289 @@ DISCLAIMER = (
 def wrap_with_disclaimer(text: str) -> str:
     return f"{text}\n\n{DISCLAIMER}"
 
-def msg_start_request_username() -> str:
-    return wrap_with_disclaimer(
+# Templates str.format ({campo}; parentesi letterali come {{ }}). Il disclaimer del locale
+# viene aggiunto una volta sola alla costruzione del catalogo, tranne che per NO_DISCLAIMER.
+# Le funzioni msg_* passano i valori a CATALOG.render() nell'ordine in cui i campi
+# compaiono per la prima volta nel template inglese.
+EN = {
+    "start_request_username": (
         "👋 Welcome!\n"
         "To begin, please set your **Zealy username** using:\n"
         "`/set_username <your_username>`\n\n"
         "Example: `/set_username andrea_xyz`"
-    )
-
-def msg_username_saved(u: str) -> str:
-    return wrap_with_disclaimer(f"✅ Username saved: `{u}`\nYou can now use `/status`.")
-
-def msg_status(username: str, rank: str | int | None, xp: str | int | None, wallet: str | None, deadline_str: str, wvc: str | None, wvc_used: int | None) -> str:
-    r = f"{rank}" if rank is not None else "-"
-    x = f"{xp}" if xp is not None else "-"
-    w = wallet or "-"
-    return wrap_with_disclaimer(
+    ),
+    "username_saved": "✅ Username saved: `{u}`\nYou can now use `/status`.",
+    "username_suggestions": (
+        "🤔 `{u}` is not in the winners list.\n"
+        "Did you mean one of these? Tap your Zealy username to confirm."
+    ),
+    "btn_username_keep": "✏️ Keep {u}",
+    "status": (
         "🧾 *Contest Status*\n"
-        f"• Zealy Username: `{username}`\n"
-        f"• Rank: `{r}`\n"
-        f"• XP: `{x}`\n"
-        f"• Registered BSC wallet: `{w}`\n"
-        f"• Wallet change deadline: *{deadline_str}*\n\n"
+        "• Zealy Username: `{username}`\n"
+        "• Rank: `{rank}`\n"
+        "• XP: `{xp}`\n"
+        "• Registered BSC wallet: `{wallet}`\n"
+        "• Wallet change deadline: *{deadline_str}*\n\n"
         "Actions:\n"
         "• `/help` → Full usage guide\n"
         "• `/change_wallet` → Change wallet\n"
         "• `/add_wallet` → Register wallet (if missing)\n"
         "• `/proof` → Send Zealy profile screenshot"
-    )
-
-def msg_not_whitelisted() -> str:
-    return wrap_with_disclaimer(
+    ),
+    "not_whitelisted": (
         "⛔ Your username is not listed among the winners.\n"
         "If you believe this is an error, please contact support."
-    )
-
-def msg_after_deadline(deadline_str: str) -> str:
-    return wrap_with_disclaimer(
-        f"⛔ The period to register or change the wallet ended on *{deadline_str}*.\n"
+    ),
+    "after_deadline": (
+        "⛔ The period to register or change the wallet ended on *{deadline_str}*.\n"
         "It is no longer possible to make changes."
-    )
-
-def msg_add_wallet_guide(username: str, deadline_str: str, need_wvc: bool) -> str:
-    gate = "" if not need_wvc else "⚠️ Your WVC must be *validated* first with `/use_wvc <code>`.\n\n"
-    return wrap_with_disclaimer(
+    ),
+    "wvc_gate": "⚠️ Your WVC must be *validated* first with `/use_wvc <code>`.\n\n",
+    "add_wallet_guide": (
         "🆕 *BSC Wallet Registration*\n"
-        + gate +
+        "{gate}"
         "Please follow these steps:\n\n"
         "1️⃣ Send a *screenshot* of your Zealy profile → `/proof` (attach as a photo)\n"
         "2️⃣ Send your BSC wallet → `/set_wallet 0x...`\n"
         "3️⃣ Sign on BscScan and send the signature with `/reg_sig 0x...`\n\n"
         "*Message to sign (with the same wallet):*\n"
         "```\n"
-        f"Wallet registration — Zealy: {username} — Wallet: {{wallet}}\n"
+        "Wallet registration — Zealy: {username} — Wallet: {{wallet}}\n"
         "I declare that I request the registration of the wallet indicated above and release Savitri Network from any liability in case of my own mistake.\n"
         "```\n\n"
-        f"⚠️ You have time until *{deadline_str}*"
-    )
-
-def msg_proof_ok() -> str:
-    return wrap_with_disclaimer("✅ Screenshot received.\nNow send your wallet with: `/set_wallet 0x...`")
-
-def msg_need_photo() -> str:
-    return wrap_with_disclaimer("⚠️ Please send a *screenshot* as a *photo* (not as a file).")
-
-def msg_set_wallet_ok(wallet: str, username: str) -> str:
-    return wrap_with_disclaimer(
-        f"🧾 Wallet provided: `{wallet}`\n"
+        "⚠️ You have time until *{deadline_str}*"
+    ),
+    "proof_ok": "✅ Screenshot received.\nNow send your wallet with: `/set_wallet 0x...`",
+    "need_photo": "⚠️ Please send a *screenshot* as a *photo* (not as a file).",
+    "set_wallet_ok": (
+        "🧾 Wallet provided: `{wallet}`\n"
         "Now sign on BscScan and send the signature with `/reg_sig 0x...`\n\n"
         "*Message to sign:*\n"
         "```\n"
-        f"Wallet registration — Zealy: {username} — Wallet: {wallet}\n"
+        "Wallet registration — Zealy: {username} — Wallet: {wallet}\n"
         "I declare that I request the registration of the wallet indicated above and release Savitri Network from any liability in case of my own mistake.\n"
         "```"
-    )
-
-def msg_reg_sig_ok(wallet: str, msg_hash: str) -> str:
-    return wrap_with_disclaimer(
-        f"✅ Wallet successfully registered: `{wallet}`\n\n"
+    ),
+    "reg_sig_ok": (
+        "✅ Wallet successfully registered: `{wallet}`\n\n"
         "🔎 *Technical verification*\n"
-        f"SHA-256 hash of the signed message:\n`{msg_hash}`"
-    )
-
-def msg_sig_invalid() -> str:
-    return wrap_with_disclaimer(
+        "SHA-256 hash of the signed message:\n`{msg_hash}`"
+    ),
+    "sig_invalid": (
         "❌ Invalid signature. Make sure you signed *exactly* the required text "
         "and used the *same wallet* you specified."
-    )
-
-def msg_change_wallet_guide(username: str, old_wallet: str, deadline_str: str, need_wvc: bool) -> str:
-    gate = "" if not need_wvc else "⚠️ Your WVC must be *validated* first with `/use_wvc <code>`.\n\n"
-    return wrap_with_disclaimer(
+    ),
+    "change_wallet_guide": (
         "🔁 *BSC Wallet Change*\n"
-        + gate +
+        "{gate}"
         "For security you must:\n\n"
         "1️⃣ Sign with your **old wallet** on BscScan:\n"
         "```\n"
-        f"Wallet change request — Zealy: {username} — Old: {old_wallet}\n"
+        "Wallet change request — Zealy: {username} — Old: {old_wallet}\n"
         "```\n"
         "2️⃣ Send the signature: `/old_sig 0x...`\n\n"
         "3️⃣ Send the *new* wallet: `/new_wallet 0x...`\n"
         "4️⃣ Sign with your **new wallet** on BscScan:\n"
         "```\n"
-        f"Wallet change request — Zealy: {username} — Old: {old_wallet} — New: {{new_wallet}}\n"
+        "Wallet change request — Zealy: {username} — Old: {old_wallet} — New: {{new_wallet}}\n"
         "```\n"
         "5️⃣ Send the signature: `/new_sig 0x...`\n\n"
-        f"⚠️ You have time until *{deadline_str}*"
-    )
-
-def msg_old_sig_ok(msg_hash: str) -> str:
-    return wrap_with_disclaimer(
+        "⚠️ You have time until *{deadline_str}*"
+    ),
+    "old_sig_ok": (
         "✅ Old wallet signature verified.\n"
-        f"🔎 SHA-256 message hash: `{msg_hash}`\n\n"
+        "🔎 SHA-256 message hash: `{msg_hash}`\n\n"
         "Now send the *new wallet* with: `/new_wallet 0x...`"
-    )
-
-def msg_new_wallet_ok(new_wallet: str, username: str, old_wallet: str) -> str:
-    return wrap_with_disclaimer(
-        f"🆕 New wallet: `{new_wallet}`\n"
+    ),
+    "new_wallet_ok": (
+        "🆕 New wallet: `{new_wallet}`\n"
         "Now sign on BscScan and send the signature with `/new_sig 0x...`\n\n"
         "*Message to sign:*\n"
         "```\n"
-        f"Wallet change request — Zealy: {username} — Old: {old_wallet} — New: {new_wallet}\n"
+        "Wallet change request — Zealy: {username} — Old: {old_wallet} — New: {new_wallet}\n"
         "```"
-    )
-
-def msg_new_sig_ok(old_wallet: str, new_wallet: str, msg_hash: str) -> str:
-    return wrap_with_disclaimer(
+    ),
+    "new_sig_ok": (
         "✅ Wallet updated\n"
-        f"• Old: `{old_wallet}`\n"
-        f"• New: `{new_wallet}`\n\n"
+        "• Old: `{old_wallet}`\n"
+        "• New: `{new_wallet}`\n\n"
         "🔎 *Technical verification*\n"
-        f"SHA-256 message hash: `{msg_hash}`"
-    )
+        "SHA-256 message hash: `{msg_hash}`"
+    ),
+    "username_format_error": "⚠️ Invalid username format. Example: `/set_username andrea_xyz`",
+    "wallet_format_error": "⚠️ Invalid wallet. Make sure it has format `0x` + 40 hex chars.",
+    "wallet_checksum_error": (
+        "⚠️ This address mixes upper and lower case but the checksum does not match: "
+        "it was probably mistyped. Copy it again from your wallet app."
+    ),
+    "command_usage": "{text}",
+    # --- WVC messages ---
+    "wvc_none": "ℹ️ No WVC code is assigned to your username.",
+    "wvc_used": "🔑 Your WVC (`{hint}`) — *USED*",
+    "wvc_unused": "🔑 Your WVC ends with `{hint}` — *NOT USED*\nUse `/use_wvc <code>` with the full code you received to validate it (one-time).",
+    "wvc_required": "🔒 You must validate your WVC first: use `/use_wvc <code>`.",
+    "wvc_ok": "✅ WVC `{code}` validated. You can proceed with wallet actions.",
+    "wvc_invalid": "❌ Invalid WVC for your account (or already used). Please check your code.",
+    # --- Anti-flood ---
+    "throttled": "⏳ Too many requests. Please wait a few seconds and try again.",
+    "muted": "⛔ Too many requests: your messages will be ignored for the next {minutes} minutes.",
+    # --- Deadline reminders (admin broadcast) ---
+    "reminder_no_wallet": (
+        "⏰ *Reminder*\n"
+        "You have not registered a BSC wallet for your reward yet.\n"
+        "Use `/add_wallet` before *{deadline_str}*: after that date no changes are possible."
+    ),
+    "reminder_change_pending": (
+        "⏰ *Reminder*\n"
+        "Your wallet change is not complete yet.\n"
+        "Finish it with `/change_wallet` (or check it with `/status`) before *{deadline_str}*."
+    ),
+    # --- Admin notifications (to admin group) ---
+    "admin_notify_registration": (
+        "🔐 *Wallet Registration*\n\n"
+        "User: `{username}` (TG ID: `{tg_id}`)\n"
+        "Wallet: `{wallet}`\n"
+        "Signature: `{signature}`\n"
+        "Message hash: `{msg_hash}`\n\n"
+        "Verify signature:\nhttps://bscscan.com/verifiedSignatures"
+    ),
+    "admin_notify_change": (
+        "🔐 *Wallet Change*\n\n"
+        "User: `{username}` (TG ID: `{tg_id}`)\n"
+        "Old: `{old_wallet}`\n"
+        "New: `{new_wallet}`\n"
+        "Signature: `{signature}`\n"
+        "Message hash: `{msg_hash}`\n\n"
+        "Verify signature:\nhttps://bscscan.com/verifiedSignatures"
+    ),
+}
+
+# Italiano: per ora solo le notifiche admin; le altre chiavi ricadono sull'inglese
+IT = {
+    "admin_notify_registration": (
+        "🔐 *Registrazione wallet*\n\n"
+        "Utente: `{username}` (TG ID: `{tg_id}`)\n"
+        "Wallet: `{wallet}`\n"
+        "Firma: `{signature}`\n"
+        "Hash del messaggio: `{msg_hash}`\n\n"
+        "Verifica firma:\nhttps://bscscan.com/verifiedSignatures"
+    ),
+    "admin_notify_change": (
+        "🔐 *Cambio wallet*\n\n"
+        "Utente: `{username}` (TG ID: `{tg_id}`)\n"
+        "Vecchio: `{old_wallet}`\n"
+        "Nuovo: `{new_wallet}`\n"
+        "Firma: `{signature}`\n"
+        "Hash del messaggio: `{msg_hash}`\n\n"
+        "Verifica firma:\nhttps://bscscan.com/verifiedSignatures"
+    ),
+}
+
+NO_DISCLAIMER = ("btn_username_keep", "wvc_gate", "admin_notify_registration", "admin_notify_change",
+                 "reminder_no_wallet", "reminder_change_pending", "throttled", "muted")
+
+CATALOG = MessageCatalog({"en": EN, "it": IT}, DEFAULT_LOCALE, footers={"en": DISCLAIMER},
+                         no_footer=NO_DISCLAIMER, cache_size=1024)
+
+def msg_start_request_username(locale: str | None = None) -> str:
+    return CATALOG.text("start_request_username", locale)
+
+def msg_username_saved(u: str, locale: str | None = None) -> str:
+    return CATALOG.render("username_saved", locale, u)
+
+def msg_username_suggestions(u: str, locale: str | None = None) -> str:
+    return CATALOG.render("username_suggestions", locale, u)
+
+def btn_username_keep(u: str, locale: str | None = None) -> str:
+    return CATALOG.render("btn_username_keep", locale, u)
+
+def msg_status(username: str, rank: str | int | None, xp: str | int | None, wallet: str | None, deadline_str: str, wvc: str | None, wvc_used: int | None, locale: str | None = None) -> str:
+    r = f"{rank}" if rank is not None else "-"
+    x = f"{xp}" if xp is not None else "-"
+    return CATALOG.render("status", locale, username, r, x, wallet or "-", deadline_str)
+
+def msg_not_whitelisted(locale: str | None = None) -> str:
+    return CATALOG.text("not_whitelisted", locale)
+
+def msg_after_deadline(deadline_str: str, locale: str | None = None) -> str:
+    return CATALOG.render("after_deadline", locale, deadline_str)
+
+def msg_add_wallet_guide(username: str, deadline_str: str, need_wvc: bool, locale: str | None = None) -> str:
+    gate = CATALOG.text("wvc_gate", locale) if need_wvc else ""
+    return CATALOG.render("add_wallet_guide", locale, gate, username, deadline_str)
+
+def msg_proof_ok(locale: str | None = None) -> str:
+    return CATALOG.text("proof_ok", locale)
+
+def msg_need_photo(locale: str | None = None) -> str:
+    return CATALOG.text("need_photo", locale)
+
+def msg_set_wallet_ok(wallet: str, username: str, locale: str | None = None) -> str:
+    return CATALOG.render("set_wallet_ok", locale, wallet, username)
+
+def msg_reg_sig_ok(wallet: str, msg_hash: str, locale: str | None = None) -> str:
+    return CATALOG.render("reg_sig_ok", locale, wallet, msg_hash)
+
+def msg_sig_invalid(locale: str | None = None) -> str:
+    return CATALOG.text("sig_invalid", locale)
+
+def msg_change_wallet_guide(username: str, old_wallet: str, deadline_str: str, need_wvc: bool, locale: str | None = None) -> str:
+    gate = CATALOG.text("wvc_gate", locale) if need_wvc else ""
+    return CATALOG.render("change_wallet_guide", locale, gate, username, old_wallet, deadline_str)
 
-def msg_username_format_error() -> str:
-    return wrap_with_disclaimer("⚠️ Invalid username format. Example: `/set_username andrea_xyz`")
+def msg_old_sig_ok(msg_hash: str, locale: str | None = None) -> str:
+    return CATALOG.render("old_sig_ok", locale, msg_hash)
 
-def msg_wallet_format_error() -> str:
-    return wrap_with_disclaimer("⚠️ Invalid wallet. Make sure it has format `0x` + 40 hex chars.")
+def msg_new_wallet_ok(new_wallet: str, username: str, old_wallet: str, locale: str | None = None) -> str:
+    return CATALOG.render("new_wallet_ok", locale, new_wallet, username, old_wallet)
 
-def msg_command_usage(s: str) -> str:
-    return wrap_with_disclaimer(s)
+def msg_new_sig_ok(old_wallet: str, new_wallet: str, msg_hash: str, locale: str | None = None) -> str:
+    return CATALOG.render("new_sig_ok", locale, old_wallet, new_wallet, msg_hash)
+
+def msg_username_format_error(locale: str | None = None) -> str:
+    return CATALOG.text("username_format_error", locale)
+
+def msg_wallet_format_error(locale: str | None = None) -> str:
+    return CATALOG.text("wallet_format_error", locale)
+
+def msg_wallet_checksum_error(locale: str | None = None) -> str:
+    return CATALOG.text("wallet_checksum_error", locale)
+
+def msg_command_usage(s: str, locale: str | None = None) -> str:
+    return CATALOG.render("command_usage", locale, s)
 
 # --- WVC messages ---
-def msg_show_wvc(code: str | None, used: int | None) -> str:
-    if not code:
-        return wrap_with_disclaimer("ℹ️ No WVC code is assigned to your username.")
-    status = "USED" if used else "NOT USED"
-    return wrap_with_disclaimer(f"🔑 Your WVC: `{code}` — *{status}*\nUse `/use_wvc {code}` to validate it (one-time).")
+def msg_show_wvc(hint: str | None, used: int | None, locale: str | None = None) -> str:
+    if not hint:
+        return CATALOG.text("wvc_none", locale)
+    return CATALOG.render("wvc_used" if used else "wvc_unused", locale, hint)
+
+def msg_wvc_required(locale: str | None = None) -> str:
+    return CATALOG.text("wvc_required", locale)
+
+def msg_wvc_ok(code: str, locale: str | None = None) -> str:
+    return CATALOG.render("wvc_ok", locale, code)
 
-def msg_wvc_required() -> str:
-    return wrap_with_disclaimer("🔒 You must validate your WVC first: use `/use_wvc <code>`.")
+def msg_wvc_invalid(locale: str | None = None) -> str:
+    return CATALOG.text("wvc_invalid", locale)
 
-def msg_wvc_ok(code: str) -> str:
-    return wrap_with_disclaimer(f"✅ WVC `{code}` validated. You can proceed with wallet actions.")
+def msg_reminder(segment: str, deadline_str: str, locale: str | None = None) -> str:
+    """Default /admin_broadcast text for a segment ("no_wallet", "change_pending")."""
+    return CATALOG.render(f"reminder_{segment}", locale, deadline_str)
 
-def msg_wvc_invalid() -> str:
-    return wrap_with_disclaimer("❌ Invalid WVC for your account (or already used). Please check your code.")
+def msg_throttled(locale: str | None = None) -> str:
+    return CATALOG.text("throttled", locale)
+
+def msg_muted(minutes: int, locale: str | None = None) -> str:
+    return CATALOG.render("muted", locale, minutes)
 
 # --- Admin notifications (to admin group) ---
-def admin_notify_registration(username: str, tg_id: int, wallet: str, signature: str, msg_hash: str) -> str:
-    return (
-        "🔐 *Wallet Registration*\n\n"
-        f"User: `{username}` (TG ID: `{tg_id}`)\n"
-        f"Wallet: `{wallet}`\n"
-        f"Signature: `{signature}`\n"
-        f"Message hash: `{msg_hash}`\n\n"
-        "Verify signature:\nhttps://bscscan.com/verifiedSignatures"
-    )
+def admin_notify_registration(username: str, tg_id: int, wallet: str, signature: str, msg_hash: str, locale: str | None = ADMIN_LOCALE) -> str:
+    return CATALOG.render("admin_notify_registration", locale, username, tg_id, wallet, signature, msg_hash)
 
-def admin_notify_change(username: str, tg_id: int, old_wallet: str, new_wallet: str, signature: str, msg_hash: str) -> str:
-    return (
-        "🔐 *Wallet Change*\n\n"
-        f"User: `{username}` (TG ID: `{tg_id}`)\n"
-        f"Old: `{old_wallet}`\n"
-        f"New: `{new_wallet}`\n"
-        f"Signature: `{signature}`\n"
-        f"Message hash: `{msg_hash}`\n\n"
-        "Verify signature:\nhttps://bscscan.com/verifiedSignatures"
-    )
+def admin_notify_change(username: str, tg_id: int, old_wallet: str, new_wallet: str, signature: str, msg_hash: str, locale: str | None = ADMIN_LOCALE) -> str:
+    return CATALOG.render("admin_notify_change", locale, username, tg_id, old_wallet, new_wallet, signature, msg_hash)
 
 # --- Backward-compat strings expected by main.py ---
 # These constants provide a simple string interface compatible with the
@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py
+
+In-process instrumentation for the bot.
+
+- Latency histograms and error counters for every registered handler
+  (wrapped once in main() via instrument_application).
+- Timings for storage I/O (the @timed decorator) and for outbound Bot API
+  calls (InstrumentedRequest, a drop-in HTTPXRequest).
+- A small asyncio HTTP server that serves everything in Prometheus text
+  format on /metrics. It runs on the bot's own event loop, so no locking is
+  needed and a stalled loop shows up as a scrape timeout.
+- Event-loop health: a lag sampler (scheduling delay of a periodic sleep), a
+  watchdog thread that grabs the loop thread's stack when the loop stops
+  ticking, and a slow-handler detector that records where a handler was
+  suspended once it exceeds a threshold.
+- Liveness/readiness checks for the same HTTP server (/healthz, /readyz),
+  cached so a probe never does real work more than once per TTL.
+
+All state lives in memory and resets on restart, as Prometheus expects.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from telegram.ext import ApplicationHandlerStop
+from telegram.request import HTTPXRequest
+
+log = logging.getLogger("savitri-bot.metrics")
+
+# Upper bounds in seconds; the last implicit bucket is +Inf
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside the matching bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lo + (hi - lo) * (rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+class Registry:
+    """Metric store keyed by (metric name, sorted label pairs)."""
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, Union[float, Callable[[], float]]]] = {}
+        self.help: Dict[str, str] = {}
+
+    @staticmethod
+    def _labels(labels: Optional[dict]) -> Labels:
+        return tuple(sorted((labels or {}).items()))
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def observe(self, name: str, value: float, /, **labels) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = self._labels(labels)
+        h = series.get(key)
+        if h is None:
+            h = series[key] = Histogram()
+        h.observe(value)
+
+    def inc(self, name: str, amount: float = 1, /, **labels) -> None:
+        series = self.counters.setdefault(name, {})
+        key = self._labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: Union[float, Callable[[], float]], /, **labels) -> None:
+        """Set a gauge to a value, or to a callable evaluated at scrape time."""
+        self.gauges.setdefault(name, {})[self._labels(labels)] = value
+
+    def counter_value(self, name: str, /, **labels) -> float:
+        return self.counters.get(name, {}).get(self._labels(labels), 0)
+
+    def snapshot(self, name: str) -> List[dict]:
+        """Histogram summary rows for /admin_stats, slowest p99 first."""
+        rows = []
+        for key, h in self.histograms.get(name, {}).items():
+            rows.append({
+                "labels": dict(key), "count": h.count, "sum": h.sum,
+                "p50": h.quantile(0.5), "p99": h.quantile(0.99), "max": h.max,
+            })
+        rows.sort(key=lambda r: r["p99"], reverse=True)
+        return rows
+
+    # ---------- Prometheus text format ----------
+    @staticmethod
+    def _fmt_labels(key: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        body = ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in pairs
+        )
+        return "{" + body + "}"
+
+    def render(self) -> str:
+        out: List[str] = []
+        for name, series in sorted(self.counters.items()):
+            if name in self.help:
+                out.append(f"# HELP {name} {self.help[name]}")
+            out.append(f"# TYPE {name} counter")
+            for key, v in series.items():
+                out.append(f"{name}{self._fmt_labels(key)} {v}")
+        for name, series in sorted(self.gauges.items()):
+            if name in self.help:
+                out.append(f"# HELP {name} {self.help[name]}")
+            out.append(f"# TYPE {name} gauge")
+            for key, v in series.items():
+                try:
+                    value = v() if callable(v) else v
+                except Exception as e:
+                    log.warning("Gauge %s failed: %s", name, e)
+                    continue
+                out.append(f"{name}{self._fmt_labels(key)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            if name in self.help:
+                out.append(f"# HELP {name} {self.help[name]}")
+            out.append(f"# TYPE {name} histogram")
+            for key, h in series.items():
+                cumulative = 0
+                for bound, c in zip(BUCKETS + (float("inf"),), h.counts):
+                    cumulative += c
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    out.append(f"{name}_bucket{self._fmt_labels(key, ('le', le))} {cumulative}")
+                out.append(f"{name}_sum{self._fmt_labels(key)} {h.sum}")
+                out.append(f"{name}_count{self._fmt_labels(key)} {h.count}")
+        return "\n".join(out) + "\n"
+
+REGISTRY = Registry()
+REGISTRY.describe("bot_handler_seconds", "Update handler latency")
+REGISTRY.describe("bot_handler_errors_total", "Exceptions raised by update handlers")
+REGISTRY.describe("bot_storage_seconds", "Time spent in storage I/O helpers")
+REGISTRY.describe("bot_api_seconds", "Outbound Telegram Bot API call latency")
+REGISTRY.describe("bot_api_errors_total", "Failed Bot API calls (network errors or HTTP status >= 400)")
+REGISTRY.describe("bot_loop_lag_seconds", "Event loop scheduling delay of the lag sampler")
+REGISTRY.describe("bot_loop_stalls_total", "Times the event loop stopped ticking for longer than the stall threshold")
+REGISTRY.describe("bot_slow_handlers_total", "Handler runs slower than the slow-handler threshold")
+
+# -------------------- EVENT LOOP HEALTH --------------------
+MAX_STACK_CHARS = 3000
+
+def _format_frames(frames) -> str:
+    text = "".join(traceback.format_list(traceback.StackSummary.extract(
+        ((f, f.f_lineno) for f in frames), capture_locals=False)))
+    return text[-MAX_STACK_CHARS:]
+
+def coroutine_stack(coro) -> str:
+    """Where a suspended coroutine is waiting: follow the await chain down to the innermost frame."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return _format_frames(frames)
+
+def thread_stack(thread_id: int) -> str:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return ""
+    return "".join(traceback.format_stack(frame))[-MAX_STACK_CHARS:]
+
+class SlowHandlerDetector:
+    """Keeps the last slow handler runs with the stack they were stuck in.
+
+    If the handler is awaiting (network, sleep) a timer on the loop records the
+    await chain when the threshold passes. If it is blocking the loop, the timer
+    cannot fire and the LoopLagMonitor thread captures the synchronous stack.
+    """
+
+    def __init__(self, threshold: float = 2.0, keep: int = 20):
+        self.threshold = threshold
+        self.events: Deque[dict] = deque(maxlen=keep)
+        # handler currently running on the loop (PTB runs updates sequentially by default)
+        self.current: Optional[Tuple[str, float]] = None
+
+    def capture(self, task: Optional[asyncio.Task], pending: dict) -> None:
+        if task is not None and not task.done():
+            pending["stack"] = coroutine_stack(task.get_coro())
+
+    def report(self, label: str, elapsed: float, stack: str) -> None:
+        REGISTRY.inc("bot_slow_handlers_total", handler=label)
+        self.events.append({"ts": time.time(), "handler": label, "seconds": elapsed, "stack": stack})
+        log.warning("Slow handler %s took %.2fs (threshold %.2fs)%s", label, elapsed, self.threshold,
+                    f"; stuck at:\n{stack}" if stack else "")
+
+SLOW_HANDLERS = SlowHandlerDetector()
+
+class LoopLagMonitor:
+    """Samples event-loop lag and catches stalls from a side thread.
+
+    The sampler sleeps `interval` seconds on the loop and records how late it
+    wakes up. A daemon thread watches the sampler's heartbeat; when the loop has
+    not ticked for `stall_threshold` seconds it logs the loop thread's current
+    stack (the blocking call) once per stall.
+    """
+
+    def __init__(self, interval: float = 0.25, stall_threshold: float = 1.0, keep: int = 20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.stalls: Deque[dict] = deque(maxlen=keep)
+        self.recent: Deque[float] = deque(maxlen=max(1, int(10 / interval)))  # ~10s of samples
+        self.last_tick = time.monotonic()
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample(), name="loop-lag-sampler")
+        self._thread = threading.Thread(target=self._watch, name="loop-stall-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t0 - self.interval)
+            self.last_tick = time.monotonic()
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.recent.append(lag)
+            REGISTRY.observe("bot_loop_lag_seconds", lag)
+
+    def _watch(self) -> None:
+        reported_tick = None
+        limit = self.interval + self.stall_threshold
+        while not self._stop.wait(min(0.1, self.stall_threshold / 2)):
+            tick = self.last_tick
+            blocked = time.monotonic() - tick
+            if blocked < limit or reported_tick == tick:
+                continue
+            reported_tick = tick
+            stack = thread_stack(self._loop_thread_id) if self._loop_thread_id else ""
+            current = SLOW_HANDLERS.current
+            handler = current[0] if current else None
+            REGISTRY.inc("bot_loop_stalls_total")
+            self.stalls.append({"ts": time.time(), "blocked": blocked, "handler": handler, "stack": stack})
+            log.warning("Event loop blocked for %.2fs%s; loop thread stack:\n%s",
+                        blocked, f" (handler {handler})" if handler else "", stack)
+
+    def summary(self) -> dict:
+        """Recent (~10s) lag figures for health probes."""
+        recent = sorted(self.recent)
+        return {
+            "last_tick_age_s": round(time.monotonic() - self.last_tick, 3),
+            "recent_p99_s": round(recent[min(len(recent) - 1, int(len(recent) * 0.99))], 4) if recent else 0.0,
+            "recent_max_s": round(recent[-1], 4) if recent else 0.0,
+            "max_s": round(self.max_lag, 4),
+            "stalls": len(self.stalls),
+        }
+
+    def stall_during(self, since_wall: float) -> Optional[dict]:
+        """Last stall recorded after `since_wall` (time.time()), if any."""
+        for st in reversed(self.stalls):
+            if st["ts"] >= since_wall:
+                return st
+        return None
+
+LOOP_MONITOR: Optional[LoopLagMonitor] = None
+
+def start_loop_monitor(interval: float = 0.25, stall_threshold: float = 1.0) -> LoopLagMonitor:
+    """Start the lag sampler on the running loop (call from post_init)."""
+    global LOOP_MONITOR
+    LOOP_MONITOR = LoopLagMonitor(interval, stall_threshold)
+    LOOP_MONITOR.start()
+    return LOOP_MONITOR
+
+# -------------------- INSTRUMENTATION --------------------
+def instrument_handler(callback: Callable[..., Awaitable], name: Optional[str] = None):
+    """Wrap an async PTB callback to record latency and errors."""
+    if getattr(callback, "__instrumented__", False):
+        return callback
+    label = name or getattr(callback, "__name__", "handler")
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        t0 = time.perf_counter()
+        started = time.time()
+        pending: dict = {}
+        timer = None
+        if SLOW_HANDLERS.threshold > 0:
+            timer = asyncio.get_running_loop().call_later(
+                SLOW_HANDLERS.threshold, SLOW_HANDLERS.capture, asyncio.current_task(), pending)
+        previous, SLOW_HANDLERS.current = SLOW_HANDLERS.current, (label, started)
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            REGISTRY.inc("bot_handler_errors_total", handler=label)
+            raise
+        finally:
+            SLOW_HANDLERS.current = previous
+            elapsed = time.perf_counter() - t0
+            REGISTRY.observe("bot_handler_seconds", elapsed, handler=label)
+            if timer is not None:
+                timer.cancel()
+                if elapsed > SLOW_HANDLERS.threshold:
+                    stack = pending.get("stack")
+                    if stack is None and LOOP_MONITOR is not None:
+                        stall = LOOP_MONITOR.stall_during(started)
+                        stack = stall["stack"] if stall else ""
+                    SLOW_HANDLERS.report(label, elapsed, stack or "")
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def instrument_application(application) -> int:
+    """Wrap the callback of every handler registered on the application. Returns the count."""
+    n = 0
+    for handlers in application.handlers.values():
+        for h in handlers:
+            h.callback = instrument_handler(h.callback)
+            n += 1
+    return n
+
+def timed(op: str):
+    """Decorator for synchronous storage helpers."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REGISTRY.observe("bot_storage_seconds", time.perf_counter() - t0, op=op)
+        return wrapper
+    return deco
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call, labelled by API method."""
+
+    # calls currently waiting on Telegram, across all instances (getUpdates included)
+    inflight = 0
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1] or "unknown"
+        t0 = time.perf_counter()
+        InstrumentedRequest.inflight += 1
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            REGISTRY.inc("bot_api_errors_total", method=api_method, code="network")
+            raise
+        finally:
+            InstrumentedRequest.inflight -= 1
+            REGISTRY.observe("bot_api_seconds", time.perf_counter() - t0, method=api_method)
+        if code >= 400:
+            REGISTRY.inc("bot_api_errors_total", method=api_method, code=str(code))
+        return code, payload
+
+REGISTRY.describe("bot_api_inflight", "Bot API calls currently in flight")
+REGISTRY.set_gauge("bot_api_inflight", lambda: InstrumentedRequest.inflight)
+
+# -------------------- HTTP ENDPOINT --------------------
+RouteResult = Tuple[int, str, str]  # (status, content type, body)
+CheckResult = Tuple[bool, str]      # (ok, detail)
+
+def json_result(ok: bool, payload: dict) -> RouteResult:
+    return (200 if ok else 503), "application/json", json.dumps(payload, separators=(",", ":")) + "\n"
+
+class HealthChecks:
+    """Named readiness checks with a per-check result cache.
+
+    Probes can hit the endpoint as often as they like: each check runs at most
+    once every `ttl` seconds, the rest of the time the cached result is served.
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self.checks: Dict[str, Callable[[], CheckResult]] = {}
+        self._cache: Dict[str, Tuple[float, bool, str]] = {}
+
+    def add(self, name: str, fn: Callable[[], CheckResult]) -> None:
+        self.checks[name] = fn
+
+    def run(self) -> Tuple[bool, Dict[str, dict]]:
+        now = time.monotonic()
+        results = {}
+        for name, fn in self.checks.items():
+            cached = self._cache.get(name)
+            if cached is None or now - cached[0] >= self.ttl:
+                try:
+                    ok, detail = fn()
+                except Exception as e:
+                    ok, detail = False, f"error: {e}"
+                cached = self._cache[name] = (now, ok, detail)
+            results[name] = {"ok": cached[1], "detail": cached[2]}
+        return all(r["ok"] for r in results.values()), results
+
+class MetricsServer:
+    """Minimal HTTP/1.0 server for /metrics (and any extra GET routes)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.routes: Dict[str, Callable[[], Union[RouteResult, Awaitable[RouteResult]]]] = {
+            "/metrics": lambda: (200, "text/plain; version=0.0.4; charset=utf-8", REGISTRY.render()),
+        }
+
+    def route(self, path: str, fn) -> None:
+        self.routes[path] = fn
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        log.info("Metrics endpoint listening on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # drain headers
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) >= 2 else "/"
+            fn = self.routes.get(path) if parts and parts[0] in ("GET", "HEAD") else None
+            if fn is None:
+                status, ctype, body = 404, "text/plain; charset=utf-8", "not found\n"
+            else:
+                res = fn()
+                status, ctype, body = (await res) if asyncio.iscoroutine(res) else res
+            data = body.encode("utf-8")
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}.get(status, "OK")
+            head = (
+                f"HTTP/1.0 {status} {reason}\r\n"
+                f"Content-Type: {ctype}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode("latin-1")
+            writer.write(head if parts and parts[0] == "HEAD" else head + data)
+            await writer.drain()
+        except Exception as e:
+            log.debug("Metrics request failed: %s", e)
+        finally:
+            writer.close()
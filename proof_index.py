@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+proof_index.py
+
+Perceptual-hash index over the Zealy screenshots stored in data/proofs.
+
+Each proof gets a 64-bit dHash (horizontal gradient) and a 64-bit aHash
+(mean threshold). Re-encoded, resized or slightly recompressed copies of the
+same screenshot keep a small Hamming distance, while the SHA-256 of the file
+changes completely.
+
+The dHashes live in a BK-tree, so a nearest-neighbour query only visits the
+branches allowed by the triangle inequality instead of scanning every proof.
+Hashes are cached next to the proofs, one JSON array per line appended as
+proofs arrive, so an upload writes one line and restarts only decode images
+added since the last run. The cache is rewritten in full only by a scan that
+finds it stale (deleted proofs, a truncated line, or the single-object
+format of earlier versions). Decoding runs outside the index lock: main.py
+calls add_file() and refresh() from a worker thread.
+
+Dependencies:
+    pip install pillow
+( without Pillow the index stays empty and ingestion is never blocked )
+"""
+
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Optional imports for image decoding
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+log = logging.getLogger("savitri-bot.proofs")
+
+HASH_SIZE = 8  # 8x8 -> 64 bit
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def _grayscale(path: Path, width: int, height: int) -> List[int]:
+    with Image.open(path) as img:
+        # JPEG: decode directly at reduced scale (much faster than a full decode)
+        img.draft("L", (width * 8, height * 8))
+        small = img.convert("L").resize((width, height), Image.BILINEAR)
+        return list(small.getdata())
+
+def dhash_ahash(path: Path) -> Tuple[int, int]:
+    """Return (dhash, ahash) of an image file as 64-bit integers."""
+    if not PIL_AVAILABLE:
+        raise RuntimeError("Pillow not available. Install with: pip install pillow")
+    px = _grayscale(path, HASH_SIZE + 1, HASH_SIZE)
+    dh = 0
+    for y in range(HASH_SIZE):
+        row = y * (HASH_SIZE + 1)
+        for x in range(HASH_SIZE):
+            dh = (dh << 1) | (px[row + x] > px[row + x + 1])
+    # aHash over the same thumbnail, dropping the extra column
+    cells = [px[y * (HASH_SIZE + 1) + x] for y in range(HASH_SIZE) for x in range(HASH_SIZE)]
+    mean = sum(cells) / len(cells)
+    ah = 0
+    for v in cells:
+        ah = (ah << 1) | (v > mean)
+    return dh, ah
+
+def tg_id_from_name(name: str) -> Optional[int]:
+    # proofs are saved as <tg_id>_<ts>.jpg
+    head = name.split("_", 1)[0]
+    return int(head) if head.isdigit() else None
+
+class BKTree:
+    """BK-tree keyed by 64-bit hashes under the Hamming metric.
+
+    Nodes are [hash, children{distance: node}, payloads[]]; identical hashes
+    share one node.
+    """
+
+    def __init__(self):
+        self.root: Optional[list] = None
+        self.size = 0
+
+    def add(self, h: int, payload) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [h, {}, [payload]]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[2].append(payload)
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [h, {}, [payload]]
+                return
+            node = child
+
+    def search(self, h: int, max_distance: int) -> List[Tuple[int, int, object]]:
+        """Return [(distance, hash, payload)] within max_distance, closest first."""
+        out = []
+        if self.root is None:
+            return out
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= max_distance:
+                out.extend((d, node[0], p) for p in node[2])
+            lo, hi = d - max_distance, d + max_distance
+            for dist, child in node[1].items():
+                if lo <= dist <= hi:
+                    stack.append(child)
+        out.sort(key=lambda t: t[0])
+        return out
+
+    def __len__(self) -> int:
+        return self.size
+
+class ProofIndex:
+    """Similarity index over proof screenshots, backed by a JSON hash cache."""
+
+    def __init__(self, proofs_dir: Path, cache_file: Path, max_distance: int = 6, ahash_slack: int = 4):
+        self.proofs_dir = Path(proofs_dir)
+        self.cache_file = Path(cache_file)
+        self.max_distance = max_distance
+        self.ahash_slack = ahash_slack
+        self.tree = BKTree()
+        # file name -> (dhash, ahash)
+        self.hashes: Dict[str, Tuple[int, int]] = {}
+        self.lock = threading.Lock()  # tree/hashes: add_file() e refresh() girano in thread
+        self.cache_stale = False
+
+    # ---------- persistence ----------
+    @staticmethod
+    def _cache_line(name: str, hv: Tuple[int, int]) -> str:
+        return json.dumps([name, f"{hv[0]:016x}", f"{hv[1]:016x}"], separators=(",", ":")) + "\n"
+
+    def _load_cache(self) -> Dict[str, Tuple[int, int]]:
+        """Hashes in the cache file; sets cache_stale when the file needs a full rewrite."""
+        self.cache_stale = False
+        if not self.cache_file.exists():
+            return {}
+        try:
+            text = self.cache_file.read_text(encoding="utf-8")
+        except Exception as e:
+            log.warning("Failed to read proof hash cache: %s", e)
+            return {}
+        out: Dict[str, Tuple[int, int]] = {}
+        if text.startswith("{"):
+            # formato delle versioni precedenti: un solo oggetto JSON
+            self.cache_stale = True
+            try:
+                return {k: (int(v[0], 16), int(v[1], 16)) for k, v in json.loads(text).items()}
+            except Exception as e:
+                log.warning("Failed to read proof hash cache: %s", e)
+                return {}
+        lines = text.splitlines()
+        for line in lines:
+            try:
+                name, dh, ah = json.loads(line)
+                out[name] = (int(dh, 16), int(ah, 16))
+            except (ValueError, TypeError):
+                continue  # riga troncata da un crash durante l'append: l'hash viene ricalcolato
+        self.cache_stale = len(out) != len(lines) or not text.endswith("\n")
+        return out
+
+    def _append_cache(self, items: List[Tuple[str, Tuple[int, int]]]) -> None:
+        if not items:
+            return
+        try:
+            # una sola write in append: le righe di più worker non si mescolano
+            with open(self.cache_file, "a", encoding="utf-8") as f:
+                f.write("".join(self._cache_line(name, hv) for name, hv in items))
+        except Exception as e:
+            log.warning("Failed to append to proof hash cache: %s", e)
+
+    def _save_cache(self) -> None:
+        # file temporaneo + rename: con più worker nessuno legge mai una cache scritta a metà
+        tmp = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text("".join(self._cache_line(k, hv) for k, hv in self.hashes.items()), encoding="utf-8")
+            os.replace(tmp, self.cache_file)
+        except Exception as e:
+            log.warning("Failed to write proof hash cache: %s", e)
+
+    # ---------- build / ingest ----------
+    def build(self) -> int:
+        """(Re)build the index from proofs_dir, hashing only files missing from the cache."""
+        with self.lock:
+            self.tree = BKTree()
+            self.hashes = {}
+        if not self.proofs_dir.exists():
+            return 0
+        _, computed = self._scan()
+        log.info("Proof index built: %d images (%d newly hashed)", len(self.hashes), computed)
+        return len(self.hashes)
+
+    def refresh(self) -> int:
+        """Index the proofs saved since the last build (e.g. by another worker); returns how many."""
+        if not self.proofs_dir.exists():
+            return 0
+        added, computed = self._scan()
+        if added:
+            log.info("Proof index refreshed: %d new images (%d newly hashed)", added, computed)
+        return added
+
+    def _scan(self) -> Tuple[int, int]:
+        """Insert the files of proofs_dir not indexed yet: (added, hashed instead of read from the cache)."""
+        with self.lock:
+            cached = self._load_cache()
+            added = 0
+            todo: List[Path] = []
+            for p in sorted(self.proofs_dir.iterdir()):
+                if p.suffix.lower() not in IMAGE_SUFFIXES or p.name in self.hashes:
+                    continue
+                hv = cached.get(p.name)
+                if hv is None:
+                    todo.append(p)
+                    continue
+                self._insert(p.name, hv)
+                added += 1
+        # decodifica fuori dal lock, come add_file: upload e query non aspettano la scansione
+        hashed: List[Tuple[str, Tuple[int, int]]] = []
+        for p in todo if PIL_AVAILABLE else ():
+            try:
+                hashed.append((p.name, dhash_ahash(p)))
+            except Exception as e:
+                log.warning("Cannot hash proof %s: %s", p.name, e)
+        with self.lock:
+            new = [(name, hv) for name, hv in hashed if name not in self.hashes]  # add_file può averle già inserite
+            for name, hv in new:
+                self._insert(name, hv)
+            added += len(new)
+            if self.cache_stale or any(name not in self.hashes for name in cached):
+                self._save_cache()
+            else:
+                self._append_cache(new)
+        return added, len(new)
+
+    def _insert(self, name: str, hv: Tuple[int, int]) -> None:
+        self.hashes[name] = hv
+        self.tree.add(hv[0], name)
+
+    def add_file(self, path: Path) -> List[dict]:
+        """Hash and index a new proof; return similar proofs from *other* users."""
+        path = Path(path)
+        if not PIL_AVAILABLE or path.name in self.hashes:
+            return []
+        hv = dhash_ahash(path)  # decodifica fuori dal lock
+        with self.lock:
+            if path.name in self.hashes:
+                return []
+            matches = self.similar_to(hv, exclude_tg_id=tg_id_from_name(path.name))
+            self._insert(path.name, hv)
+            self._append_cache([(path.name, hv)])
+        return matches
+
+    # ---------- queries ----------
+    def similar_to(self, hv: Tuple[int, int], max_distance: Optional[int] = None,
+                   exclude_tg_id: Optional[int] = None) -> List[dict]:
+        md = self.max_distance if max_distance is None else max_distance
+        dh, ah = hv
+        out = []
+        for d, _, name in self.tree.search(dh, md):
+            tg = tg_id_from_name(name)
+            if exclude_tg_id is not None and tg == exclude_tg_id:
+                continue
+            # second opinion from aHash to cut false positives on near-blank screenshots
+            ad = hamming(ah, self.hashes[name][1])
+            if ad > md + self.ahash_slack:
+                continue
+            out.append({"file": name, "tg_id": tg, "distance": d, "ahash_distance": ad})
+        return out
+
+    def similar_groups(self, max_distance: Optional[int] = None) -> List[List[dict]]:
+        """Cluster proofs shared across different tg_ids (union-find over BK-tree neighbours)."""
+        md = self.max_distance if max_distance is None else max_distance
+        with self.lock:
+            return self._groups(md)
+
+    def _groups(self, md: int) -> List[List[dict]]:
+        parent: Dict[str, str] = {}
+
+        def find(x: str) -> str:
+            while parent.get(x, x) != x:
+                parent[x] = parent.get(parent[x], parent[x])
+                x = parent[x]
+            return x
+
+        for name, hv in self.hashes.items():
+            tg = tg_id_from_name(name)
+            for m in self.similar_to(hv, md, exclude_tg_id=tg):
+                parent.setdefault(name, name)
+                parent.setdefault(m["file"], m["file"])
+                ra, rb = find(name), find(m["file"])
+                if ra != rb:
+                    parent[ra] = rb
+
+        groups: Dict[str, List[str]] = {}
+        for name in parent:
+            groups.setdefault(find(name), []).append(name)
+        out = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            ref = self.hashes[members[0]][0]
+            out.append(sorted(
+                ({"file": n, "tg_id": tg_id_from_name(n), "distance": hamming(ref, self.hashes[n][0])} for n in members),
+                key=lambda e: e["file"]
+            ))
+        out.sort(key=len, reverse=True)
+        return out
+
+    def __len__(self) -> int:
+        return len(self.hashes)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+rewards.py
+
+Payout computation from the winners list: rank and XP come from the Zealy
+index (or from winners_final.csv, the /admin_export_final file), the wallet
+is the updated one when the user registered or changed it.
+
+Two formulas:
+  tiers         fixed amount per rank range, e.g. "1:1000,2-10:500,11-100:100"
+  proportional  a pool split by weight: xp**exp (default) or (1/rank)**exp
+
+Amounts are integers in units of 10**-decimals (default 6 decimals). The
+proportional split floors every share and gives the leftover units to the
+largest remainders, so the total is exactly the pool. Winners with several
+rows on the same wallet are summed into one payout; winners without a valid
+wallet are left out of the manifest and reported as withheld (with
+--redistribute their share goes to the others).
+
+WinnerTable parses the rows once into arrays; allocate() is then plain
+array arithmetic (NumPy when installed, lists otherwise), so a new formula on
+100k winners is recomputed in a few milliseconds. The manifest is one CSV
+row per wallet with the multisend batch it belongs to.
+
+Usage:
+    python rewards.py --input winners_final.csv --tiers "1:1000,2-10:500,11-100:100"
+    python rewards.py --input winners_final.csv --pool 100000 --weight xp --batch-size 200 --split-dir batches/
+"""
+
+import re
+import csv
+import sys
+import bisect
+import argparse
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+WALLET_RE = re.compile(r"^0x[a-fA-F0-9]{40}$")
+DEFAULT_DECIMALS = 6
+DEFAULT_BATCH_SIZE = 200  # indirizzi per transazione multisend
+MANIFEST_FIELDS = ["batch", "wallet", "amount", "winners", "usernames"]
+
+def _number(value) -> float:
+    # "1,234" / " 12 " / "#3" -> 1234.0 / 12.0 / 3.0; vuoto o non numerico -> 0; negativo -> ValueError
+    text = str(value or "").strip()
+    if text.startswith(("-", "\u2212")) and re.search(r"[1-9]", text):
+        raise ValueError(f"valore negativo non ammesso: '{text}'")
+    digits = re.sub(r"[^0-9.]", "", text)
+    try:
+        return float(digits) if digits else 0.0
+    except ValueError:
+        return 0.0
+
+def parse_tiers(spec: str) -> List[Tuple[int, int, float]]:
+    """"1:1000,2-10:500" -> [(1, 1, 1000.0), (2, 10, 500.0)], sorted, no overlaps."""
+    tiers = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        m = re.fullmatch(r"(\d+)(?:-(\d+))?:(\d+(?:\.\d+)?)", part)
+        if not m:
+            raise ValueError(f"fascia non valida: '{part}' (formato: 1:1000 oppure 2-10:500)")
+        lo, hi = int(m.group(1)), int(m.group(2) or m.group(1))
+        if lo < 1 or hi < lo:
+            raise ValueError(f"fascia non valida: '{part}'")
+        tiers.append((lo, hi, float(m.group(3))))
+    if not tiers:
+        raise ValueError("nessuna fascia")
+    tiers.sort()
+    for (_, hi, _), (lo, _, _) in zip(tiers, tiers[1:]):
+        if lo <= hi:
+            raise ValueError(f"fasce sovrapposte al rank {lo}")
+    return tiers
+
+def format_units(units: int, decimals: int = DEFAULT_DECIMALS) -> str:
+    if not decimals:
+        return str(units)
+    return f"{units // 10 ** decimals}.{units % 10 ** decimals:0{decimals}d}"
+
+class WinnerTable:
+    """Rank/XP/wallet columns of the winners, parsed once."""
+
+    def __init__(self, rows: Iterable[dict]):
+        self.usernames: List[str] = []
+        self.wallets: List[str] = []     # un indirizzo per wallet distinto (prima grafia vista)
+        self.missing: List[str] = []     # username senza wallet valido
+        ranks, xps, wallet_ids = [], [], []
+        seen: Dict[str, int] = {}
+        for row in rows:
+            wallet = (row.get("updated_wallet") or row.get("wallet") or "").strip()
+            self.usernames.append(row.get("username") or "")
+            ranks.append(int(_number(row.get("rank"))))
+            xps.append(_number(row.get("xp")))
+            if WALLET_RE.match(wallet):
+                wid = seen.setdefault(wallet.lower(), len(self.wallets))
+                if wid == len(self.wallets):
+                    self.wallets.append(wallet)
+            else:
+                wid = -1
+                self.missing.append(self.usernames[-1])
+            wallet_ids.append(wid)
+        if NUMPY_AVAILABLE:
+            self.ranks = np.array(ranks, dtype=np.int64)
+            self.xp = np.array(xps, dtype=np.float64)
+            self.wallet_ids = np.array(wallet_ids, dtype=np.int64)
+        else:
+            self.ranks, self.xp, self.wallet_ids = ranks, xps, wallet_ids
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+# -------------------- FORMULAS --------------------
+def _tier_units(ranks, tiers: List[Tuple[int, int, float]], unit: int):
+    lo = [t[0] for t in tiers]
+    hi = [t[1] for t in tiers]
+    amounts = [round(t[2] * unit) for t in tiers]
+    if NUMPY_AVAILABLE:
+        idx = np.searchsorted(np.array(hi), ranks, side="left")
+        inside = idx < len(tiers)
+        idx = np.minimum(idx, len(tiers) - 1)
+        inside &= ranks >= np.array(lo)[idx]
+        return np.where(inside, np.array(amounts, dtype=np.int64)[idx], 0)
+    out = []
+    for r in ranks:
+        i = bisect.bisect_left(hi, r)
+        out.append(amounts[i] if i < len(tiers) and r >= lo[i] else 0)
+    return out
+
+def _weights(table: WinnerTable, weight: str, exponent: float):
+    if weight not in ("xp", "rank"):
+        raise ValueError(f"peso sconosciuto: {weight}")
+    if NUMPY_AVAILABLE:
+        if weight == "xp":
+            return np.power(np.maximum(table.xp, 0.0), exponent)
+        ranked = table.ranks > 0
+        return np.where(ranked, np.power(np.where(ranked, table.ranks, 1).astype(np.float64), -exponent), 0.0)
+    if weight == "xp":
+        return [max(x, 0.0) ** exponent for x in table.xp]
+    return [r ** -exponent if r > 0 else 0.0 for r in table.ranks]
+
+def _split_pool(weights, pool_units: int):
+    """Floor of each share, leftover units to the largest remainders: the sum is exactly pool_units."""
+    if NUMPY_AVAILABLE:
+        total = weights.sum()
+        if total <= 0:
+            return np.zeros(len(weights), dtype=np.int64)
+        raw = weights * (pool_units / total)
+        units = np.floor(raw).astype(np.int64)
+        left = int(pool_units - units.sum())
+        if left > 0:
+            units[np.argsort(units - raw, kind="stable")[:left]] += 1  # resti più grandi prima
+        return units
+    total = sum(weights)
+    if total <= 0:
+        return [0] * len(weights)
+    raw = [w * (pool_units / total) for w in weights]
+    units = [int(x) for x in raw]
+    left = pool_units - sum(units)
+    for i in sorted(range(len(raw)), key=lambda i: units[i] - raw[i])[:max(left, 0)]:
+        units[i] += 1
+    return units
+
+# -------------------- ALLOCATION --------------------
+class Payouts:
+    """Per-winner units of one formula, grouped by wallet for the manifest."""
+
+    def __init__(self, table: WinnerTable, units, decimals: int, pool_units: Optional[int] = None):
+        self.table = table
+        self.units = units
+        self.decimals = decimals
+        self.pool_units = pool_units
+        if NUMPY_AVAILABLE:
+            paid = table.wallet_ids >= 0
+            self.wallet_units = np.zeros(len(table.wallets), dtype=np.int64)
+            np.add.at(self.wallet_units, table.wallet_ids[paid], units[paid])
+            self.withheld_units = int(units[~paid].sum())
+        else:
+            self.wallet_units = [0] * len(table.wallets)
+            self.withheld_units = 0
+            for wid, u in zip(table.wallet_ids, units):
+                if wid >= 0:
+                    self.wallet_units[wid] += u
+                else:
+                    self.withheld_units += u
+
+    def per_wallet(self) -> List[Tuple[str, int]]:
+        """(wallet, units) with units > 0, largest first."""
+        pairs = [(w, int(u)) for w, u in zip(self.table.wallets, self.wallet_units) if u > 0]
+        pairs.sort(key=lambda p: (-p[1], p[0].lower()))
+        return pairs
+
+    def batches(self, size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Tuple[str, int]]]:
+        pairs = self.per_wallet()
+        for i in range(0, len(pairs), size):
+            yield pairs[i:i + size]
+
+    def summary(self, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+        """Totals and consistency checks."""
+        pairs = self.per_wallet()
+        paid = sum(u for _, u in pairs)
+        allocated = int(sum(self.units))
+        wallets = len(pairs)
+        out = {
+            "winners": len(self.table),
+            "winners_paid": sum(1 for wid, u in zip(self.table.wallet_ids, self.units) if wid >= 0 and u > 0),
+            "wallets": wallets,
+            "batches": -(-wallets // batch_size),
+            "total": format_units(paid, self.decimals),
+            "withheld": format_units(self.withheld_units, self.decimals),
+            "missing_wallet": len(self.table.missing),
+            "shared_wallets": len(self.table) - len(self.table.missing) - len(self.table.wallets),
+            "checks_ok": paid + self.withheld_units == allocated
+                         and (self.pool_units is None or allocated == self.pool_units),
+        }
+        if self.pool_units is not None:
+            out["pool"] = format_units(self.pool_units, self.decimals)
+        return out
+
+    def write_manifest(self, path: Path, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """One row per wallet (batch, wallet, amount, winners, usernames); returns the number of rows."""
+        names: Dict[int, List[str]] = {}
+        for username, wid, u in zip(self.table.usernames, self.table.wallet_ids, self.units):
+            if wid >= 0 and u > 0:
+                names.setdefault(int(wid), []).append(username)
+        index = {w: i for i, w in enumerate(self.table.wallets)}
+        rows = 0
+        with path.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(MANIFEST_FIELDS)
+            for b, batch in enumerate(self.batches(batch_size), 1):
+                for wallet, units in batch:
+                    who = names.get(index[wallet], [])
+                    writer.writerow([b, wallet, format_units(units, self.decimals), len(who), ";".join(who)])
+                    rows += 1
+        return rows
+
+def allocate(table: WinnerTable, tiers: Optional[str] = None, pool: Optional[float] = None,
+             weight: str = "xp", exponent: float = 1.0, redistribute: bool = False,
+             decimals: int = DEFAULT_DECIMALS) -> Payouts:
+    """Tier amounts (`tiers`) or a proportional split of `pool`."""
+    unit = 10 ** decimals
+    if (tiers is None) == (pool is None):
+        raise ValueError("specifica le fasce oppure il pool")
+    if exponent < 0:
+        raise ValueError(f"esponente negativo non ammesso: {exponent}")
+    if tiers is not None:
+        return Payouts(table, _tier_units(table.ranks, parse_tiers(tiers), unit), decimals)
+    weights = _weights(table, weight, exponent)
+    if redistribute:
+        if NUMPY_AVAILABLE:
+            weights = np.where(table.wallet_ids >= 0, weights, 0.0)
+        else:
+            weights = [w if wid >= 0 else 0.0 for w, wid in zip(weights, table.wallet_ids)]
+    pool_units = round(pool * unit)
+    return Payouts(table, _split_pool(weights, pool_units), decimals, pool_units)
+
+def read_winners_csv(path: Path) -> List[dict]:
+    """winners_final.csv (or any CSV with username/rank/xp/wallet columns).
+
+    Rows without rank and XP are skipped: in winners_final.csv they are users who
+    only wrote to the bot and are not in the Zealy list.
+    """
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delim = ";" if sample.splitlines()[0].count(";") > sample.splitlines()[0].count(",") else ","
+        rows = [{(k or "").strip().lower(): v for k, v in row.items()} for row in csv.DictReader(f, delimiter=delim)]
+    return [r for r in rows if (r.get("rank") or "").strip() or (r.get("xp") or "").strip()]
+
+def main():
+    ap = argparse.ArgumentParser(description="Compute the reward payout manifest from the winners list.")
+    ap.add_argument("--input", default="winners_final.csv", help="winners_final.csv from /admin_export_final")
+    ap.add_argument("--out", default="payouts.csv", help="Manifest CSV (batch, wallet, amount, ...)")
+    ap.add_argument("--tiers", default="", help='Rank tiers, e.g. "1:1000,2-10:500,11-100:100"')
+    ap.add_argument("--pool", type=float, default=None, help="Proportional split of this amount")
+    ap.add_argument("--weight", choices=("xp", "rank"), default="xp", help="Proportional weight: xp**exp or (1/rank)**exp")
+    ap.add_argument("--exp", type=float, default=1.0, help="Weight exponent")
+    ap.add_argument("--redistribute", action="store_true", help="Give the share of winners without wallet to the others")
+    ap.add_argument("--decimals", type=int, default=DEFAULT_DECIMALS, help="Amount precision")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Wallets per multisend batch")
+    ap.add_argument("--split-dir", default="", help="Also write one address,amount CSV per batch here")
+    args = ap.parse_args()
+
+    path = Path(args.input)
+    if not path.exists():
+        print(f"ERROR: file not found: {path}")
+        sys.exit(1)
+    try:
+        table = WinnerTable(read_winners_csv(path))
+        payouts = allocate(table, tiers=args.tiers or None, pool=args.pool, weight=args.weight,
+                           exponent=args.exp, redistribute=args.redistribute, decimals=args.decimals)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    rows = payouts.write_manifest(Path(args.out), args.batch_size)
+    if args.split_dir:
+        out_dir = Path(args.split_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for b, batch in enumerate(payouts.batches(args.batch_size), 1):
+            with (out_dir / f"batch_{b:03d}.csv").open("w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerows((w, format_units(u, args.decimals)) for w, u in batch)
+    s = payouts.summary(args.batch_size)
+    print(f"✅ Manifest written: {Path(args.out).resolve()} ({rows} wallets, {s['batches']} batches)")
+    print(f"   Winners: {s['winners']} | paid: {s['winners_paid']} | without wallet: {s['missing_wallet']} "
+          f"| sharing a wallet: {s['shared_wallets']}")
+    print(f"   Total: {s['total']} | withheld: {s['withheld']}" + (f" | pool: {s['pool']}" if "pool" in s else ""))
+    if not s["checks_ok"]:
+        print("ERROR: totals do not add up")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ from datetime import datetime
 from dotenv import load_dotenv
 from eth_account import Account
 from eth_account.messages import encode_defunct
+from eth_utils import is_checksum_address
 
 from telegram import Update
 from telegram.constants import ParseMode
@@ -35,6 +36,7 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 ADMINS = {int(x.strip()) for x in os.getenv("ADMINS", "").split(",") if x.strip()}
 ADMIN_GROUP_ID = int(os.getenv("ADMIN_GROUP_ID", "0"))
 PROJECT_NAME = os.getenv("PROJECT_NAME", "Savitri_Rewards")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")  # empty = api.telegram.org
 
 DATA_DIR = Path("data"); DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = DATA_DIR / "rewards.db"
@@ -83,13 +85,33 @@ def init_db():
             created_at INTEGER
         );
         """)
+        # WVC registry: only the SHA-256 of each code, one code per winner.
+        # Redemption is a single conditional UPDATE (... AND used=0), see redeem_wvc()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS wvc_codes (
+            code_hash TEXT PRIMARY KEY,
+            username TEXT UNIQUE,
+            hint TEXT,
+            used INTEGER NOT NULL DEFAULT 0,
+            used_by INTEGER,
+            used_at INTEGER
+        );
+        """)
+        # codes imported in clear by older versions into winners.wvc: move them into the registry
+        legacy = cur.execute("SELECT username, wvc, wvc_used FROM winners WHERE wvc IS NOT NULL AND wvc <> ''").fetchall()
+        cur.executemany(
+            "INSERT OR IGNORE INTO wvc_codes (code_hash, username, hint, used) VALUES (?,?,?,?)",
+            [(wvc_hash(c), u, wvc_hint(c), int(bool(used))) for u, c, used in legacy]
+        )
+        cur.execute("UPDATE winners SET wvc=NULL WHERE wvc IS NOT NULL")
         con.commit()
 
-def db_exec(q, p=()):
+def db_exec(q, p=()) -> int:
     with closing(sqlite3.connect(DB_PATH)) as con:
         cur = con.cursor()
         cur.execute(q, p)
         con.commit()
+        return cur.rowcount
 
 def db_one(q, p=()):
     with closing(sqlite3.connect(DB_PATH)) as con:
@@ -99,7 +121,7 @@ def db_one(q, p=()):
 
 def upsert_winner(username: str, tg_id: Optional[int] = None, rank: Optional[int] = None,
                   xp: Optional[int] = None, wallet: Optional[str] = None,
-                  wvc: Optional[str] = None, wvc_used: Optional[int] = None):
+                  wvc: Optional[str] = None):
     row = db_one("SELECT id FROM winners WHERE username=?", (username.lower(),))
     sets, vals = [], []
     if tg_id is not None:
@@ -110,18 +132,94 @@ def upsert_winner(username: str, tg_id: Optional[int] = None, rank: Optional[int
         sets.append("xp=?"); vals.append(int(xp))
     if wallet is not None:
         sets.append("wallet=?"); vals.append(wallet)
-    if wvc is not None:
-        sets.append("wvc=?"); vals.append(wvc)
-    if wvc_used is not None:
-        sets.append("wvc_used=?"); vals.append(int(wvc_used))
     if row:
         if sets:
             db_exec(f"UPDATE winners SET {', '.join(sets)} WHERE username=?", (*vals, username.lower()))
     else:
         db_exec(
-            "INSERT INTO winners (username, tg_id, rank, xp, wallet, wvc, wvc_used) VALUES (?,?,?,?,?,?,?)",
-            (username.lower(), tg_id, rank, xp, wallet, wvc, wvc_used if wvc_used is not None else 0)
+            "INSERT INTO winners (username, tg_id, rank, xp, wallet) VALUES (?,?,?,?,?)",
+            (username.lower(), tg_id, rank, xp, wallet)
         )
+    if wvc is not None:
+        assign_wvc([(username, wvc)])
+
+# ----- WVC REGISTRY -----
+def wvc_hash(code: str) -> str:
+    return hashlib.sha256(code.strip().upper().encode("utf-8")).hexdigest()
+
+def wvc_hint(code: str) -> str:
+    """Last 4 characters, enough for the user to recognise the code in /show_wvc."""
+    return "…" + code.strip().upper()[-4:]
+
+def assign_wvc(pairs) -> tuple:
+    """Assign codes to winners in one transaction: pairs of (username, code).
+    A winner's unused code is replaced, a used one is kept; a code already
+    owned by another winner is skipped (the winner keeps the current one).
+    Returns (assigned, skipped)."""
+    assigned = skipped = 0
+    with closing(sqlite3.connect(DB_PATH)) as con:
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")  # nessun altro writer tra il controllo del proprietario e l'upsert
+        for username, code in pairs:
+            u, h = username.lower(), wvc_hash(code)
+            owner = cur.execute("SELECT username FROM wvc_codes WHERE code_hash=?", (h,)).fetchone()
+            if owner is not None:
+                if owner[0] == u:
+                    assigned += 1
+                else:
+                    skipped += 1
+                continue
+            # codice libero: sostituisce quello non usato del vincitore in un solo statement
+            cur.execute(
+                "INSERT INTO wvc_codes (code_hash, username, hint) VALUES (?,?,?) "
+                "ON CONFLICT(username) DO UPDATE SET code_hash=excluded.code_hash, hint=excluded.hint "
+                "WHERE wvc_codes.used=0",
+                (h, u, wvc_hint(code))
+            )
+            if cur.rowcount == 1:
+                assigned += 1
+            else:
+                skipped += 1
+        con.commit()
+    return assigned, skipped
+
+def import_wvc_csv(path: Path) -> tuple:
+    """Bulk assignment from a generate_wvc.py CSV (columns wvc, assigned_to).
+    Rows with assigned_to go to that username; the others go, in rank order,
+    to the winners that have no code yet. Returns (assigned, skipped, left_over)."""
+    with path.open("r", encoding="utf-8-sig", newline="") as fh:
+        sample = fh.read(4096); fh.seek(0)
+        reader = csv.DictReader(fh, delimiter=sniff_delim_from_sample(sample))
+        headers = {_norm(h): h for h in reader.fieldnames or []}
+        code_key, user_key = headers.get("wvc") or headers.get("code"), headers.get("assigned_to")
+        if not code_key:
+            raise ValueError("column 'wvc' not found")
+        named, free = [], []
+        for row in reader:
+            code = (row.get(code_key) or "").strip()
+            if not code:
+                continue
+            user = (row.get(user_key) or "").strip() if user_key else ""
+            (named if user else free).append((user, code))
+    with closing(sqlite3.connect(DB_PATH)) as con:
+        waiting = [u for (u,) in con.execute(
+            "SELECT w.username FROM winners w LEFT JOIN wvc_codes c ON c.username = w.username "
+            "WHERE c.code_hash IS NULL ORDER BY w.rank IS NULL, w.rank, w.id"
+        )]
+    taken = {u.lower() for u, _ in named}
+    waiting = [u for u in waiting if u not in taken]
+    pairs = named + [(u, code) for u, (_, code) in zip(waiting, free)]
+    assigned, skipped = assign_wvc(pairs)
+    return assigned, skipped, max(0, len(free) - len(waiting))
+
+def redeem_wvc(username: str, code: str, tg_id: int) -> bool:
+    """Mark the code used if it is this winner's and still unused.
+    One conditional UPDATE: two concurrent redemptions cannot both succeed."""
+    n = db_exec(
+        "UPDATE wvc_codes SET used=1, used_by=?, used_at=? WHERE code_hash=? AND username=? AND used=0",
+        (tg_id, int(time.time()), wvc_hash(code), username.lower())
+    )
+    return n == 1
 
 # ----- HELPERS -----
 def now_local() -> datetime:
@@ -153,11 +251,15 @@ def is_admin(uid: int) -> bool:
 def is_whitelisted(username: str) -> bool:
     return db_one("SELECT id FROM winners WHERE username=?", (username.lower(),)) is not None
 
+# (username, rank, xp, wallet, wvc hint, wvc used): the code itself is never stored
 def get_current_user_row(tg_id: int):
-    return db_one("SELECT username, rank, xp, wallet, wvc, wvc_used FROM winners WHERE tg_id=?", (tg_id,))
+    return db_one(
+        "SELECT w.username, w.rank, w.xp, w.wallet, c.hint, c.used FROM winners w "
+        "LEFT JOIN wvc_codes c ON c.username = w.username WHERE w.tg_id=?", (tg_id,)
+    )
 
 def user_requires_wvc(username: str) -> bool:
-    row = db_one("SELECT wvc, wvc_used FROM winners WHERE username=?", (username.lower(),))
+    row = db_one("SELECT hint, used FROM wvc_codes WHERE username=?", (username.lower(),))
     if not row:
         return False
     wvc, used = row
@@ -183,8 +285,13 @@ def clean_wallet(v: Optional[str]) -> Optional[str]:
     if not v:
         return None
     s = str(v).replace('\u00A0', ' ').strip()  # remove NBSP
-    s = s.replace(' ', '').strip("`'\"").lower()  # strip spaces/quotes
-    return s if re.fullmatch(r"0x[a-f0-9]{40}", s) else None
+    s = s.replace(' ', '').strip("`'\"")  # strip spaces/quotes
+    if not re.fullmatch(r"0x[a-fA-F0-9]{40}", s):
+        return None
+    body = s[2:]
+    if body != body.lower() and body != body.upper() and not is_checksum_address(s):
+        return None  # maiuscole/minuscole miste ma checksum EIP-55 errato: indirizzo copiato male
+    return s.lower()
 
 # ----- COMMANDS -----
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -234,10 +341,9 @@ async def use_wvc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not wvc or used:
         await update.message.reply_text(M.msg_show_wvc(wvc, used), parse_mode=ParseMode.MARKDOWN)
         return
-    if code != wvc:
+    if not redeem_wvc(username, code, update.effective_user.id):
         await update.message.reply_text(M.msg_wvc_invalid(), parse_mode=ParseMode.MARKDOWN)
         return
-    db_exec("UPDATE winners SET wvc_used=1 WHERE username=?", (username.lower(),))
     await update.message.reply_text(M.msg_wvc_ok(code), parse_mode=ParseMode.MARKDOWN)
 
 # --- Registration flow ---
@@ -406,7 +512,10 @@ async def new_sig(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(M.msg_sig_invalid(), parse_mode=ParseMode.MARKDOWN)
         return
     sig = context.args[0].strip()
-    row = db_one("SELECT username, wallet, pending_new_wallet, wvc, wvc_used FROM winners WHERE tg_id=?", (update.effective_user.id,))
+    row = db_one(
+        "SELECT w.username, w.wallet, w.pending_new_wallet, c.hint, c.used FROM winners w "
+        "LEFT JOIN wvc_codes c ON c.username = w.username WHERE w.tg_id=?", (update.effective_user.id,)
+    )
     if not row:
         await update.message.reply_text(M.msg_not_whitelisted(), parse_mode=ParseMode.MARKDOWN)
         return
@@ -467,6 +576,7 @@ async def admin_import_winners(update: Update, context: ContextTypes.DEFAULT_TYP
     await f.download_to_drive(str(dest))
 
     inserted = 0
+    bad_wallets = []  # (riga, username) con wallet presente ma non valido
     preview_rows = []
     try:
         with dest.open("r", encoding="utf-8-sig", newline="") as fh:
@@ -514,6 +624,8 @@ async def admin_import_winners(update: Update, context: ContextTypes.DEFAULT_TYP
                 rank_i = _to_int_safe(rank_raw)
                 xp_i   = _to_int_safe(xp_raw)
                 wallet = clean_wallet(wal_raw) if wal_raw else None
+                if wal_raw and wallet is None:
+                    bad_wallets.append((i, u))
                 wvc    = wvc_raw if wvc_raw else None
 
                 upsert_winner(u, rank=rank_i, xp=xp_i, wallet=wallet, wvc=wvc)
@@ -522,12 +634,16 @@ async def admin_import_winners(update: Update, context: ContextTypes.DEFAULT_TYP
                 # preview (prime 3), con backtick corretti
                 if i <= 3:
                     preview_rows.append(
-                        f"{i:02d}: user=`{u}` | rank=`{rank_i}` | xp=`{xp_i}` | wallet=`{wallet or '-'}` | wvc=`{wvc or '-'}`"
+                        f"{i:02d}: user=`{u}` | rank=`{rank_i}` | xp=`{xp_i}` | wallet=`{wallet or '-'}` | wvc=`{wvc_hint(wvc) if wvc else '-'}`"
                     )
 
         # 2° messaggio: risultato + preview in blocco codice per evitare errori Markdown
         preview_block = "No preview" if not preview_rows else "\n".join(preview_rows)
         summary = f"✅ Import completed. Rows processed: {inserted}\n\nPreview (first 3):\n```text\n{preview_block}\n```"
+        if bad_wallets:
+            listed = "\n".join(f"{i:02d}: {u}" for i, u in bad_wallets[:20])
+            more = f"\n… (+{len(bad_wallets) - 20})" if len(bad_wallets) > 20 else ""
+            summary += f"\n\n⚠️ Invalid wallets (format or EIP-55 checksum), imported without wallet: {len(bad_wallets)}\n```text\n{listed}{more}\n```"
         await update.message.reply_text(summary, parse_mode=ParseMode.MARKDOWN)
 
     except Exception as e:
@@ -542,7 +658,10 @@ async def admin_show(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: `/admin_show <username>`", parse_mode=ParseMode.MARKDOWN)
         return
     u = context.args[0].strip().lower()
-    row = db_one("SELECT username, tg_id, rank, xp, wallet, wvc, wvc_used FROM winners WHERE username=?", (u,))
+    row = db_one(
+        "SELECT w.username, w.tg_id, w.rank, w.xp, w.wallet, c.hint, c.used FROM winners w "
+        "LEFT JOIN wvc_codes c ON c.username = w.username WHERE w.username=?", (u,)
+    )
     if not row:
         await update.message.reply_text(f"Not found: `{u}`", parse_mode=ParseMode.MARKDOWN)
         return
@@ -558,6 +677,31 @@ async def admin_show(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(txt, parse_mode=ParseMode.MARKDOWN)
 
+async def admin_import_wvc(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bulk WVC assignment: reply to a generate_wvc.py CSV with /admin_import_wvc."""
+    if update.effective_user.id not in ADMINS:
+        return
+    if not update.message or not update.message.reply_to_message or not update.message.reply_to_message.document:
+        await update.message.reply_text(
+            "📎 Reply to the WVC CSV (generate_wvc.py output) with `/admin_import_wvc`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    doc = update.message.reply_to_message.document
+    f = await doc.get_file()
+    dest = DATA_DIR / f"import_{int(time.time())}_{doc.file_name}"
+    await f.download_to_drive(str(dest))
+    try:
+        assigned, skipped, left_over = import_wvc_csv(dest)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Import failed: {e}")
+        return
+    finally:
+        dest.unlink(missing_ok=True)  # il CSV contiene i codici in chiaro
+    await update.message.reply_text(
+        f"✅ WVC assigned: {assigned}\n• skipped (code owned by another winner): {skipped}\n• codes left over: {left_over}"
+    )
+
 async def admin_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMINS:
         return
@@ -578,7 +722,10 @@ async def admin_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def main():
     init_db()
-    app = Application.builder().token(BOT_TOKEN).rate_limiter(AIORateLimiter()).build()
+    builder = Application.builder().token(BOT_TOKEN).rate_limiter(AIORateLimiter())
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("set_username", set_username))
@@ -602,6 +749,7 @@ def main():
 
     # Admin
     app.add_handler(CommandHandler("admin_import_winners", admin_import_winners))
+    app.add_handler(CommandHandler("admin_import_wvc", admin_import_wvc))
     app.add_handler(CommandHandler("admin_show", admin_show))
     app.add_handler(CommandHandler("admin_link", admin_link))
 
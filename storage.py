@@ -0,0 +1,649 @@
+# -*- coding: utf-8 -*-
+"""
+storage.py
+
+SQLite storage for the root bot (main.py): wallet update requests, user
+submissions, the Zealy winners list and the PTB persistence (user_data,
+chat_data, bot_data, conversations) in one WAL database, data/bot.db.
+
+Every command touches only its own rows: a request is read or decided by
+primary key, a submission is updated in place, admin lists page through the
+(status, id) / (user_id, id) indexes. Previously each of these re-read and
+rewrote a whole JSON file, and PicklePersistence re-pickled every user_data
+on each flush.
+
+Migration of the legacy files (user_submissions.json,
+wallet_update_requests.json, the bot_state pickle, the Zealy CSV) runs once,
+automatically at the first start of main.py, or by hand:
+
+    python storage.py migrate [--data-dir data] [--zealy-csv zealy_with_wvc.csv] [--force]
+
+The legacy files are left where they are (rollback = previous image + files).
+"""
+
+import csv
+import json
+import hashlib
+import pickle
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from wallets import validate_wallets, wallet_key
+
+log = logging.getLogger("savitri-bot.storage")
+
+DB_NAME = "bot.db"
+SCHEMA_VERSION = 3
+REQUEST_FIELDS = ("id", "user_id", "username", "first_name", "last_name", "wallet",
+                  "timestamp", "status", "handled_by", "handled_at", "note")
+ZEALY_FIELDS = ("rank", "xp", "wallet", "wvc_hash", "wvc_used")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    wallet TEXT,
+    timestamp TEXT,
+    day TEXT,               -- "YYYY-MM-DD" del timestamp, per i filtri from=/to=
+    status TEXT NOT NULL DEFAULT 'pending',
+    handled_by INTEGER,
+    handled_at TEXT,
+    note TEXT DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS requests_status_id ON requests(status, id);
+CREATE INDEX IF NOT EXISTS requests_user_id ON requests(user_id, id);
+CREATE INDEX IF NOT EXISTS requests_username ON requests(username COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS submissions (
+    sid TEXT PRIMARY KEY,   -- tg_id come stringa (chiave storica del JSON)
+    tg_id INTEGER,
+    username TEXT,
+    data TEXT NOT NULL      -- record completo in JSON (proofs, reg_wallet, firme, ...)
+);
+CREATE INDEX IF NOT EXISTS submissions_username ON submissions(username COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS zealy (
+    username_lc TEXT PRIMARY KEY,
+    rank TEXT,
+    xp TEXT,
+    wallet TEXT,            -- indirizzo EIP-55 (wallets.check_wallet)
+    wvc_hash TEXT,          -- SHA-256 del WVC (wvc_hash()), il codice in chiaro non viene salvato
+    wvc_used INTEGER,
+    wallet_bin BLOB         -- 20 byte dell'indirizzo (wallets.wallet_key): indice senza maiuscole/minuscole
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS admin_messages (
+    req_id INTEGER NOT NULL,    -- notifica di una richiesta con i pulsanti approve/reject
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (req_id, chat_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ptb_state (
+    kind TEXT NOT NULL,     -- user_data | chat_data | bot_data | callback_data | conversation
+    key TEXT NOT NULL,
+    data BLOB NOT NULL,     -- pickle
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+# -------------------- ZEALY CSV --------------------
+def wvc_hash(code: str) -> str:
+    """SHA-256 (hex) of the normalised WVC; same normalisation as savitri_rewards_bot."""
+    return hashlib.sha256(code.strip().upper().encode("utf-8")).hexdigest()
+
+def read_zealy_csv(path: Path, rejected: Optional[List[dict]] = None) -> Dict[str, Dict[str, Any]]:
+    """Parse the (semicolon separated) Zealy export into {username_lower: entry}.
+
+    Wallets are validated in one batch after the read (wallets.validate_wallets)
+    and stored in EIP-55 form; an invalid one becomes None and, if `rejected` is
+    given, is appended to it as {line, username, wallet, reason}.
+    Raises ValueError when the header or the username column is missing.
+    """
+    index: Dict[str, Dict[str, Any]] = {}
+    raw_wallets: List[Tuple[str, int, str]] = []  # (username_lc, riga, wallet come scritto)
+    with Path(path).open("r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        if not reader.fieldnames:
+            raise ValueError("Il CSV non contiene intestazioni (header)")
+        # Normalize header names
+        headers = {h.lower().strip(): h for h in reader.fieldnames}
+        pos_key = headers.get("position on leadborad") or headers.get("position on leaderboard") or headers.get("position")
+        xp_key = headers.get("xp") or headers.get("xp on zealy") or headers.get("zealy xp")
+        user_key = headers.get("username")
+        wallet_col = headers.get("binance smart chain address") or headers.get("bsc address") or headers.get("wallet")
+        wvc_key = headers.get("wvc")
+        if not user_key:
+            raise ValueError("Colonna 'username' non trovata nel CSV")
+        for line, row in enumerate(reader, start=2):
+            username = (row.get(user_key) or "").strip()
+            if not username:
+                continue
+            rank = (row.get(pos_key) or "").strip() if pos_key else ""
+            xp = (row.get(xp_key) or "").strip() if xp_key else ""
+            wallet = (row.get(wallet_col) or "").strip() if wallet_col else ""
+            wvc = (row.get(wvc_key) or "").strip() if wvc_key else ""
+            index[username.lower()] = {
+                "rank": rank or None,
+                "xp": xp or None,
+                "wallet": None,
+                "wvc_hash": wvc_hash(wvc) if wvc else None,
+                "wvc_used": None,  # unknown from CSV
+            }
+            if wallet:
+                raw_wallets.append((username.lower(), line, wallet))
+    addresses, errors = validate_wallets([w for _, _, w in raw_wallets])
+    for i, ((key, line, wallet), address) in enumerate(zip(raw_wallets, addresses)):
+        index[key]["wallet"] = address
+        if i in errors and rejected is not None:
+            rejected.append({"line": line, "username": key, "wallet": wallet, "reason": errors[i]})
+    return index
+
+_ZEALY_INSERT = "(username_lc, rank, xp, wallet, wvc_hash, wvc_used, wallet_bin) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+def _zealy_params(index: Dict[str, Dict[str, Any]]) -> Iterator[tuple]:
+    for k, e in index.items():
+        yield (k, *(e.get(f) for f in ZEALY_FIELDS), wallet_key(e["wallet"]) if e.get("wallet") else None)
+
+# -------------------- STORE --------------------
+class Storage:
+    """One SQLite connection shared by the bot (event loop) and its helper threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: autocommit, le transazioni sono esplicite (transaction())
+        self.con = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        self.con.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")  # WAL: durabile ai crash del processo
+        self.con.execute("PRAGMA busy_timeout=5000")
+        with self.transaction():
+            for stmt in SCHEMA.split(";"):
+                if stmt.strip():
+                    self.con.execute(stmt)
+            self._upgrade()
+            self.con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _upgrade(self) -> None:
+        # v1 -> v2: zealy.wvc (in chiaro) diventa zealy.wvc_hash
+        cols = {row["name"] for row in self.con.execute("PRAGMA table_info(zealy)")}
+        if "wvc" in cols:
+            self.con.create_function("wvc_hash", 1, lambda c: wvc_hash(c) if c else None, deterministic=True)
+            self.con.execute("ALTER TABLE zealy RENAME COLUMN wvc TO wvc_hash")
+            self.con.execute("UPDATE zealy SET wvc_hash = wvc_hash(wvc_hash)")
+        # v2 -> v3: indice sul wallet in binario (20 byte) al posto di wallet COLLATE NOCASE
+        cols = {row["name"] for row in self.con.execute("PRAGMA table_info(zealy)")}
+        if "wallet_bin" not in cols:
+            self.con.execute("ALTER TABLE zealy ADD COLUMN wallet_bin BLOB")
+            rows = self.con.execute("SELECT username_lc, wallet FROM zealy WHERE wallet IS NOT NULL").fetchall()
+            addresses, errors = validate_wallets([r["wallet"] for r in rows])
+            if errors:
+                log.warning("Schema v3: %d Zealy wallets not valid (EIP-55/format), set to NULL", len(errors))
+            self.con.executemany(
+                "UPDATE zealy SET wallet=?, wallet_bin=? WHERE username_lc=?",
+                ((a, wallet_key(a) if a else None, r["username_lc"]) for r, a in zip(rows, addresses)),
+            )
+        self.con.execute("DROP INDEX IF EXISTS zealy_wallet")
+        self.con.execute("CREATE INDEX IF NOT EXISTS zealy_wallet_bin ON zealy(wallet_bin)")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error); reentrant within a thread."""
+        with self.lock:
+            if self.con.in_transaction:
+                yield self.con
+                return
+            self.con.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.con
+            except BaseException:
+                self.con.execute("ROLLBACK")
+                raise
+            self.con.execute("COMMIT")
+
+    def query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.con.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self.lock:
+            self.con.close()
+
+    def backup(self, target: Path) -> Path:
+        """Consistent copy of the database (online backup API, safe while the bot writes)."""
+        dst = sqlite3.connect(str(target))
+        try:
+            with self.lock:
+                self.con.backup(dst)
+        finally:
+            dst.close()
+        return Path(target)
+
+    # ---------- meta ----------
+    def get_meta(self, key: str) -> Optional[str]:
+        rows = self.query("SELECT value FROM meta WHERE key=?", (key,))
+        return rows[0]["value"] if rows else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.transaction() as con:
+            con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ---------- requests ----------
+    @staticmethod
+    def _request(row: sqlite3.Row) -> dict:
+        return {f: row[f] for f in REQUEST_FIELDS}
+
+    def add_request(self, r: dict) -> int:
+        """Insert a request and return its id (r["id"] is honoured when present, e.g. migration)."""
+        vals = {f: r.get(f) for f in REQUEST_FIELDS}
+        vals["status"] = vals["status"] or "pending"
+        vals["note"] = vals["note"] or ""
+        with self.transaction() as con:
+            cur = con.execute(
+                "INSERT INTO requests (id, user_id, username, first_name, last_name, wallet, timestamp, day,"
+                " status, handled_by, handled_at, note) VALUES (:id, :user_id, :username, :first_name, :last_name,"
+                " :wallet, :timestamp, substr(:timestamp, 1, 10), :status, :handled_by, :handled_at, :note)",
+                vals,
+            )
+            return cur.lastrowid
+
+    def get_request(self, rid: int) -> Optional[dict]:
+        rows = self.query("SELECT * FROM requests WHERE id=?", (rid,))
+        return self._request(rows[0]) if rows else None
+
+    def save_requests(self, items: List[dict]) -> List[int]:
+        """Write back status/handled_by/handled_at/note of many requests in one transaction.
+
+        Only rows still pending are written: returns the ids actually changed, so that a
+        request decided meanwhile by another admin (or worker) is neither overwritten nor
+        notified twice.
+        """
+        changed = []
+        with self.transaction() as con:
+            for r in items:
+                cur = con.execute(
+                    "UPDATE requests SET status=:status, handled_by=:handled_by, handled_at=:handled_at,"
+                    " note=:note WHERE id=:id AND status='pending'",
+                    {"id": r["id"], "status": r.get("status"), "handled_by": r.get("handled_by"),
+                     "handled_at": r.get("handled_at"), "note": r.get("note") or ""},
+                )
+                if cur.rowcount:
+                    changed.append(r["id"])
+        return changed
+
+    def count_requests(self, status: Optional[str] = None) -> int:
+        if status:
+            return self.query("SELECT count(*) FROM requests WHERE status=?", (status,))[0][0]
+        return self.query("SELECT count(*) FROM requests")[0][0]
+
+    def latest_request(self, user_id: int, status: Optional[str] = None) -> Optional[dict]:
+        sql, params = "SELECT * FROM requests WHERE user_id=?", [user_id]
+        if status:
+            sql += " AND status=?"
+            params.append(status)
+        rows = self.query(sql + " ORDER BY id DESC LIMIT 1", params)
+        return self._request(rows[0]) if rows else None
+
+    def user_id_by_name(self, username: str) -> Optional[int]:
+        rows = self.query("SELECT user_id FROM requests WHERE username=? COLLATE NOCASE ORDER BY id DESC LIMIT 1",
+                          (username,))
+        return rows[0]["user_id"] if rows else None
+
+    @staticmethod
+    def _where(flt: dict) -> Tuple[str, list]:
+        conds, params = [], []
+        if flt.get("status"):
+            conds.append("status=?")
+            params.append(flt["status"])
+        if flt.get("user_id") is not None:
+            conds.append("user_id=?")
+            params.append(flt["user_id"])
+        if flt.get("from"):
+            conds.append("day>=?")
+            params.append(flt["from"])
+        if flt.get("to"):
+            conds.append("day<=?")
+            params.append(flt["to"])
+        return " AND ".join(conds) or "1", params
+
+    def iter_requests(self, flt: dict, batch: int = 1000) -> Iterator[dict]:
+        """Yield matching requests in ascending id order, `batch` rows per query (keyset)."""
+        where, params = self._where(flt)
+        last = 0
+        while True:
+            rows = self.query(f"SELECT * FROM requests WHERE {where} AND id>? ORDER BY id LIMIT ?",
+                              params + [last, batch])
+            for row in rows:
+                yield self._request(row)
+            if len(rows) < batch:
+                return
+            last = rows[-1]["id"]
+
+    def page_requests(self, flt: dict, cursor: Optional[int] = None, direction: str = "next",
+                      size: int = 10) -> Tuple[List[dict], bool, bool]:
+        """Return (rows newest-first, has_newer, has_older) for one page.
+
+        direction "next" walks towards older requests (ids < cursor),
+        "prev" towards newer ones (ids > cursor).
+        """
+        where, params = self._where(flt)
+        if cursor is not None and direction == "prev":
+            rows = self.query(f"SELECT * FROM requests WHERE {where} AND id>? ORDER BY id LIMIT ?",
+                              params + [cursor, size])[::-1]
+        elif cursor is not None:
+            rows = self.query(f"SELECT * FROM requests WHERE {where} AND id<? ORDER BY id DESC LIMIT ?",
+                              params + [cursor, size])
+        else:
+            rows = self.query(f"SELECT * FROM requests WHERE {where} ORDER BY id DESC LIMIT ?", params + [size])
+        if not rows:
+            return [], False, False
+        newest, oldest = rows[0]["id"], rows[-1]["id"]
+        has_newer = bool(self.query(f"SELECT 1 FROM requests WHERE {where} AND id>? LIMIT 1", params + [newest]))
+        has_older = bool(self.query(f"SELECT 1 FROM requests WHERE {where} AND id<? LIMIT 1", params + [oldest]))
+        return [self._request(r) for r in rows], has_newer, has_older
+
+    # ---------- admin_messages ----------
+    def add_admin_messages(self, req_id: int, sent: List[Tuple[int, int]]) -> None:
+        """Remember the (chat_id, message_id) of the admin notifications of a request."""
+        with self.transaction() as con:
+            con.executemany("INSERT OR REPLACE INTO admin_messages (req_id, chat_id, message_id) VALUES (?, ?, ?)",
+                            ((req_id, chat_id, message_id) for chat_id, message_id in sent))
+
+    def pop_admin_messages(self, req_ids: Iterable[int]) -> Dict[int, List[Tuple[int, int]]]:
+        """Remove and return the admin notifications of the given requests: {req_id: [(chat_id, message_id)]}."""
+        ids = list(req_ids)
+        out: Dict[int, List[Tuple[int, int]]] = {}
+        with self.transaction() as con:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for row in con.execute(f"SELECT req_id, chat_id, message_id FROM admin_messages "
+                                       f"WHERE req_id IN ({marks})", chunk):
+                    out.setdefault(row["req_id"], []).append((row["chat_id"], row["message_id"]))
+                con.execute(f"DELETE FROM admin_messages WHERE req_id IN ({marks})", chunk)
+        return out
+
+    # ---------- submissions ----------
+    def get_submission(self, sid: str) -> Optional[dict]:
+        rows = self.query("SELECT data FROM submissions WHERE sid=?", (str(sid),))
+        return json.loads(rows[0]["data"]) if rows else None
+
+    def _put_submission(self, con: sqlite3.Connection, sid: str, rec: dict) -> None:
+        con.execute(
+            "INSERT OR REPLACE INTO submissions (sid, tg_id, username, data) VALUES (?, ?, ?, ?)",
+            (str(sid), rec.get("tg_id"), rec.get("username"), json.dumps(rec, ensure_ascii=False)),
+        )
+
+    def update_submission(self, sid: str, defaults: dict, append: Optional[Dict[str, Any]] = None,
+                          **fields) -> dict:
+        """Read-modify-write of one record in a single transaction; returns the new record.
+
+        `fields` overwrite keys, `append` adds items to list keys (e.g. proofs),
+        once: an update handled again after a restart does not duplicate them.
+        """
+        with self.transaction() as con:
+            rows = con.execute("SELECT data FROM submissions WHERE sid=?", (str(sid),)).fetchall()
+            rec = json.loads(rows[0]["data"]) if rows else dict(defaults)
+            rec.update(fields)
+            for k, v in (append or {}).items():
+                if v not in (rec.get(k) or []):
+                    rec[k] = (rec.get(k) or []) + [v]
+            self._put_submission(con, sid, rec)
+        return rec
+
+    def all_submissions(self) -> Dict[str, dict]:
+        return {row["sid"]: json.loads(row["data"]) for row in self.query("SELECT sid, data FROM submissions")}
+
+    def replace_submissions(self, data: Dict[str, dict]) -> None:
+        with self.transaction() as con:
+            con.execute("DELETE FROM submissions")
+            for sid, rec in data.items():
+                self._put_submission(con, sid, rec)
+
+    def count_submissions(self) -> int:
+        return self.query("SELECT count(*) FROM submissions")[0][0]
+
+    # ---------- zealy ----------
+    def replace_zealy(self, index: Dict[str, Dict[str, Any]]) -> None:
+        with self.transaction() as con:
+            con.execute("DELETE FROM zealy")
+            con.executemany("INSERT INTO zealy " + _ZEALY_INSERT, _zealy_params(index))
+
+    def load_zealy(self) -> Dict[str, Dict[str, Any]]:
+        return {row["username_lc"]: {f: row[f] for f in ZEALY_FIELDS} for row in self.query("SELECT * FROM zealy")}
+
+    def zealy_usernames_by_wallet(self, address: str) -> List[str]:
+        """Zealy usernames whose CSV wallet is `address` (a valid address, any case)."""
+        rows = self.query("SELECT username_lc FROM zealy WHERE wallet_bin=? ORDER BY username_lc",
+                          (wallet_key(address),))
+        return [r["username_lc"] for r in rows]
+
+    # ---------- ptb_state ----------
+    def state_get(self, kind: str) -> Dict[str, Any]:
+        return {row["key"]: pickle.loads(row["data"])
+                for row in self.query("SELECT key, data FROM ptb_state WHERE kind=?", (kind,))}
+
+    def state_put(self, kind: str, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.transaction() as con:
+            con.execute("INSERT OR REPLACE INTO ptb_state (kind, key, data) VALUES (?, ?, ?)", (kind, key, blob))
+
+    def state_drop(self, kind: str, key: str) -> None:
+        with self.transaction() as con:
+            con.execute("DELETE FROM ptb_state WHERE kind=? AND key=?", (kind, key))
+
+# -------------------- PTB PERSISTENCE --------------------
+class SQLitePersistence(BasePersistence):
+    """PTB persistence on the ptb_state table: one row per user/chat, written only when it changed.
+
+    Drop-in replacement for PicklePersistence (which rewrites the whole pickle
+    at every flush); values are still pickled, so user_data can hold anything
+    it held before.
+    """
+
+    def __init__(self, store: Storage, store_data: Optional[PersistenceInput] = None,
+                 update_interval: float = 60):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.store = store
+        self.conversations: Optional[Dict[str, Dict[tuple, object]]] = None
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return {int(k): v for k, v in self.store.state_get("user_data").items()}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {int(k): v for k, v in self.store.state_get("chat_data").items()}
+
+    async def get_bot_data(self) -> Any:
+        return self.store.state_get("bot_data").get("", {})
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return self.store.state_get("callback_data").get("")
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        if self.conversations is None:
+            self.conversations = {}
+            for k, v in self.store.state_get("conversation").items():
+                conv, key = json.loads(k)
+                self.conversations.setdefault(conv, {})[tuple(key)] = v
+        return deepcopy(self.conversations.get(name, {}))
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        if self.conversations is None:
+            await self.get_conversations(name)
+        if self.conversations.setdefault(name, {}).get(key) == new_state:
+            return
+        db_key = json.dumps([name, list(key)])
+        if new_state is None:
+            self.conversations[name].pop(key, None)
+            self.store.state_drop("conversation", db_key)
+        else:
+            self.conversations[name][key] = new_state
+            self.store.state_put("conversation", db_key, new_state)
+
+    async def update_user_data(self, user_id: int, data: Any) -> None:
+        self.store.state_put("user_data", str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        self.store.state_put("chat_data", str(chat_id), data)
+
+    async def update_bot_data(self, data: Any) -> None:
+        self.store.state_put("bot_data", "", data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        self.store.state_put("callback_data", "", data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self.store.state_drop("user_data", str(user_id))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self.store.state_drop("chat_data", str(chat_id))
+
+    async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass  # ogni update è già committato
+
+# -------------------- MIGRATION --------------------
+def migrate_legacy(store: Storage, data_dir: Path, zealy_csv: Optional[Path] = None,
+                   force: bool = False) -> Dict[str, int]:
+    """Import the JSON/pickle/CSV files into the database, once.
+
+    Returns the imported counts ({} when the database was already migrated).
+    Rows already in the database win over the legacy files (INSERT OR IGNORE),
+    so --force on a live database only fills gaps.
+    """
+    if store.get_meta("migrated_at") and not force:
+        return {}
+    data_dir = Path(data_dir)
+
+    def legacy_json(name: str, default):
+        # come i vecchi load_requests/load_submissions: un file illeggibile vale come vuoto
+        path = data_dir / name
+        if not path.exists():
+            return default
+        try:
+            return json.loads(path.read_text(encoding="utf-8")) or default
+        except Exception as e:
+            log.warning("Legacy %s not imported: %s", path, e)
+            return default
+
+    counts = {"requests": 0, "submissions": 0, "user_data": 0, "chat_data": 0, "conversations": 0, "zealy": 0}
+    with store.transaction() as con:
+        # più worker avviati insieme (WORKERS > 1): solo il primo che entra importa
+        if not force and con.execute("SELECT 1 FROM meta WHERE key='migrated_at'").fetchone():
+            return {}
+        for r in legacy_json("wallet_update_requests.json", []):
+            if isinstance(r, dict):
+                vals = {f: r.get(f) for f in REQUEST_FIELDS}
+                vals["status"] = vals["status"] or "pending"
+                vals["note"] = vals["note"] or ""
+                cur = con.execute(
+                    "INSERT OR IGNORE INTO requests (id, user_id, username, first_name, last_name, wallet, timestamp,"
+                    " day, status, handled_by, handled_at, note) VALUES (:id, :user_id, :username, :first_name,"
+                    " :last_name, :wallet, :timestamp, substr(:timestamp, 1, 10), :status, :handled_by, :handled_at,"
+                    " :note)",
+                    vals,
+                )
+                counts["requests"] += cur.rowcount
+
+        for sid, rec in legacy_json("user_submissions.json", {}).items():
+            if isinstance(rec, dict):
+                cur = con.execute(
+                    "INSERT OR IGNORE INTO submissions (sid, tg_id, username, data) VALUES (?, ?, ?, ?)",
+                    (str(sid), rec.get("tg_id"), rec.get("username"), json.dumps(rec, ensure_ascii=False)),
+                )
+                counts["submissions"] += cur.rowcount
+
+        state = None
+        state_file = data_dir / "bot_state"
+        if state_file.exists():
+            try:
+                with state_file.open("rb") as f:
+                    state = pickle.load(f)
+            except Exception as e:  # es. pickle troncato da un dump interrotto
+                log.warning("Legacy %s not imported: %s", state_file, e)
+        if isinstance(state, dict):
+            rows = []
+            for kind in ("user_data", "chat_data"):
+                for k, v in (state.get(kind) or {}).items():
+                    rows.append((kind, str(k), v))
+                    counts[kind] += 1
+            if state.get("bot_data") is not None:
+                rows.append(("bot_data", "", state["bot_data"]))
+            if state.get("callback_data") is not None:
+                rows.append(("callback_data", "", state["callback_data"]))
+            for name, conv in (state.get("conversations") or {}).items():
+                for key, st in conv.items():
+                    rows.append(("conversation", json.dumps([name, list(key)]), st))
+                    counts["conversations"] += 1
+            con.executemany(
+                "INSERT OR IGNORE INTO ptb_state (kind, key, data) VALUES (?, ?, ?)",
+                ((kind, k, pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)) for kind, k, v in rows),
+            )
+
+        index = {}
+        if zealy_csv is not None and Path(zealy_csv).exists():
+            try:
+                index = read_zealy_csv(Path(zealy_csv))
+            except Exception as e:
+                log.warning("Zealy CSV %s not imported: %s", zealy_csv, e)
+        if index:
+            con.executemany("INSERT OR IGNORE INTO zealy " + _ZEALY_INSERT, _zealy_params(index))
+            counts["zealy"] = len(index)
+
+        con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_at', ?)",
+                    (datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC"),))
+    log.info("Legacy data migrated into %s: %s", store.path, counts)
+    return counts
+
+def main():
+    ap = argparse.ArgumentParser(description="SQLite storage of the Savitri bot.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    mig = sub.add_parser("migrate", help="import the legacy JSON/pickle/CSV files into bot.db")
+    mig.add_argument("--data-dir", default="data")
+    mig.add_argument("--db", help=f"database path (default <data-dir>/{DB_NAME})")
+    mig.add_argument("--zealy-csv", default="zealy_with_wvc.csv")
+    mig.add_argument("--force", action="store_true", help="run again even if already migrated")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    store = Storage(Path(args.db) if args.db else data_dir / DB_NAME)
+    try:
+        counts = migrate_legacy(store, data_dir, Path(args.zealy_csv), force=args.force)
+    finally:
+        store.close()
+    if not counts:
+        print(f"[INFO] {store.path} già migrato (usa --force per ripetere).")
+        return
+    print(f"[OK] Migrazione completata in {store.path}:")
+    for k, v in counts.items():
+        print(f"  {k}: {v}")
+
+if __name__ == "__main__":
+    main()
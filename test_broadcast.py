@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test per i broadcast (broadcast.py): selezione dei segmenti, esiti degli invii
+e ripresa dopo un'interruzione senza reinviare ai destinatari già raggiunti.
+"""
+
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from broadcast import Broadcaster, select_targets
+from storage import Storage
+
+class FakeBot:
+    """Registra gli invii; `errors` associa chat_id -> eccezione da sollevare (una volta)."""
+
+    def __init__(self, errors=None, stop_after=None):
+        self.sent = []
+        self.errors = dict(errors or {})
+        self.stop_after = stop_after
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.stop_after is not None and len(self.sent) >= self.stop_after:
+            raise asyncio.CancelledError()  # come un riavvio a metà broadcast
+        err = self.errors.pop(chat_id, None)
+        if err is not None:
+            raise err
+        self.sent.append(chat_id)
+
+def test_select_targets():
+    """Test: segmenti no_wallet e change_pending"""
+    print("\n[TEST] Selezione dei segmenti")
+    print("="*60)
+
+    zealy = {"alice": {"wallet": ""}, "bob": {"wallet": "0xabc"}, "carol": {"wallet": ""},
+             "dave": {"wallet": ""}, "erin": {"wallet": ""}}
+    users = {1: "alice", 2: "bob", 3: "carol", 4: "dave", 5: "erin", 6: "", 7: "mallory"}
+    subs = {"3": {"reg_wallet": "0x1"}, "2": {"old_sig": "0x9"}}
+    pending, approved = {4}, {5}
+
+    assert select_targets("no_wallet", users, zealy, subs, pending, approved) == [1]
+    assert select_targets("change_pending", users, zealy, subs, pending, approved) == [2, 4]
+    assert select_targets("all", users, zealy, subs, pending, approved) == [1, 2, 3, 4, 5, 6, 7]
+    try:
+        select_targets("nope", users, zealy, subs, pending, approved)
+        raise AssertionError("segmento sconosciuto accettato")
+    except ValueError:
+        pass
+
+def test_outcomes_and_resume():
+    """Test: bloccati/falliti/flood e ripresa dai soli destinatari in coda"""
+    print("\n[TEST] Esiti e ripresa")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        bc = Broadcaster(store, rate=1000, batch=10)
+        bid = bc.create("all", "hello", range(1, 101), created_by=1, report_chat_id=1)
+
+        errors = {3: Forbidden("blocked"), 4: BadRequest("chat not found"), 5: RetryAfter(0)}
+        bot = FakeBot(errors, stop_after=12)
+        try:
+            asyncio.run(bc.run(bot, bid))
+        except asyncio.CancelledError:
+            pass
+        b = bc.progress(bid)
+        print(f"   Interrotto: {b['sent']} inviati, {b['pending']} in coda")
+        assert b["status"] == "running" and b["sent"] == 7 and b["blocked"] == 1 and b["failed"] == 1
+
+        # riavvio: nuova istanza sullo stesso database
+        bot2 = FakeBot()
+        done = asyncio.run(Broadcaster(store, rate=1000, batch=10).run(bot2, bid))
+        print(f"   Ripreso: {len(bot2.sent)} invii, stato {done['status']}")
+        assert done["status"] == "done" and done["pending"] == 0
+        assert done["sent"] + done["blocked"] + done["failed"] == 100
+        assert 5 in bot2.sent  # flood control: riprovato
+        assert not set(bot.sent[:7]) & set(bot2.sent)  # il primo batch salvato non viene reinviato
+        store.close()
+
+def test_pause_cancel():
+    """Test: un broadcast in pausa non invia e può essere ripreso"""
+    print("\n[TEST] Pausa e ripresa")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        bc = Broadcaster(store, rate=1000)
+        bid = bc.create("all", "hi", [10, 11, 12], created_by=1, report_chat_id=1)
+        assert bc.set_status(bid, "paused")
+        bot = FakeBot()
+        assert asyncio.run(bc.run(bot, bid))["status"] == "paused" and bot.sent == []
+        assert bc.next_running() is None
+        assert bc.set_status(bid, "running")
+        asyncio.run(bc.worker(bot))
+        assert sorted(bot.sent) == [10, 11, 12] and bc.get(bid)["status"] == "done"
+        assert not bc.set_status(bid, "cancelled")  # già concluso
+        store.close()
+
+def run_all_broadcast_tests():
+    """Esegue tutti i test dei broadcast"""
+    tests = [
+        ("Selezione dei segmenti", test_select_targets),
+        ("Esiti e ripresa", test_outcomes_and_resume),
+        ("Pausa e ripresa", test_pause_cancel),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_broadcast_tests())
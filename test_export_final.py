@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test per il join di admin_export_final (build_final_rows).
+Verifica che l'indice per username dia lo stesso risultato della scansione originale.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from main import build_final_rows
+
+ZEALY = {
+    "alice": {"rank": "1", "xp": "900", "wallet": "0x" + "a" * 40},
+    "bob": {"rank": "2", "xp": "800", "wallet": None},
+    "carol": {"rank": "3", "xp": "700", "wallet": "0x" + "c" * 40},
+}
+SUBS = {
+    "11": {"tg_id": 11, "username": "Alice", "reg_wallet": "0x" + "1" * 40, "proofs": ["p1.jpg", "p2.jpg"]},
+    "12": {"tg_id": 12, "username": "bob", "reg_wallet": "0x" + "2" * 40},
+    "13": {"tg_id": 13, "username": "carol", "new_wallet": "0x" + "3" * 40, "old_sig": "0xo", "new_sig": "0xn"},
+    "14": {"tg_id": 14, "username": "dave", "reg_wallet": "0x" + "4" * 40},
+    "15": {"tg_id": 15, "username": "ALICE", "reg_wallet": "0x" + "5" * 40},  # duplicato: vince il primo
+    "16": {"tg_id": 16, "proofs": ["orphan.jpg"]},                              # senza username: ignorato
+}
+
+def test_final_rows_join():
+    """Test: righe ordinate per username, merge Zealy + submissions, primo record vince"""
+    print("\n[TEST] Join export finale")
+    print("="*60)
+
+    rows = {r["username"].lower(): r for r in build_final_rows(ZEALY, SUBS)}
+    print(f"[INFO] {len(rows)} righe: {sorted(rows)}")
+    assert [r["username"] for r in build_final_rows(ZEALY, SUBS)] == ["Alice", "bob", "carol", "dave"]
+
+    alice = rows["alice"]
+    assert alice["tg_id"] == 11
+    assert alice["updated_wallet"] == "0x" + "1" * 40 and alice["change_type"] == "added"
+    assert alice["proofs"] == "p1.jpg;p2.jpg"
+    assert rows["bob"]["original_wallet"] is None and rows["bob"]["change_type"] == "added"
+    assert rows["carol"]["change_type"] == "changed" and rows["carol"]["new_sig"] == "0xn"
+    dave = rows["dave"]
+    assert dave["rank"] is None and dave["updated_wallet"] == "0x" + "4" * 40
+
+    # /admin_rewards: solo i vincitori Zealy, dave non deve contare come vincitore senza rank
+    winners = [r["username"] for r in build_final_rows(ZEALY, SUBS, winners_only=True)]
+    assert winners == ["Alice", "bob", "carol"]
+
+def test_final_rows_zealy_only():
+    """Test: utenti solo nel CSV Zealy mantengono il wallet originale"""
+    print("\n[TEST] Utenti senza submission")
+    print("="*60)
+
+    rows = list(build_final_rows(ZEALY, {}))
+    assert len(rows) == 3
+    assert all(r["change_type"] in ("none",) for r in rows)
+    assert rows[0]["updated_wallet"] == rows[0]["original_wallet"]
+    assert rows[0]["proofs"] == "" and rows[0]["tg_id"] is None
+
+def run_all_export_final_tests():
+    print("\n" + "="*60)
+    print("TEST EXPORT FINALE")
+    print("="*60)
+    test_final_rows_join()
+    test_final_rows_zealy_only()
+    print("\n[OK] Tutti i test export finale superati")
+
+if __name__ == "__main__":
+    run_all_export_final_tests()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test per lo stato dei flussi wallet (flow.py): sequenza di registrazione e di
+cambio, comandi fuori sequenza, codifica compatta e conversione dalle chiavi
+user_data delle versioni precedenti.
+"""
+
+import sys
+import pickle
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from flow import TRANSITIONS, Event, FlowState, Step
+
+OLD = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+NEW = "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359"
+
+def test_register_and_change():
+    """Test: stesso motore per registrazione e cambio, comandi fuori sequenza rifiutati"""
+    print("\n[TEST] Registrazione e cambio")
+    print("="*60)
+
+    st = FlowState()
+    assert st.start(None) == Step.REGISTER and st.flow == "register"
+    assert not st.advance(Event.REG_SIG) and st.step == Step.REGISTER  # manca il wallet
+    assert st.advance(Event.SET_WALLET, NEW.lower()) and st.wallet == NEW
+    assert st.advance(Event.REG_SIG) and st.step == Step.REG_SIGN
+    assert not st.allows(Event.NEW_SIG)
+
+    assert st.start(OLD) == Step.CHANGE and st.flow == "change"
+    assert st.old_wallet == OLD and st.wallet is None
+    for event in (Event.SET_WALLET, Event.REG_SIG, Event.NEW_WALLET, Event.NEW_SIG):
+        assert not st.allows(event)
+    assert st.advance(Event.OLD_SIG) and st.step == Step.CHG_WALLET
+    assert st.advance(Event.NEW_WALLET, NEW) and st.advance(Event.NEW_SIG)
+    assert (st.step, st.old_wallet, st.wallet) == (Step.CHG_SIGN, OLD, NEW)
+    assert st.start("not-a-wallet") == Step.REGISTER  # wallet del CSV non valido: registrazione
+    # ogni step raggiungibile ha almeno un comando valido
+    assert {s for s, _ in TRANSITIONS} == set(Step)
+
+def test_compact_encoding():
+    """Test: flag e wallet sopravvivono alla codifica, molto più piccola del dict precedente"""
+    print("\n[TEST] Codifica compatta")
+    print("="*60)
+
+    ud = {"zealy_username": "alice"}
+    st = FlowState.load(ud)
+    st.save(ud)
+    assert ud == {"zealy_username": "alice"}  # niente da salvare
+
+    st.start(OLD)
+    st.proof_done = True
+    st.advance(Event.OLD_SIG)
+    st.advance(Event.NEW_WALLET, NEW)
+    st.awaiting_wallet = True
+    st.save(ud)
+    assert len(ud["fsm"]) == 43
+    back = FlowState.load(ud)
+    assert (back.step, back.old_wallet, back.wallet) == (Step.CHG_SIGN, OLD, NEW)
+    assert back.proof_done and back.awaiting_wallet and not back.awaiting_proof and back.pending is None
+
+    back.awaiting_wallet = False
+    back.start(None)
+    back.pending = Event.ADD_WALLET
+    assert FlowState.decode(back.encode()).pending == Event.ADD_WALLET
+    assert len(back.encode()) == 3
+
+    legacy = {"zealy_username": "alice", "flow": "change", "old_wallet": OLD, "new_wallet": NEW,
+              "old_sig": "0x" + "a" * 64, "proof_done": True, "awaiting_wallet": True}
+    compact = {"zealy_username": "alice", "fsm": st.encode()}
+    sizes = len(pickle.dumps(legacy)), len(pickle.dumps(compact))
+    print(f"   user_data serializzato: {sizes[0]} -> {sizes[1]} byte")
+    assert sizes[1] * 2 < sizes[0]
+
+def test_legacy_user_data():
+    """Test: le chiavi delle versioni precedenti vengono convertite e rimosse"""
+    print("\n[TEST] Conversione user_data precedente")
+    print("="*60)
+
+    ud = {"zealy_username": "bob", "flow": "register", "reg_wallet": NEW, "reg_sig": "0x1",
+          "proof_done": True, "awaiting_proof": None}
+    st = FlowState.load(ud)
+    assert (st.step, st.wallet, st.proof_done) == (Step.REG_SIGN, NEW, True)
+    assert set(ud) == {"zealy_username", "fsm"}  # già convertito anche se l'handler non salva
+
+    ud = {"flow": "change", "old_wallet": OLD, "awaiting_proof": True, "post_proof_action": "change_wallet"}
+    st = FlowState.load(ud)
+    assert (st.step, st.old_wallet, st.pending) == (Step.CHANGE, OLD, Event.CHANGE_WALLET)
+    assert st.awaiting_proof and not st.proof_done
+    assert FlowState.load({"flow": "change", "old_wallet": OLD, "old_sig": "0x2"}).step == Step.CHG_WALLET
+
+    ud = {"awaiting_wallet": False, "proof_done": False}
+    assert FlowState.load(ud).step == Step.IDLE and ud == {}
+
+def run_all_flow_tests():
+    """Esegue tutti i test dei flussi wallet"""
+    tests = [
+        ("Registrazione e cambio", test_register_and_change),
+        ("Codifica compatta", test_compact_encoding),
+        ("Conversione user_data precedente", test_legacy_user_data),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_flow_tests())
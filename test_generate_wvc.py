@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test per generate_wvc.py.
+Verifica formato, unicità e distribuzione dei codici, e lo ZIP dei QR (se qrcode è installato).
+"""
+
+import sys
+import zipfile
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from generate_wvc import ALPHABET, QR_AVAILABLE, generate_codes, random_chars, write_qr_zip
+
+def test_codes_format_and_uniqueness():
+    """Test: codici unici, prefisso e segmenti corretti"""
+    print("\n[TEST] Formato e unicità codici")
+    print("="*60)
+
+    codes = generate_codes(20000, "SAVI", 3, 4)
+    assert len(codes) == 20000 and len(set(codes)) == 20000
+    for c in codes[:500]:
+        parts = c.split("-")
+        assert parts[0] == "SAVI" and len(parts) == 4, c
+        assert all(len(p) == 4 and set(p) <= set(ALPHABET) for p in parts[1:]), c
+    assert all("-" not in c for c in generate_codes(10, "", 1, 8))
+    print("[OK] Codici corretti")
+    return True
+
+def test_alphabet_is_uniform():
+    """Test: nessun carattere favorito dalla mappatura byte -> alfabeto"""
+    print("\n[TEST] Distribuzione caratteri")
+    print("="*60)
+
+    n = 360000
+    counts = Counter(random_chars(n))
+    assert set(counts) == set(ALPHABET)
+    expected = n / len(ALPHABET)
+    chi2 = sum((c - expected) ** 2 / expected for c in counts.values())
+    print(f"chi2 = {chi2:.1f} (35 gradi di libertà)")
+    assert chi2 < 80, chi2  # p ~ 1e-5 con 35 gdl
+    print("[OK] Distribuzione uniforme")
+    return True
+
+def test_qr_zip():
+    """Test: un PNG per codice nello ZIP, senza directory intermedia"""
+    print("\n[TEST] ZIP QR")
+    print("="*60)
+
+    if not QR_AVAILABLE:
+        print("[SKIP] qrcode non installato")
+        return True
+    codes = generate_codes(40, "SAVI", 3, 4)
+    zip_path = Path(tempfile.mkdtemp(prefix="wvc_test_")) / "qr.zip"
+    assert write_qr_zip(codes, zip_path, workers=2, chunksize=8) == 40
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == [f"{c}.png" for c in codes]
+        assert zf.read(f"{codes[0]}.png").startswith(b"\x89PNG")
+    print("[OK] ZIP corretto")
+    return True
+
+def run_all_generate_wvc_tests():
+    print("\n" + "="*60)
+    print("TEST GENERAZIONE WVC")
+    print("="*60)
+    test_codes_format_and_uniqueness()
+    test_alphabet_is_uniform()
+    test_qr_zip()
+    print("\n[OK] Tutti i test WVC superati")
+
+if __name__ == "__main__":
+    run_all_generate_wvc_tests()
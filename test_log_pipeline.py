@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test per la pipeline di logging asincrona (log_pipeline.py).
+Verifica redazione del token, campionamento httpx e formattazione differita.
+"""
+
+import io
+import sys
+import logging
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from log_pipeline import setup_logging, SamplingFilter, REDACTED
+
+TOKEN = "123456:ABCdefSECRET"
+
+def _pipeline():
+    buf = io.StringIO()
+    return setup_logging([TOKEN], httpx_sample_every=5, stream=buf), buf
+
+def test_token_redacted_in_args_and_traceback():
+    """Test: il token sparisce da messaggio, argomenti e traceback"""
+    print("\n[TEST] Redazione token")
+    print("="*60)
+
+    pipeline, buf = _pipeline()
+    log = logging.getLogger("test.redact")
+    log.info("GET https://api.telegram.org/bot%s/getMe", TOKEN)
+    try:
+        raise RuntimeError(f"bad url /bot{TOKEN}/sendMessage")
+    except RuntimeError:
+        log.exception("call failed")
+    pipeline.stop()
+    out = buf.getvalue()
+    print(out)
+    assert TOKEN not in out
+    assert out.count(REDACTED) >= 2
+    assert "Traceback" in out
+
+def test_httpx_sampling():
+    """Test: le righe httpx INFO sono campionate, errori HTTP e warning passano sempre"""
+    print("\n[TEST] Campionamento httpx")
+    print("="*60)
+
+    pipeline, buf = _pipeline()
+    httpx_log = logging.getLogger("httpx")
+    for i in range(20):
+        httpx_log.info('HTTP Request: %s %s "%s %d %s"', "POST", f"https://x/bot{TOKEN}/getUpdates", "HTTP/1.1", 200, "OK")
+    httpx_log.info('HTTP Request: %s %s "%s %d %s"', "POST", "https://x/sendMessage", "HTTP/1.1", 429, "Too Many Requests")
+    httpx_log.warning("connection reset")
+    pipeline.stop()
+    lines = buf.getvalue().splitlines()
+    print(f"[INFO] {len(lines)} righe emesse su 22")
+    assert sum("200 OK" in l for l in lines) == 4
+    assert any("429" in l for l in lines)
+    assert any("connection reset" in l for l in lines)
+    assert SamplingFilter(1).filter(logging.makeLogRecord({"levelno": logging.INFO}))
+
+def test_formatting_is_deferred():
+    """Test: gli argomenti vengono formattati nel thread del listener, non nel chiamante"""
+    print("\n[TEST] Formattazione differita")
+    print("="*60)
+
+    formatted_in = []
+
+    class Probe:
+        def __str__(self):
+            formatted_in.append(threading.current_thread().name)
+            return "probe"
+
+    pipeline, buf = _pipeline()
+    logging.getLogger("test.defer").info("value=%s", Probe())
+    pipeline.stop()
+    assert "value=probe" in buf.getvalue()
+    assert formatted_in and threading.main_thread().name not in formatted_in
+
+def run_all_log_pipeline_tests():
+    print("\n" + "="*60)
+    print("TEST LOG PIPELINE")
+    print("="*60)
+    test_token_redacted_in_args_and_traceback()
+    test_httpx_sampling()
+    test_formatting_is_deferred()
+    print("\n[OK] Tutti i test log pipeline superati")
+
+if __name__ == "__main__":
+    run_all_log_pipeline_tests()
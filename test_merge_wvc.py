@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test per merge_wvc.py.
+Verifica join per chiave e per rank, righe senza codice e partizionamento (Grace hash join).
+"""
+
+import sys
+import csv
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from merge_wvc import merge
+
+def _write(path: Path, header, rows, delim=","):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter=delim)
+        w.writerow(header)
+        w.writerows(rows)
+
+def _read(path: Path):
+    with path.open("r", encoding="utf-8", newline="") as f:
+        return list(csv.reader(f, delimiter=";"))
+
+def test_key_join_and_unmatched():
+    """Test: join su username (case-insensitive), righe senza codice riportate"""
+    print("\n[TEST] Join per chiave")
+    print("="*60)
+
+    tmp = Path(tempfile.mkdtemp(prefix="merge_wvc_test_"))
+    _write(tmp / "zealy.csv", ["userId", "xp", "username"],
+           [[f"id{i}", str(1000 - i), f"User{i}"] for i in range(300)], delim=";")
+    _write(tmp / "wvc.csv", ["wvc", "assigned_to", "created_at", "expires_at", "used"],
+           [[f"SAVI-{i:04d}", f"user{i}", "", "", "false"] for i in range(0, 300, 2)]
+           + [["SAVI-DUP", "user0", "", "", "false"], ["SAVI-NOBODY", "ghost", "", "", "false"]])
+
+    results = []
+    for parts in (1, 7):
+        stats = merge(tmp / "zealy.csv", tmp / "wvc.csv", tmp / f"out{parts}.csv", "key",
+                      partitions=parts, unmatched_path=tmp / f"miss{parts}.csv")
+        print(parts, dict(stats))
+        assert stats == {"rows": 300, "matched": 150, "unmatched": 150, "unused_codes": 1, "duplicate_keys": 1}
+        rows = _read(tmp / f"out{parts}.csv")
+        assert rows[0] == ["userId", "xp", "username", "WVC"]
+        results.append(sorted(rows[1:]))
+        assert len(_read(tmp / f"miss{parts}.csv")) == 151
+    assert results[0] == results[1]
+    by_user = {r[2]: r[3] for r in results[0]}
+    assert by_user["User0"] == "SAVI-0000" and by_user["User1"] == ""
+    print("[OK] Join per chiave corretto")
+    return True
+
+def test_rank_assignment():
+    """Test: l'n-esimo codice va al rank n, anche con il CSV Zealy non ordinato"""
+    print("\n[TEST] Assegnazione per rank")
+    print("="*60)
+
+    tmp = Path(tempfile.mkdtemp(prefix="merge_wvc_test_"))
+    _write(tmp / "zealy.csv", ["username", "Position on Leaderboard", "WVC"],
+           [["carl", "#3", "OLD"], ["alice", "1", ""], ["bob", "2nd", ""]], delim=";")
+    _write(tmp / "wvc.csv", ["wvc"], [["C1"], ["C2"], ["C3"], ["C4"]])
+    for parts in (1, 3):
+        stats = merge(tmp / "zealy.csv", tmp / "wvc.csv", tmp / "out.csv", "rank", partitions=parts)
+        assert stats["matched"] == 3 and stats["unused_codes"] == 1
+        rows = _read(tmp / "out.csv")
+        assert rows[0] == ["username", "Position on Leaderboard", "WVC"]
+        assert {r[0]: r[2] for r in rows[1:]} == {"alice": "C1", "bob": "C2", "carl": "C3"}
+    print("[OK] Assegnazione per rank corretta")
+    return True
+
+def run_all_merge_wvc_tests():
+    print("\n" + "="*60)
+    print("TEST MERGE WVC")
+    print("="*60)
+    test_key_join_and_unmatched()
+    test_rank_assignment()
+    print("\n[OK] Tutti i test merge WVC superati")
+
+if __name__ == "__main__":
+    run_all_merge_wvc_tests()
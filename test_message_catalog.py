@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test per message_catalog.py e messages.py.
+Verifica messaggi statici precompilati, ordine dei campi tra locale, fallback e cache limitata.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import messages as T
+from message_catalog import MessageCatalog
+
+def test_catalog_compile_and_fallback():
+    """Test: footer unito una volta, campi posizionali nello stesso ordine per ogni locale"""
+    print("\n[TEST] Catalogo messaggi")
+    print("="*60)
+
+    cat = MessageCatalog(
+        {"en": {"hi": "Hi {name}, you have {n} {{points}}", "bye": "Bye", "btn": "OK {name}"},
+         "it": {"hi": "{n} {{punti}} per te, {name}"}},
+        footers={"en": "-- {footer}"}, no_footer=("btn",), cache_size=2,
+    )
+    assert cat.text("bye") == "Bye\n\n-- {footer}"
+    assert cat.text("bye", "it") == cat.text("bye")  # fallback sull'inglese
+    assert cat.render("hi", None, "Ann", 3) == "Hi Ann, you have 3 {points}\n\n-- {footer}"
+    assert cat.render("hi", "it", "Ann", 3) == "3 {punti} per te, Ann\n\n-- {footer}"
+    assert cat.get("hi", "it", n=3, name="Ann") == cat.render("hi", "it", "Ann", 3)
+    assert cat.render("btn", None, "x") == "OK x"
+    for i in range(5):
+        cat.render("btn", None, str(i))
+    assert cat.cache_info().currsize == 2
+    try:
+        MessageCatalog({"en": {"a": "{x}"}, "it": {"a": "{y}"}})
+        raise AssertionError("campo sconosciuto accettato")
+    except ValueError:
+        pass
+    print("[OK] Catalogo corretto")
+    return True
+
+def test_messages_wrappers():
+    """Test: le funzioni msg_* passano i valori nell'ordine dei campi del template"""
+    print("\n[TEST] Funzioni messages.py")
+    print("="*60)
+
+    calls = {
+        "status": (T.msg_status("alice", 1, None, "0xabc", "30/11/2025", None, None),
+                   dict(username="alice", rank="1", xp="-", wallet="0xabc", deadline_str="30/11/2025")),
+        "add_wallet_guide": (T.msg_add_wallet_guide("alice", "30/11/2025", False),
+                             dict(gate="", username="alice", deadline_str="30/11/2025")),
+        "change_wallet_guide": (T.msg_change_wallet_guide("alice", "0xold", "30/11/2025", False),
+                                dict(gate="", username="alice", old_wallet="0xold", deadline_str="30/11/2025")),
+        "new_wallet_ok": (T.msg_new_wallet_ok("0xnew", "alice", "0xold"),
+                          dict(new_wallet="0xnew", username="alice", old_wallet="0xold")),
+        "new_sig_ok": (T.msg_new_sig_ok("0xold", "0xnew", "0xh"), dict(old_wallet="0xold", new_wallet="0xnew", msg_hash="0xh")),
+        "set_wallet_ok": (T.msg_set_wallet_ok("0xw", "alice"), dict(wallet="0xw", username="alice")),
+        "admin_notify_change": (T.admin_notify_change("alice", 7, "0xold", "0xnew", "0xs", "0xh"),
+                                dict(username="alice", tg_id=7, old_wallet="0xold", new_wallet="0xnew",
+                                     signature="0xs", msg_hash="0xh")),
+    }
+    for key, (rendered, params) in calls.items():
+        locale = T.ADMIN_LOCALE if key.startswith("admin_") else None
+        assert rendered == T.CATALOG.get(key, locale, **params), key
+    assert "{wallet}" in T.msg_add_wallet_guide("alice", "30/11/2025", True)
+    assert T.msg_need_photo().endswith(T.DISCLAIMER)
+    assert T.admin_notify_change("a", 1, "o", "n", "s", "h").startswith("🔐 *Cambio wallet*")
+    assert T.admin_notify_change("a", 1, "o", "n", "s", "h", locale="en").startswith("🔐 *Wallet Change*")
+    print("[OK] Funzioni corrette")
+    return True
+
+def run_all_message_catalog_tests():
+    print("\n" + "="*60)
+    print("TEST CATALOGO MESSAGGI")
+    print("="*60)
+    test_catalog_compile_and_fallback()
+    test_messages_wrappers()
+    print("\n[OK] Tutti i test catalogo superati")
+
+if __name__ == "__main__":
+    run_all_message_catalog_tests()
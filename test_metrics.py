@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test per il sottosistema di metriche (metrics.py).
+Verifica istogrammi, wrapper degli handler e formato Prometheus.
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import metrics
+from metrics import Histogram, Registry, REGISTRY, instrument_handler, timed
+
+def test_histogram_quantiles():
+    """Test: i quantili stimati cadono nel bucket corretto"""
+    print("\n[TEST] Quantili istogramma")
+    print("="*60)
+
+    h = Histogram()
+    for _ in range(90):
+        h.observe(0.003)   # bucket (0.001, 0.005]
+    for _ in range(10):
+        h.observe(0.8)     # bucket (0.5, 1.0]
+    p50, p99 = h.quantile(0.5), h.quantile(0.99)
+    print(f"[INFO] p50={p50:.4f}s p99={p99:.4f}s max={h.max}")
+    assert 0.001 < p50 <= 0.005
+    assert 0.5 < p99 <= 0.8
+    assert h.count == 100
+
+def test_handler_wrapper_and_render():
+    """Test: il wrapper conta latenze ed errori, il render è in formato Prometheus"""
+    print("\n[TEST] Wrapper handler e render Prometheus")
+    print("="*60)
+
+    async def ok_handler(update, context):
+        return "done"
+
+    async def failing_handler(update, context):
+        raise RuntimeError("boom")
+
+    ok = instrument_handler(ok_handler)
+    bad = instrument_handler(failing_handler)
+    assert instrument_handler(ok) is ok  # non viene avvolto due volte
+
+    async def run():
+        assert await ok(None, None) == "done"
+        try:
+            await bad(None, None)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("l'eccezione deve propagarsi")
+    asyncio.run(run())
+
+    assert REGISTRY.counter_value("bot_handler_errors_total", handler="failing_handler") >= 1
+    text = REGISTRY.render()
+    assert '# TYPE bot_handler_seconds histogram' in text
+    assert 'bot_handler_seconds_bucket{handler="ok_handler",le="+Inf"}' in text
+    assert 'bot_handler_seconds_count{handler="failing_handler"}' in text
+    print("[OK] Render Prometheus valido")
+
+def test_label_escaping_and_timed():
+    """Test: escape delle label e decoratore timed per lo storage"""
+    print("\n[TEST] Escape label e decoratore timed")
+    print("="*60)
+
+    reg = Registry()
+    reg.inc("x_total", name='a"b\\c')
+    assert 'x_total{name="a\\"b\\\\c"} 1' in reg.render()
+
+    @timed("unit_test_op")
+    def op():
+        return 42
+    assert op() == 42
+    assert any(r["labels"] == {"op": "unit_test_op"} for r in REGISTRY.snapshot("bot_storage_seconds"))
+    print("[OK] Label e timing storage corretti")
+
+def test_loop_stall_and_slow_handlers():
+    """Test: blocco del loop rilevato con lo stack, handler lento con il punto di attesa"""
+    print("\n[TEST] Lag del loop e handler lenti")
+    print("="*60)
+
+    def blocking_call():
+        time.sleep(0.4)  # simula zipfile/json.dumps sincroni nel loop
+
+    async def blocking_handler(update, context):
+        blocking_call()
+
+    async def waiting_handler(update, context):
+        await asyncio.sleep(0.2)
+
+    blocking = instrument_handler(blocking_handler)
+    waiting = instrument_handler(waiting_handler)
+    old_threshold = metrics.SLOW_HANDLERS.threshold
+    metrics.SLOW_HANDLERS.threshold = 0.1
+    stalls_before = REGISTRY.counter_value("bot_loop_stalls_total")
+
+    async def run():
+        monitor = metrics.start_loop_monitor(interval=0.02, stall_threshold=0.1)
+        await asyncio.sleep(0.1)
+        await blocking(None, None)
+        await waiting(None, None)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    try:
+        monitor = asyncio.run(run())
+    finally:
+        metrics.SLOW_HANDLERS.threshold = old_threshold
+
+    assert REGISTRY.counter_value("bot_loop_stalls_total") > stalls_before
+    stall = monitor.stalls[-1]
+    print(f"[INFO] Loop bloccato {stall['blocked']:.2f}s nell'handler {stall['handler']}")
+    assert stall["handler"] == "blocking_handler"
+    assert "blocking_call" in stall["stack"]
+    events = {e["handler"]: e for e in metrics.SLOW_HANDLERS.events}
+    assert "blocking_call" in events["blocking_handler"]["stack"]
+    assert "waiting_handler" in events["waiting_handler"]["stack"]
+    assert REGISTRY.snapshot("bot_loop_lag_seconds")[0]["max"] >= 0.3
+    print("[OK] Blocchi e handler lenti registrati con stack")
+
+def test_health_checks_cached():
+    """Test: i check di readiness sono in cache per il TTL e gli errori diventano 503"""
+    print("\n[TEST] Health check in cache")
+    print("="*60)
+
+    calls = {"n": 0}
+
+    def counted():
+        calls["n"] += 1
+        return True, "ok"
+
+    def broken():
+        raise OSError("disk full")
+
+    checks = metrics.HealthChecks(ttl=60)
+    checks.add("counted", counted)
+    ok, res = checks.run()
+    checks.run()
+    assert ok and calls["n"] == 1
+    checks.add("broken", broken)
+    ok, res = checks.run()
+    assert not ok and "disk full" in res["broken"]["detail"]
+    status, ctype, body = metrics.json_result(ok, {"checks": res})
+    assert status == 503 and ctype == "application/json" and '"broken"' in body
+    print("[OK] Cache e stato 503 corretti")
+
+def run_all_metrics_tests():
+    """Esegue tutti i test delle metriche"""
+    tests = [
+        ("Quantili istogramma", test_histogram_quantiles),
+        ("Wrapper e render", test_handler_wrapper_and_render),
+        ("Escape e timed", test_label_escaping_and_timed),
+        ("Lag loop e handler lenti", test_loop_stall_and_slow_handlers),
+        ("Health check in cache", test_health_checks_cached),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_metrics_tests())
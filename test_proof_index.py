@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test per l'indice percettivo degli screenshot (proof_index.py).
+Verifica BK-tree, hash percettivi e rilevamento di copie ricompresse.
+"""
+
+import sys
+import json
+import random
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import proof_index
+from proof_index import BKTree, ProofIndex, hamming, dhash_ahash, PIL_AVAILABLE
+
+PROOFS_DIR = Path(__file__).parent / "data" / "proofs"
+
+def test_bktree_matches_linear_scan():
+    """Test: il BK-tree restituisce gli stessi vicini di una scansione lineare"""
+    print("\n[TEST] BK-tree vs scansione lineare")
+    print("="*60)
+
+    rnd = random.Random(42)
+    hashes = [rnd.getrandbits(64) for _ in range(3000)]
+    # qualche quasi-duplicato (1-3 bit diversi)
+    for h in hashes[:50]:
+        hashes.append(h ^ (1 << rnd.randrange(64)) ^ (1 << rnd.randrange(64)))
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+
+    for q in hashes[:50]:
+        got = sorted(p for _, _, p in tree.search(q, 6))
+        expected = sorted(i for i, h in enumerate(hashes) if hamming(q, h) <= 6)
+        assert got == expected, f"BK-tree mismatch: {got} != {expected}"
+    print(f"[OK] {len(tree)} hash indicizzati, risultati identici alla scansione lineare")
+
+def test_reencoded_copy_is_similar():
+    """Test: una copia ricompressa e ridimensionata resta entro la soglia"""
+    print("\n[TEST] Copia ricompressa di uno screenshot")
+    print("="*60)
+
+    if not PIL_AVAILABLE:
+        print("[INFO] Pillow non installato, test saltato")
+        return
+    sources = sorted(PROOFS_DIR.glob("*.jpg"))
+    if not sources:
+        print("[INFO] Nessuno screenshot disponibile, test saltato")
+        return
+
+    from PIL import Image
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = sources[0]
+        copy = tmp / "999_1.jpg"
+        with Image.open(src) as img:
+            w, h = img.size
+            img.convert("RGB").resize((w * 2 // 3, h * 2 // 3)).save(copy, quality=40)
+
+        d_src, a_src = dhash_ahash(src)
+        d_copy, a_copy = dhash_ahash(copy)
+        print(f"[INFO] dHash distance: {hamming(d_src, d_copy)}, aHash distance: {hamming(a_src, a_copy)}")
+        assert hamming(d_src, d_copy) <= 6
+
+        (tmp / src.name).write_bytes(src.read_bytes())
+        index = ProofIndex(tmp, tmp / "cache.json")
+        assert index.build() == 2
+        groups = index.similar_groups()
+        assert len(groups) == 1 and {e["file"] for e in groups[0]} == {src.name, copy.name}
+        print(f"[OK] Copia rilevata come simile a {src.name}")
+
+        # la cache evita di ricalcolare gli hash
+        assert (tmp / "cache.json").exists()
+        assert ProofIndex(tmp, tmp / "cache.json").build() == 2
+
+def test_append_only_cache():
+    """Test: un nuovo proof aggiunge una riga alla cache, riscritta solo se non più valida"""
+    print("\n[TEST] Cache in append")
+    print("="*60)
+
+    if not PIL_AVAILABLE:
+        print("[INFO] Pillow non installato, test saltato")
+        return
+
+    from PIL import Image
+    rnd = random.Random(7)
+
+    def screenshot(path: Path) -> None:
+        img = Image.new("L", (90, 80))
+        img.putdata([rnd.randrange(256) for _ in range(90 * 80)])
+        img.save(path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = tmp / "cache.json"
+        for i in range(3):
+            screenshot(tmp / f"{100 + i}_1.png")
+        index = ProofIndex(tmp, cache)
+        assert index.build() == 3
+        before = cache.read_text(encoding="utf-8")
+        assert len(before.splitlines()) == 3
+
+        screenshot(tmp / "200_1.png")
+        assert index.add_file(tmp / "200_1.png") == [] and len(index) == 4
+        after = cache.read_text(encoding="utf-8")
+        assert after.startswith(before) and len(after.splitlines()) == 4  # solo una riga in più
+        # copia esatta di un altro utente: trovata, e la cache la contiene già per il riavvio
+        (tmp / "300_1.png").write_bytes((tmp / "100_1.png").read_bytes())
+        assert [m["file"] for m in index.add_file(tmp / "300_1.png")] == ["100_1.png"]
+
+        # riga troncata da un crash e proof cancellato: la scansione riscrive la cache
+        (tmp / "101_1.png").unlink()
+        cache.write_text(cache.read_text(encoding="utf-8") + '["400_1.png","00', encoding="utf-8")
+        fresh = ProofIndex(tmp, cache)
+        assert fresh.build() == 4 and fresh.hashes == {k: v for k, v in index.hashes.items() if k != "101_1.png"}
+        assert len(cache.read_text(encoding="utf-8").splitlines()) == 4
+
+        # cache delle versioni precedenti (un solo oggetto JSON): letta e convertita
+        legacy = {k: [f"{dh:016x}", f"{ah:016x}"] for k, (dh, ah) in fresh.hashes.items()}
+        cache.write_text(json.dumps(legacy), encoding="utf-8")
+        again = ProofIndex(tmp, cache)
+        assert again.build() == 4 and again.hashes == fresh.hashes
+        assert cache.read_text(encoding="utf-8").startswith("[")
+        print(f"[OK] {len(again)} proof, cache di {len(cache.read_text(encoding='utf-8').splitlines())} righe")
+
+        # la scansione decodifica le immagini nuove senza tenere il lock dell'indice
+        screenshot(tmp / "500_1.png")
+        free = []
+
+        def probe(path):
+            t = threading.Thread(target=lambda: free.append(again.lock.acquire(blocking=False) and not again.lock.release()))
+            t.start()
+            t.join()
+            return dhash_ahash(path)
+
+        proof_index.dhash_ahash = probe
+        try:
+            assert again.refresh() == 1 and "500_1.png" in again.hashes
+        finally:
+            proof_index.dhash_ahash = dhash_ahash
+        assert free == [True]
+
+def run_all_proof_index_tests():
+    """Esegue tutti i test dell'indice proof"""
+    tests = [
+        ("BK-tree vs scansione lineare", test_bktree_matches_linear_scan),
+        ("Copia ricompressa", test_reencoded_copy_is_similar),
+        ("Cache in append", test_append_only_cache),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_proof_index_tests())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test per il calcolo dei pagamenti (rewards.py): fasce, ripartizione del pool
+al centesimo, wallet condivisi e manifest a batch; stessi risultati con e
+senza NumPy.
+"""
+
+import sys
+import csv
+import random
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import rewards
+from rewards import WinnerTable, allocate, parse_tiers
+
+def _rows(n: int, seed: int = 3) -> list:
+    rnd = random.Random(seed)
+    wallets = ["0x%040x" % rnd.getrandbits(160) for _ in range(n)]
+    rows = []
+    for i in range(n):
+        wallet = wallets[i] if rnd.random() < 0.9 else (wallets[0].upper().replace("0X", "0x") if rnd.random() < 0.5 else "")
+        rows.append({"username": f"user{i}", "rank": str(i + 1), "xp": str(rnd.randint(0, 9000)), "updated_wallet": wallet})
+    return rows
+
+def _both(fn):
+    """Esegue fn con e senza NumPy e restituisce i due risultati."""
+    out = []
+    saved = rewards.NUMPY_AVAILABLE
+    for flag in ((True, False) if saved else (False,)):
+        rewards.NUMPY_AVAILABLE = flag
+        try:
+            out.append(fn())
+        finally:
+            rewards.NUMPY_AVAILABLE = saved
+    return out
+
+def test_tiers():
+    """Test: importi per fascia di rank e wallet condivisi sommati"""
+    print("\n[TEST] Fasce di rank")
+    print("="*60)
+
+    w1, w2 = "0x" + "a" * 40, "0x" + "b" * 40
+    rows = [
+        {"username": "first", "rank": "1", "xp": "900", "updated_wallet": w1},
+        {"username": "second", "rank": "#2", "xp": "800", "updated_wallet": w2},
+        {"username": "third", "rank": "3", "xp": "700", "updated_wallet": w2.upper().replace("0X", "0x")},
+        {"username": "nowallet", "rank": "4", "xp": "600", "updated_wallet": ""},
+        {"username": "far", "rank": "50", "xp": "10", "updated_wallet": "0x" + "c" * 40},
+    ]
+    for p in _both(lambda: allocate(WinnerTable(rows), tiers="1:1000,2-4:100.5")):
+        assert p.per_wallet() == [(w1, 1000_000000), (w2, 201_000000)], p.per_wallet()
+        s = p.summary()
+        assert s["total"] == "1201.000000" and s["withheld"] == "100.500000" and s["checks_ok"]
+        assert s["missing_wallet"] == 1 and s["shared_wallets"] == 1
+    try:
+        parse_tiers("1-10:5,5-20:1")
+        raise AssertionError("fasce sovrapposte accettate")
+    except ValueError:
+        pass
+
+def test_pool_exact():
+    """Test: la ripartizione proporzionale somma esattamente al pool"""
+    print("\n[TEST] Pool proporzionale")
+    print("="*60)
+
+    rows = _rows(5000)
+    for weight, redistribute in (("xp", False), ("rank", True)):
+        results = _both(lambda: allocate(WinnerTable(rows), pool=123456.789, weight=weight,
+                                         exponent=0.7, redistribute=redistribute))
+        for p in results:
+            s = p.summary()
+            print(f"   {weight}: totale {s['total']}, trattenuto {s['withheld']}")
+            assert s["checks_ok"] and s["pool"] == "123456.789000"
+            assert sum(int(u) for u in p.units) == 123456_789000
+            if redistribute:
+                assert s["withheld"] == "0.000000"
+        if len(results) == 2:
+            assert results[0].per_wallet() == results[1].per_wallet()
+
+def test_manifest_batches():
+    """Test: manifest CSV a batch, un wallet per riga"""
+    print("\n[TEST] Manifest a batch")
+    print("="*60)
+
+    p = allocate(WinnerTable(_rows(1000)), pool=1000)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "payouts.csv"
+        n = p.write_manifest(path, batch_size=100)
+        with path.open(encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    assert n == len(rows) == p.summary(100)["wallets"]
+    assert max(int(r["batch"]) for r in rows) == p.summary(100)["batches"]
+    assert len({r["wallet"].lower() for r in rows}) == len(rows)
+    assert abs(sum(float(r["amount"]) for r in rows) + float(p.summary()["withheld"]) - 1000) < 1e-6
+
+def test_invalid_input():
+    """Test: XP negativi ed esponente negativo rifiutati con ValueError"""
+    print("\n[TEST] Input non validi")
+    print("="*60)
+
+    rows = _rows(20)
+    rows[5]["xp"] = "-100"
+    for fn in (lambda: WinnerTable(rows), lambda: allocate(WinnerTable(_rows(20)), pool=100, exponent=-1)):
+        try:
+            fn()
+        except ValueError as e:
+            print(f"[INFO] rifiutato: {e}")
+        else:
+            raise AssertionError("input negativo accettato")
+    rows[5]["xp"] = "-0"
+    assert WinnerTable(rows).xp[5] == 0
+
+    # winners_final.csv: le righe senza rank né XP (solo submission) non contano come vincitori
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "winners_final.csv"
+        path.write_text("username,rank,xp,updated_wallet\nalice,1,900,0x%s\ndave,,,0x%s\n" % ("a" * 40, "4" * 40),
+                        encoding="utf-8")
+        assert [r["username"] for r in rewards.read_winners_csv(path)] == ["alice"]
+
+def run_all_rewards_tests():
+    """Esegue tutti i test dei pagamenti"""
+    tests = [
+        ("Fasce di rank", test_tiers),
+        ("Pool proporzionale", test_pool_exact),
+        ("Manifest a batch", test_manifest_batches),
+        ("Input non validi", test_invalid_input),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_rewards_tests())
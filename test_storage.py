@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test per lo storage SQLite (storage.py).
+Verifica la migrazione dai file legacy, la paginazione delle richieste e la persistence PTB.
+"""
+
+import sys
+import json
+import pickle
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from storage import Storage, SQLitePersistence, migrate_legacy, wvc_hash
+
+def _legacy_data_dir() -> Path:
+    data_dir = Path(tempfile.mkdtemp(prefix="storage_test_")) / "data"
+    data_dir.mkdir()
+    reqs = [
+        {"id": i, "user_id": 100 + i % 3, "username": f"User{i % 3}", "wallet": f"0x{i:040x}",
+         "timestamp": f"2025-11-{i:02d} 10:00:00 UTC", "status": "approved" if i % 4 == 0 else "pending"}
+        for i in range(1, 26)
+    ]
+    (data_dir / "wallet_update_requests.json").write_text(json.dumps(reqs), encoding="utf-8")
+    subs = {"101": {"tg_id": 101, "username": "user1", "proofs": ["data/proofs/101_1.jpg"]}}
+    (data_dir / "user_submissions.json").write_text(json.dumps(subs), encoding="utf-8")
+    state = {"user_data": {101: {"zealy_username": "user1", "proof_done": True}}, "chat_data": {},
+             "bot_data": {"req_admin_msgs": {3: [(1, 42)]}}, "conversations": {}, "callback_data": None}
+    with (data_dir / "bot_state").open("wb") as f:
+        pickle.dump(state, f)
+    (data_dir.parent / "zealy.csv").write_text("Position;XP;Username;WVC\n1;900;User1;WVC-1\n", encoding="utf-8")
+    return data_dir
+
+def test_migration_is_one_shot():
+    """Test: JSON, pickle e CSV importati una volta sola"""
+    print("\n[TEST] Migrazione legacy")
+    print("="*60)
+
+    data_dir = _legacy_data_dir()
+    store = Storage(data_dir / "bot.db")
+    counts = migrate_legacy(store, data_dir, data_dir.parent / "zealy.csv")
+    print(counts)
+    assert counts["requests"] == 25 and counts["submissions"] == 1
+    assert counts["user_data"] == 1 and counts["zealy"] == 1
+    assert migrate_legacy(store, data_dir, data_dir.parent / "zealy.csv") == {}
+
+    assert store.get_request(7)["wallet"] == f"0x{7:040x}"
+    assert store.add_request({"user_id": 999, "timestamp": "2025-12-01 00:00:00 UTC"}) == 26
+    assert store.user_id_by_name("user2") == 102
+    assert store.load_zealy()["user1"]["wvc_hash"] == wvc_hash("wvc-1")
+
+    rec = store.update_submission("101", {"tg_id": 101}, append={"proofs": "data/proofs/101_2.jpg"}, reg_wallet="0xabc")
+    assert rec["proofs"] == ["data/proofs/101_1.jpg", "data/proofs/101_2.jpg"] and rec["username"] == "user1"
+    assert store.get_submission("101")["reg_wallet"] == "0xabc"
+    store.close()
+    print("[OK] Migrazione e point query corrette")
+    return True
+
+def test_request_pages_and_filters():
+    """Test: pagine keyset newest-first con filtri di stato, utente e date"""
+    print("\n[TEST] Paginazione richieste")
+    print("="*60)
+
+    data_dir = _legacy_data_dir()
+    store = Storage(data_dir / "bot.db")
+    migrate_legacy(store, data_dir)
+    flt = {"status": "pending", "user_id": None, "from": None, "to": None}
+    expected = [i for i in range(25, 0, -1) if i % 4]
+
+    seen, cursor = [], None
+    while True:
+        rows, has_newer, has_older = store.page_requests(flt, cursor, "next", 5)
+        assert has_newer == bool(seen)
+        seen += [r["id"] for r in rows]
+        if not has_older:
+            break
+        cursor = rows[-1]["id"]
+    assert seen == expected, seen
+
+    rows, has_newer, _ = store.page_requests(flt, cursor, "prev", 5)
+    assert [r["id"] for r in rows] == expected[-10:-5] and has_newer
+
+    flt = {"status": None, "user_id": 101, "from": "2025-11-05", "to": "2025-11-20"}
+    ids = [r["id"] for r in store.iter_requests(flt, batch=2)]
+    assert ids == [i for i in range(5, 21) if i % 3 == 1], ids
+
+    r = store.get_request(1)
+    r.update(status="approved", handled_by=7, handled_at="2025-11-30 00:00:00 UTC")
+    store.save_requests([r])
+    assert store.get_request(1)["handled_by"] == 7
+    assert store.count_requests("pending") == len(expected) - 1
+    store.close()
+    print("[OK] Paginazione e filtri corretti")
+    return True
+
+def test_concurrent_decisions():
+    """Test: due worker (due connessioni) decidono la stessa richiesta, solo il primo la scrive"""
+    print("\n[TEST] Decisioni concorrenti")
+    print("="*60)
+
+    data_dir = _legacy_data_dir()
+    a, b = Storage(data_dir / "bot.db"), Storage(data_dir / "bot.db")
+    migrate_legacy(a, data_dir)
+    ra, rb = a.get_request(1), b.get_request(1)
+    assert ra["status"] == rb["status"] == "pending"  # entrambi superano il controllo in Python
+    ra.update(status="approved", handled_by=7)
+    rb.update(status="rejected", handled_by=8)
+    assert a.save_requests([ra]) == [1]
+    assert b.save_requests([rb]) == []
+    assert b.get_request(1)["status"] == "approved" and b.get_request(1)["handled_by"] == 7
+
+    # bulk sovrapposti in parallelo: ogni richiesta pending viene decisa una volta sola
+    pending = [r["id"] for r in a.iter_requests({"status": "pending"})]
+    changed = {}
+
+    def bulk(store, name):
+        items = [dict(store.get_request(i), status="approved", handled_by=name) for i in pending]
+        changed[name] = store.save_requests(items)
+
+    threads = [threading.Thread(target=bulk, args=(s, n)) for s, n in ((a, 1), (b, 2))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(changed[1] + changed[2]) == pending
+    assert a.count_requests("pending") == 0
+    a.close()
+    b.close()
+    print(f"[OK] Richieste decise: {len(changed[1])} + {len(changed[2])}")
+    return True
+
+def test_persistence_roundtrip():
+    """Test: user_data/bot_data/conversazioni sopravvivono al riavvio"""
+    print("\n[TEST] SQLitePersistence")
+    print("="*60)
+
+    data_dir = _legacy_data_dir()
+    db = data_dir / "bot.db"
+    store = Storage(db)
+    migrate_legacy(store, data_dir)
+
+    async def write():
+        p = SQLitePersistence(store)
+        assert (await p.get_user_data())[101]["proof_done"] is True
+        assert (await p.get_bot_data())["req_admin_msgs"] == {3: [(1, 42)]}
+        await p.update_user_data(202, {"flow": "register"})
+        await p.drop_user_data(101)
+        await p.update_conversation("wallet", (202, 202), 1)
+
+    asyncio.run(write())
+    store.close()
+
+    async def read():
+        p = SQLitePersistence(Storage(db))
+        return await p.get_user_data(), await p.get_conversations("wallet")
+
+    user_data, conv = asyncio.run(read())
+    print(user_data, conv)
+    assert user_data == {202: {"flow": "register"}}
+    assert conv == {(202, 202): 1}
+    print("[OK] Persistence corretta")
+    return True
+
+def run_all_storage_tests():
+    print("\n" + "="*60)
+    print("TEST STORAGE SQLITE")
+    print("="*60)
+    test_migration_is_one_shot()
+    test_request_pages_and_filters()
+    test_concurrent_decisions()
+    test_persistence_roundtrip()
+    print("\n[OK] Tutti i test storage superati")
+
+if __name__ == "__main__":
+    run_all_storage_tests()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test per l'anti-flood (throttle.py): bucket per utente e per tipo di update,
+limite soft (un avviso) e hard (utente ignorato), pulizia degli utenti inattivi.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from telegram import Update
+
+from throttle import ALLOW, DROP, MUTE, WARN, Limit, Throttle, parse_limits, update_kind
+
+def _update(**message) -> Update:
+    base = {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+            "from": {"id": 5, "is_bot": False, "first_name": "u"}}
+    return Update.de_json({"update_id": 1, "message": {**base, **message}}, None)
+
+def test_buckets_and_kinds():
+    """Test: burst e ricarica del bucket utente, limite più stretto per /status"""
+    print("\n[TEST] Bucket per utente e per tipo")
+    print("="*60)
+
+    kinds = parse_limits("status=0.5/2, photo=x/3, =1/1, TEXT=1")
+    assert kinds == {"status": Limit(0.5, 2), "text": Limit(1, 1)}
+    t = Throttle(Limit(rate=1, burst=4), kinds)
+    assert [t.check(1, "status", now=0) for _ in range(3)] == [ALLOW, ALLOW, WARN]
+    assert t.check(1, "help", now=0) == ALLOW  # gli altri comandi usano solo il bucket utente
+    assert t.check(1, "help", now=0) == ALLOW
+    assert t.check(1, "help", now=0) == WARN   # bucket utente vuoto: nuovo avviso dopo un update accettato
+    assert t.check(1, "help", now=0) == DROP   # avviso già dato
+    assert t.check(2, "help", now=0) == ALLOW  # utenti indipendenti
+    assert t.check(1, "status", now=1) == DROP  # 1 token utente, ma /status ha solo 0.5
+    assert t.check(1, "status", now=2) == ALLOW
+
+    assert update_kind(_update(text="/Status@SavitriBot extra")) == "status"
+    assert update_kind(_update(text="0xabc")) == "text" and update_kind(_update(text="/ ")) == "text"
+    assert update_kind(_update(photo=[{"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1}])) == "photo"
+
+def test_soft_and_hard_limit():
+    """Test: dopo troppi rifiuti l'utente viene ignorato fino alla fine del muto"""
+    print("\n[TEST] Limite soft e hard")
+    print("="*60)
+
+    t = Throttle(Limit(rate=1, burst=2), hard_strikes=5, hard_window=10, mute_seconds=100)
+    verdicts = [t.check(7, "text", now=0) for _ in range(8)]
+    assert verdicts == [ALLOW, ALLOW, WARN, DROP, DROP, DROP, MUTE, DROP]
+    assert t.muted(now=50) == 1
+    assert t.check(7, "text", now=99) == DROP  # ancora in muto, anche se i bucket sono pieni
+    assert t.check(7, "text", now=101) == ALLOW and t.muted(now=101) == 0
+
+    # rifiuti sparsi oltre la finestra non portano al muto
+    t = Throttle(Limit(rate=1, burst=1), hard_strikes=3, hard_window=5)
+    for second in range(0, 60, 6):
+        assert t.check(8, "text", now=second) == ALLOW
+        assert t.check(8, "text", now=second) == WARN
+
+def test_sweep_idle_users():
+    """Test: gli utenti tornati a bucket pieni vengono dimenticati, quelli in muto no"""
+    print("\n[TEST] Pulizia utenti inattivi")
+    print("="*60)
+
+    t = Throttle(Limit(rate=1, burst=5), {"photo": Limit(0.1, 3)}, hard_strikes=2,
+                 hard_window=10, mute_seconds=1000, sweep_interval=60)
+    assert t.idle_after == 30  # il bucket più lento: 3 / 0.1
+    for uid in range(1000):
+        t.check(uid, "photo" if uid % 2 else "text", now=0)
+    for _ in range(7):
+        t.check(5, "text", now=1)
+    assert len(t) == 1000 and t.muted(now=1) == 1
+    assert t.sweep(now=29) == 0
+    assert t.sweep(now=40) == 999 and list(t.users) == [5]
+    t.check(6, "text", now=100)  # il controllo periodico parte da check()
+    assert t.swept_at == 100 and sorted(t.users) == [5, 6]
+    print(f"   Utenti tracciati dopo la pulizia: {len(t)}")
+
+def test_photo_albums():
+    """Test: un album di 10 foto costa un solo token, anche con i limiti di default"""
+    print("\n[TEST] Album di foto")
+    print("="*60)
+
+    t = Throttle(Limit(rate=1, burst=8), parse_limits("photo=0.1/5"))
+    album = [t.check(3, "photo", now=0, group="A1") for _ in range(10)]
+    assert album == [ALLOW] * 10
+    assert t.users[3].tokens == 7 and t.users[3].kinds["photo"].tokens == 4
+    assert [t.check(3, "photo", now=1, group="A2") for _ in range(10)] == [ALLOW] * 10
+    # senza album le foto consumano un token ciascuna: 4 nel bucket photo (3 + 0.1 di ricarica)
+    assert [t.check(3, "photo", now=1) for _ in range(4)] == [ALLOW, ALLOW, ALLOW, WARN]
+    # lo stesso media_group_id oltre le 10 foto di un album torna a pagare
+    t = Throttle(Limit(rate=1, burst=2))
+    assert [t.check(4, "photo", now=0, group="B") for _ in range(12)] == [ALLOW] * 10 + [ALLOW, WARN]
+
+    photo = {"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1}
+    assert _update(photo=[photo], media_group_id="A1").effective_message.media_group_id == "A1"
+
+def run_all_throttle_tests():
+    """Esegue tutti i test dell'anti-flood"""
+    tests = [
+        ("Bucket per utente e per tipo", test_buckets_and_kinds),
+        ("Limite soft e hard", test_soft_and_hard_limit),
+        ("Pulizia utenti inattivi", test_sweep_idle_users),
+        ("Album di foto", test_photo_albums),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_throttle_tests())
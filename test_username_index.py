@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test per l'indice di trigrammi degli username (username_index.py).
+Verifica i suggerimenti contro una scansione lineare e il caso di typo tipico.
+"""
+
+import sys
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from username_index import TrigramIndex, similarity
+
+def _names(n: int, seed: int = 7) -> list:
+    rnd = random.Random(seed)
+    cons, vow = "bcdfghklmnprstvz", "aeiou"
+    out = set()
+    while len(out) < n:
+        name = "".join(rnd.choice(cons) + rnd.choice(vow) for _ in range(rnd.randint(2, 5)))
+        if rnd.random() < 0.4:
+            name += rnd.choice(["_", ""]) + str(rnd.randint(0, 999))
+        out.add(name)
+    return sorted(out)
+
+def test_suggest_matches_linear_scan():
+    """Test: stessi risultati (e stesso ordine) di una scansione lineare"""
+    print("\n[TEST] Suggerimenti vs scansione lineare")
+    print("="*60)
+
+    names = _names(5000)
+    index = TrigramIndex(min_similarity=0.4)
+    index.build(names)
+    rnd = random.Random(1)
+    for _ in range(200):
+        q = list(rnd.choice(names))
+        q[rnd.randrange(len(q))] = rnd.choice("abcdefghijklmnopqrstuvwxyz")
+        q = "".join(q)
+        scored = sorted(((similarity(q, n), n) for n in names), key=lambda x: (-x[0], x[1]))
+        expected = [(n, round(s, 3)) for s, n in scored if s >= 0.4][:3]
+        assert index.suggest(q, limit=3) == expected, q
+
+def test_typo_suggests_winner():
+    """Test: maric_bery propone Maric_berry, nomi lontani non propongono nulla"""
+    print("\n[TEST] Typo su username")
+    print("="*60)
+
+    index = TrigramIndex()
+    index.build(["maric_berry", "jhokkycfr", "andrea_xyz", "zach01"])
+    matches = index.suggest("Maric_bery")
+    print(matches)
+    assert matches and matches[0][0] == "maric_berry"
+    assert index.suggest("completely_different") == []
+    assert TrigramIndex().suggest("anything") == []
+
+def run_all_username_index_tests():
+    """Esegue tutti i test dell'indice username"""
+    tests = [
+        ("Suggerimenti vs scansione lineare", test_suggest_matches_linear_scan),
+        ("Typo su username", test_typo_suggests_winner),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_username_index_tests())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test per l'indice inverso dei wallet (wallet_index.py): duplicati tra CSV e
+submission, aggiornamento quando un utente cambia wallet, ricerca per prefisso.
+"""
+
+import sys
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from wallet_index import WalletIndex, describe_owners
+
+W1 = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+W2 = "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359"
+W3 = "0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB"
+
+def test_duplicates_and_moves():
+    """Test: stesso wallet su più username, anche con maiuscole diverse"""
+    print("\n[TEST] Duplicati e cambi wallet")
+    print("="*60)
+
+    zealy = {"alice": {"wallet": W1}, "bob": {"wallet": W2}, "carol": {"wallet": None}}
+    subs = {"10": {"tg_id": 10, "username": "Carol", "reg_wallet": W1.lower()},
+            "11": {"tg_id": 11, "new_wallet": "not-a-wallet"}}
+    index = WalletIndex()
+    index.build(zealy, subs)
+    assert len(index) == 2
+    assert index.lookup(W1.upper().replace("0X", "0x")) == {"alice": {"csv"}, "carol": {"reg_wallet"}}
+    assert [a for a, _ in index.duplicates()] == [W1]
+    assert describe_owners(index.lookup(W1)) == "alice (csv), carol (reg_wallet)"
+
+    # carol cambia wallet di registrazione: W1 torna ad avere un solo utente
+    assert index.set("carol", "reg_wallet", W3) == []
+    assert index.duplicates() == [] and index.lookup(W1) == {"alice": {"csv"}}
+    # dave propone il wallet di bob
+    assert index.set("Dave", "new_wallet", W2) == ["bob"]
+    assert index.search(W2[:8])[1] == 1 and index.search("0x")[1] == 3
+
+def test_prefix_search():
+    """Test: ricerca per prefisso uguale a una scansione lineare"""
+    print("\n[TEST] Ricerca per prefisso")
+    print("="*60)
+
+    rnd = random.Random(4)
+    zealy = {f"user{i}": {"wallet": "0x%040x" % rnd.getrandbits(160)} for i in range(3000)}
+    index = WalletIndex()
+    index.build(zealy, {})
+    for i in range(500):  # aggiornamenti incrementali: l'ordinamento resta valido
+        index.set(f"user{i}", "new_wallet", "0x%040x" % rnd.getrandbits(160))
+    assert index.sorted_hex == sorted(k.hex() for k in index.owners)
+    for prefix in ("0", "a1", "0xFF", "abc", "0x0000"):
+        p = prefix.lower()[2:] if prefix.lower().startswith("0x") else prefix.lower()
+        expected = sorted(h for h in index.sorted_hex if h.startswith(p))
+        found, total = index.search(prefix, limit=5)
+        assert total == len(expected)
+        assert [a[2:].lower() for a, _ in found] == expected[:5]
+
+def run_all_wallet_index_tests():
+    """Esegue tutti i test dell'indice wallet"""
+    tests = [
+        ("Duplicati e cambi wallet", test_duplicates_and_moves),
+        ("Ricerca per prefisso", test_prefix_search),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_wallet_index_tests())
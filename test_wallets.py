@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test per la validazione dei wallet (wallets.py): Keccak-256, checksum EIP-55,
+validazione a batch e report delle righe scartate nell'import del CSV Zealy.
+"""
+
+import sys
+import random
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import wallets
+from wallets import BAD_CHECKSUM, BAD_FORMAT, check_wallet, keccak256, validate_wallets, wallet_key
+from storage import read_zealy_csv
+
+def _swapcase(addr: str) -> str:
+    return "0x" + addr[2:].swapcase()
+
+# vettori della specifica EIP-55
+EIP55 = [
+    "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed",
+    "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359",
+    "0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB",
+    "0xD1220A0cf47c7B9Be7A2E6BA89F429762e7b9aDb",
+    "0x52908400098527886E0F7030069857D2E4169EE7",
+    "0x8617E340B3D01FA5F11F306F4090FD50E238070D",
+]
+
+def test_keccak_vectors():
+    """Test: Keccak-256 (non SHA3-256) su vettori noti, anche su più blocchi"""
+    print("\n[TEST] Keccak-256")
+    print("="*60)
+
+    assert keccak256(b"").hex() == "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"
+    assert keccak256(b"abc").hex() == "4e03657aea45a94fc7d47ba826c8d667c0d1e6e33a64a036ec44f58fa12d6c45"
+    rnd = random.Random(5)
+    msgs = [bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 300))) for _ in range(50)]
+    for m in msgs:
+        assert wallets._keccak256_py(m) == keccak256(m)
+    short = [m[:135] for m in msgs]
+    assert wallets.keccak256_many(short) == [wallets._keccak256_py(m) for m in short]
+
+def test_checksum():
+    """Test: checksum EIP-55, maiuscole/minuscole errate e chiave binaria"""
+    print("\n[TEST] Checksum EIP-55")
+    print("="*60)
+
+    for addr in EIP55:
+        assert check_wallet(addr) == (addr, None)
+        assert check_wallet(addr.lower()) == (addr, None)  # senza checksum: accettato e normalizzato
+        assert check_wallet(" `" + addr + "` ") == (addr, None)
+        assert wallet_key(addr) == wallet_key(addr.lower()) and len(wallet_key(addr)) == 20
+    typo = EIP55[0][:-1] + EIP55[0][-1].swapcase()  # una sola lettera con il caso sbagliato
+    assert check_wallet(typo) == (None, BAD_CHECKSUM)
+    assert check_wallet("0x123") == (None, BAD_FORMAT)
+
+def test_batch_and_import_report():
+    """Test: batch con e senza NumPy, righe scartate dal CSV Zealy"""
+    print("\n[TEST] Batch e import CSV")
+    print("="*60)
+
+    rnd = random.Random(9)
+    values = ["0x%040x" % rnd.getrandbits(160) for _ in range(500)] + EIP55 + ["", "nope", _swapcase(EIP55[1])]
+    wallets._CHECKSUMS.clear()
+    fast, rejected = validate_wallets(values)
+    saved = wallets.NUMPY_AVAILABLE
+    wallets.NUMPY_AVAILABLE = False
+    wallets._CHECKSUMS.clear()
+    try:
+        slow, _ = validate_wallets(values)
+    finally:
+        wallets.NUMPY_AVAILABLE = saved
+    assert fast == slow and fast[500:506] == EIP55
+    assert rejected == {507: BAD_FORMAT, 508: BAD_CHECKSUM}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "zealy.csv"
+        path.write_text(
+            "Username;Position on Leaderboard;XP;Binance Smart Chain Address\n"
+            f"alice;1;900;{EIP55[0].lower()}\n"
+            f"bob;2;800;{_swapcase(EIP55[1])}\n"
+            "carol;3;700;\n",
+            encoding="utf-8")
+        report = []
+        index = read_zealy_csv(path, report)
+    print(f"   Scartati: {report}")
+    assert index["alice"]["wallet"] == EIP55[0]
+    assert index["bob"]["wallet"] is None and index["carol"]["wallet"] is None
+    assert report == [{"line": 3, "username": "bob", "wallet": _swapcase(EIP55[1]), "reason": BAD_CHECKSUM}]
+
+def test_cache_limit():
+    """Test: batch più grande della cache senza keccak per indirizzo, eviction LRU"""
+    print("\n[TEST] Limite della cache")
+    print("="*60)
+
+    rnd = random.Random(3)
+    values = ["0x%040x" % rnd.getrandbits(160) for _ in range(300)] + EIP55
+    expected, _ = validate_wallets(values)
+    saved_size, saved_checksum = wallets.CHECKSUM_CACHE_SIZE, wallets.checksum
+    calls = []
+    wallets.CHECKSUM_CACHE_SIZE = 50
+    wallets.checksum = lambda h: calls.append(h) or saved_checksum(h)
+    wallets._CHECKSUMS.clear()
+    try:
+        got, rejected = validate_wallets(values)
+        assert got == expected and not rejected
+        assert calls == []  # i verdetti usano la tabella del batch, non la cache
+        assert list(wallets._CHECKSUMS) == sorted(v[2:].lower() for v in values)[-50:]
+        oldest = next(iter(wallets._CHECKSUMS))
+        saved_checksum(oldest)  # usato di recente: sopravvive al prossimo inserimento
+        saved_checksum("%040x" % 1)
+        assert oldest in wallets._CHECKSUMS and len(wallets._CHECKSUMS) == 50
+
+        # più thread sulla stessa cache piccola (to_thread, indice proof): nessun KeyError
+        wallets.CHECKSUM_CACHE_SIZE = 8
+        hexes = [v[2:].lower() for v in values]
+        errors = []
+
+        def hammer(k):
+            try:
+                for _ in range(20):
+                    for h in hexes[k::4]:
+                        assert saved_checksum(h) == expected[hexes.index(h)]
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=hammer, args=(k,)) for k in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == [] and len(wallets._CHECKSUMS) <= 8
+    finally:
+        wallets.CHECKSUM_CACHE_SIZE, wallets.checksum = saved_size, saved_checksum
+        wallets._CHECKSUMS.clear()
+
+def run_all_wallet_tests():
+    """Esegue tutti i test dei wallet"""
+    tests = [
+        ("Keccak-256", test_keccak_vectors),
+        ("Checksum EIP-55", test_checksum),
+        ("Batch e import CSV", test_batch_and_import_report),
+        ("Limite della cache", test_cache_limit),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_wallet_tests())
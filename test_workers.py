@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Test per la modalità multi-worker (workers.py): lease del leader, coda degli
+update con offset e deduplica, shard per utente, cambio di leader e
+riavvio a caldo con ripresa dell'update interrotto.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from telegram import Update
+
+import workers
+from storage import Storage
+from workers import Lease, UpdateQueue, Worker, claim_run
+
+def _update(update_id: int, user_id: int) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+    return Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi",
+        "chat": {"id": user_id, "type": "private"}, "from": user}}, None)
+
+class FakeBot:
+    """getUpdates su una lista fissa di update, rispettando l'offset."""
+
+    def __init__(self, updates):
+        self.updates = updates
+        self.calls = 0
+
+    async def get_updates(self, offset=None, timeout=0, allowed_updates=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return [u for u in self.updates if offset is None or u.update_id >= offset][:7]
+
+class FakeApp:
+    """Al posto di Application: registra (worker, user_id, update_id) per ogni update processato."""
+
+    def __init__(self, bot, log, worker_id):
+        self.bot, self.log, self.worker_id = bot, log, worker_id
+        self.flushes = 0
+
+    async def process_update(self, update):
+        self.log.append((self.worker_id, update.effective_user.id, update.update_id))
+
+    async def update_persistence(self):
+        self.flushes += 1
+
+def test_lease_and_job_claim():
+    """Test: un solo holder alla volta, subentro alla scadenza, job eseguito una volta"""
+    print("\n[TEST] Lease e job")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        workers.ensure_schema(store)
+        a, b = Lease(store, "leader", "a", ttl=0.3), Lease(store, "leader", "b", ttl=0.3)
+        assert a.acquire() and a.held
+        assert not b.acquire() and not b.held
+        assert a.acquire()  # rinnovo
+        time.sleep(0.35)  # "a" non rinnova più (crash)
+        assert not a.held and b.acquire()
+        assert not a.acquire()
+        b.release()
+        assert a.acquire()
+        assert claim_run(store, "daily_backup", "2025-11-30", "a")
+        assert not claim_run(store, "daily_backup", "2025-11-30", "b")
+        assert claim_run(store, "daily_backup", "2025-12-01", "b")
+        store.close()
+
+def test_queue_offset_and_dedupe():
+    """Test: offset salvato con il batch, update ripetuti ignorati, shard per utente"""
+    print("\n[TEST] Coda degli update")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        workers.ensure_schema(store)
+        q = UpdateQueue(store, shards=3)
+        assert q.offset() is None
+        batch = [_update(100 + i, user_id=10 + i % 4) for i in range(8)]
+        assert q.push(batch) == 8 and q.offset() == 108
+        assert q.push(batch[5:]) == 0 and q.depth() == 8  # stesso batch rinviato da un nuovo leader
+        for shard in range(3):
+            users = {Update.de_json(json.loads(p), None).effective_user.id
+                     for _, p in q.take(shard)}
+            assert all(u % 3 == shard for u in users)
+        assert q.begin(100) == 1 and q.begin(100) == 2  # secondo tentativo dopo un riavvio
+        q.done(100)
+        assert q.depth() == 7 and [uid for uid, _ in q.take(1)] == [103, 104, 107]
+        assert q.push(batch[:1]) == 0 and q.depth() == 7  # già gestito: non torna in coda
+        assert q.prune(window=0) == 1 and q.push(batch[:1]) == 1
+        store.close()
+
+def test_failover_exactly_once():
+    """Test: due worker, il leader cade, l'altro continua dall'offset; ogni update una volta e in ordine"""
+    print("\n[TEST] Cambio di leader")
+    print("="*60)
+
+    async def scenario(store):
+        updates = [_update(1 + i, user_id=i % 5) for i in range(60)]
+        bot, log = FakeBot(updates), []
+        w = [Worker(FakeApp(bot, log, k), store, k, 2, lease_ttl=0.4) for k in range(2)]
+        await w[0].start()
+        await asyncio.sleep(0.05)
+        await w[1].start()
+        await asyncio.sleep(0.05)
+        assert w[0].is_leader and not w[1].is_leader
+        for t in w[0].tasks:  # crash di w0: niente release del lease
+            t.cancel()
+        await asyncio.gather(*w[0].tasks, return_exceptions=True)
+        for _ in range(40):  # w1 prende il lease dopo la scadenza (0.4s)
+            await asyncio.sleep(0.05)
+            if w[1].is_leader:
+                break
+        w[0] = Worker(FakeApp(bot, log, 0), store, 0, 2, lease_ttl=0.4)
+        w[0].leader.holder = "altro-host"  # stesso WORKER_ID riprenderebbe subito il proprio lease
+        await w[0].start()  # riprende il proprio shard, rimasto in coda
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if len(log) >= 60 and w[1].queue.depth() == 0:
+                break
+        leader = 1 if w[1].is_leader else 0
+        for x in w:
+            await x.stop()
+        return log, leader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        log, leader = asyncio.run(scenario(store))
+        print(f"   Processati: {len(log)}, leader finale: worker {leader}")
+        assert leader == 1
+        assert sorted(uid for _, _, uid in log) == list(range(1, 61))
+        for worker_id, user_id, _ in log:
+            assert user_id % 2 == worker_id
+        for user in range(5):
+            seq = [uid for _, u, uid in log if u == user]
+            assert seq == sorted(seq)
+        assert UpdateQueue(store, 2).offset() == 61
+        store.close()
+
+def test_warm_restart_replay():
+    """Test: arresto durante un update, riavvio dall'offset salvato, update interrotto ripreso come replay"""
+    print("\n[TEST] Riavvio a caldo")
+    print("="*60)
+
+    class SlowApp(FakeApp):
+        """Si blocca sull'update 5 al primo giro, come un handler ancora in corso al riavvio."""
+
+        def __init__(self, bot, log, worker, hang):
+            super().__init__(bot, log, 0)
+            self.worker, self.hang, self.replayed = worker, hang, []
+
+        async def process_update(self, update):
+            if self.worker[0].is_replay(update.update_id):
+                self.replayed.append(update.update_id)
+            await super().process_update(update)
+            if update.update_id == 5 and self.hang:
+                await asyncio.sleep(60)
+
+    async def scenario(store):
+        bot, log, ref = FakeBot([_update(1 + i, user_id=7) for i in range(10)]), [], [None]
+        app = SlowApp(bot, log, ref, hang=True)
+        ref[0] = Worker(app, store, 0, 1, lease_ttl=0.4)
+        await ref[0].start()
+        for _ in range(40):
+            await asyncio.sleep(0.05)
+            if len(log) >= 5:
+                break
+        await ref[0].stop(timeout=0.1)  # l'update 5 viene interrotto
+        assert app.flushes == 4 and ref[0].queue.depth() == 6
+        bot.updates.extend(_update(11 + i, user_id=7) for i in range(3))
+        app = SlowApp(bot, log, ref, hang=False)
+        ref[0] = Worker(app, store, 0, 1, lease_ttl=0.4)
+        await ref[0].start()  # stesso holder: lease ripreso subito
+        for _ in range(40):
+            await asyncio.sleep(0.05)
+            if ref[0].queue.depth() == 0 and len(log) >= 14:
+                break
+        leader = ref[0].is_leader
+        await ref[0].stop()
+        return log, app.replayed, leader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        log, replayed, leader = asyncio.run(scenario(store))
+        print(f"   Processati: {len(log)}, replay: {replayed}")
+        assert leader
+        assert [uid for _, _, uid in log] == [1, 2, 3, 4, 5, 5, 6, 7, 8, 9, 10, 11, 12, 13]
+        assert replayed == [5]
+        assert UpdateQueue(store, 1).offset() == 14
+        store.close()
+
+def test_sqlite_errors_retry():
+    """Test: "database is locked" in coda o persistence non ferma i loop; un loop morto non è ready"""
+    print("\n[TEST] Errori SQLite")
+    print("="*60)
+
+    class LockedApp(FakeApp):
+        """La persistence fallisce ai primi due tentativi, come SQLite occupato oltre busy_timeout."""
+
+        def __init__(self, bot, log):
+            super().__init__(bot, log, 0)
+            self.locked = 2
+
+        async def update_persistence(self):
+            if self.locked:
+                self.locked -= 1
+                raise sqlite3.OperationalError("database is locked")
+            await super().update_persistence()
+
+    async def scenario(store):
+        bot, log = FakeBot([_update(1 + i, user_id=3) for i in range(10)]), []
+        w = Worker(LockedApp(bot, log), store, 0, 1, lease_ttl=0.4)
+        push, pushes = w.queue.push, []
+
+        def flaky_push(updates):
+            pushes.append(len(updates))
+            if len(pushes) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return push(updates)
+        w.queue.push = flaky_push
+        await w.start()
+        for _ in range(60):
+            await asyncio.sleep(0.05)
+            if w.queue.depth() == 0 and len(log) >= 10:
+                break
+        ready = w.status()
+        w.tasks[0].cancel()  # loop del leader terminato
+        await asyncio.gather(w.tasks[0], return_exceptions=True)
+        dead = w.status()
+        await w.stop()
+        return log, len(pushes), ready, dead
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        log, pushes, ready, dead = asyncio.run(scenario(store))
+        print(f"   Processati: {len(log)}, push: {pushes}, stato: {ready} -> {dead}")
+        # l'update 1 resta in coda finché la persistence non riesce: gestito tre volte, gli altri una
+        assert [uid for _, _, uid in log] == [1, 1, 1] + list(range(2, 11))
+        assert pushes >= 2 and ready[0] and not dead[0] and "lead" in dead[1]
+        assert UpdateQueue(store, 1).depth() == 0
+        store.close()
+
+def test_screened_updates():
+    """Test: un update scartato dall'anti-flood non conta attempts, non passa dagli handler né dalla persistence"""
+    print("\n[TEST] Update scartati")
+    print("="*60)
+
+    async def scenario(store):
+        updates = [_update(1 + i, user_id=4 if i % 3 else 6) for i in range(12)]  # 4 = spammer
+        bot, log = FakeBot(updates), []
+        app = FakeApp(bot, log, 0)
+
+        async def screen(update):
+            return update.effective_user.id != 4
+        w = Worker(app, store, 0, 1, lease_ttl=0.4, screen=screen)
+        begun, persisted = [], []
+        begin, flush = w.queue.begin, app.update_persistence
+
+        def spy_begin(update_id):
+            begun.append(update_id)
+            return begin(update_id)
+
+        async def spy_flush():
+            persisted.append(log[-1][2])
+            await flush()
+        w.queue.begin, app.update_persistence = spy_begin, spy_flush
+        w.queue.push(updates)
+        writes = store.con.total_changes
+        handled = await w._consume_batch()
+        writes = store.con.total_changes - writes
+        return handled, log, begun, persisted, writes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Storage(Path(tmp) / "bot.db")
+        handled, log, begun, persisted, writes = asyncio.run(scenario(store))
+        accepted = [1, 4, 7, 10]
+        print(f"   Presi: {handled}, gestiti: {[uid for _, _, uid in log]}, scritture SQLite: {writes}")
+        assert handled == 12 and [uid for _, _, uid in log] == accepted
+        assert begun == accepted and persisted == accepted
+        # accettati: attempts + delete + processed; scartati: solo delete + processed, in una transazione
+        assert writes == 3 * len(accepted) + 2 * 8
+        assert UpdateQueue(store, 1).depth() == 0
+        assert store.query("SELECT COUNT(*) AS n FROM processed_updates")[0]["n"] == 12  # deduplica anche per lo spam
+        store.close()
+
+def run_all_worker_tests():
+    """Esegue tutti i test dei worker"""
+    tests = [
+        ("Lease e job", test_lease_and_job_claim),
+        ("Coda degli update", test_queue_offset_and_dedupe),
+        ("Cambio di leader", test_failover_exactly_once),
+        ("Riavvio a caldo", test_warm_restart_replay),
+        ("Errori SQLite", test_sqlite_errors_retry),
+        ("Update scartati", test_screened_updates),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_worker_tests())
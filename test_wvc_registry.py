@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test per il registro WVC di savitri_rewards_bot (wvc_codes): riscatto atomico
+monouso, riassegnazione senza perdita del codice, ordine dell'import CSV e
+migrazione dei codici in chiaro da winners.wvc.
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import importlib.util
+from contextlib import closing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+BOT_MAIN = Path(__file__).parent / "savitri_rewards_bot" / "main.py"
+
+def _load_bot(tmp: Path):
+    """Importa savitri_rewards_bot/main.py con il database in `tmp`; None se mancano le dipendenze."""
+    cwd = os.getcwd()
+    os.chdir(tmp)  # crea ./data all'import
+    try:
+        spec = importlib.util.spec_from_file_location("savitri_variant_wvc", BOT_MAIN)
+        bot = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bot)
+    except ImportError as e:
+        print(f"[SKIP] savitri_rewards_bot non importabile: {e}")
+        return None
+    finally:
+        os.chdir(cwd)
+    bot.DB_PATH = tmp / "rewards.db"
+    bot.init_db()
+    return bot
+
+def _codes(bot) -> dict:
+    with closing(sqlite3.connect(bot.DB_PATH)) as con:
+        return {u: (h, used) for h, u, used in con.execute("SELECT code_hash, username, used FROM wvc_codes")}
+
+def test_single_use_redemption():
+    """Test: un codice si riscatta una volta sola e solo dal suo vincitore"""
+    print("\n[TEST] Riscatto monouso")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = _load_bot(Path(tmp))
+        if bot is None:
+            return
+        bot.upsert_winner("Alice", rank=1, wvc="wvc-aaaa-1111")
+        bot.upsert_winner("bob", rank=2, wvc="WVC-BBBB-2222")
+        assert not bot.redeem_wvc("bob", "WVC-AAAA-1111", 20)      # codice valido, utente sbagliato
+        assert not bot.redeem_wvc("alice", "WVC-BBBB-2222", 10)
+        assert bot.redeem_wvc("ALICE", " WVC-AAAA-1111 ", 10)      # maiuscole e spazi normalizzati
+        assert not bot.redeem_wvc("alice", "WVC-AAAA-1111", 10)    # secondo riscatto
+        assert _codes(bot)["alice"][1] == 1 and _codes(bot)["bob"][1] == 0
+        row = bot.db_one("SELECT used_by, hint FROM wvc_codes WHERE username='alice'")
+        assert row == (10, "…1111")
+
+def test_reassign_keeps_code():
+    """Test: un codice di un altro vincitore non toglie il codice attuale"""
+    print("\n[TEST] Riassegnazione")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = _load_bot(Path(tmp))
+        if bot is None:
+            return
+        assert bot.assign_wvc([("alice", "CODE-A"), ("bob", "CODE-B")]) == (2, 0)
+        # CODE-B è di bob: alice resta con CODE-A, prima veniva cancellato
+        assert bot.assign_wvc([("alice", "CODE-B")]) == (0, 1)
+        assert _codes(bot)["alice"] == (bot.wvc_hash("CODE-A"), 0)
+        assert bot.assign_wvc([("alice", "CODE-A")]) == (1, 0)      # già suo
+        assert bot.assign_wvc([("alice", "CODE-C")]) == (1, 0)      # codice libero: sostituisce quello non usato
+        assert _codes(bot)["alice"][0] == bot.wvc_hash("CODE-C")
+        assert bot.assign_wvc([("carol", "CODE-A")]) == (1, 0)      # CODE-A è tornato libero
+        assert bot.redeem_wvc("bob", "CODE-B", 2)
+        assert bot.assign_wvc([("bob", "CODE-D")]) == (0, 1)        # codice già usato: resta
+        assert _codes(bot)["bob"] == (bot.wvc_hash("CODE-B"), 1)
+
+def test_import_order_and_legacy():
+    """Test: import CSV (assegnati per nome, liberi per rank, avanzi) e migrazione di winners.wvc"""
+    print("\n[TEST] Import CSV e migrazione")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = _load_bot(Path(tmp))
+        if bot is None:
+            return
+        for name, rank in (("dave", 4), ("alice", 1), ("carol", 3), ("bob", 2), ("eve", None)):
+            bot.upsert_winner(name, rank=rank)
+        bot.assign_wvc([("bob", "OLD-B")])
+        csv_path = Path(tmp) / "wvc.csv"
+        csv_path.write_text("wvc;assigned_to\nF1;\nN1;Carol\nF2;\nF3;\nF4;\nF5;\n", encoding="utf-8")
+        assigned, skipped, left_over = bot.import_wvc_csv(csv_path)
+        codes = {u: h for u, (h, _) in _codes(bot).items()}
+        # carol per nome; i liberi ad alice, dave, eve (rank nullo in fondo); bob ha già un codice
+        assert codes["carol"] == bot.wvc_hash("N1")
+        assert [codes[u] for u in ("alice", "dave", "eve")] == [bot.wvc_hash(c) for c in ("F1", "F2", "F3")]
+        assert codes["bob"] == bot.wvc_hash("OLD-B")
+        assert (assigned, skipped, left_over) == (4, 0, 2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = _load_bot(Path(tmp))
+        if bot is None:
+            return
+        with closing(sqlite3.connect(bot.DB_PATH)) as con:
+            con.executemany("INSERT INTO winners (username, rank, wvc, wvc_used) VALUES (?,?,?,?)",
+                            [("alice", 1, "LEG-A", 0), ("bob", 2, "LEG-B", 1), ("carol", 3, "", 0)])
+            con.commit()
+        bot.init_db()
+        bot.init_db()  # idempotente
+        assert {u: used for u, (_, used) in _codes(bot).items()} == {"alice": 0, "bob": 1}
+        assert bot.db_one("SELECT COUNT(*) FROM winners WHERE wvc IS NOT NULL AND wvc <> ''") == (0,)
+        assert bot.redeem_wvc("alice", "leg-a", 1) and not bot.redeem_wvc("bob", "LEG-B", 2)
+
+def run_all_wvc_registry_tests():
+    """Esegue tutti i test del registro WVC"""
+    tests = [
+        ("Riscatto monouso", test_single_use_redemption),
+        ("Riassegnazione", test_reassign_keeps_code),
+        ("Import CSV e migrazione", test_import_order_and_legacy),
+    ]
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+            print(f"[PASS] - {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] - {name}: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run_all_wvc_registry_tests())
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+throttle.py
+
+Per-user anti-flood for main.py. The worker that takes an update from the
+queue (workers.py) calls Throttle.check() through main.throttle_screen()
+before counting the attempt, running any handler or writing persistence: a
+rejected update is only deleted from the queue, so spam never reaches
+user_data, photo downloads or the Bot API.
+
+Token buckets: every update costs one token from the user's bucket
+(`limit`, e.g. 1/s with a burst of 8) and, for the expensive kinds
+(/status, /proof, photos, free text...), one from the user's bucket of that
+kind (`kinds`). A bucket refills at `rate` tokens/s up to `burst`. Nothing
+is taken when either bucket is empty. An album (up to ALBUM_SIZE photos
+sharing a media_group_id, delivered as separate updates) costs the tokens
+of its first item only, so a 10-photo proof is not cut off at the burst.
+
+Soft limit: the first rejected update of a burst returns WARN (main.py
+replies once), the following ones DROP (no reply). Hard limit: after
+`hard_strikes` rejections within `hard_window` seconds the user is muted
+for `mute_seconds` (MUTE once, then DROP at the cost of a dict lookup).
+
+State is one __slots__ object per recently active user, plus one bucket per
+expensive kind used. Users whose buckets are full again (idle for the
+longest burst/rate) and who are not muted carry no information: sweep()
+drops them every `sweep_interval` seconds.
+"""
+
+import time
+from typing import Dict, NamedTuple, Optional
+
+from telegram import Update
+
+ALLOW, WARN, DROP, MUTE = "allow", "warn", "drop", "mute"
+ALBUM_SIZE = 10  # massimo di media in un album Telegram
+
+class Limit(NamedTuple):
+    rate: float   # token al secondo
+    burst: float  # capacità del bucket
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    """"status=0.2/3,photo=0.1/5" -> {kind: Limit(rate, burst)}; invalid items are ignored."""
+    limits: Dict[str, Limit] = {}
+    for item in spec.split(","):
+        kind, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            limit = Limit(float(rate), float(burst or 1))
+        except ValueError:
+            continue
+        if kind.strip() and limit.rate > 0 and limit.burst >= 1:
+            limits[kind.strip().lower()] = limit
+    return limits
+
+def update_kind(update: Update) -> str:
+    """Command name without "/" and "@bot", else "photo", "document", "text", "callback" or "other"."""
+    if update.callback_query is not None:
+        return "callback"
+    msg = update.effective_message
+    if msg is None:
+        return "other"
+    if msg.text:
+        parts = msg.text[1:].split(maxsplit=1) if msg.text.startswith("/") else None
+        return parts[0].split("@", 1)[0].lower() if parts else "text"
+    if msg.photo:
+        return "photo"
+    if msg.document is not None:
+        return "document"
+    return "other"
+
+class _Bucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens: float, stamp: float):
+        self.tokens = tokens
+        self.stamp = stamp
+
+    def refill(self, limit: Limit, now: float) -> None:
+        self.tokens = min(limit.burst, self.tokens + (now - self.stamp) * limit.rate)
+        self.stamp = now
+
+class _User(_Bucket):
+    __slots__ = ("kinds", "strikes", "strike_at", "muted_until", "warned", "album", "album_left")
+
+    def __init__(self, tokens: float, stamp: float):
+        super().__init__(tokens, stamp)
+        self.kinds: Optional[Dict[str, _Bucket]] = None  # creato solo al primo tipo "costoso"
+        self.strikes = 0
+        self.strike_at = 0.0
+        self.muted_until = 0.0
+        self.warned = False
+        self.album: Optional[str] = None  # media_group_id dell'ultimo album accettato
+        self.album_left = 0
+
+class Throttle:
+    """Token buckets per user and per (user, kind), with a soft and a hard limit."""
+
+    def __init__(self, limit: Limit, kinds: Optional[Dict[str, Limit]] = None,
+                 hard_strikes: int = 20, hard_window: float = 60.0, mute_seconds: float = 300.0,
+                 sweep_interval: float = 60.0):
+        self.limit = limit
+        self.kinds = dict(kinds or {})
+        self.hard_strikes = hard_strikes
+        self.hard_window = hard_window
+        self.mute_seconds = mute_seconds
+        self.sweep_interval = sweep_interval
+        # dopo questo tempo di inattività tutti i bucket di un utente sono di nuovo pieni
+        self.idle_after = max([l.burst / l.rate for l in (limit, *self.kinds.values())] + [hard_window])
+        self.users: Dict[int, _User] = {}
+        self.swept_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def muted(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        return sum(1 for u in self.users.values() if u.muted_until > now)
+
+    def check(self, user_id: int, kind: str, now: Optional[float] = None, group: Optional[str] = None) -> str:
+        """ALLOW and take the tokens, or WARN / MUTE (reply once) / DROP (ignore silently).
+
+        `group` is the media_group_id of the message: the other items of an album
+        already accepted pass without taking tokens.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.swept_at >= self.sweep_interval:
+            self.sweep(now)
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = _User(self.limit.burst, now)
+        elif user.muted_until > now:
+            return DROP
+        elif group is not None and group == user.album and user.album_left > 0:
+            user.album_left -= 1
+            return ALLOW
+        user.refill(self.limit, now)
+        limit = self.kinds.get(kind)
+        bucket = None
+        if limit is not None:
+            if user.kinds is None:
+                user.kinds = {}
+            bucket = user.kinds.get(kind)
+            if bucket is None:
+                bucket = user.kinds[kind] = _Bucket(limit.burst, now)
+            else:
+                bucket.refill(limit, now)
+        if user.tokens >= 1 and (bucket is None or bucket.tokens >= 1):
+            user.tokens -= 1
+            if bucket is not None:
+                bucket.tokens -= 1
+            user.warned = False
+            if group is not None and group != user.album:
+                user.album, user.album_left = group, ALBUM_SIZE - 1
+            return ALLOW
+        if now - user.strike_at > self.hard_window:
+            user.strikes, user.strike_at = 0, now
+        user.strikes += 1
+        if user.strikes >= self.hard_strikes:
+            user.strikes, user.muted_until = 0, now + self.mute_seconds
+            return MUTE
+        if user.warned:
+            return DROP
+        user.warned = True
+        return WARN
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Forget users idle long enough to be back at full buckets; returns how many."""
+        now = time.monotonic() if now is None else now
+        self.swept_at = now
+        idle = [uid for uid, u in self.users.items()
+                if now - u.stamp >= self.idle_after and u.muted_until <= now]
+        for uid in idle:
+            del self.users[uid]
+        return len(idle)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+wallet_index.py
+
+Reverse index wallet -> Zealy usernames, to catch two accounts registering
+the same BSC wallet and to search wallets by partial address.
+
+Sources of a wallet: "csv" (Zealy export), "reg_wallet" (/set_wallet) and
+"new_wallet" (/new_wallet). Each (username, source) holds one wallet; setting
+a new one moves the username off the previous key. Keys are the 20 raw bytes
+of the address (wallets.wallet_key), so case never splits a wallet.
+
+A dict gives the owners of an address in O(1) at submission time; a sorted
+list of the distinct addresses (lowercase hex) answers prefix searches with
+two bisects. The index is rebuilt from the Zealy index and the submissions
+whenever the CSV is loaded and updated in place by the wallet commands.
+"""
+
+import bisect
+from typing import Dict, List, Optional, Set, Tuple
+
+from wallets import check_wallet, checksum, wallet_key
+
+SOURCES = ("csv", "reg_wallet", "new_wallet")
+
+class WalletIndex:
+    """wallet key -> {username: {sources}}, plus the sorted addresses for prefix search."""
+
+    def __init__(self):
+        self.owners: Dict[bytes, Dict[str, Set[str]]] = {}
+        self.by_owner: Dict[Tuple[str, str], bytes] = {}
+        self.sorted_hex: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    def build(self, zealy_index: Dict[str, dict], submissions: Dict[str, dict]) -> None:
+        self.owners, self.by_owner = {}, {}
+        for username, entry in zealy_index.items():
+            self._put(username, "csv", entry.get("wallet"), sort=False)
+        for rec in submissions.values():
+            owner = submission_owner(rec)
+            for source in ("reg_wallet", "new_wallet"):
+                self._put(owner, source, rec.get(source), sort=False)
+        self.sorted_hex = sorted(k.hex() for k in self.owners)
+
+    def _put(self, username: str, source: str, address: Optional[str], sort: bool = True) -> Optional[bytes]:
+        old = self.by_owner.pop((username, source), None)
+        if old is not None:
+            sources = self.owners[old].get(username)
+            if sources is not None:
+                sources.discard(source)
+                if not sources:
+                    del self.owners[old][username]
+            if not self.owners[old]:
+                del self.owners[old]
+                if sort:
+                    i = bisect.bisect_left(self.sorted_hex, old.hex())
+                    if i < len(self.sorted_hex) and self.sorted_hex[i] == old.hex():
+                        del self.sorted_hex[i]
+        address, _ = check_wallet(address) if address else (None, None)
+        if address is None:
+            return None
+        key = wallet_key(address)
+        entry = self.owners.get(key)
+        if entry is None:
+            entry = self.owners[key] = {}
+            if sort:
+                bisect.insort(self.sorted_hex, key.hex())
+        entry.setdefault(username, set()).add(source)
+        self.by_owner[(username, source)] = key
+        return key
+
+    def set(self, username: str, source: str, address: Optional[str]) -> List[str]:
+        """Record `address` as `username`'s wallet for `source`; returns the other usernames on it."""
+        key = self._put(username.lower(), source, address)
+        if key is None:
+            return []
+        return sorted(u for u in self.owners[key] if u != username.lower())
+
+    def lookup(self, address: str) -> Dict[str, Set[str]]:
+        """{username: sources} of a valid address (any case); empty if unknown."""
+        address, _ = check_wallet(address)
+        return dict(self.owners.get(wallet_key(address), {})) if address else {}
+
+    def search(self, prefix: str, limit: int = 20) -> Tuple[List[Tuple[str, Dict[str, Set[str]]]], int]:
+        """Addresses starting with `prefix` (hex, "0x" optional): (first `limit` as (EIP-55, owners), total)."""
+        p = prefix.strip().lower()
+        p = p[2:] if p.startswith("0x") else p
+        lo = bisect.bisect_left(self.sorted_hex, p)
+        hi = bisect.bisect_left(self.sorted_hex, p + "g")  # "g" > ogni cifra esadecimale
+        found = [(checksum(h), dict(self.owners[bytes.fromhex(h)])) for h in self.sorted_hex[lo:min(hi, lo + limit)]]
+        return found, hi - lo
+
+    def duplicates(self) -> List[Tuple[str, Dict[str, Set[str]]]]:
+        """Addresses owned by more than one username, most shared first."""
+        dups = [(checksum(k.hex()), dict(v)) for k, v in self.owners.items() if len(v) > 1]
+        dups.sort(key=lambda d: (-len(d[1]), d[0].lower()))
+        return dups
+
+def submission_owner(rec: dict) -> str:
+    """Username (lowercase) a submission belongs to; "tg:<id>" if it never set one."""
+    return (rec.get("username") or "").lower() or f"tg:{rec.get('tg_id')}"
+
+def describe_owners(owners: Dict[str, Set[str]]) -> str:
+    """"alice (csv, reg_wallet), bob (new_wallet)"."""
+    return ", ".join(f"{u} ({', '.join(s for s in SOURCES if s in owners[u])})" for u in sorted(owners))
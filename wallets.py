@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+wallets.py
+
+BSC/Ethereum address validation for the Zealy import and the wallet commands.
+
+An address is "0x" + 40 hex digits. EIP-55 encodes a checksum in the case of
+the letters: the letter at position i is uppercase when nibble i of
+keccak256(lowercase hex) is >= 8. An all-lowercase or all-uppercase address
+carries no checksum and is accepted as is; a mixed-case one must match its
+checksum, otherwise it was mistyped (or edited by hand) and is rejected.
+
+Valid addresses are normalised to their checksummed form for display and to
+20 raw bytes (wallet_key) for indexing, so the same wallet written in
+different cases is one key.
+
+keccak256 is not hashlib.sha3_256 (different padding). It uses pycryptodome
+(in requirements.txt) or eth-hash when installed, otherwise the pure-Python permutation below
+(~2.5k addresses/s). validate_wallets() checks a whole import in one pass:
+the distinct addresses not yet in the checksum cache are hashed together,
+as one NumPy array of Keccak states when NumPy is available (~70k
+addresses/s without a C backend), and checked against that local result.
+The shared cache keeps the CHECKSUM_CACHE_SIZE most recently used
+addresses (LRU), so a re-import of a list that fits costs only the lookups.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from Crypto.Hash import keccak as _crypto_keccak
+
+    def _keccak_backend(data: bytes) -> bytes:
+        return _crypto_keccak.new(digest_bits=256, data=data).digest()
+    KECCAK_BACKEND = "pycryptodome"
+except ImportError:
+    try:
+        from eth_hash.auto import keccak as _keccak_backend
+        KECCAK_BACKEND = "eth-hash"
+    except ImportError:
+        _keccak_backend = None
+        KECCAK_BACKEND = "python"
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+ADDRESS_RE = re.compile(r"^0x[0-9a-fA-F]{40}$")
+BAD_FORMAT = "formato non valido (0x + 40 caratteri esadecimali)"
+BAD_CHECKSUM = "checksum EIP-55 non valido (maiuscole/minuscole errate)"
+CHECKSUM_CACHE_SIZE = 1 << 18
+
+# -------------------- KECCAK-256 --------------------
+_MASK = (1 << 64) - 1
+_RC = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+# rho + pi: la lane x + 5y finisce in y + 5((2x + 3y) % 5) ruotata di _ROT[x + 5y]
+_ROT = [0, 1, 62, 28, 27, 36, 44, 6, 55, 20, 3, 10, 43, 25, 39, 41, 45, 15, 21, 8, 18, 2, 61, 56, 14]
+_PI = [0] * 25
+for _x in range(5):
+    for _y in range(5):
+        _PI[_x + 5 * _y] = _y + 5 * ((2 * _x + 3 * _y) % 5)
+_RHO_PI = [(i, _PI[i], _ROT[i], 64 - _ROT[i]) for i in range(25)]
+del _x, _y
+
+def _keccak_f(a: List[int]) -> None:
+    """Keccak-f[1600] in place on 25 lanes (little-endian 64-bit ints)."""
+    b = [0] * 25
+    mask = _MASK
+    for rc in _RC:
+        # theta
+        c0 = a[0] ^ a[5] ^ a[10] ^ a[15] ^ a[20]
+        c1 = a[1] ^ a[6] ^ a[11] ^ a[16] ^ a[21]
+        c2 = a[2] ^ a[7] ^ a[12] ^ a[17] ^ a[22]
+        c3 = a[3] ^ a[8] ^ a[13] ^ a[18] ^ a[23]
+        c4 = a[4] ^ a[9] ^ a[14] ^ a[19] ^ a[24]
+        d0 = c4 ^ (((c1 << 1) | (c1 >> 63)) & mask)
+        d1 = c0 ^ (((c2 << 1) | (c2 >> 63)) & mask)
+        d2 = c1 ^ (((c3 << 1) | (c3 >> 63)) & mask)
+        d3 = c2 ^ (((c4 << 1) | (c4 >> 63)) & mask)
+        d4 = c3 ^ (((c0 << 1) | (c0 >> 63)) & mask)
+        for y in (0, 5, 10, 15, 20):
+            a[y] ^= d0
+            a[y + 1] ^= d1
+            a[y + 2] ^= d2
+            a[y + 3] ^= d3
+            a[y + 4] ^= d4
+        # rho + pi
+        for i, j, r, rr in _RHO_PI:
+            v = a[i]
+            b[j] = ((v << r) | (v >> rr)) & mask if r else v
+        # chi
+        for y in (0, 5, 10, 15, 20):
+            b0, b1, b2, b3, b4 = b[y], b[y + 1], b[y + 2], b[y + 3], b[y + 4]
+            a[y] = b0 ^ (~b1 & b2)
+            a[y + 1] = b1 ^ (~b2 & b3)
+            a[y + 2] = b2 ^ (~b3 & b4)
+            a[y + 3] = b3 ^ (~b4 & b0)
+            a[y + 4] = b4 ^ (~b0 & b1)
+        # iota
+        a[0] ^= rc
+
+def _keccak256_py(data: bytes) -> bytes:
+    rate = 136
+    padded = bytearray(data)
+    padded.append(0x01)  # padding Keccak originale (SHA3 usa 0x06)
+    padded.extend(b"\x00" * (-len(padded) % rate))
+    padded[-1] |= 0x80
+    state = [0] * 25
+    for off in range(0, len(padded), rate):
+        block = padded[off:off + rate]
+        for i in range(rate // 8):
+            state[i] ^= int.from_bytes(block[8 * i:8 * i + 8], "little")
+        _keccak_f(state)
+    return b"".join(state[i].to_bytes(8, "little") for i in range(4))
+
+def _keccak256_np(datas: List[bytes]) -> List[bytes]:
+    """Same permutation on a (25, N) uint64 array: one NumPy op per lane op for N one-block messages."""
+    rate, n = 136, len(datas)
+    buf = bytearray(rate * n)
+    for k, d in enumerate(datas):
+        off = k * rate
+        buf[off:off + len(d)] = d
+        buf[off + len(d)] ^= 0x01
+        buf[off + rate - 1] ^= 0x80
+    a = np.zeros((25, n), dtype=np.uint64)
+    a[:rate // 8] = np.frombuffer(bytes(buf), dtype="<u8").reshape(n, rate // 8).T
+    b = np.empty_like(a)
+    one, s63 = np.uint64(1), np.uint64(63)
+    rot = [(i, j, np.uint64(r), np.uint64(64 - r)) for i, j, r, _ in _RHO_PI]
+    for rc in _RC:
+        c = a[0:5] ^ a[5:10] ^ a[10:15] ^ a[15:20] ^ a[20:25]
+        d = np.roll(c, 1, axis=0) ^ ((np.roll(c, -1, axis=0) << one) | (np.roll(c, -1, axis=0) >> s63))
+        a ^= np.tile(d, (5, 1))
+        for i, j, r, rr in rot:
+            b[j] = (a[i] << r) | (a[i] >> rr) if r else a[i]
+        for y in (0, 5, 10, 15, 20):
+            row = b[y:y + 5]
+            a[y:y + 5] = row ^ (~np.roll(row, -1, axis=0) & np.roll(row, -2, axis=0))
+        a[0] ^= np.uint64(rc)
+    digest = np.ascontiguousarray(a[:4].T).astype("<u8").tobytes()
+    return [digest[32 * k:32 * k + 32] for k in range(n)]
+
+def keccak256(data: bytes) -> bytes:
+    if _keccak_backend is not None:
+        return _keccak_backend(data)
+    return _keccak256_py(data)
+
+def keccak256_many(datas: List[bytes]) -> List[bytes]:
+    """keccak256 of many messages; vectorized with NumPy when there is no C backend."""
+    if _keccak_backend is None and NUMPY_AVAILABLE and len(datas) > 16 and all(len(d) < 136 for d in datas):
+        return _keccak256_np(datas)
+    return [keccak256(d) for d in datas]
+
+# -------------------- ADDRESSES --------------------
+_CHECKSUMS: "OrderedDict[str, str]" = OrderedDict()  # 40 hex minuscoli -> indirizzo EIP-55 (LRU condivisa)
+_CHECKSUMS_LOCK = threading.Lock()  # la cache è usata anche dai thread (asyncio.to_thread, indice proof)
+
+def _apply_checksum(hex40: str, digest: bytes) -> str:
+    h = digest.hex()
+    return "0x" + "".join(c.upper() if c > "9" and h[i] >= "8" else c for i, c in enumerate(hex40))
+
+def _store(hex40: str, address: str) -> None:
+    # con _CHECKSUMS_LOCK acquisito
+    _CHECKSUMS[hex40] = address
+    while len(_CHECKSUMS) > CHECKSUM_CACHE_SIZE:
+        _CHECKSUMS.popitem(last=False)  # limite di memoria: esce l'indirizzo usato meno di recente
+
+def checksum(hex40: str) -> str:
+    """EIP-55 form of 40 lowercase hex digits (without 0x)."""
+    with _CHECKSUMS_LOCK:
+        address = _CHECKSUMS.get(hex40)
+        if address is not None:
+            _CHECKSUMS.move_to_end(hex40)
+            return address
+    address = _apply_checksum(hex40, keccak256(hex40.encode("ascii")))  # keccak fuori dal lock
+    with _CHECKSUMS_LOCK:
+        _store(hex40, address)
+    return address
+
+def _checksum_many(hexes: List[str]) -> List[str]:
+    """checksum() of many addresses; with NumPy the case is applied to the whole batch at once."""
+    if not hexes:
+        return []
+    digests = keccak256_many([h.encode("ascii") for h in hexes])
+    if not NUMPY_AVAILABLE:
+        return [_apply_checksum(h, d) for h, d in zip(hexes, digests)]
+    n = len(hexes)
+    chars = np.frombuffer("".join(hexes).encode("ascii"), dtype=np.uint8).reshape(n, 40).copy()
+    first = np.frombuffer(b"".join(d[:20] for d in digests), dtype=np.uint8).reshape(n, 20)
+    nibbles = np.empty((n, 40), dtype=np.uint8)
+    nibbles[:, 0::2] = first >> 4
+    nibbles[:, 1::2] = first & 0x0F
+    chars[(nibbles >= 8) & (chars >= ord("a"))] -= 32  # 'a'..'f' -> 'A'..'F'
+    flat = chars.tobytes().decode("ascii")
+    return ["0x" + flat[40 * k:40 * k + 40] for k in range(n)]
+
+def _clean(raw: Optional[str]) -> str:
+    return (raw or "").replace("\u00a0", "").replace(" ", "").strip().strip("`'\"")
+
+def _verdict(s: str, good: str) -> Tuple[Optional[str], Optional[str]]:
+    body = s[2:]
+    if body != body.lower() and body != body.upper() and s != good:
+        return None, BAD_CHECKSUM
+    return good, None
+
+def check_wallet(raw: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(checksummed address, None) or (None, reason) for a user/CSV value."""
+    s = _clean(raw)
+    if not s:
+        return None, "vuoto"
+    if not ADDRESS_RE.match(s):
+        return None, BAD_FORMAT
+    return _verdict(s, checksum(s[2:].lower()))
+
+def wallet_key(address: str) -> bytes:
+    """20 raw bytes of a valid address: the case-insensitive key for indexes."""
+    return bytes.fromhex(address[2:])
+
+def validate_wallets(values: Iterable[Optional[str]]) -> Tuple[List[Optional[str]], Dict[int, str]]:
+    """Batch check_wallet: (address or None per value, {position: reason} of the rejected non-empty values).
+
+    Empty values are not rejections (wallet not provided). The addresses missing
+    from the cache are hashed together (keccak256_many) in one pass; the verdicts
+    use this batch's own table, which does not depend on the size of the cache.
+    """
+    cleaned = [_clean(v) for v in values]
+    hexes = {s[2:].lower() for s in cleaned if ADDRESS_RE.match(s)}
+    with _CHECKSUMS_LOCK:
+        known = {h: _CHECKSUMS[h] for h in hexes if h in _CHECKSUMS}
+    misses = sorted(hexes - known.keys())
+    addresses = _checksum_many(misses)
+    with _CHECKSUMS_LOCK:
+        for hex40, address in zip(misses, addresses):
+            known[hex40] = address
+            _store(hex40, address)
+    out: List[Optional[str]] = []
+    rejected: Dict[int, str] = {}
+    for i, s in enumerate(cleaned):
+        if not s:
+            out.append(None)
+            continue
+        if not ADDRESS_RE.match(s):
+            address, reason = None, BAD_FORMAT
+        else:
+            address, reason = _verdict(s, known[s[2:].lower()])
+        out.append(address)
+        if reason is not None:
+            rejected[i] = reason
+    return out, rejected
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+workers.py
+
+Update intake of main.py through a queue in data/bot.db, shared by WORKERS
+processes (WORKER_ID 0..N-1, started by entrypoint.sh).
+
+Telegram allows one getUpdates consumer per token, so exactly one process,
+the leader, polls. Leadership is a lease row in SQLite (`leases`): the holder
+renews it at every poll, and when it stops renewing (crash, hung loop) any
+other worker takes it over after LEASE_TTL seconds. The holder is host +
+WORKER_ID, so a worker restarted by entrypoint.sh gets its lease back at
+once. The leader writes each batch of updates into `update_queue` together
+with the next getUpdates offset, in one transaction: a new leader continues
+from there. An update delivered twice is ignored, while queued (update_id is
+the primary key) and for DEDUPE_WINDOW seconds after it was handled
+(`processed_updates`).
+
+Each update goes to shard user_id % WORKERS (chat id when there is no user)
+and every worker processes only its own shard, in update_id order, through
+Application.process_update: one user's updates stay sequential on one
+process, different users run on different cores. After each update the
+persistence (user_data: where the user is in the wallet flow) is written,
+then the row is deleted. The `screen` coroutine (main.py's anti-flood) runs
+first: an update it rejects skips the attempt counter, the handlers and the
+persistence, and is deleted with the rest of its batch. An update interrupted by a crash is handled again
+when the worker restarts (at-least-once); is_replay() tells the handlers, so
+they can skip side effects that were already done. A single process
+(WORKERS=1) runs the same way, as leader of the only shard: a restart loses
+no update and resumes from the queue.
+
+Stopping (SIGTERM, watchdog) finishes the update in progress, writes the
+persistence and leaves the rest in the queue for the next start. An error
+in either loop (SQLite still locked after busy_timeout, ...) is logged and
+the iteration retried with a growing pause; status() reports a loop that
+keeps failing, or has died, to /readyz.
+
+Scheduled jobs: claim_run() lets exactly one process run a job for a given
+slot (e.g. the daily backup for a date), whichever JobQueue fires first;
+work that must have a single owner while it runs (the broadcast sender)
+follows the leader lease.
+"""
+
+import json
+import time
+import signal
+import socket
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional, Sequence, Set, Tuple
+
+from telegram import Update
+from telegram.error import Conflict, RetryAfter, TelegramError
+
+import metrics
+from storage import Storage
+
+log = logging.getLogger("savitri-bot.workers")
+
+LEASE_TTL = 30.0      # secondi senza rinnovo dopo i quali un altro worker prende il lease
+POLL_TIMEOUT = 10     # long polling di getUpdates; deve restare sotto LEASE_TTL / 2
+BATCH = 50            # update presi dalla coda per giro
+IDLE_SLEEP = 0.2      # attesa quando la coda del proprio shard è vuota
+DEDUPE_WINDOW = 24 * 3600  # secondi per cui un update gestito viene ancora riconosciuto (Telegram li tiene 24h)
+STOP_TIMEOUT = 10.0   # attesa massima dell'update in corso all'arresto
+RETRY_MAX = 30.0      # attesa massima tra due tentativi dopo errori consecutivi (SQLite occupato, ...)
+NOT_READY_ERRORS = 3  # errori consecutivi di un loop dopo cui /readyz risponde not_ready
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL       -- epoch (time.time()), condiviso tra processi
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS update_queue (
+    update_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    payload TEXT NOT NULL,      -- Update.to_json()
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0   -- > 1: ripreso dopo un riavvio a metà gestione
+);
+CREATE INDEX IF NOT EXISTS update_queue_shard ON update_queue(shard, update_id);
+
+CREATE TABLE IF NOT EXISTS processed_updates (
+    update_id INTEGER PRIMARY KEY,
+    done_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS processed_updates_done_at ON processed_updates(done_at);
+
+CREATE TABLE IF NOT EXISTS job_runs (
+    name TEXT NOT NULL,
+    slot TEXT NOT NULL,         -- es. la data per un job giornaliero
+    holder TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (name, slot)
+) WITHOUT ROWID;
+"""
+
+def ensure_schema(store: Storage) -> None:
+    with store.transaction() as con:
+        for stmt in SCHEMA.split(";"):
+            if stmt.strip():
+                con.execute(stmt)
+        cols = {row["name"] for row in con.execute("PRAGMA table_info(update_queue)")}
+        if "attempts" not in cols:
+            con.execute("ALTER TABLE update_queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+def holder_id(worker_id: int) -> str:
+    """Stable across restarts of the same worker: a restarted process renews its own lease at once."""
+    return f"{socket.gethostname()}:w{worker_id}"
+
+# -------------------- LEASES --------------------
+class Lease:
+    """A named lease in SQLite: one holder at a time, lost if not renewed within `ttl` seconds."""
+
+    def __init__(self, store: Storage, name: str, holder: str, ttl: float = LEASE_TTL):
+        self.store = store
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self.valid_until = 0.0  # monotonic: oltre questo istante il lease va considerato perso
+
+    @property
+    def held(self) -> bool:
+        return time.monotonic() < self.valid_until
+
+    def acquire(self) -> bool:
+        """Take the lease if free or expired, renew it if already ours; False if someone else holds it."""
+        start = time.monotonic()
+        now = time.time()
+        with self.store.transaction() as con:
+            row = con.execute("SELECT holder, expires FROM leases WHERE name=?", (self.name,)).fetchone()
+            if row is not None and row["holder"] != self.holder and row["expires"] > now:
+                self.valid_until = 0.0
+                return False
+            con.execute("INSERT OR REPLACE INTO leases (name, holder, expires) VALUES (?, ?, ?)",
+                        (self.name, self.holder, now + self.ttl))
+        if not self.held:
+            log.info("Lease %r acquired by %s", self.name, self.holder)
+            metrics.REGISTRY.inc("worker_lease_acquired_total", lease=self.name)
+        self.valid_until = start + self.ttl
+        return True
+
+    def release(self) -> None:
+        self.valid_until = 0.0
+        with self.store.transaction() as con:
+            con.execute("DELETE FROM leases WHERE name=? AND holder=?", (self.name, self.holder))
+
+def claim_run(store: Storage, name: str, slot: str, holder: str) -> bool:
+    """True for the first process that claims job `name` for `slot`; the others skip it."""
+    with store.transaction() as con:
+        cur = con.execute("INSERT OR IGNORE INTO job_runs (name, slot, holder, started_at) VALUES (?, ?, ?, ?)",
+                          (name, slot, holder, time.time()))
+    return cur.rowcount == 1
+
+# -------------------- UPDATE QUEUE --------------------
+def shard_of(update: Update, shards: int) -> int:
+    """Shard of an update: by user, so one user's updates are always handled by the same worker."""
+    if update.effective_user is not None:
+        key = update.effective_user.id
+    elif update.effective_chat is not None:
+        key = update.effective_chat.id
+    else:
+        key = 0
+    return key % shards
+
+class UpdateQueue:
+    """Updates fetched by the leader, waiting for the worker of their shard."""
+
+    OFFSET_KEY = "update_offset"
+
+    def __init__(self, store: Storage, shards: int):
+        self.store = store
+        self.shards = max(1, shards)
+
+    def offset(self) -> Optional[int]:
+        value = self.store.get_meta(self.OFFSET_KEY)
+        return int(value) if value else None
+
+    def push(self, updates: Sequence[Update]) -> int:
+        """Queue a getUpdates batch and advance the offset past it (one transaction); returns the new rows.
+
+        Updates already queued or handled within DEDUPE_WINDOW are skipped.
+        """
+        if not updates:
+            return 0
+        now = time.time()
+        rows = [(u.update_id, shard_of(u, self.shards), u.to_json(), now, u.update_id) for u in updates]
+        with self.store.transaction() as con:
+            before = con.total_changes
+            con.executemany("INSERT OR IGNORE INTO update_queue (update_id, shard, payload, queued_at) "
+                            "SELECT ?, ?, ?, ? WHERE NOT EXISTS "
+                            "(SELECT 1 FROM processed_updates WHERE update_id=?)", rows)
+            added = con.total_changes - before
+            con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        (self.OFFSET_KEY, str(max(u.update_id for u in updates) + 1)))
+        return added
+
+    def take(self, shard: int, limit: int = BATCH) -> List[Tuple[int, str]]:
+        rows = self.store.query("SELECT update_id, payload FROM update_queue WHERE shard=? "
+                                "ORDER BY update_id LIMIT ?", (shard, limit))
+        return [(r["update_id"], r["payload"]) for r in rows]
+
+    def begin(self, update_id: int) -> int:
+        """Count one more attempt at handling an update; returns the attempt number (1 = first)."""
+        with self.store.transaction() as con:
+            con.execute("UPDATE update_queue SET attempts=attempts+1 WHERE update_id=?", (update_id,))
+            row = con.execute("SELECT attempts FROM update_queue WHERE update_id=?", (update_id,)).fetchone()
+        return row["attempts"] if row else 1
+
+    def done(self, *update_ids: int) -> None:
+        """Remove handled updates from the queue and remember them for the dedupe window."""
+        now = time.time()
+        with self.store.transaction() as con:
+            con.executemany("DELETE FROM update_queue WHERE update_id=?", ((u,) for u in update_ids))
+            con.executemany("INSERT OR REPLACE INTO processed_updates (update_id, done_at) VALUES (?, ?)",
+                            ((u, now) for u in update_ids))
+
+    def prune(self, window: float = DEDUPE_WINDOW) -> int:
+        with self.store.transaction() as con:
+            return con.execute("DELETE FROM processed_updates WHERE done_at < ?", (time.time() - window,)).rowcount
+
+    def depth(self, shard: Optional[int] = None) -> int:
+        if shard is None:
+            return self.store.query("SELECT COUNT(*) AS n FROM update_queue")[0]["n"]
+        return self.store.query("SELECT COUNT(*) AS n FROM update_queue WHERE shard=?", (shard,))[0]["n"]
+
+# -------------------- WORKER --------------------
+class Worker:
+    """Poller (while leader) and consumer of one shard, inside one main.py process."""
+
+    def __init__(self, application, store: Storage, worker_id: int, workers: int,
+                 lease_ttl: float = LEASE_TTL, poll_timeout: int = POLL_TIMEOUT, batch: int = BATCH,
+                 screen: Optional[Callable[[Update], Awaitable[bool]]] = None):
+        ensure_schema(store)
+        self.application = application
+        self.store = store
+        self.worker_id = worker_id
+        self.workers = workers
+        self.holder = holder_id(worker_id)
+        self.leader = Lease(store, "leader", self.holder, lease_ttl)
+        self.queue = UpdateQueue(store, workers)
+        self.poll_timeout = min(poll_timeout, int(lease_ttl / 2))
+        self.batch = batch
+        self.screen = screen  # anti-flood: False = update scartato prima di qualsiasi scrittura
+        self.tasks: List[asyncio.Task] = []
+        self.stopping = False
+        self.replays: Set[int] = set()  # update in corso già tentati prima di un riavvio
+        self.errors = {"lead": 0, "consume": 0}  # errori consecutivi per loop
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader.held
+
+    def is_replay(self, update_id: int) -> bool:
+        """True while handling an update that a previous run had already started."""
+        return update_id in self.replays
+
+    async def start(self) -> None:
+        self.stopping = False
+        self.errors = {"lead": 0, "consume": 0}
+        self.tasks = [asyncio.create_task(self._lead(), name=f"worker{self.worker_id}:lead"),
+                      asyncio.create_task(self._consume(), name=f"worker{self.worker_id}:consume")]
+
+    async def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """Stop polling, let the update in progress finish (up to `timeout`), release the lease."""
+        self.stopping = True
+        lead, consume = self.tasks or (None, None)
+        if lead is not None:
+            lead.cancel()
+            await asyncio.gather(lead, return_exceptions=True)
+        if consume is not None:
+            done, _ = await asyncio.wait([consume], timeout=timeout)
+            if not done:
+                log.warning("Update still running after %.0fs: interrupted, it will be handled again", timeout)
+                consume.cancel()
+            await asyncio.gather(consume, return_exceptions=True)
+        self.tasks = []
+        if self.leader.held:
+            self.leader.release()
+
+    def status(self) -> Tuple[bool, str]:
+        """Readiness: both loops running and not failing over and over (e.g. "database is locked")."""
+        dead = [t.get_name() for t in self.tasks if t.done()]
+        if dead:
+            return False, f"task terminati: {', '.join(dead)}"
+        failing = {loop: n for loop, n in self.errors.items() if n >= NOT_READY_ERRORS}
+        if failing:
+            return False, ", ".join(f"{loop}: {n} errori consecutivi" for loop, n in failing.items())
+        return bool(self.tasks), "lead/consume attivi" if self.tasks else "non avviato"
+
+    async def _backoff(self, loop: str, error: Exception) -> None:
+        """After a failed iteration (SQLite busy beyond busy_timeout, ...): log, wait, retry."""
+        self.errors[loop] += 1
+        n = self.errors[loop]
+        delay = min(RETRY_MAX, IDLE_SLEEP * 2 ** n)
+        log.warning("Worker %d %s loop failed (%d in a row), retrying in %.1fs: %s",
+                    self.worker_id, loop, n, delay, error, exc_info=n == 1)
+        metrics.REGISTRY.inc("worker_loop_errors_total", loop=loop)
+        await asyncio.sleep(delay)
+
+    async def _lead(self) -> None:
+        pruned_at = 0.0
+        while True:
+            try:
+                pruned_at = await self._poll(pruned_at)
+                self.errors["lead"] = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._backoff("lead", e)
+
+    async def _poll(self, pruned_at: float) -> float:
+        """One leader iteration: renew the lease, getUpdates, queue the batch; returns pruned_at."""
+        if not self.leader.acquire():
+            await asyncio.sleep(self.leader.ttl / 3)
+            return pruned_at
+        try:
+            updates = await self.application.bot.get_updates(offset=self.queue.offset(), timeout=self.poll_timeout,
+                                                             allowed_updates=Update.ALL_TYPES)
+        except Conflict as e:
+            # un altro getUpdates sullo stesso token (vecchio leader non ancora fermo, altra istanza)
+            log.warning("getUpdates conflict: %s", e)
+            await asyncio.sleep(self.leader.ttl / 3)
+            return pruned_at
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta)
+                                else float(e.retry_after))
+            return pruned_at
+        except TelegramError as e:
+            log.warning("getUpdates failed: %s", e)
+            await asyncio.sleep(1)
+            return pruned_at
+        if updates:
+            added = self.queue.push(updates)
+            metrics.REGISTRY.inc("worker_updates_queued_total", added)
+            if added < len(updates):
+                metrics.REGISTRY.inc("worker_updates_duplicate_total", len(updates) - added)
+        if time.monotonic() - pruned_at > 60:
+            self.queue.prune()
+            pruned_at = time.monotonic()
+        return pruned_at
+
+    async def _consume(self) -> None:
+        while not self.stopping:
+            try:
+                handled = await self._consume_batch()
+                self.errors["consume"] = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # la riga resta in coda: al prossimo giro l'update viene ripreso (come replay)
+                await self._backoff("consume", e)
+                continue
+            if not handled:
+                await asyncio.sleep(IDLE_SLEEP)
+
+    async def _consume_batch(self) -> int:
+        """Handle the next rows of this worker's shard, in order; returns how many were taken."""
+        app = self.application
+        rows = self.queue.take(self.worker_id, self.batch)
+        screened: List[int] = []  # scartati dall'anti-flood: tolti dalla coda tutti insieme
+        for update_id, payload in rows:
+            if self.stopping:
+                break
+            try:
+                update = Update.de_json(json.loads(payload), app.bot)
+            except Exception as e:
+                log.exception("Update %s dropped: %s", update_id, e)
+                update = None
+            if update is not None and self.screen is not None and not await self.screen(update):
+                # niente attempts, handler né persistence: lo spam costa solo la riga in coda
+                screened.append(update_id)
+                continue
+            if self.queue.begin(update_id) > 1:
+                log.warning("Update %s handled again after an interrupted run", update_id)
+                metrics.REGISTRY.inc("worker_updates_replayed_total")
+                self.replays.add(update_id)
+            if update is not None:
+                try:
+                    await app.process_update(update)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # gli errori degli handler passano già dagli error handler
+                    log.exception("Update %s dropped: %s", update_id, e)
+            # stato dell'utente salvato prima di togliere l'update dalla coda
+            await app.update_persistence()
+            self.queue.done(update_id)
+            self.replays.discard(update_id)
+            metrics.REGISTRY.inc("worker_updates_processed_total", worker=str(self.worker_id))
+        if screened:
+            self.queue.done(*screened)
+            metrics.REGISTRY.inc("worker_updates_screened_total", len(screened), worker=str(self.worker_id))
+        return len(rows)
+
+# -------------------- RUN --------------------
+def _raise_system_exit() -> None:
+    raise SystemExit
+
+def run(application, worker: Worker,
+        stop_signals: Sequence[int] = (signal.SIGINT, signal.SIGTERM, signal.SIGABRT)) -> None:
+    """Application.run_polling() for a worker: same lifecycle (post_init, stop_running(),
+    persistence, post_shutdown), with updates read from the queue instead of getUpdates."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for sig in stop_signals:
+        try:
+            loop.add_signal_handler(sig, _raise_system_exit)
+        except NotImplementedError:
+            pass
+    try:
+        loop.run_until_complete(application.initialize())
+        if application.post_init:
+            loop.run_until_complete(application.post_init(application))
+        loop.run_until_complete(application.start())
+        loop.run_until_complete(worker.start())
+        log.info("Worker %d/%d running (%s)", worker.worker_id, worker.workers, worker.holder)
+        loop.run_forever()
+    except (KeyboardInterrupt, SystemExit):
+        log.debug("Worker received stop signal. Shutting down.")
+    finally:
+        try:
+            loop.run_until_complete(worker.stop())
+            if application.running:
+                loop.run_until_complete(application.stop())
+                if application.post_stop:
+                    loop.run_until_complete(application.post_stop(application))
+            loop.run_until_complete(application.shutdown())
+            if application.post_shutdown:
+                loop.run_until_complete(application.post_shutdown(application))
+        finally:
+            loop.close()